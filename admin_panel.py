@@ -844,6 +844,9 @@ def render_product_management(
             list_cols_r[0].text(str(prod_id_in_list) if prod_id_in_list is not None else "N/A")
             list_cols_r[1].text(f"{prod_item_in_list.get('brand','') or ''} {prod_item_in_list.get('model_name','') or ''}".strip())
             prod_img_b64_list_view = prod_item_in_list.get('image_base64')
+            if not prod_img_b64_list_view and prod_id_in_list is not None:
+                # Listen enthalten keine Bilddaten mehr; Vorschaubild einzeln (gecacht) laden
+                prod_img_b64_list_view = (get_product_by_id_func(prod_id_in_list) or {}).get('image_base64')
             if prod_img_b64_list_view:
                 try:
                     list_cols_r[2].image(base64.b64decode(prod_img_b64_list_view), width=40)
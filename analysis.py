@@ -24,6 +24,7 @@ from reportlab.lib import colors  # Für HexColor Zugriff
 import colorsys  # Für HLS/RGB Konvertierungen
 from datetime import datetime, timedelta
 from calculations import AdvancedCalculationsIntegrator
+from chart_export_engine import DeferredChart, defer_chart_export
 
 # HINZUGEFÜGT: Import der kompletten Finanz-Tools
 from financial_tools import (
@@ -1793,41 +1794,16 @@ def _apply_custom_style_to_fig(
         fig.update_layout(colorway=final_colorway)
 
 
-_PLOT_EXPORT_CACHE: Dict[str, bytes] = {}
-
-def _export_plotly_fig_to_bytes(
+def _defer_plotly_fig_export(
     fig: Optional[go.Figure], texts: Dict[str, str]
-) -> Optional[bytes]:
-    if fig is None:
-        return None
-    # Cache-Key über die Figure-Struktur ableiten
-    try:
-        fig_json = fig.to_json()
-        cache_key = fig_json  # bereits JSON-String
-        cached = _PLOT_EXPORT_CACHE.get(cache_key)
-        if cached:
-            return cached
-    except Exception:
-        cache_key = None
-    try:
-        # Reduzierte Auflösung für schnellere Erstellung im Dashboard
-        img = fig.to_image(format="png", scale=1.5, width=800, height=480)
-        if cache_key:
-            # Soft-LRU: einfache Größe begrenzen
-            if len(_PLOT_EXPORT_CACHE) > 64:
-                _PLOT_EXPORT_CACHE.clear()
-            _PLOT_EXPORT_CACHE[cache_key] = img
-        return img
-    except Exception as e:
-        if "kaleido" in str(e).lower() and "st" in globals() and hasattr(st, "warning"):
-            st.warning(
-                get_text(
-                    texts,
-                    "analysis_chart_export_error_kaleido_v4",
-                    "Hinweis: Diagramm-Export für PDF fehlgeschlagen (Kaleido?). Details: {error_details}",
-                ).format(error_details=str(e))
-            )
-        return None
+) -> Optional[DeferredChart]:
+    """Merkt die Figur für den PDF-Export vor, statt sie bei jedem Rerun zu rastern.
+
+    Die PNG-Bytes entstehen erst beim PDF-Export gebündelt
+    (``materialize_deferred_charts``).
+    """
+    # Reduzierte Auflösung für schnellere Erstellung beim PDF-Export
+    return defer_chart_export(fig, width=800, height=480, scale=1.5)
 
 
 AVAILABLE_CHART_TYPES = {
@@ -2069,7 +2045,7 @@ def render_daily_production_switcher(
             fig, use_container_width=True, key="analysis_daily_prod_switcher_key_v7_2d"
         )
         analysis_results["daily_production_switcher_chart_bytes"] = (
-            _export_plotly_fig_to_bytes(fig, texts)
+            _defer_plotly_fig_export(fig, texts)
         )
     else:
         st.error("Fehler beim Erstellen des Tagesproduktions-Diagramms")
@@ -2121,7 +2097,7 @@ def render_weekly_production_switcher(
             fig, use_container_width=True, key="analysis_weekly_prod_switcher_key_v7_2d"
         )
         analysis_results["weekly_production_switcher_chart_bytes"] = (
-            _export_plotly_fig_to_bytes(fig, texts)
+            _defer_plotly_fig_export(fig, texts)
         )
     else:
         st.error("Fehler beim Erstellen des Wochenproduktions-Diagramms")
@@ -2221,7 +2197,7 @@ def render_yearly_production_switcher(
             fig, use_container_width=True, key="analysis_yearly_prod_switcher_key_v7_2d"
         )
         analysis_results["yearly_production_switcher_chart_bytes"] = (
-            _export_plotly_fig_to_bytes(fig, texts)
+            _defer_plotly_fig_export(fig, texts)
         )
     else:
         st.error("Fehler beim Erstellen des Jahresproduktions-Diagramms")
@@ -2298,7 +2274,7 @@ def render_project_roi_matrix_switcher(
             key="analysis_project_roi_matrix_switcher_key_v7_2d",
         )
         analysis_results["project_roi_matrix_switcher_chart_bytes"] = (
-            _export_plotly_fig_to_bytes(fig, texts)
+            _defer_plotly_fig_export(fig, texts)
         )
     else:
         st.error("Fehler beim Erstellen des ROI-Diagramms")
@@ -2415,7 +2391,7 @@ def render_feed_in_revenue_switcher(
             key="analysis_feed_in_revenue_switcher_key_v7_2d",
         )
         analysis_results["feed_in_revenue_switcher_chart_bytes"] = (
-            _export_plotly_fig_to_bytes(fig, texts)
+            _defer_plotly_fig_export(fig, texts)
         )
     else:
         st.error("Fehler beim Erstellen des Einspeisevergütungs-Diagramms")
@@ -2639,7 +2615,7 @@ def render_production_vs_consumption_switcher(
     st.plotly_chart(
         fig, use_container_width=True, key="analysis_prod_vs_cons_switcher_key_v7_2d"
     )
-    analysis_results["prod_vs_cons_switcher_chart_bytes"] = _export_plotly_fig_to_bytes(
+    analysis_results["prod_vs_cons_switcher_chart_bytes"] = _defer_plotly_fig_export(
         fig, texts
     )
 
@@ -2708,7 +2684,7 @@ def render_tariff_cube_switcher(
     if fig:
         _apply_custom_style_to_fig(fig, viz_settings, "tariff_cube_switcher")
         st.plotly_chart(fig, use_container_width=True, key="analysis_tariff_cube_switcher_plot")
-        analysis_results["tariff_cube_switcher_chart_bytes"] = _export_plotly_fig_to_bytes(fig, texts)
+        analysis_results["tariff_cube_switcher_chart_bytes"] = _defer_plotly_fig_export(fig, texts)
     else:
         analysis_results["tariff_cube_switcher_chart_bytes"] = None
 
@@ -2819,7 +2795,7 @@ def render_co2_savings_value_switcher(
 
     if fig:
         analysis_results["co2_savings_value_switcher_chart_bytes"] = (
-            _export_plotly_fig_to_bytes(fig, texts)
+            _defer_plotly_fig_export(fig, texts)
         )
     else:
         analysis_results["co2_savings_value_switcher_chart_bytes"] = None
@@ -3518,7 +3494,7 @@ def render_co2_savings_value_switcher(
             key="analysis_co2_savings_value_switcher_key_v6_final",
         )
         analysis_results["co2_savings_value_switcher_chart_bytes"] = (
-            _export_plotly_fig_to_bytes(fig, texts)
+            _defer_plotly_fig_export(fig, texts)
         )
     else:
         st.warning("CO₂-Diagramm konnte nicht erstellt werden.")
@@ -3654,7 +3630,7 @@ def render_investment_value_switcher(
     )
     _apply_custom_style_to_fig(fig, viz_settings, "investment_value_switcher")
     st.plotly_chart(fig, use_container_width=True, key="analysis_investment_value_switcher_plot")
-    analysis_results["investment_value_switcher_chart_bytes"] = _export_plotly_fig_to_bytes(fig, texts)
+    analysis_results["investment_value_switcher_chart_bytes"] = _defer_plotly_fig_export(fig, texts)
 
 
 def render_storage_effect_switcher(
@@ -3755,7 +3731,7 @@ def render_storage_effect_switcher(
     )
     _apply_custom_style_to_fig(fig, viz_settings, "storage_effect_switcher")
     st.plotly_chart(fig, use_container_width=True, key="analysis_storage_effect_switcher_plot")
-    analysis_results["storage_effect_switcher_chart_bytes"] = _export_plotly_fig_to_bytes(fig, texts)
+    analysis_results["storage_effect_switcher_chart_bytes"] = _defer_plotly_fig_export(fig, texts)
 
 
 def render_selfuse_stack_switcher(
@@ -3864,7 +3840,7 @@ def render_selfuse_stack_switcher(
         key="analysis_selfuse_stack_switcher_key_v6_final",
     )
     analysis_results["selfuse_stack_switcher_chart_bytes"] = (
-        _export_plotly_fig_to_bytes(fig, texts)
+        _defer_plotly_fig_export(fig, texts)
     )
 
 
@@ -3938,7 +3914,7 @@ def render_cost_growth_switcher(
     st.plotly_chart(
         fig, use_container_width=True, key="analysis_cost_growth_switcher_key_v6_final"
     )
-    analysis_results["cost_growth_switcher_chart_bytes"] = _export_plotly_fig_to_bytes(
+    analysis_results["cost_growth_switcher_chart_bytes"] = _defer_plotly_fig_export(
         fig, texts
     )
 
@@ -4044,7 +4020,7 @@ def render_selfuse_ratio_switcher(
         key="analysis_selfuse_ratio_switcher_key_v6_final",
     )
     analysis_results["selfuse_ratio_switcher_chart_bytes"] = (
-        _export_plotly_fig_to_bytes(fig, texts)
+        _defer_plotly_fig_export(fig, texts)
     )
 
 
@@ -4117,7 +4093,7 @@ def render_roi_comparison_switcher(
         key="analysis_roi_comparison_switcher_key_v6_final",
     )
     analysis_results["roi_comparison_switcher_chart_bytes"] = (
-        _export_plotly_fig_to_bytes(fig, texts)
+        _defer_plotly_fig_export(fig, texts)
     )
 
 
@@ -4201,7 +4177,7 @@ def render_scenario_comparison_switcher(
         key="analysis_scenario_comp_switcher_key_v6_final",
     )
     analysis_results["scenario_comparison_switcher_chart_bytes"] = (
-        _export_plotly_fig_to_bytes(fig, texts)
+        _defer_plotly_fig_export(fig, texts)
     )
 
 
@@ -4310,7 +4286,7 @@ def render_tariff_comparison_switcher(
         fig, use_container_width=True, key="analysis_tariff_comp_switcher_key_v6_final"
     )
     analysis_results["tariff_comparison_switcher_chart_bytes"] = (
-        _export_plotly_fig_to_bytes(fig, texts)
+        _defer_plotly_fig_export(fig, texts)
     )
 
 
@@ -4379,7 +4355,7 @@ def render_income_projection_switcher(
         fig, use_container_width=True, key="analysis_income_proj_switcher_key_v6_final"
     )
     analysis_results["income_projection_switcher_chart_bytes"] = (
-        _export_plotly_fig_to_bytes(fig, texts)
+        _defer_plotly_fig_export(fig, texts)
     )
 
 
@@ -4928,7 +4904,7 @@ def _render_consumption_coverage_pie(
                 key=f"{chart_key_prefix}_final_pie_chart_key_v7_corrected",
             )
             analysis_results_local[f"{chart_key_prefix}_chart_bytes"] = (
-                _export_plotly_fig_to_bytes(fig, texts_local)
+                _defer_plotly_fig_export(fig, texts_local)
             )
         else:
             st.info(
@@ -5084,7 +5060,7 @@ def _render_pv_usage_pie(
                 key=f"{chart_key_prefix}_final_pie_chart_key_v7_corrected",
             )
             analysis_results_local[f"{chart_key_prefix}_chart_bytes"] = (
-                _export_plotly_fig_to_bytes(fig, texts_local)
+                _defer_plotly_fig_export(fig, texts_local)
             )
         else:
             st.info(
@@ -5923,9 +5899,9 @@ def render_financial_scenarios(
             n_simulations = st.number_input(
                 "Anzahl Simulationen",
                 min_value=100,
-                max_value=10000,
-                value=1000,
-                step=100,
+                max_value=100000,
+                value=10000,
+                step=1000,
                 key=f"n_simulations_{unique_session_id}",
             )
 
@@ -7047,7 +7023,7 @@ def render_analysis(
                 key="analysis_monthly_comp_chart_final_v8_corrected",
             )
             results_for_display["monthly_prod_cons_chart_bytes"] = (
-                _export_plotly_fig_to_bytes(fig_monthly_comp, texts)
+                _defer_plotly_fig_export(fig_monthly_comp, texts)
             )
         else:
             st.info(
@@ -7078,7 +7054,7 @@ def render_analysis(
                 key="analysis_cost_proj_chart_final_v8_corrected",
             )
             results_for_display["cost_projection_chart_bytes"] = (
-                _export_plotly_fig_to_bytes(fig_cost_projection, texts)
+                _defer_plotly_fig_export(fig_cost_projection, texts)
             )
         else:
             st.info(
@@ -7109,7 +7085,7 @@ def render_analysis(
                 key="analysis_cum_cashflow_chart_final_v8_corrected",
             )
             results_for_display["cumulative_cashflow_chart_bytes"] = (
-                _export_plotly_fig_to_bytes(fig_cum_cf, texts)
+                _defer_plotly_fig_export(fig_cum_cf, texts)
             )
         else:
             st.info(
@@ -7834,13 +7810,13 @@ def render_financing_analysis(
 
                 # Speichere Daten für PDF-Export
                 st.session_state["financing_analysis_charts"] = {
-                    "tilgungsplan_chart": _export_plotly_fig_to_bytes(
+                    "tilgungsplan_chart": _defer_plotly_fig_export(
                         fig_tilgung, texts
                     ),
-                    "zins_anteil_chart": _export_plotly_fig_to_bytes(
+                    "zins_anteil_chart": _defer_plotly_fig_export(
                         fig_zins_anteil, texts
                     ),
-                    "cumulative_chart": _export_plotly_fig_to_bytes(
+                    "cumulative_chart": _defer_plotly_fig_export(
                         fig_cumulative, texts
                     ),
                     "tilgungsplan_data": tilgungsplan_df.to_dict("records"),
@@ -7969,13 +7945,13 @@ def render_financing_analysis(
 
                 # Speichere Leasing-Daten für PDF-Export
                 st.session_state["leasing_analysis_charts"] = {
-                    "leasing_costs_chart": _export_plotly_fig_to_bytes(
+                    "leasing_costs_chart": _defer_plotly_fig_export(
                         fig_leasing_costs, texts
                     ),
-                    "cashflow_comparison_chart": _export_plotly_fig_to_bytes(
+                    "cashflow_comparison_chart": _defer_plotly_fig_export(
                         fig_cashflow_comparison, texts
                     ),
-                    "monthly_burden_chart": _export_plotly_fig_to_bytes(
+                    "monthly_burden_chart": _defer_plotly_fig_export(
                         fig_monthly_burden, texts
                     ),
                     "leasing_data": leasing_result,
@@ -8098,8 +8074,8 @@ def render_financing_analysis(
 
                 # Speichere Szenario-Daten für PDF-Export
                 st.session_state["financing_scenarios"] = {
-                    "rates_chart": _export_plotly_fig_to_bytes(fig_rates, texts),
-                    "costs_chart": _export_plotly_fig_to_bytes(fig_total_costs, texts),
+                    "rates_chart": _defer_plotly_fig_export(fig_rates, texts),
+                    "costs_chart": _defer_plotly_fig_export(fig_total_costs, texts),
                     "scenario_data": scenario_df.to_dict("records"),
                 }
 
@@ -8238,8 +8214,8 @@ def render_financing_analysis(
 
         # Speichere ROI-Daten für PDF-Export
         st.session_state["financing_roi_analysis"] = {
-            "roi_chart": _export_plotly_fig_to_bytes(fig_roi, texts),
-            "cashflow_evolution_chart": _export_plotly_fig_to_bytes(
+            "roi_chart": _defer_plotly_fig_export(fig_roi, texts),
+            "cashflow_evolution_chart": _defer_plotly_fig_export(
                 fig_cashflow_evolution, texts
             ),
             "roi_data": roi_df.to_dict("records"),
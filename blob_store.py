@@ -0,0 +1,179 @@
+# blob_store.py
+"""
+Inhaltsadressierter Ablageort für Binärdaten (Produktbilder, Firmenlogos).
+
+Bisher lagen Bilder als Base64-Text direkt in den Tabellenzeilen
+(``products.image_base64``, ``companies.logo_base64``). Jede Listenabfrage mit
+``SELECT *`` hat dadurch Megabytes an Bildtext in Python-Dicts kopiert, die
+der Aufrufer meist gar nicht braucht.
+
+Hier werden die dekodierten Bytes als Datei unter ihrem SHA-256 abgelegt
+(``data/blobs/ab/abcdef...``); die Tabellen speichern nur noch den Hash.
+Gleiche Bilder werden automatisch nur einmal gespeichert. Lesezugriffe werden
+im Prozess (LRU, nach Bytes begrenzt) zwischengespeichert.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+BLOB_STORE_DIR = os.path.join(DATA_DIR, "blobs")
+
+# Obergrenze für den Prozess-Cache der Base64-Strings
+DEFAULT_MEMORY_BYTES = 32 * 1024 * 1024
+# Blobs, die jünger sind, gelten beim Aufräumen als "in Arbeit": zwischen put()
+# und dem Commit der Zeile, die auf sie verweist, sind sie noch unreferenziert.
+DEFAULT_PRUNE_GRACE_SECONDS = 10 * 60
+
+
+def _is_sha256_hex(value: str) -> bool:
+    return len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+
+def decode_base64_payload(value: Optional[str]) -> Optional[bytes]:
+    """Dekodiert Base64 (optional mit ``data:...;base64,``-Präfix); None bei ungültigen Daten."""
+    if not isinstance(value, str):
+        return None
+    text = value.strip()
+    if text.startswith("data:") and "," in text:
+        text = text.split(",", 1)[1]
+    text = "".join(text.split())
+    if not text:
+        return None
+    try:
+        return base64.b64decode(text, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+class BlobStore:
+    def __init__(self, base_dir: str = BLOB_STORE_DIR, memory_bytes: int = DEFAULT_MEMORY_BYTES):
+        self.base_dir = base_dir
+        self.memory_bytes = int(memory_bytes)
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._memory_size = 0
+
+    def path_for(self, sha: str) -> str:
+        return os.path.join(self.base_dir, sha[:2], sha)
+
+    def put(self, data: bytes) -> str:
+        """Speichert ``data`` (idempotent) und gibt den SHA-256 zurück."""
+        sha = hashlib.sha256(data).hexdigest()
+        path = self.path_for(sha)
+        if os.path.exists(path):
+            # Zeitstempel auffrischen, damit ein gerade wiederverwendeter Blob die
+            # Schonfrist von delete_unreferenced() genießt
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return sha
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # atomar schreiben, damit parallele Leser nie eine halbe Datei sehen
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return sha
+
+    def get(self, sha: Optional[str]) -> Optional[bytes]:
+        if not sha or not _is_sha256_hex(sha):
+            return None
+        try:
+            with open(self.path_for(sha), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def exists(self, sha: Optional[str]) -> bool:
+        return bool(sha) and _is_sha256_hex(sha) and os.path.exists(self.path_for(sha))
+
+    def put_base64(self, value: Optional[str]) -> Optional[str]:
+        """Speichert einen Base64-String als Bytes; None, wenn er nicht dekodierbar ist."""
+        data = decode_base64_payload(value)
+        if data is None:
+            return None
+        return self.put(data)
+
+    def get_base64(self, sha: Optional[str]) -> Optional[str]:
+        """Base64-Text eines Blobs (für bestehende Aufrufer, die ``*_base64`` erwarten)."""
+        if not sha:
+            return None
+        with self._lock:
+            cached = self._memory.get(sha)
+            if cached is not None:
+                self._memory.move_to_end(sha)
+                return cached
+        data = self.get(sha)
+        if data is None:
+            return None
+        encoded = base64.b64encode(data).decode("ascii")
+        with self._lock:
+            if sha not in self._memory and len(encoded) <= self.memory_bytes:
+                self._memory[sha] = encoded
+                self._memory_size += len(encoded)
+                while self._memory_size > self.memory_bytes:
+                    _, evicted = self._memory.popitem(last=False)
+                    self._memory_size -= len(evicted)
+        return encoded
+
+    def delete_unreferenced(self, referenced: Iterable[str], min_age_seconds: float = 0.0) -> int:
+        """Löscht alle Blobs, deren Hash nicht in ``referenced`` vorkommt.
+
+        Blobs, die vor weniger als ``min_age_seconds`` geschrieben wurden, bleiben
+        erhalten (siehe ``DEFAULT_PRUNE_GRACE_SECONDS``).
+        """
+        keep = {sha for sha in referenced if sha}
+        cutoff = time.time() - float(min_age_seconds)
+        removed = 0
+        if not os.path.isdir(self.base_dir):
+            return 0
+        for prefix in os.listdir(self.base_dir):
+            prefix_dir = os.path.join(self.base_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if _is_sha256_hex(name) and name not in keep:
+                    path = os.path.join(prefix_dir, name)
+                    try:
+                        if min_age_seconds > 0 and os.path.getmtime(path) > cutoff:
+                            continue
+                        os.remove(path)
+                        removed += 1
+                    except OSError:
+                        pass
+        with self._lock:
+            for sha in [sha for sha in self._memory if sha not in keep]:
+                self._memory_size -= len(self._memory.pop(sha))
+        return removed
+
+
+_BLOB_STORE: Optional[BlobStore] = None
+_BLOB_STORE_LOCK = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    global _BLOB_STORE
+    if _BLOB_STORE is None:
+        with _BLOB_STORE_LOCK:
+            if _BLOB_STORE is None:
+                _BLOB_STORE = BlobStore()
+    return _BLOB_STORE
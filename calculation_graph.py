@@ -0,0 +1,237 @@
+# calculation_graph.py
+"""
+Stufen-Graph mit Memoisierung für perform_calculations.
+
+perform_calculations ist in benannte Stufen zerlegt (Ertrag, Energiefluss,
+Kosten, Wirtschaftlichkeit Jahr 1, Simulation, Kennzahlen, ...). Jede Stufe
+ist eine Funktion, deren Parameter ihre Eingaben sind; ``outputs`` nennt die
+Werte, die sie an nachfolgende Stufen weitergibt. Daraus ergibt sich der
+Abhängigkeitsgraph: Eine Stufe hängt von den Stufen ab, die ihre Eingaben
+erzeugen.
+
+- Schlüssel: BLAKE2b über die Eingabewerte der Stufe. Große Eingaben wie
+  ``global_constants``, ``texts`` oder ``project_details`` werden vorher auf
+  die Keys reduziert, die die Stufe tatsächlich liest (``projections``).
+- Treffer: Ergebnis-Einträge (``results``) und Ausgaben werden aus dem Cache
+  kopiert, die Stufe läuft nicht. Ändert sich z. B. nur die
+  Strompreissteigerung, rechnen Ertrag, Energiefluss und Kosten nicht neu.
+- Nicht gemerkt werden Läufe, die Meldungen in ``errors_list`` geschrieben
+  haben (z. B. PVGIS-Timeout), damit sie beim nächsten Mal erneut versucht
+  werden.
+- Eingaben, die sich nicht hashen lassen (z. B. das Preis-Matrix-DataFrame),
+  werden als ``opaque`` übergeben; eine Fingerprint-Eingabe steht für sie ein.
+- Pro Lauf wird die Zeit je Stufe (und ob sie aus dem Cache kam) erfasst.
+"""
+
+from __future__ import annotations
+
+import copy
+import hashlib
+import inspect
+import math
+import struct
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_MEMO_ENTRIES_PER_STAGE = 64
+
+# Parameter, die jede Stufe vom Graphen bekommt (keine Eingaben im Sinne des Graphen)
+_STAGE_RUNTIME_PARAMS = ("results", "errors_list")
+
+
+class UnhashableStageInput(TypeError):
+    pass
+
+
+def _feed(h, value: Any) -> None:
+    if value is None:
+        h.update(b"N")
+    elif value is True or value is False:
+        h.update(b"B1" if value else b"B0")
+    elif isinstance(value, int):
+        h.update(b"I%d;" % value)
+    elif isinstance(value, float):
+        h.update(b"F" + struct.pack("<d", value) if not math.isnan(value) else b"Fnan")
+    elif isinstance(value, str):
+        data = value.encode("utf-8", "surrogatepass")
+        h.update(b"S%d;" % len(data))
+        h.update(data)
+    elif isinstance(value, (bytes, bytearray)):
+        h.update(b"Y%d;" % len(value))
+        h.update(value)
+    elif isinstance(value, Mapping):
+        h.update(b"D%d;" % len(value))
+        for k, v in value.items():
+            _feed(h, k)
+            _feed(h, v)
+    elif isinstance(value, (list, tuple)):
+        h.update((b"L%d;" if isinstance(value, list) else b"T%d;") % len(value))
+        for item in value:
+            _feed(h, item)
+    elif isinstance(value, np.ndarray):
+        h.update(b"A" + str(value.dtype).encode() + repr(value.shape).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, np.generic):
+        _feed(h, value.item())
+    else:
+        raise UnhashableStageInput(f"Nicht hashbarer Stufen-Input: {type(value).__name__}")
+
+
+def fingerprint(value: Any) -> str:
+    """Stabiler Hash über (verschachtelte) Python-/NumPy-Werte."""
+    h = hashlib.blake2b(digest_size=16)
+    _feed(h, value)
+    return h.hexdigest()
+
+
+def project_mapping(source: Any, keys: Tuple[str, ...]) -> Dict[str, Any]:
+    """Teilmenge eines Dicts; fehlende Keys bleiben fehlend (``.get``-Defaults greifen weiter)."""
+    if not isinstance(source, Mapping):
+        return {}
+    return {k: source[k] for k in keys if k in source}
+
+
+@dataclass(frozen=True)
+class CalculationStage:
+    name: str
+    func: Callable[..., Dict[str, Any]]
+    outputs: Tuple[str, ...] = ()
+    projections: Mapping[str, Tuple[str, ...]] = field(default_factory=dict)
+    opaque: Tuple[str, ...] = ()  # werden übergeben, aber nicht gehasht
+    memoize: bool = True
+
+    @property
+    def inputs(self) -> Tuple[str, ...]:
+        params = inspect.signature(self.func).parameters
+        return tuple(p for p in params if p not in _STAGE_RUNTIME_PARAMS)
+
+
+@dataclass(frozen=True)
+class StageTiming:
+    stage: str
+    ms: float
+    cached: bool
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"stage": self.stage, "ms": round(self.ms, 3), "cached": self.cached}
+
+
+class CalculationGraph:
+    def __init__(
+        self,
+        stages: Tuple[CalculationStage, ...],
+        memo_entries_per_stage: int = DEFAULT_MEMO_ENTRIES_PER_STAGE,
+    ):
+        self.stages = tuple(stages)
+        self.memo_entries_per_stage = memo_entries_per_stage
+        self._lock = threading.Lock()
+        self._memo: Dict[str, "OrderedDict[str, Tuple[Dict[str, Any], Dict[str, Any]]]"] = {
+            s.name: OrderedDict() for s in self.stages
+        }
+        self.stats = {s.name: {"hits": 0, "misses": 0} for s in self.stages}
+        self._inputs = {s.name: s.inputs for s in self.stages}
+        producer: Dict[str, str] = {}
+        self.dependencies: Dict[str, Tuple[str, ...]] = {}
+        for stage in self.stages:
+            for proj_name in stage.projections:
+                if proj_name not in self._inputs[stage.name]:
+                    raise ValueError(f"Stufe '{stage.name}': Projektion auf unbekannte Eingabe '{proj_name}'")
+            deps = []
+            for name in self._inputs[stage.name]:
+                src = producer.get(name)
+                if src is not None and src not in deps:
+                    deps.append(src)
+            self.dependencies[stage.name] = tuple(deps)
+            for out in stage.outputs:
+                if out in producer:
+                    raise ValueError(f"Ausgabe '{out}' wird von '{producer[out]}' und '{stage.name}' erzeugt")
+                producer[out] = stage.name
+        self.producer = producer
+
+    def downstream(self, stage_name: str) -> Tuple[str, ...]:
+        """Alle Stufen, die (transitiv) von ``stage_name`` abhängen."""
+        affected = {stage_name}
+        for stage in self.stages:
+            if any(dep in affected for dep in self.dependencies[stage.name]):
+                affected.add(stage.name)
+        affected.discard(stage_name)
+        return tuple(s.name for s in self.stages if s.name in affected)
+
+    def _stage_kwargs(self, stage: CalculationStage, env: Mapping[str, Any]) -> Dict[str, Any]:
+        kwargs = {}
+        for name in self._inputs[stage.name]:
+            if name not in env:
+                raise KeyError(f"Stufe '{stage.name}': Eingabe '{name}' fehlt")
+            value = env[name]
+            keys = stage.projections.get(name)
+            kwargs[name] = project_mapping(value, keys) if keys is not None else value
+        return kwargs
+
+    def _memo_key(self, stage: CalculationStage, kwargs: Mapping[str, Any]) -> Optional[str]:
+        if not stage.memoize:
+            return None
+        try:
+            return fingerprint(
+                (stage.name, [(k, v) for k, v in kwargs.items() if k not in stage.opaque])
+            )
+        except UnhashableStageInput:
+            return None
+
+    def run(
+        self,
+        env: Dict[str, Any],
+        results: Dict[str, Any],
+        errors_list: List[str],
+    ) -> List[StageTiming]:
+        """Führt alle Stufen in Reihenfolge aus; ``env`` wird um die Ausgaben ergänzt."""
+        timings: List[StageTiming] = []
+        for stage in self.stages:
+            t0 = time.perf_counter()
+            kwargs = self._stage_kwargs(stage, env)
+            key = self._memo_key(stage, kwargs)
+            cached_entry = None
+            if key is not None:
+                with self._lock:
+                    memo = self._memo[stage.name]
+                    cached_entry = memo.get(key)
+                    if cached_entry is not None:
+                        memo.move_to_end(key)
+                        self.stats[stage.name]["hits"] += 1
+                    else:
+                        self.stats[stage.name]["misses"] += 1
+            if cached_entry is not None:
+                # Kopie: Aufrufer dürfen ihre results verändern, ohne den Cache zu treffen
+                stage_results, outputs = copy.deepcopy(cached_entry)
+            else:
+                stage_results: Dict[str, Any] = {}
+                stage_errors: List[str] = []
+                outputs = stage.func(results=stage_results, errors_list=stage_errors, **kwargs) or {}
+                missing = [o for o in stage.outputs if o not in outputs]
+                if missing or len(outputs) != len(stage.outputs):
+                    raise RuntimeError(
+                        f"Stufe '{stage.name}' liefert {sorted(outputs)}, erwartet {list(stage.outputs)}"
+                    )
+                errors_list.extend(stage_errors)
+                if key is not None and not stage_errors:
+                    entry = copy.deepcopy((stage_results, outputs))
+                    with self._lock:
+                        memo = self._memo[stage.name]
+                        memo[key] = entry
+                        while len(memo) > self.memo_entries_per_stage:
+                            memo.popitem(last=False)
+            results.update(stage_results)
+            env.update(outputs)
+            timings.append(StageTiming(stage.name, (time.perf_counter() - t0) * 1000.0, cached_entry is not None))
+        return timings
+
+    def clear(self) -> None:
+        with self._lock:
+            for memo in self._memo.values():
+                memo.clear()
+            for counters in self.stats.values():
+                counters["hits"] = counters["misses"] = 0
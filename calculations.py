@@ -5,16 +5,34 @@ Hauptmodul für die Berechnung von Photovoltaikanlagen und Wirtschaftlichkeitsan
 
 from __future__ import annotations
 
+import functools
 import io
+import multiprocessing
+import os
 import pandas as pd
 import numpy as np
 import json
 import math
-from typing import Dict, Any, List, Optional, Union, Tuple
+import time
+from typing import Dict, Any, Iterable, Iterator, List, Mapping, Optional, Union, Tuple
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import traceback
 import requests  # Für HTTP-Anfragen an PVGIS
 
+# Kernmodule der Berechnung (Stufen-Pipeline, Preis-Matrix-Lookup, Jahresvektoren):
+# perform_calculations ist darauf aufgebaut, sie sind daher bewusst Pflicht-Importe.
+from calculation_graph import CalculationGraph, CalculationStage, StageTiming
+from price_matrix_index import PriceMatrixIndex
+from projection_engine import (
+    break_even_search,
+    levelized_cost,
+    net_present_value,
+    project_costs_without_pv,
+    project_financials,
+    sequential_sum,
+)
+
 # Streamlit Import für UI-Funktionen
 try:
     import streamlit as st
@@ -173,6 +191,9 @@ def Dummy_load_admin_setting_calc(key, default=None):
             "default_performance_ratio_percent": 78.0,
             "peak_shaving_effect_kw_estimate": 0.0,
             "optimal_storage_factor": 1.0,
+            "energy_flow_model": "hourly",  # "hourly" (8760 h) oder "monthly"
+            "storage_c_rate": 0.5,
+            "storage_min_soc_percent": 0.0,
             "app_debug_mode_enabled": False,
         }
     return default
@@ -202,6 +223,26 @@ except ImportError:
 except Exception:
     real_load_admin_setting = Dummy_load_admin_setting_calc
 
+try:
+    from database import get_admin_settings_snapshot as real_get_admin_settings_snapshot
+except Exception:
+    real_get_admin_settings_snapshot = None
+_DB_LOAD_ADMIN_SETTING = real_load_admin_setting
+
+
+def _current_admin_settings_snapshot() -> Optional[Mapping]:
+    """Snapshot der DB-Settings, sofern load_admin_setting nicht ersetzt wurde
+    (Dummy oder Test-Patch lesen weiter über die Funktion)."""
+    if real_get_admin_settings_snapshot is None:
+        return None
+    if real_load_admin_setting is not _DB_LOAD_ADMIN_SETTING or real_load_admin_setting is Dummy_load_admin_setting_calc:
+        return None
+    try:
+        return real_get_admin_settings_snapshot()
+    except Exception as e_snapshot:
+        print(f"CALC: Settings-Snapshot nicht verfügbar: {e_snapshot}")
+        return None
+
 _PRODUCT_DB_AVAILABLE = True
 try:
     from product_db import (
@@ -233,82 +274,207 @@ except Exception:
     )
 
 
+# --- Persistenter PVGIS-Cache (optional) ---
+try:
+    from pvgis_cache import get_pvgis_cache, is_cache_only_mode
+
+    _PVGIS_CACHE_AVAILABLE = True
+except ImportError:
+    get_pvgis_cache = None  # type: ignore[assignment]
+
+    def is_cache_only_mode(setting_value: Any = None) -> bool:  # type: ignore[misc]
+        return False
+
+    _PVGIS_CACHE_AVAILABLE = False
+
+
+# --- Stündliche Energiefluss-Simulation (optional, sonst monatliches Modell) ---
+try:
+    from energy_flow_engine import simulate_year_from_monthly
+
+    _ENERGY_FLOW_ENGINE_AVAILABLE = True
+except ImportError:
+    simulate_year_from_monthly = None  # type: ignore[assignment]
+    _ENERGY_FLOW_ENGINE_AVAILABLE = False
+
+
+# --- Monte-Carlo-Risikoanalyse (optional, nur für run_monte_carlo_simulation) ---
+try:
+    from monte_carlo_engine import run_monte_carlo
+
+    _MONTE_CARLO_ENGINE_AVAILABLE = True
+except ImportError:
+    run_monte_carlo = None  # type: ignore[assignment]
+    _MONTE_CARLO_ENGINE_AVAILABLE = False
+
+
+# --- Persistente Ablage der geparsten Preis-Matrix (optional) ---
+try:
+    from price_matrix_sidecar import load_price_matrix_sidecar, save_price_matrix_sidecar
+
+    _PRICE_MATRIX_SIDECAR_AVAILABLE = True
+except ImportError:
+    load_price_matrix_sidecar = None  # type: ignore[assignment]
+    save_price_matrix_sidecar = None  # type: ignore[assignment]
+    _PRICE_MATRIX_SIDECAR_AVAILABLE = False
+
+
 # --- Performance: einfacher Modul-Cache für Preis-Matrix ---
 # Hinweis: Admin-Settings liefern die Matrix als Bytes (Excel) oder String (CSV).
-# Wir berechnen je Quelle einen stabilen Hash und cachen das geparste DataFrame,
-# bis sich der Inhalt ändert. Dadurch werden teure pd.read_excel/pd.read_csv
-# in perform_calculations bei unveränderten Daten vermieden.
+# Das geparste DataFrame wird gecacht, bis sich der Inhalt ändert. Erkannt wird
+# das möglichst billig: über den Versions-Stempel des Settings (Revision aus
+# admin_settings, siehe get_admin_setting_stamp) oder dasselbe Rohdaten-Objekt;
+# nur ohne Stempel wird ein Hash über den Inhalt gebildet. Neu geparste
+# Matrizen landen zusätzlich als NPZ-Datei auf der Platte (price_matrix_sidecar),
+# so dass auch ein frisch gestarteter Prozess pd.read_excel/pd.read_csv spart.
 _PRICE_MATRIX_CACHE: Dict[str, Any] = {
-    "excel_hash": None,
-    "csv_hash": None,
+    "source": "Keine",  # "Excel"/"CSV" des gecachten df
     "df": None,
-    "source": "Keine",
+    "lookup": None,  # PriceMatrixIndex zum df
+    "data": None,  # Rohdaten zum df (nur Referenz, für Identitätsvergleich)
+    "stamp": None,  # Versions-Stempel der Rohdaten (falls bekannt)
+    "hash": None,  # Inhalts-Hash der Rohdaten (erst bei Bedarf berechnet)
+    "fingerprint": None,  # Stempel oder Hash, mit dem das df geladen wurde
 }
 
+# Letzter gehashter Wert je Typ: Dasselbe (unveränderliche) Objekt wird nicht
+# erneut gehasht, z. B. wenn im Batch immer dieselben Matrix-Bytes übergeben werden.
+_HASH_MEMO: Dict[str, Tuple[Any, Optional[str]]] = {}
+
+
 def _hash_bytes(data: Optional[bytes]) -> Optional[str]:
     if not data:
         return None
+    memo = _HASH_MEMO.get("bytes")
+    if memo is not None and memo[0] is data:
+        return memo[1]
     try:
         import hashlib
 
-        return hashlib.sha256(data).hexdigest()
+        digest = hashlib.sha256(data).hexdigest()
+        if isinstance(data, bytes):
+            _HASH_MEMO["bytes"] = (data, digest)
+        return digest
     except Exception:
         return str(len(data)) if data is not None else None
 
 def _hash_text(text: Optional[str]) -> Optional[str]:
     if not text:
         return None
+    memo = _HASH_MEMO.get("text")
+    if memo is not None and memo[0] is text:
+        return memo[1]
     try:
         import hashlib
 
-        return hashlib.sha256(text.encode("utf-8", errors="ignore")).hexdigest()
+        digest = hashlib.sha256(text.encode("utf-8", errors="ignore")).hexdigest()
+        _HASH_MEMO["text"] = (text, digest)
+        return digest
     except Exception:
         return str(len(text)) if text is not None else None
 
+def _price_matrix_cache_hit(source: str, data: Any, stamp: Optional[str]) -> bool:
+    """Passt das gecachte df zu ``data``? Stempel/Identität vor Hash."""
+    cache = _PRICE_MATRIX_CACHE
+    if cache.get("df") is None or cache.get("source") != source:
+        return False
+    if data is cache.get("data") or (stamp and stamp == cache.get("stamp")):
+        return True
+    if stamp and cache.get("stamp"):
+        return False  # neue Revision des Settings
+    hash_func = _hash_bytes if source == "Excel" else _hash_text
+    if cache.get("hash") is None:
+        cache["hash"] = hash_func(cache.get("data"))
+    return cache["hash"] is not None and hash_func(data) == cache["hash"]
+
+
+def _load_price_matrix_source(
+    source: str,
+    data: Any,
+    stamp: Optional[str],
+    errors_list: List[str],
+) -> Optional[pd.DataFrame]:
+    if _price_matrix_cache_hit(source, data, stamp):
+        _PRICE_MATRIX_CACHE["data"] = data
+        if stamp:
+            _PRICE_MATRIX_CACHE["stamp"] = stamp
+        return _PRICE_MATRIX_CACHE["df"]
+
+    content_hash = None
+    if not stamp:
+        content_hash = _hash_bytes(data) if source == "Excel" else _hash_text(data)
+    fingerprint = f"rev:{stamp}" if stamp else content_hash
+    df = load_price_matrix_sidecar(source, fingerprint) if _PRICE_MATRIX_SIDECAR_AVAILABLE else None
+    from_sidecar = df is not None
+    if df is None:
+        if source == "Excel":
+            df = parse_module_price_matrix_excel(data, errors_list)
+        else:
+            df = parse_module_price_matrix_csv(data, errors_list)
+    if df is None or df.empty:
+        return None
+    _PRICE_MATRIX_CACHE.update({
+        "source": source,
+        "df": df,
+        "lookup": PriceMatrixIndex.from_frame(df),
+        "data": data,
+        "stamp": stamp,
+        "hash": content_hash,
+        "fingerprint": fingerprint,
+    })
+    if not from_sidecar and _PRICE_MATRIX_SIDECAR_AVAILABLE:
+        save_price_matrix_sidecar(source, fingerprint, df)
+    return df
+
+
 def load_price_matrix_df_with_cache(
     price_matrix_excel_bytes: Optional[bytes],
     price_matrix_csv_content: Optional[str],
     errors_list: List[str],
+    excel_stamp: Optional[str] = None,
+    csv_stamp: Optional[str] = None,
 ) -> Tuple[Optional[pd.DataFrame], str]:
-    global _PRICE_MATRIX_CACHE
-
-    excel_hash = _hash_bytes(price_matrix_excel_bytes) if price_matrix_excel_bytes else None
-    csv_hash = _hash_text(price_matrix_csv_content) if price_matrix_csv_content else None
+    """Geparste Preis-Matrix (Excel bevorzugt, sonst CSV) und ihre Quelle.
 
+    ``excel_stamp``/``csv_stamp`` sind die Versions-Stempel der Settings
+    (``AdminSettingsSnapshot.stamp``); ohne Stempel wird der Inhalt gehasht.
+    """
     # Wenn Excel-Daten vorhanden sind, bevorzugen wir diese; sonst CSV
-    if excel_hash:
-        if _PRICE_MATRIX_CACHE.get("excel_hash") == excel_hash and _PRICE_MATRIX_CACHE.get("df") is not None:
-            return _PRICE_MATRIX_CACHE.get("df"), _PRICE_MATRIX_CACHE.get("source", "Excel")
-        df_excel = parse_module_price_matrix_excel(price_matrix_excel_bytes, errors_list)
-        if df_excel is not None and not df_excel.empty:
-            _PRICE_MATRIX_CACHE.update({
-                "excel_hash": excel_hash,
-                "csv_hash": None,  # Excel gewinnt
-                "df": df_excel,
-                "source": "Excel",
-            })
+    if price_matrix_excel_bytes:
+        df_excel = _load_price_matrix_source("Excel", price_matrix_excel_bytes, excel_stamp, errors_list)
+        if df_excel is not None:
             return df_excel, "Excel"
-        # Excel fehlgeschlagen -> ggf. CSV versuchen (Cache invalidieren)
-        _PRICE_MATRIX_CACHE.update({"excel_hash": None})
-
-    if csv_hash:
-        if _PRICE_MATRIX_CACHE.get("csv_hash") == csv_hash and _PRICE_MATRIX_CACHE.get("df") is not None:
-            return _PRICE_MATRIX_CACHE.get("df"), _PRICE_MATRIX_CACHE.get("source", "CSV")
-        df_csv = parse_module_price_matrix_csv(price_matrix_csv_content, errors_list)
-        if df_csv is not None and not df_csv.empty:
-            _PRICE_MATRIX_CACHE.update({
-                "excel_hash": None,
-                "csv_hash": csv_hash,
-                "df": df_csv,
-                "source": "CSV",
-            })
+        # Excel fehlgeschlagen -> ggf. CSV versuchen
+
+    if price_matrix_csv_content:
+        df_csv = _load_price_matrix_source("CSV", price_matrix_csv_content, csv_stamp, errors_list)
+        if df_csv is not None:
             return df_csv, "CSV"
-        _PRICE_MATRIX_CACHE.update({"csv_hash": None})
 
     # Weder Excel noch CSV gültig
     return None, "Keine"
 
 
+def get_price_matrix_fingerprint(df: Optional[pd.DataFrame]) -> Optional[str]:
+    """Stempel/Hash, mit dem die gecachte Matrix ``df`` geladen wurde."""
+    if df is not None and _PRICE_MATRIX_CACHE.get("df") is df:
+        return _PRICE_MATRIX_CACHE.get("fingerprint")
+    return None
+
+
+def get_price_matrix_lookup(df: Optional[pd.DataFrame]) -> Optional[PriceMatrixIndex]:
+    """Lookup-Struktur zur Matrix; für die gecachte Matrix wird sie nur einmal gebaut."""
+    if df is None:
+        return None
+    if _PRICE_MATRIX_CACHE.get("df") is df:
+        lookup = _PRICE_MATRIX_CACHE.get("lookup")
+        if lookup is None:
+            lookup = PriceMatrixIndex.from_frame(df)
+            _PRICE_MATRIX_CACHE["lookup"] = lookup
+        return lookup
+    return PriceMatrixIndex.from_frame(df)
+
+
 def parse_module_price_matrix_csv(
     csv_data: Union[str, io.StringIO], errors_list: List[str]
 ) -> Optional[pd.DataFrame]:
@@ -1678,66 +1844,42 @@ class AdvancedCalculationsIntegrator:
     def run_monte_carlo_simulation(
         self, calc_results: Dict[str, Any], n_simulations: int, confidence_level: int
     ) -> Dict[str, Any]:
-        """Monte-Carlo-Simulation für Risikobewertung"""
-        np.random.seed(42)  # Für reproduzierbare Ergebnisse
-
+        """Monte-Carlo-Simulation für Risikobewertung (vektorisiert, siehe monte_carlo_engine)"""
+        if not _MONTE_CARLO_ENGINE_AVAILABLE:
+            raise RuntimeError("Monte-Carlo-Simulation nicht verfügbar: monte_carlo_engine konnte nicht importiert werden")
         base_investment = calc_results.get("total_investment_netto", 20000)
         base_annual_benefit = calc_results.get("annual_financial_benefit_year1", 1500)
-        lifetime = 25
-
-        npv_distribution = []
-
-        for _ in range(n_simulations):
-            # Variationen der Parameter (normalverteilt)
-            investment = np.random.normal(base_investment, base_investment * 0.1)
-            annual_benefit = np.random.normal(
-                base_annual_benefit, base_annual_benefit * 0.15
-            )
-            discount_rate = np.random.normal(0.04, 0.01)
-
-            # NPV berechnen
-            npv = -investment
-            for year in range(1, lifetime + 1):
-                npv += annual_benefit / (1 + discount_rate) ** year
-
-            npv_distribution.append(npv)
-
-        npv_distribution = np.array(npv_distribution)
-
-        # Statistiken
-        npv_mean = np.mean(npv_distribution)
-        npv_std = np.std(npv_distribution)
-
-        # Konfidenzintervall
-        alpha = (100 - confidence_level) / 2
-        npv_lower_bound = np.percentile(npv_distribution, alpha)
-        npv_upper_bound = np.percentile(npv_distribution, 100 - alpha)
-
-        # Value at Risk
-        var_5 = np.percentile(npv_distribution, 5)
-
-        # Erfolgswahrscheinlichkeit
-        success_probability = (npv_distribution > 0).sum() / n_simulations * 100
-
-        # Sensitivitätsanalyse (vereinfacht)
-        sensitivity_analysis = [
-            {"parameter": "Investitionskosten", "impact": -0.8},
-            {"parameter": "Jährlicher Nutzen", "impact": 0.9},
-            {"parameter": "Diskontierungsrate", "impact": -0.4},
-            {"parameter": "Strompreissteigerung", "impact": 0.6},
-            {"parameter": "Anlagenlebensdauer", "impact": 0.3},
-        ]
+        savings_year1 = calc_results.get(
+            "annual_electricity_cost_savings_self_consumption_year1"
+        )
+        feed_in_year1 = calc_results.get("annual_feed_in_revenue_year1")
+        if not isinstance(savings_year1, (int, float)) or not isinstance(
+            feed_in_year1, (int, float)
+        ):
+            # Ohne Aufteilung: gesamten Nutzen als konstanten Betrag behandeln
+            savings_year1, feed_in_year1 = 0.0, float(base_annual_benefit or 0.0)
+        else:
+            # Steuervorteil o. ä. wie Einspeiseerlöse (nominal konstant) behandeln
+            feed_in_year1 = float(base_annual_benefit or 0.0) - float(savings_year1)
 
-        return {
-            "npv_distribution": npv_distribution.tolist(),
-            "npv_mean": npv_mean,
-            "npv_std": npv_std,
-            "npv_lower_bound": npv_lower_bound,
-            "npv_upper_bound": npv_upper_bound,
-            "var_5": var_5,
-            "success_probability": success_probability,
-            "sensitivity_analysis": sensitivity_analysis,
-        }
+        price_increase_percent = calc_results.get(
+            "electricity_price_increase_rate_effective_percent", 3.0
+        )
+        mc = run_monte_carlo(
+            investment=float(base_investment or 0.0),
+            savings_year1=float(savings_year1),
+            feed_in_revenue_year1=float(feed_in_year1),
+            maintenance_year1=float(
+                calc_results.get("annual_maintenance_costs_eur_year1", 0.0) or 0.0
+            ),
+            n_simulations=n_simulations,
+            confidence_level=confidence_level,
+            lifetime_years=25,
+            price_increase_mean=float(price_increase_percent or 0.0) / 100.0,
+            seed=42,  # Für reproduzierbare Ergebnisse
+        )
+        mc["npv_distribution"] = mc["npv_distribution"].tolist()
+        return mc
 
     def calculate_subsidy_scenarios(
         self, calc_results: Dict[str, Any]
@@ -2151,6 +2293,33 @@ def convert_orientation_to_pvgis_azimuth(orientation_text: Optional[str]) -> int
     return 0  # Fallback auf Süd
 
 
+PVGIS_REFERENCE_PEAK_POWER_KWP = 1.0
+
+
+def scale_pvgis_profile(
+    profile: Dict[str, Any], peak_power_kwp: float
+) -> Dict[str, Any]:
+    """Skaliert ein (normiertes) PVGIS-Profil auf die gewünschte Anlagenleistung.
+
+    Der spezifische Ertrag (kWh/kWp) bleibt unverändert, Monats- und Jahreswerte
+    werden linear mit ``peak_power_kwp / reference_peak_power_kwp`` skaliert.
+    """
+    reference_kwp = float(
+        profile.get("reference_peak_power_kwp", PVGIS_REFERENCE_PEAK_POWER_KWP)
+        or PVGIS_REFERENCE_PEAK_POWER_KWP
+    )
+    factor = float(peak_power_kwp) / reference_kwp
+    return {
+        "monthly_production_kwh": [
+            float(m or 0.0) * factor for m in profile.get("monthly_production_kwh", [])
+        ],
+        "annual_production_kwh": float(profile.get("annual_production_kwh", 0.0) or 0.0)
+        * factor,
+        "specific_yield_kwh_kwp_pa": profile.get("specific_yield_kwh_kwp_pa", 0.0),
+        "pvgis_source": profile.get("pvgis_source", "PVGIS-TMY"),
+    }
+
+
 def get_pvgis_data(
     latitude: float,
     longitude: float,
@@ -2161,8 +2330,16 @@ def get_pvgis_data(
     texts: Optional[Dict[str, str]] = None,
     errors_list: Optional[List[str]] = None,
     debug_mode_enabled: bool = False,
+    cache_only: bool = False,
 ) -> Optional[Dict[str, Any]]:
-    """Holt PV-Produktionsdaten von der PVGIS API."""
+    """Holt PV-Produktionsdaten von der PVGIS API.
+
+    Abgefragt wird das normierte 1-kWp-Profil des Standorts, das anschließend
+    per ``scale_pvgis_profile`` auf ``peak_power_kwp`` skaliert wird.
+    Profile werden im persistenten PVGIS-Cache (pvgis_cache.py) abgelegt.
+    Mit ``cache_only=True`` (Offline-Modus) wird keine Anfrage gesendet und
+    auch ein abgelaufener Cache-Eintrag akzeptiert.
+    """
     local_errors: List[str] = []  # Für interne Fehler dieser Funktion
     texts = texts if texts is not None else {}  # Sicherstellen, dass texts ein Dict ist
     effective_errors_list = errors_list if errors_list is not None else local_errors
@@ -2191,10 +2368,13 @@ def get_pvgis_data(
         return None
 
     base_url = "https://re.jrc.ec.europa.eu/api/seriescalc"
+    # PVGIS skaliert linear mit 'peakpower'. Abgefragt (und gecacht) wird daher
+    # immer das normierte 1-kWp-Profil; die Anlagengröße wird lokal aufmultipliziert.
+    # Eine Änderung der Modulanzahl löst so keine neue API-Anfrage aus.
     params = {
         "lat": latitude,
         "lon": longitude,
-        "peakpower": peak_power_kwp,
+        "peakpower": PVGIS_REFERENCE_PEAK_POWER_KWP,
         "loss": system_loss_percent,
         "pvtechchoice": "crystSi",
         "mountingplace": "building",
@@ -2213,6 +2393,26 @@ def get_pvgis_data(
 
     error_msg_pvgis = ""  # Initialisiere Fehlermeldung
 
+    pvgis_cache = None
+    if _PVGIS_CACHE_AVAILABLE and get_pvgis_cache is not None:
+        try:
+            pvgis_cache = get_pvgis_cache()
+            cached_profile = pvgis_cache.get(params, allow_stale=cache_only)
+            if cached_profile is not None:
+                return scale_pvgis_profile(cached_profile, peak_power_kwp)
+        except Exception:
+            pvgis_cache = None  # Cache-Probleme dürfen die Berechnung nicht blockieren
+
+    if cache_only:
+        effective_errors_list.append(
+            texts.get(
+                "pvgis_cache_only_miss",
+                "PVGIS: Offline-Modus aktiv und keine gecachten Daten für diesen Standort vorhanden. Nutze manuelle Ertragsberechnung.",
+            )
+            or ""
+        )
+        return None
+
     try:
         response = requests.get(
             base_url, params=params, timeout=25
@@ -2245,7 +2445,7 @@ def get_pvgis_data(
         if (
             not monthly_production_kwh
             or len(monthly_production_kwh) != 12
-            or (annual_production_kwh == 0.0 and peak_power_kwp > 0)
+            or annual_production_kwh == 0.0
         ):
             error_msg_pvgis = (
                 texts.get(
@@ -2258,14 +2458,18 @@ def get_pvgis_data(
             effective_errors_list.append(error_msg_pvgis)
             return None
 
-        return {
+        pvgis_profile = {
             "monthly_production_kwh": monthly_production_kwh,
             "annual_production_kwh": annual_production_kwh,
             "specific_yield_kwh_kwp_pa": specific_yield_kwh_kwp_pa,
             "pvgis_source": data.get("meta", {}).get(
                 "source", "PVGIS-TMY"
             ),  # Quelle der Daten (z.B. TMY, ERA5)
+            "reference_peak_power_kwp": PVGIS_REFERENCE_PEAK_POWER_KWP,
         }
+        if pvgis_cache is not None:
+            pvgis_cache.set(params, pvgis_profile)
+        return scale_pvgis_profile(pvgis_profile, peak_power_kwp)
 
     except requests.exceptions.HTTPError as e_http:
         status_code_val = (
@@ -2328,295 +2532,133 @@ def get_pvgis_data(
     return None
 
 
-def perform_calculations(
-    project_data: Dict[str, Any],
-    texts: Dict[str, str],
+# --- perform_calculations als Stufen-Graph ---
+# Jede Stufe bekommt ihre Eingaben als Parameter und schreibt ihre Ergebnis-Keys
+# in ein eigenes results-Dict; calculation_graph merkt sich beides je Eingabe-Hash.
+OPTIONAL_COMPONENT_COST_KEYS = {
+    "selected_wallbox_id": "cost_wallbox_aufpreis_netto",
+    "selected_ems_id": "cost_ems_aufpreis_netto",
+    "selected_optimizer_id": "cost_optimizer_aufpreis_netto",  # Annahme: pauschal oder pro Modul * Menge? Hier pauschal.
+    "selected_carport_id": "cost_carport_aufpreis_netto",
+    "selected_notstrom_id": "cost_notstrom_aufpreis_netto",
+    "selected_tierabwehr_id": "cost_tierabwehr_aufpreis_netto",
+}
+
+
+def _calc_stage_yield(
+    results: Dict[str, Any],
     errors_list: List[str],
-    simulation_duration_user: Optional[int] = None,
-    electricity_price_increase_user: Optional[float] = None,
+    project_details: Dict[str, Any],
+    global_constants: Dict[str, Any],
+    texts: Dict[str, str],
+    anlage_kwp: float,
+    pvgis_enabled: bool,
+    pvgis_cache_only: bool,
+    app_debug_mode_is_enabled: bool,
+    DEFAULT_YIELD_KWH_PER_KWP_ANNUAL: float,
+    global_yield_adjustment_percent: float,
 ) -> Dict[str, Any]:
-    results: Dict[str, Any] = {"calculation_errors": errors_list}
-    customer_data = project_data.get("customer_data", {})
-    project_details = project_data.get("project_details", {})
-    economic_data = project_data.get("economic_data", {})
-
-    # KORREKTUR: Definition von module_quantity an den Anfang verschieben
-    # Anlagengröße (Modulanzahl wird früh benötigt)
-    module_quantity = int(project_details.get("module_quantity", 0) or 0)
-    # selected_module_id wird später für die Kapazität benötigt, aber die Anzahl ist jetzt schon da.
+    """Stufe Ertrag: PVGIS oder manuelle Ertragsberechnung (Jahr 1)."""
+    pvgis_results_data = None
 
-    global_constants = real_load_admin_setting("global_constants")
-    if not isinstance(global_constants, dict) or not global_constants:
-        global_constants = Dummy_load_admin_setting_calc("global_constants")
-        errors_list.append(
-            texts.get(
-                "warn_global_constants_fallback",
-                "Warnung: Fallback für globale Konstanten verwendet.",
+    if (
+        pvgis_enabled
+        and project_details.get("latitude") is not None
+        and project_details.get("longitude") is not None
+        and anlage_kwp > 0
+    ):
+        try:
+            lat = float(project_details["latitude"])
+            lon = float(project_details["longitude"])
+            # Nur Koordinaten prüfen wenn PV GIS aktiviert ist
+            if (
+                abs(lat) < 1e-5 and abs(lon) < 1e-5
+            ):  # Standardkoordinaten (0,0) sind meist ungültig für PVGIS
+                errors_list.append(
+                    texts.get(
+                        "warn_pvgis_zero_coords",
+                        "PVGIS: Ungültige Standardkoordinaten (0,0) erhalten. Nutze manuelle Ertragsberechnung.",
+                    )
+                )
+            elif not (
+                -90 <= lat <= 90 and -180 <= lon <= 180
+            ):  # Gültigkeitsbereich prüfen
+                errors_list.append(
+                    texts.get(
+                        "pvgis_invalid_lat_lon_range",
+                        "PVGIS: Breiten- oder Längengrade außerhalb des gültigen Bereichs.",
+                    )
+                )
+            else:
+                tilt_val = int(project_details.get("roof_inclination_deg", 30) or 30)
+                orientation_text_val = project_details.get("roof_orientation", "Süd")
+                azimuth_val = convert_orientation_to_pvgis_azimuth(orientation_text_val)
+                SYSTEM_LOSS_PVGIS = float(
+                    global_constants.get("pvgis_system_loss_default_percent", 14.0)
+                    or 14.0
+                )
+                pvgis_results_data = get_pvgis_data(
+                    lat,
+                    lon,
+                    anlage_kwp,
+                    tilt_val,
+                    azimuth_val,
+                    SYSTEM_LOSS_PVGIS,
+                    texts,
+                    errors_list,
+                    debug_mode_enabled=app_debug_mode_is_enabled,
+                    cache_only=pvgis_cache_only,
+                )
+        except (ValueError, TypeError) as e_coords:
+            errors_list.append(
+                (
+                    texts.get(
+                        "error_geocoding_conversion_calc",
+                        "Fehler Konvertierung Geodaten für PVGIS.",
+                    )
+                    or ""
+                )
+                + f" Details: {e_coords}"
             )
-        )
+            pvgis_results_data = None  # Sicherstellen, dass es None ist bei Fehler
+    elif not pvgis_enabled:
+        # PVGIS ist deaktiviert - verwende manuelle Berechnung ohne Meldung
+        pvgis_results_data = None
 
-    app_debug_mode_is_enabled = global_constants.get("app_debug_mode_enabled", False)
-    if not isinstance(app_debug_mode_is_enabled, bool):
-        app_debug_mode_is_enabled = False
-    # --- Preis-Matrix laden (mit Cache) ---
-    price_matrix_excel_bytes = real_load_admin_setting("price_matrix_excel_bytes", None)
-    price_matrix_csv_content = real_load_admin_setting("price_matrix_csv_data", "")
-    price_matrix_df_for_lookup, pm_source = load_price_matrix_df_with_cache(
-        price_matrix_excel_bytes if isinstance(price_matrix_excel_bytes, (bytes, bytearray)) else None,
-        price_matrix_csv_content if isinstance(price_matrix_csv_content, str) else None,
-        errors_list,
-    )
-    results["price_matrix_source_type"] = pm_source
-    results["price_matrix_loaded_successfully"] = bool(
-        price_matrix_df_for_lookup is not None and not price_matrix_df_for_lookup.empty
-    )
-    # if app_debug_mode_is_enabled: print(f"CALC: Preis-Matrix für Lookup geladen: {results['price_matrix_loaded_successfully']} (Quelle: {results.get('price_matrix_source_type', 'Keine')})") # Bereinigt
+    annual_pv_production_kwh_base, monthly_pv_production_kwh_base = 0.0, [0.0] * 12
+    results["pvgis_data_used"] = False  # Standardmäßig auf False setzen
 
-    # Einspeisevergütungen laden
-    feed_in_tariffs_block = real_load_admin_setting(
-        "feed_in_tariffs", Dummy_load_admin_setting_calc("feed_in_tariffs")
-    )
-    einspeiseverguetung_parts_data = (
-        feed_in_tariffs_block.get("parts", [])
-        if isinstance(feed_in_tariffs_block, dict)
-        else []
-    )
-    einspeiseverguetung_full_data = (
-        feed_in_tariffs_block.get("full", [])
-        if isinstance(feed_in_tariffs_block, dict)
-        else []
-    )
-
-    # Globale Konstanten extrahieren mit robusten Fallbacks
-    DEFAULT_YIELD_KWH_PER_KWP_ANNUAL = float(
-        global_constants.get("default_specific_yield_kwh_kwp", 950.0) or 950.0
-    )
-    simulation_period_years_default = int(
-        global_constants.get("simulation_period_years", 20) or 20
-    )
-    results["simulation_period_years_effective"] = (
-        simulation_duration_user
-        if simulation_duration_user is not None
-        else int(
-            economic_data.get(
-                "simulation_period_years", simulation_period_years_default
-            )
-            or simulation_period_years_default
-        )
-    )
-    electricity_price_increase_default_percent = float(
-        global_constants.get("electricity_price_increase_annual_percent", 3.0) or 3.0
-    )
-    results["electricity_price_increase_rate_effective_percent"] = (
-        electricity_price_increase_user
-        if electricity_price_increase_user is not None
-        else float(
-            economic_data.get(
-                "electricity_price_increase_annual_percent",
-                electricity_price_increase_default_percent,
-            )
-            or electricity_price_increase_default_percent
-        )
-    )
-    vat_rate_percent = float(global_constants.get("vat_rate_percent", 0.0) or 0.0)
-    inflation_rate_percent = float(
-        global_constants.get("inflation_rate_percent", 2.0) or 2.0
-    )
-    loan_interest_rate_percent = float(
-        global_constants.get("loan_interest_rate_percent", 4.0) or 4.0
-    )
-    annual_module_degradation_percent = float(
-        global_constants.get("annual_module_degradation_percent", 0.5) or 0.5
-    )
-    annual_degredation_factor = 1.0 - (annual_module_degradation_percent / 100.0)
-    specific_yields_by_orientation_tilt = global_constants.get(
-        "specific_yields_by_orientation_tilt", {}
-    )
-    if not isinstance(
-        specific_yields_by_orientation_tilt, dict
-    ):  # Fallback, falls Typ nicht stimmt
-        specific_yields_by_orientation_tilt = Dummy_load_admin_setting_calc(
-            "global_constants"
-        )["specific_yields_by_orientation_tilt"]
-    global_yield_adjustment_percent = float(
-        global_constants.get("global_yield_adjustment_percent", 0.0) or 0.0
-    )
-
-    # Projektdaten für Verbrauch und Strompreis
-    jahresverbrauch_haushalt = float(
-        project_details.get("annual_consumption_kwh_yr", 0.0) or 0.0
-    )
-    jahresverbrauch_heizung = float(
-        project_details.get("consumption_heating_kwh_yr", 0.0) or 0.0
-    )
-    annual_consumption_kwh_yr = jahresverbrauch_haushalt + jahresverbrauch_heizung
-    electricity_price_kwh = float(
-        project_details.get("electricity_price_kwh", 0.30) or 0.30
-    )
-    results["total_consumption_kwh_yr"] = (
-        annual_consumption_kwh_yr  # Für Diagramme oft benötigt
-    )
-    (
-        results["jahresstromverbrauch_fuer_hochrechnung_kwh"],
-        results["aktueller_strompreis_fuer_hochrechnung_euro_kwh"],
-    ) = (annual_consumption_kwh_yr, electricity_price_kwh)
-
-    # Anlagengröße
-    selected_module_id = project_details.get("selected_module_id")
-    module_details = (
-        real_get_product_by_id(selected_module_id) if selected_module_id else None
-    )
-    module_capacity_w = (
-        float(module_details.get("capacity_w", 0.0) or 0.0) if module_details else 0.0
-    )
-    results["anlage_kwp"] = (module_quantity * module_capacity_w) / 1000.0
-
-    # Anlagengröße für erweiterte Berechnungen definieren
-    anlage_kwp = results["anlage_kwp"]
-
-    # Fallback: Neuberechnung, falls 'anlage_kwp' aus project_details fehlt oder 0 ist.
-    # Dies ist die ursprüngliche Logik, die nun als Fallback dient.
-
-    # Hinzufügen von Fehlermeldungen/Warnungen, wenn der Fallback verwendet wird oder null ergibt
-
-    # PVGIS-Datenabruf oder manuelle Ertragsberechnung
-    pvgis_results_data = None
-    
-    # KORREKTUR: PV GIS Einstellung aus Datenbank laden statt aus global_constants
-    try:
-        from database import load_admin_setting
-        pvgis_setting_raw = load_admin_setting("pvgis_enabled", "false")  # Default auf false
-        # Boolean-Konvertierung - berücksichtigt String-Werte aus Datenbank
-        if isinstance(pvgis_setting_raw, str):
-            pvgis_enabled = pvgis_setting_raw.lower() in ['true', '1', 'yes', 'on']
-        else:
-            pvgis_enabled = bool(pvgis_setting_raw)
-        
-        # Debug-Info für PV GIS Status
-        if app_debug_mode_is_enabled:
-            debug_msg = f"DEBUG: PV GIS Status - Raw: '{pvgis_setting_raw}', Enabled: {pvgis_enabled}"
-            print(debug_msg)
-            if STREAMLIT_AVAILABLE:
-                st.sidebar.info(debug_msg)
-                
-    except ImportError:
-        # Fallback auf global_constants wenn Datenbank nicht verfügbar
-        pvgis_enabled = bool(global_constants.get("pvgis_enabled", False))  # Default auf false
-        if app_debug_mode_is_enabled:
-            debug_msg = f"DEBUG: PV GIS Fallback - Enabled: {pvgis_enabled} (Database not available)"
-            print(debug_msg)
-            if STREAMLIT_AVAILABLE:
-                st.sidebar.info(debug_msg)
-
-    if (
-        pvgis_enabled
-        and project_details.get("latitude") is not None
-        and project_details.get("longitude") is not None
-        and results["anlage_kwp"] > 0
-    ):
-        # Debug: Zeige PV GIS Status
-        if hasattr(st, 'sidebar'):  # Nur wenn Streamlit verfügbar
-            st.info(f" DEBUG: PV GIS ist AKTIVIERT (pvgis_enabled={pvgis_enabled})")
-        
-        try:
-            lat = float(project_details["latitude"])
-            lon = float(project_details["longitude"])
-            # Nur Koordinaten prüfen wenn PV GIS aktiviert ist
-            if (
-                abs(lat) < 1e-5 and abs(lon) < 1e-5
-            ):  # Standardkoordinaten (0,0) sind meist ungültig für PVGIS
-                errors_list.append(
-                    texts.get(
-                        "warn_pvgis_zero_coords",
-                        "PVGIS: Ungültige Standardkoordinaten (0,0) erhalten. Nutze manuelle Ertragsberechnung.",
-                    )
-                )
-            elif not (
-                -90 <= lat <= 90 and -180 <= lon <= 180
-            ):  # Gültigkeitsbereich prüfen
-                errors_list.append(
-                    texts.get(
-                        "pvgis_invalid_lat_lon_range",
-                        "PVGIS: Breiten- oder Längengrade außerhalb des gültigen Bereichs.",
-                    )
-                )
-            else:
-                tilt_val = int(project_details.get("roof_inclination_deg", 30) or 30)
-                orientation_text_val = project_details.get("roof_orientation", "Süd")
-                azimuth_val = convert_orientation_to_pvgis_azimuth(orientation_text_val)
-                SYSTEM_LOSS_PVGIS = float(
-                    global_constants.get("pvgis_system_loss_default_percent", 14.0)
-                    or 14.0
-                )
-                pvgis_results_data = get_pvgis_data(
-                    lat,
-                    lon,
-                    results["anlage_kwp"],
-                    tilt_val,
-                    azimuth_val,
-                    SYSTEM_LOSS_PVGIS,
-                    texts,
-                    errors_list,
-                    debug_mode_enabled=app_debug_mode_is_enabled,
-                )
-        except (ValueError, TypeError) as e_coords:
-            errors_list.append(
-                (
-                    texts.get(
-                        "error_geocoding_conversion_calc",
-                        "Fehler Konvertierung Geodaten für PVGIS.",
-                    )
-                    or ""
-                )
-                + f" Details: {e_coords}"
-            )
-            pvgis_results_data = None  # Sicherstellen, dass es None ist bei Fehler
-    elif not pvgis_enabled:
-        # PVGIS ist deaktiviert - verwende manuelle Berechnung ohne Meldung
-        pvgis_results_data = None
-
-    annual_pv_production_kwh_base, monthly_pv_production_kwh_base = 0.0, [0.0] * 12
-    results["pvgis_data_used"] = False  # Standardmäßig auf False setzen
-
-    if pvgis_results_data and isinstance(pvgis_results_data, dict):
-        annual_prod_pvgis = pvgis_results_data.get("annual_production_kwh")
-        monthly_prod_pvgis = pvgis_results_data.get("monthly_production_kwh")
-        if (
-            isinstance(annual_prod_pvgis, (int, float))
-            and isinstance(monthly_prod_pvgis, list)
-            and len(monthly_prod_pvgis) == 12
-        ):
-            if (
-                annual_prod_pvgis == 0.0 and results["anlage_kwp"] > 0
-            ):  # Wenn PVGIS 0 liefert trotz Anlage
-                # if app_debug_mode_is_enabled and not any("PVGIS" in err for err in errors_list): # Bereinigt
-                # errors_list.append(texts.get("warn_pvgis_returned_zero_yield_fallback", "PVGIS lieferte 0 kWh Ertrag. Nutze manuelle Ertragsberechnung."))
-                pass  # Fehler wurde bereits in get_pvgis_data behandelt oder es wird der manuelle Fallback genutzt
-            else:
-                annual_pv_production_kwh_base = annual_prod_pvgis
-                monthly_pv_production_kwh_base = monthly_prod_pvgis
-                results["specific_annual_yield_kwh_per_kwp"] = pvgis_results_data.get(
-                    "specific_yield_kwh_kwp_pa", 0.0
-                )
-                results["pvgis_source"] = pvgis_results_data.get(
-                    "pvgis_source", "PVGIS"
-                )
-                results["pvgis_data_used"] = True
-        # else: # Bereinigt
-        # if app_debug_mode_is_enabled:
-        # errors_list.append(texts.get("warn_pvgis_incomplete_data_fallback", "PVGIS-Antwort unvollständig/fehlerhaft. Nutze manuelle Ertragsberechnung."))
+    if pvgis_results_data and isinstance(pvgis_results_data, dict):
+        annual_prod_pvgis = pvgis_results_data.get("annual_production_kwh")
+        monthly_prod_pvgis = pvgis_results_data.get("monthly_production_kwh")
+        if (
+            isinstance(annual_prod_pvgis, (int, float))
+            and isinstance(monthly_prod_pvgis, list)
+            and len(monthly_prod_pvgis) == 12
+        ):
+            if (
+                annual_prod_pvgis == 0.0 and anlage_kwp > 0
+            ):  # Wenn PVGIS 0 liefert trotz Anlage
+                # if app_debug_mode_is_enabled and not any("PVGIS" in err for err in errors_list): # Bereinigt
+                # errors_list.append(texts.get("warn_pvgis_returned_zero_yield_fallback", "PVGIS lieferte 0 kWh Ertrag. Nutze manuelle Ertragsberechnung."))
+                pass  # Fehler wurde bereits in get_pvgis_data behandelt oder es wird der manuelle Fallback genutzt
+            else:
+                annual_pv_production_kwh_base = annual_prod_pvgis
+                monthly_pv_production_kwh_base = monthly_prod_pvgis
+                results["specific_annual_yield_kwh_per_kwp"] = pvgis_results_data.get(
+                    "specific_yield_kwh_kwp_pa", 0.0
+                )
+                results["pvgis_source"] = pvgis_results_data.get(
+                    "pvgis_source", "PVGIS"
+                )
+                results["pvgis_data_used"] = True
+        # else: # Bereinigt
+        # if app_debug_mode_is_enabled:
+        # errors_list.append(texts.get("warn_pvgis_incomplete_data_fallback", "PVGIS-Antwort unvollständig/fehlerhaft. Nutze manuelle Ertragsberechnung."))
 
     if (
-        not results["pvgis_data_used"] and results["anlage_kwp"] > 0
+        not results["pvgis_data_used"] and anlage_kwp > 0
     ):  # Fallback zur manuellen Berechnung
-        # Informative Meldung wenn PV GIS bewusst deaktiviert wurde  
-        if not pvgis_enabled and STREAMLIT_AVAILABLE:
-            try:
-                import streamlit as st_local
-                st_local.info("ℹ PV GIS ist in den Einstellungen DEAKTIVIERT. Verwende manuelle Ertragsberechnung.")
-            except:
-                pass  # Streamlit nicht verfügbar, ignoriere Meldung
-        
         orientation_key = project_details.get(
             "roof_orientation", "Sonstige"
         )  # Default auf 'Sonstige'
@@ -2641,7 +2683,7 @@ def perform_calculations(
             or DEFAULT_YIELD_KWH_PER_KWP_ANNUAL
         )
         annual_pv_production_kwh_base = (
-            results["anlage_kwp"] * specific_annual_yield_kwh_per_kwp_manual
+            anlage_kwp * specific_annual_yield_kwh_per_kwp_manual
         )
         results["specific_annual_yield_kwh_per_kwp"] = (
             specific_annual_yield_kwh_per_kwp_manual
@@ -2678,7 +2720,7 @@ def perform_calculations(
         results["pvgis_source"] = "Manuelle Berechnung"  # Quelle klarstellen
         # if app_debug_mode_is_enabled: # Bereinigt
         # print(f"CALC: Manuelle Ertragsberechnung: lookup_key='{lookup_key}', specific_yield={specific_annual_yield_kwh_per_kwp_manual} kWh/kWp/a")
-    elif results["anlage_kwp"] == 0:  # Keine Anlage, keine Produktion
+    elif anlage_kwp == 0:  # Keine Anlage, keine Produktion
         annual_pv_production_kwh_base = 0.0
         monthly_pv_production_kwh_base = [0.0] * 12
         results["specific_annual_yield_kwh_per_kwp"] = 0.0
@@ -2704,6 +2746,29 @@ def perform_calculations(
 
     # if app_debug_mode_is_enabled: print(f"CALC: Jährliche PV Produktion (nach Anpassung, Jahr 1): {annual_pv_production_kwh:.2f} kWh") # Bereinigt
 
+    return {
+        "annual_pv_production_kwh": annual_pv_production_kwh,
+        "monthly_pv_production_kwh": monthly_pv_production_kwh,
+        "specific_annual_yield_kwh_per_kwp": results.get(
+            "specific_annual_yield_kwh_per_kwp", 0.0
+        ),
+    }
+
+
+def _calc_stage_energy_flow(
+    results: Dict[str, Any],
+    errors_list: List[str],
+    project_details: Dict[str, Any],
+    customer_data: Dict[str, Any],
+    global_constants: Dict[str, Any],
+    texts: Dict[str, str],
+    monthly_pv_production_kwh: List[float],
+    annual_consumption_kwh_yr: float,
+    include_storage: Any,
+    selected_storage_capacity_kwh: float,
+    storage_details_from_db: Optional[Dict[str, Any]],
+) -> Dict[str, Any]:
+    """Stufe Energiefluss: Monatsverbrauch, Eigenverbrauch, Speicher, Einspeisung."""
     # Monatlicher Verbrauch
     monthly_distribution_factors_consumption = global_constants.get(
         "monthly_consumption_distribution", [1 / 12] * 12
@@ -2742,16 +2807,6 @@ def perform_calculations(
         global_constants.get("direct_self_consumption_factor_of_production", 0.25)
         or 0.25
     )
-    include_storage = project_details.get("include_storage", False)
-    selected_storage_id = (
-        project_details.get("selected_storage_id") if include_storage else None
-    )
-    # Nutze die explizit im Projekt ausgewählte Kapazität, nicht die aus den Produktdetails für diese Logik
-    selected_storage_capacity_kwh = (
-        float(project_details.get("selected_storage_storage_power_kw", 0.0) or 0.0)
-        if include_storage
-        else 0.0
-    )
     storage_efficiency = float(
         global_constants.get("storage_efficiency", 0.9) or 0.9
     )  # Speicherwirkungsgrad
@@ -2766,56 +2821,121 @@ def perform_calculations(
     monthly_feed_in_kwh = [0.0] * 12
     monthly_grid_bezug_kwh = [0.0] * 12
 
-    for i in range(12):
-        prod_month = monthly_pv_production_kwh[i]
-        cons_month = monthly_total_consumption_kwh[i]
-
-        # Direkter Eigenverbrauch
-        direct_sc = min(prod_month * direct_sc_from_production_factor, cons_month)
-        monthly_direct_self_consumption_kwh[i] = direct_sc
-
-        rem_prod_after_direct_sc = prod_month - direct_sc
-        rem_cons_after_direct_sc = cons_month - direct_sc
-
-        # Speicherlogik (vereinfacht: Speicher wird geladen, wenn Überschuss, und entladen, wenn Bedarf)
-        if include_storage and selected_storage_capacity_kwh > 0:
-            storage_cycles_per_year_val = float(
-                global_constants.get("storage_cycles_per_year", 250) or 250
+    # Stündliche Simulation (8760 h) mit Lastprofil und Speicher-SOC; das
+    # monatliche Modell bleibt über global_constants["energy_flow_model"] = "monthly" wählbar.
+    energy_flow_model = str(
+        global_constants.get("energy_flow_model", "hourly") or "hourly"
+    ).strip().lower()
+    hourly_flow_result = None
+    if energy_flow_model == "hourly" and _ENERGY_FLOW_ENGINE_AVAILABLE:
+        try:
+            storage_capacity_for_sim = (
+                selected_storage_capacity_kwh
+                if include_storage and selected_storage_capacity_kwh > 0
+                else 0.0
             )
-            # Max. mögliche Ladung/Entladung pro Monat basierend auf Kapazität und Zyklen (vereinfacht)
-            monthly_storage_charge_potential_effective = (
-                selected_storage_capacity_kwh * (storage_cycles_per_year_val / 12.0)
-            )  # Max kWh die pro Monat theoretisch geladen/entladen werden könnten
-
-            # Laden des Speichers
-            # Wie viel kann *vor* Ladeverlusten in den Speicher?
-            potential_charge_to_storage_brutto = min(
-                rem_prod_after_direct_sc,
-                (
-                    monthly_storage_charge_potential_effective / storage_efficiency
-                    if storage_efficiency > 0
-                    else float("inf")
-                ),
+            storage_power_for_sim = 0.0
+            if storage_details_from_db:
+                storage_power_for_sim = float(
+                    storage_details_from_db.get("power_kw", 0.0) or 0.0
+                )
+            if storage_power_for_sim <= 0:
+                storage_power_for_sim = storage_capacity_for_sim * float(
+                    global_constants.get("storage_c_rate", 0.5) or 0.5
+                )
+            load_profile_type = project_details.get("load_profile") or (
+                "G0"
+                if str(customer_data.get("type", "Privat")).lower() == "gewerblich"
+                else "H0"
             )
-            # Tatsächliche Nettoladung unter Berücksichtigung des Wirkungsgrads
-            actual_charge_into_storage_netto = (
-                potential_charge_to_storage_brutto * storage_efficiency
+            hourly_flow_result = simulate_year_from_monthly(
+                monthly_pv_production_kwh,
+                monthly_total_consumption_kwh,
+                latitude=project_details.get("latitude") or 51.0,
+                load_profile=load_profile_type,
+                battery_capacity_kwh=storage_capacity_for_sim,
+                charge_power_kw=storage_power_for_sim,
+                discharge_power_kw=storage_power_for_sim,
+                charge_efficiency=storage_efficiency,
+                min_soc_percent=float(
+                    global_constants.get("storage_min_soc_percent", 0.0) or 0.0
+                ),
             )
-            monthly_storage_charge_kwh[i] = (
-                actual_charge_into_storage_netto  # Gespeichert: wie viel *im* Speicher ankommt
+        except Exception as e_hourly_flow:
+            errors_list.append(
+                f"Stündliche Energieflusssimulation fehlgeschlagen, nutze Monatsmodell: {e_hourly_flow}"
             )
-            rem_prod_after_direct_sc -= potential_charge_to_storage_brutto  # Vom Überschuss abziehen, was zum Laden verwendet wurde (brutto)
+            hourly_flow_result = None
+
+    if hourly_flow_result is not None:
+        monthly_direct_self_consumption_kwh = hourly_flow_result[
+            "monthly_direct_self_consumption_kwh"
+        ]
+        monthly_storage_charge_kwh = hourly_flow_result["monthly_storage_charge_kwh"]
+        monthly_storage_discharge_for_sc_kwh = hourly_flow_result[
+            "monthly_storage_discharge_kwh"
+        ]
+        monthly_feed_in_kwh = hourly_flow_result["monthly_feed_in_kwh"]
+        monthly_grid_bezug_kwh = hourly_flow_result["monthly_grid_import_kwh"]
+        results["energy_flow_model"] = "hourly"
+        results["battery_full_cycles_per_year"] = hourly_flow_result[
+            "battery_full_cycles"
+        ]
+        results["battery_avg_soc_percent"] = hourly_flow_result[
+            "battery_avg_soc_percent"
+        ]
+    else:
+        results["energy_flow_model"] = "monthly"
+        for i in range(12):
+            prod_month = monthly_pv_production_kwh[i]
+            cons_month = monthly_total_consumption_kwh[i]
+
+            # Direkter Eigenverbrauch
+            direct_sc = min(prod_month * direct_sc_from_production_factor, cons_month)
+            monthly_direct_self_consumption_kwh[i] = direct_sc
+
+            rem_prod_after_direct_sc = prod_month - direct_sc
+            rem_cons_after_direct_sc = cons_month - direct_sc
+
+            # Speicherlogik (vereinfacht: Speicher wird geladen, wenn Überschuss, und entladen, wenn Bedarf)
+            if include_storage and selected_storage_capacity_kwh > 0:
+                storage_cycles_per_year_val = float(
+                    global_constants.get("storage_cycles_per_year", 250) or 250
+                )
+                # Max. mögliche Ladung/Entladung pro Monat basierend auf Kapazität und Zyklen (vereinfacht)
+                monthly_storage_charge_potential_effective = (
+                    selected_storage_capacity_kwh * (storage_cycles_per_year_val / 12.0)
+                )  # Max kWh die pro Monat theoretisch geladen/entladen werden könnten
+
+                # Laden des Speichers
+                # Wie viel kann *vor* Ladeverlusten in den Speicher?
+                potential_charge_to_storage_brutto = min(
+                    rem_prod_after_direct_sc,
+                    (
+                        monthly_storage_charge_potential_effective / storage_efficiency
+                        if storage_efficiency > 0
+                        else float("inf")
+                    ),
+                )
+                # Tatsächliche Nettoladung unter Berücksichtigung des Wirkungsgrads
+                actual_charge_into_storage_netto = (
+                    potential_charge_to_storage_brutto * storage_efficiency
+                )
+                monthly_storage_charge_kwh[i] = (
+                    actual_charge_into_storage_netto  # Gespeichert: wie viel *im* Speicher ankommt
+                )
+                rem_prod_after_direct_sc -= potential_charge_to_storage_brutto  # Vom Überschuss abziehen, was zum Laden verwendet wurde (brutto)
 
-            # Entladen des Speichers für Eigenverbrauch
-            discharge_from_storage_for_sc = min(
-                actual_charge_into_storage_netto, rem_cons_after_direct_sc
-            )  # Kann max. das entladen, was geladen wurde und was gebraucht wird
-            monthly_storage_discharge_for_sc_kwh[i] = discharge_from_storage_for_sc
-            rem_cons_after_direct_sc -= discharge_from_storage_for_sc
+                # Entladen des Speichers für Eigenverbrauch
+                discharge_from_storage_for_sc = min(
+                    actual_charge_into_storage_netto, rem_cons_after_direct_sc
+                )  # Kann max. das entladen, was geladen wurde und was gebraucht wird
+                monthly_storage_discharge_for_sc_kwh[i] = discharge_from_storage_for_sc
+                rem_cons_after_direct_sc -= discharge_from_storage_for_sc
 
-        # Verbleibender Überschuss geht ins Netz, verbleibender Bedarf aus dem Netz
-        monthly_feed_in_kwh[i] = max(0, rem_prod_after_direct_sc)
-        monthly_grid_bezug_kwh[i] = max(0, rem_cons_after_direct_sc)
+            # Verbleibender Überschuss geht ins Netz, verbleibender Bedarf aus dem Netz
+            monthly_feed_in_kwh[i] = max(0, rem_prod_after_direct_sc)
+            monthly_grid_bezug_kwh[i] = max(0, rem_cons_after_direct_sc)
 
     eigenverbrauch_pro_jahr_kwh = sum(monthly_direct_self_consumption_kwh) + sum(
         monthly_storage_discharge_for_sc_kwh
@@ -2835,18 +2955,35 @@ def perform_calculations(
         }
     )
 
-    selected_inverter_id = project_details.get("selected_inverter_id")
-    inverter_details = (
-        real_get_product_by_id(selected_inverter_id) if selected_inverter_id else None
-    )
+    return {
+        "monthly_direct_self_consumption_kwh": monthly_direct_self_consumption_kwh,
+        "monthly_storage_discharge_for_sc_kwh": monthly_storage_discharge_for_sc_kwh,
+        "eigenverbrauch_pro_jahr_kwh": eigenverbrauch_pro_jahr_kwh,
+        "netzeinspeisung_kwh": netzeinspeisung_kwh,
+    }
+
+
+def _calc_stage_costs(
+    results: Dict[str, Any],
+    errors_list: List[str],
+    project_details: Dict[str, Any],
+    economic_data: Dict[str, Any],
+    global_constants: Dict[str, Any],
+    texts: Dict[str, str],
+    price_matrix_lookup: Optional[PriceMatrixIndex],
+    price_matrix_fingerprint: Tuple[Any, ...],
+    module_quantity: int,
+    module_details: Optional[Dict[str, Any]],
+    inverter_details: Optional[Dict[str, Any]],
+    include_storage: Any,
+    storage_details_from_db: Optional[Dict[str, Any]],
+    optional_component_details: Dict[str, Optional[Dict[str, Any]]],
+    vat_rate_percent: float,
+) -> Dict[str, Any]:
+    """Stufe Kosten: Preis-Matrix, Zusatzkosten, Investition."""
+    # price_matrix_fingerprint steht im Cache-Schlüssel für die Matrix
     free_roof_area_sqm = float(project_details.get("free_roof_area_sqm", 0.0) or 0.0)
 
-    # --- Kostenberechnung ---
-    storage_details_from_db = (
-        real_get_product_by_id(selected_storage_id)
-        if selected_storage_id and include_storage
-        else None
-    )
     storage_name_for_matrix_lookup = texts.get(
         "no_storage_option_for_matrix", "Ohne Speicher"
     )
@@ -2860,78 +2997,49 @@ def perform_calculations(
     # errors_list.append(f"CALC: Speicher (ID: {selected_storage_id}) ausgewählt, aber Details nicht in product_db gefunden. Matrix-Preis nutzt '{storage_name_for_matrix_lookup}'.")
 
     base_matrix_price_netto, matrix_column_used_for_price = 0.0, None
-    if (
-        price_matrix_df_for_lookup is not None
-        and not price_matrix_df_for_lookup.empty
-        and module_quantity > 0
-    ):
+    if price_matrix_lookup is not None and module_quantity > 0:
         # Finde die passende Zeile in der Matrix (genau oder nächstkleinere Modulanzahl)
-        relevant_rows_matrix = price_matrix_df_for_lookup[
-            price_matrix_df_for_lookup.index <= module_quantity
-        ]
-        if not relevant_rows_matrix.empty:
-            selected_row_from_matrix = relevant_rows_matrix.iloc[
-                -1
-            ]  # Letzte Zeile, die Bedingung erfüllt
-            actual_module_count_in_matrix = (
-                selected_row_from_matrix.name
-            )  # Indexwert der Zeile (Modulanzahl)
+        matrix_row_position = price_matrix_lookup.floor_position(module_quantity)
+        if matrix_row_position >= 0:
+            actual_module_count_in_matrix = price_matrix_lookup.module_count_at(
+                matrix_row_position
+            )  # Modulanzahl der verwendeten Zeile
             # if module_quantity != actual_module_count_in_matrix and app_debug_mode_is_enabled: # Bereinigt
             # errors_list.append(f"CALC: Für {module_quantity} Module wurde Matrix-Stufe '{actual_module_count_in_matrix}' Module verwendet.")
 
-            # Spaltennamen normalisieren für robusten Zugriff
-            normalized_matrix_columns_map = {
-                str(col).strip().lower(): str(col)
-                for col in selected_row_from_matrix.index
-            }
-            normalized_storage_name_lookup = (
-                str(storage_name_for_matrix_lookup).strip().lower()
-            )
-            no_storage_text_normalized_lookup = (
+            # Spalten werden normalisiert (strip/lower) nachgeschlagen
+            no_storage_column_position = price_matrix_lookup.column_position(
                 texts.get("no_storage_option_for_matrix", "Ohne Speicher")
-                .strip()
-                .lower()
             )
-
-            # Original Spaltennamen aus der Map holen
-            original_no_storage_column_name = normalized_matrix_columns_map.get(
-                no_storage_text_normalized_lookup
-            )
-            original_price_col_key_for_df_access = normalized_matrix_columns_map.get(
-                normalized_storage_name_lookup
+            storage_column_position = price_matrix_lookup.column_position(
+                storage_name_for_matrix_lookup
             )
             price_value_from_matrix = None
 
             # Versuche Preis für spezifischen Speicher zu finden
-            if (
-                original_price_col_key_for_df_access
-                and original_price_col_key_for_df_access
-                in selected_row_from_matrix.index
-                and pd.notna(
-                    selected_row_from_matrix[original_price_col_key_for_df_access]
-                )
+            if storage_column_position is not None and pd.notna(
+                price_matrix_lookup.value(matrix_row_position, storage_column_position)
             ):
-                price_value_from_matrix = selected_row_from_matrix[
-                    original_price_col_key_for_df_access
-                ]
-                matrix_column_used_for_price = original_price_col_key_for_df_access  # Speichere den verwendeten Spaltennamen
+                price_value_from_matrix = price_matrix_lookup.value(
+                    matrix_row_position, storage_column_position
+                )
+                matrix_column_used_for_price = price_matrix_lookup.columns[
+                    storage_column_position
+                ]  # Speichere den verwendeten Spaltennamen
 
             # Fallback auf "Ohne Speicher", wenn spezifischer Speicher nicht gefunden oder Preis ungültig
-            if price_value_from_matrix is None or not pd.notna(price_value_from_matrix):
+            if price_value_from_matrix is None:
                 # if normalized_storage_name_lookup != no_storage_text_normalized_lookup and include_storage : # Bereinigt (Fehlermeldung bereits informativ genug)
                 # errors_list.append((texts.get("warn_specific_storage_not_in_matrix_fallback_no_storage", "Preis für Speichermodell '{selected_storage_name}' bei {module_count} Modulen nicht in Matrix oder Wert ungültig. Versuche Fallback auf '{no_storage_option_text}'.") or "").format(selected_storage_name=storage_name_for_matrix_lookup, module_count=actual_module_count_in_matrix, no_storage_option_text=texts.get("no_storage_option_for_matrix", "Ohne Speicher")))
-                if (
-                    original_no_storage_column_name
-                    and original_no_storage_column_name
-                    in selected_row_from_matrix.index
-                    and pd.notna(
-                        selected_row_from_matrix[original_no_storage_column_name]
-                    )
+                if no_storage_column_position is not None and pd.notna(
+                    price_matrix_lookup.value(matrix_row_position, no_storage_column_position)
                 ):
-                    price_value_from_matrix = selected_row_from_matrix[
-                        original_no_storage_column_name
-                    ]
-                    matrix_column_used_for_price = original_no_storage_column_name  # Speichere "Ohne Speicher" als verwendeten Spaltennamen
+                    price_value_from_matrix = price_matrix_lookup.value(
+                        matrix_row_position, no_storage_column_position
+                    )
+                    matrix_column_used_for_price = price_matrix_lookup.columns[
+                        no_storage_column_position
+                    ]  # Speichere "Ohne Speicher" als verwendeten Spaltennamen
                 else:  # Auch "Ohne Speicher" nicht gefunden oder ungültig
                     price_value_from_matrix = 0.0  # Sicherer Fallback
                     errors_list.append(
@@ -3068,20 +3176,12 @@ def perform_calculations(
 
     # Optionale Komponenten
     total_optional_components_cost_netto = 0.0
-    optional_component_keys_map_calc = {
-        "selected_wallbox_id": "cost_wallbox_aufpreis_netto",
-        "selected_ems_id": "cost_ems_aufpreis_netto",
-        "selected_optimizer_id": "cost_optimizer_aufpreis_netto",  # Annahme: pauschal oder pro Modul * Menge? Hier pauschal.
-        "selected_carport_id": "cost_carport_aufpreis_netto",
-        "selected_notstrom_id": "cost_notstrom_aufpreis_netto",
-        "selected_tierabwehr_id": "cost_tierabwehr_aufpreis_netto",
-    }
     if project_details.get("include_additional_components", False):
-        for pd_key, res_key in optional_component_keys_map_calc.items():
+        for pd_key, res_key in OPTIONAL_COMPONENT_COST_KEYS.items():
             component_id = project_details.get(pd_key)
             cost_val = 0.0
             if component_id:
-                component_details_db = real_get_product_by_id(component_id)
+                component_details_db = optional_component_details.get(pd_key)
                 cost_val = (
                     float(component_details_db.get("additional_cost_netto", 0.0) or 0.0)
                     if component_details_db
@@ -3142,10 +3242,32 @@ def perform_calculations(
     # Bruttoinvestition für erweiterte Berechnungen definieren
     total_investment_brutto = results["total_investment_brutto"]
 
-    # --- Wirtschaftlichkeitsberechnung (Jahr 1) ---
-    annual_electricity_cost_savings_self_consumption_year1 = (
-        eigenverbrauch_pro_jahr_kwh * electricity_price_kwh
-    )
+    return {
+        "base_matrix_price_netto": base_matrix_price_netto,
+        "total_investment_netto": total_investment_netto,
+        "total_investment_brutto": total_investment_brutto,
+    }
+
+
+def _calc_stage_economics_year1(
+    results: Dict[str, Any],
+    errors_list: List[str],
+    project_details: Dict[str, Any],
+    customer_data: Dict[str, Any],
+    anlage_kwp: float,
+    electricity_price_kwh: float,
+    eigenverbrauch_pro_jahr_kwh: float,
+    netzeinspeisung_kwh: float,
+    total_investment_netto: float,
+    einspeiseverguetung_parts_data: List[Dict[str, Any]],
+    einspeiseverguetung_full_data: List[Dict[str, Any]],
+    amortization_cheat_settings: Any,
+) -> Dict[str, Any]:
+    """Stufe Wirtschaftlichkeit Jahr 1: Einsparung, Einspeisevergütung, Amortisation."""
+    # --- Wirtschaftlichkeitsberechnung (Jahr 1) ---
+    annual_electricity_cost_savings_self_consumption_year1 = (
+        eigenverbrauch_pro_jahr_kwh * electricity_price_kwh
+    )
     results["annual_electricity_cost_savings_self_consumption_year1"] = (
         annual_electricity_cost_savings_self_consumption_year1
     )
@@ -3161,7 +3283,7 @@ def perform_calculations(
         else einspeiseverguetung_full_data
     )
     if (
-        results["anlage_kwp"] > 0
+        anlage_kwp > 0
         and einspeiseverguetung_data_to_use
         and isinstance(einspeiseverguetung_data_to_use, list)
     ):
@@ -3169,7 +3291,7 @@ def perform_calculations(
             einspeiseverguetung_data_to_use,
             key=lambda x: float(x.get("kwp_max", 0.0) or 0.0),
         ):  # Sicherstellen, dass kwp_max ein Float ist
-            if results["anlage_kwp"] <= float(
+            if anlage_kwp <= float(
                 entry.get("kwp_max", float("inf")) or float("inf")
             ):  # Sicherstellen, dass kwp_max ein Float ist
                 einspeiseverguetung_ct_per_kwh = float(
@@ -3224,7 +3346,7 @@ def perform_calculations(
     results["amortization_time_years"] = amortization_time_calc
     # Admin-Cheat anwenden (falls aktiviert)
     try:
-        cheat_settings = real_load_admin_setting("amortization_cheat_settings", None)
+        cheat_settings = amortization_cheat_settings
         if isinstance(cheat_settings, dict) and cheat_settings.get("enabled"):
             mode = cheat_settings.get("mode", "fixed")
             cheated_value_years = cheat_settings.get("value_years")
@@ -3260,21 +3382,35 @@ def perform_calculations(
         # Cheat-Einstellungen ignorieren, falls Fehler
         pass
 
-    # --- Simulation über die Jahre ---
-    cash_flows_initial_investment = [
-        -total_investment_netto
-    ]  # Jahr 0 ist die Investition
-    (
-        annual_productions_sim_list,
-        annual_benefits_sim_list,
-        annual_maintenance_costs_sim_list,
-    ) = ([], [], [])
-    (
-        annual_cash_flows_yearly_list,
-        annual_elec_prices_sim_list,
-        annual_feed_in_tariffs_sim_list,
-    ) = ([], [], [])
-    annual_revenue_from_feed_in_sim_list = []  # Für detailliertere Analyse
+    return {
+        "annual_financial_benefit_year1": annual_financial_benefit_year1,
+        "feed_in_tariff_effective": feed_in_tariff_effective,
+        "income_tax_rate_percent": income_tax_rate_percent,
+        "einspeiseverguetung_eur_per_kwh": results["einspeiseverguetung_eur_per_kwh"],
+    }
+
+
+def _calc_stage_simulation(
+    results: Dict[str, Any],
+    errors_list: List[str],
+    customer_data: Dict[str, Any],
+    global_constants: Dict[str, Any],
+    anlage_kwp: float,
+    simulation_period_years_effective: int,
+    electricity_price_increase_rate_effective_percent: float,
+    electricity_price_kwh: float,
+    inflation_rate_percent: float,
+    annual_degredation_factor: float,
+    annual_pv_production_kwh: float,
+    eigenverbrauch_pro_jahr_kwh: float,
+    netzeinspeisung_kwh: float,
+    base_matrix_price_netto: float,
+    total_investment_netto: float,
+    einspeiseverguetung_eur_per_kwh: float,
+    income_tax_rate_percent: float,
+) -> Dict[str, Any]:
+    """Stufe Simulation über die Jahre (Cashflows, Wartung, Tarife)."""
+    # --- Simulation über die Jahre (Jahresvektoren, siehe projection_engine) ---
 
     # Wartungskosten
     maintenance_fixed_pa = float(
@@ -3302,7 +3438,7 @@ def perform_calculations(
         maintenance_fixed_pa > 0 or maintenance_variable_pa_kwp > 0
     ):  # Wenn spezifische Werte da sind
         annual_maintenance_costs_eur_year1_calc = maintenance_fixed_pa + (
-            maintenance_variable_pa_kwp * results["anlage_kwp"]
+            maintenance_variable_pa_kwp * anlage_kwp
         )
     else:  # Fallback auf Prozentsatz der Investition
         annual_maintenance_costs_eur_year1_calc = (
@@ -3318,96 +3454,79 @@ def perform_calculations(
     # Wartungskosten für erweiterte Berechnungen definieren
     maintenance_cost_fixed_pa = annual_maintenance_costs_eur_year1_calc
 
-    for year_idx in range(1, results["simulation_period_years_effective"] + 1):
-        current_year_production = annual_pv_production_kwh * (
-            annual_degredation_factor ** (year_idx - 1)
-        )
-        annual_productions_sim_list.append(current_year_production)
-
-        # Annahme: Anteile von EV und Einspeisung bleiben über die Jahre relativ konstant zur Produktion
-        ev_anteil_an_prod_j1 = (
-            eigenverbrauch_pro_jahr_kwh / annual_pv_production_kwh
-            if annual_pv_production_kwh > 0
-            else 0
-        )
-        einspeisung_anteil_an_prod_j1 = (
-            netzeinspeisung_kwh / annual_pv_production_kwh
-            if annual_pv_production_kwh > 0
-            else 0
-        )
-
-        current_year_ev = current_year_production * ev_anteil_an_prod_j1
-        current_year_einspeisung = (
-            current_year_production * einspeisung_anteil_an_prod_j1
-        )
-
-        elec_price_sim = electricity_price_kwh * (
-            (1 + results["electricity_price_increase_rate_effective_percent"] / 100.0)
-            ** (year_idx - 1)
-        )
-        annual_elec_prices_sim_list.append(elec_price_sim)
-
-        feed_in_tariff_sim = results[
-            "einspeiseverguetung_eur_per_kwh"
-        ]  # Annahme: fester Tarif für EEG-Zeitraum
-        if year_idx > int(
+    projection = project_financials(
+        years=simulation_period_years_effective,
+        investment=total_investment_netto,
+        annual_production_kwh=annual_pv_production_kwh,
+        degradation_factor=annual_degredation_factor,
+        self_consumption_kwh=eigenverbrauch_pro_jahr_kwh,
+        feed_in_kwh=netzeinspeisung_kwh,
+        electricity_price_kwh=electricity_price_kwh,
+        electricity_price_increase_percent=electricity_price_increase_rate_effective_percent,
+        feed_in_tariff_eur_per_kwh=einspeiseverguetung_eur_per_kwh,  # Annahme: fester Tarif für EEG-Zeitraum
+        feed_in_tariff_period_years=int(
             global_constants.get("einspeiseverguetung_period_years", 20) or 20
-        ):  # Nach EEG-Vergütungszeitraum
-            feed_in_tariff_sim = float(
-                global_constants.get("marktwert_strom_eur_per_kwh_after_eeg", 0.03)
-                or 0.03
-            )  # Marktwert
-        annual_feed_in_tariffs_sim_list.append(feed_in_tariff_sim)
-
-        cost_savings_sim = current_year_ev * elec_price_sim
-        feed_in_rev_sim = current_year_einspeisung * feed_in_tariff_sim
-        annual_revenue_from_feed_in_sim_list.append(
-            feed_in_rev_sim
-        )  # Speichern für Details
-
-        tax_benefit_sim = (
-            feed_in_rev_sim * (income_tax_rate_percent / 100.0)
+        ),
+        market_price_after_eeg_eur_per_kwh=float(
+            global_constants.get("marktwert_strom_eur_per_kwh_after_eeg", 0.03)
+            or 0.03
+        ),  # Marktwert nach EEG-Vergütungszeitraum
+        maintenance_year1=annual_maintenance_costs_eur_year1_calc,
+        maintenance_increase_rate=maintenance_increase_pa_rate,
+        feed_in_tax_rate=(
+            income_tax_rate_percent / 100.0
             if customer_data.get("type", "Privat").lower() == "gewerblich"
-            else 0.0
-        )
-        maint_costs_sim = annual_maintenance_costs_eur_year1_calc * (
-            (1 + maintenance_increase_pa_rate) ** (year_idx - 1)
-        )
-        annual_maintenance_costs_sim_list.append(maint_costs_sim)
-
-        annual_benefit_this_year = cost_savings_sim + feed_in_rev_sim + tax_benefit_sim
-        annual_benefits_sim_list.append(annual_benefit_this_year)
-
-        cash_flow_this_year = annual_benefit_this_year - maint_costs_sim
-        cash_flows_initial_investment.append(cash_flow_this_year)  # Für IRR und NPV
-        annual_cash_flows_yearly_list.append(
-            cash_flow_this_year
-        )  # Nur die jährlichen CFs
+            else None
+        ),
+    )
 
     results.update(
         {
-            "annual_productions_sim": annual_productions_sim_list,
-            "annual_benefits_sim": annual_benefits_sim_list,
-            "annual_maintenance_costs_sim": annual_maintenance_costs_sim_list,
-            "annual_cash_flows_sim": annual_cash_flows_yearly_list,  # Jährliche CFs (ohne Jahr 0)
-            "cumulative_cash_flows_sim": np.cumsum(
-                cash_flows_initial_investment
-            ).tolist(),  # Kumulierte CFs (inkl. Jahr 0)
-            "annual_elec_prices_sim": annual_elec_prices_sim_list,  # Strompreise pro Jahr
-            "annual_feed_in_tariffs_sim": annual_feed_in_tariffs_sim_list,  # Einspeisevergütung pro Jahr
-            "annual_revenue_from_feed_in_sim": annual_revenue_from_feed_in_sim_list,  # Jährliche Einnahmen aus Einspeisung
+            "annual_productions_sim": projection.productions_kwh.tolist(),
+            "annual_benefits_sim": projection.benefits.tolist(),
+            "annual_maintenance_costs_sim": projection.maintenance_costs.tolist(),
+            "annual_cash_flows_sim": projection.cash_flows.tolist(),  # Jährliche CFs (ohne Jahr 0)
+            "cumulative_cash_flows_sim": projection.cumulative_cash_flows.tolist(),  # Kumulierte CFs (inkl. Jahr 0)
+            "annual_elec_prices_sim": projection.elec_prices.tolist(),  # Strompreise pro Jahr
+            "annual_feed_in_tariffs_sim": projection.feed_in_tariffs.tolist(),  # Einspeisevergütung pro Jahr
+            "annual_revenue_from_feed_in_sim": projection.feed_in_revenue.tolist(),  # Jährliche Einnahmen aus Einspeisung
         }
     )
 
+    return {
+        "cash_flows_initial_investment": projection.cash_flows_with_investment,
+        "annual_productions_sim": projection.productions_kwh,
+        "annual_maintenance_costs_sim": projection.maintenance_costs,
+        "maintenance_cost_fixed_pa": maintenance_cost_fixed_pa,
+    }
+
+
+def _calc_stage_kpis(
+    results: Dict[str, Any],
+    errors_list: List[str],
+    project_details: Dict[str, Any],
+    global_constants: Dict[str, Any],
+    texts: Dict[str, str],
+    anlage_kwp: float,
+    simulation_period_years_effective: int,
+    electricity_price_increase_rate_effective_percent: float,
+    loan_interest_rate_percent: float,
+    annual_pv_production_kwh: float,
+    specific_annual_yield_kwh_per_kwp: float,
+    total_investment_netto: float,
+    annual_financial_benefit_year1: float,
+    cash_flows_initial_investment: np.ndarray,
+    annual_productions_sim: np.ndarray,
+    annual_maintenance_costs_sim: np.ndarray,
+) -> Dict[str, Any]:
+    """Stufe Kennzahlen: NPV, IRR, LCOE, CO2, Kostenhochrechnung."""
     # --- Weitere Kennzahlen ---
     # Nettobarwert (NPV)
-    npv_value = -cash_flows_initial_investment[0]  # Investition in Jahr 0
     discount_rate_npv = loan_interest_rate_percent / 100.0  # Kalkulatorischer Zinssatz
-    for i_npv, cf_val in enumerate(cash_flows_initial_investment[1:], 1):  # Ab Jahr 1
-        npv_value += cf_val / ((1 + discount_rate_npv) ** i_npv)
+    npv_value = net_present_value(cash_flows_initial_investment, discount_rate_npv)
     results["npv_value"] = npv_value
     results["npv_per_kwp"] = (
-        npv_value / results["anlage_kwp"] if results["anlage_kwp"] > 0 else float("nan")
+        npv_value / anlage_kwp if anlage_kwp > 0 else float("nan")
     )
 
     # Interner Zinsfuß (IRR)
@@ -3445,29 +3564,15 @@ def perform_calculations(
         )
 
     # Stromgestehungskosten (LCOE)
-    total_discounted_costs_lcoe = total_investment_netto  # Kosten in Jahr 0
-    total_discounted_production_lcoe = 0.0
     discount_rate_lcoe = (
         loan_interest_rate_percent / 100.0
     )  # Gleicher Diskontsatz wie NPV
-    if annual_productions_sim_list and annual_maintenance_costs_sim_list:
-        for y_idx in range(
-            min(
-                len(annual_productions_sim_list),
-                len(annual_maintenance_costs_sim_list),
-                results["simulation_period_years_effective"],
-            )
-        ):
-            total_discounted_production_lcoe += annual_productions_sim_list[y_idx] / (
-                (1 + discount_rate_lcoe) ** (y_idx + 1)
-            )
-            total_discounted_costs_lcoe += annual_maintenance_costs_sim_list[y_idx] / (
-                (1 + discount_rate_lcoe) ** (y_idx + 1)
-            )  # Diskontierte Wartungskosten addieren
-    results["lcoe_euro_per_kwh"] = (
-        total_discounted_costs_lcoe / total_discounted_production_lcoe
-        if total_discounted_production_lcoe > 0
-        else float("inf")
+    results["lcoe_euro_per_kwh"] = levelized_cost(
+        total_investment_netto,  # Kosten in Jahr 0
+        annual_productions_sim,
+        annual_maintenance_costs_sim,  # Diskontierte Wartungskosten
+        discount_rate_lcoe,
+        simulation_period_years_effective,
     )
     results["effektiver_pv_strompreis_ct_kwh"] = (
         results["lcoe_euro_per_kwh"] * 100
@@ -3486,9 +3591,7 @@ def perform_calculations(
     ref_specific_yield_for_pr = float(
         global_constants.get("reference_specific_yield_pr", 1100.0) or 1100.0
     )
-    current_specific_yield = (
-        results.get("specific_annual_yield_kwh_per_kwp", 0.0) or 0.0
-    )
+    current_specific_yield = specific_annual_yield_kwh_per_kwp or 0.0
     if current_specific_yield > 0 and ref_specific_yield_for_pr > 0:
         pr_calculated = (current_specific_yield / ref_specific_yield_for_pr) * 100
         results["performance_ratio_percent"] = min(
@@ -3507,7 +3610,7 @@ def perform_calculations(
     results["restwert_anlage_eur_nach_laufzeit"] = max(
         0.0,
         total_investment_netto
-        - (results["afa_linear_pa_eur"] * results["simulation_period_years_effective"]),
+        - (results["afa_linear_pa_eur"] * simulation_period_years_effective),
     )
 
     # Eigenkapitalrendite (ROE) - hier vereinfacht als IRR, da keine Fremdfinanzierung modelliert
@@ -3519,7 +3622,7 @@ def perform_calculations(
     )
     results["alternativanlage_kapitalwert_eur"] = total_investment_netto * (
         (1 + alternative_investment_interest_rate_percent / 100.0)
-        ** results["simulation_period_years_effective"]
+        ** simulation_period_years_effective
     )
 
     # CO2-Einsparungen
@@ -3545,7 +3648,7 @@ def perform_calculations(
         annual_co2_savings_kg / co2_per_flight if co2_per_flight > 0 else 0.0
     )
     total_co2_savings_over_lifetime_kg = (
-        sum(annual_productions_sim_list) if annual_productions_sim_list else 0
+        sequential_sum(annual_productions_sim) if len(annual_productions_sim) else 0
     ) * co2_emission_factor_kg_per_kwh
     results["co2_avoidance_cost_euro_per_tonne"] = (
         (total_investment_netto / (total_co2_savings_over_lifetime_kg / 1000.0))
@@ -3603,9 +3706,6 @@ def perform_calculations(
         results["pv_deckungsgrad_wp_pct"] = 0.0
 
     # Kostenhochrechnung ohne PV
-    annual_costs_hochrechnung_values_calc = []
-    total_projected_costs_with_increase_calc = 0.0
-    total_projected_costs_without_increase_calc = 0.0
     base_consumption_for_projection_calc = (
         project_details.get("annual_consumption_kwh_yr", 0.0) or 0.0
     ) + (project_details.get("consumption_heating_kwh_yr", 0.0) or 0.0)
@@ -3614,31 +3714,23 @@ def perform_calculations(
     )
     # if base_consumption_for_projection_calc==0 and results['anlage_kwp']>0 and app_debug_mode_is_enabled: errors_list.append(texts.get("warn_zero_consumption_for_projection","Warnung: Gesamtjahresverbrauch für Kostenhochrechnung ist 0 kWh.")) # Bereinigt
     # if base_price_for_projection_calc==0 and results['anlage_kwp']>0 and base_consumption_for_projection_calc > 0 and app_debug_mode_is_enabled: errors_list.append(texts.get("warn_zero_price_for_projection","Warnung: Strompreis für Kostenhochrechnung ist 0 €/kWh.")) # Bereinigt
-    for year_proj_calc in range(results["simulation_period_years_effective"]):
-        cost_this_year_proj_calc = (
-            base_consumption_for_projection_calc
-            * base_price_for_projection_calc
-            * (
-                (
-                    1
-                    + results["electricity_price_increase_rate_effective_percent"]
-                    / 100.0
-                )
-                ** year_proj_calc
-            )
-        )
-        annual_costs_hochrechnung_values_calc.append(cost_this_year_proj_calc)
-        total_projected_costs_with_increase_calc += cost_this_year_proj_calc
-        total_projected_costs_without_increase_calc += (
-            base_consumption_for_projection_calc * base_price_for_projection_calc
-        )
-    results["annual_costs_hochrechnung_values"] = annual_costs_hochrechnung_values_calc
-    results["annual_costs_hochrechnung_jahre_effektiv"] = results[
-        "simulation_period_years_effective"
-    ]
-    results["annual_costs_hochrechnung_steigerung_effektiv_prozent"] = results[
-        "electricity_price_increase_rate_effective_percent"
-    ]
+    (
+        annual_costs_hochrechnung_values_calc,
+        total_projected_costs_with_increase_calc,
+        total_projected_costs_without_increase_calc,
+    ) = project_costs_without_pv(
+        base_consumption_for_projection_calc,
+        base_price_for_projection_calc,
+        electricity_price_increase_rate_effective_percent,
+        simulation_period_years_effective,
+    )
+    results["annual_costs_hochrechnung_values"] = annual_costs_hochrechnung_values_calc.tolist()
+    results["annual_costs_hochrechnung_jahre_effektiv"] = (
+        simulation_period_years_effective
+    )
+    results["annual_costs_hochrechnung_steigerung_effektiv_prozent"] = (
+        electricity_price_increase_rate_effective_percent
+    )
     results["total_projected_costs_with_increase"] = (
         total_projected_costs_with_increase_calc
     )
@@ -3646,15 +3738,35 @@ def perform_calculations(
         total_projected_costs_without_increase_calc
     )
 
+
+def _calc_stage_analyses(
+    results: Dict[str, Any],
+    errors_list: List[str],
+    anlage_kwp: float,
+    simulation_period_years_effective: int,
+    electricity_price_increase_rate_effective_percent: float,
+    electricity_price_kwh: float,
+    inflation_rate_percent: float,
+    annual_module_degradation_percent: float,
+    annual_consumption_kwh_yr: float,
+    annual_pv_production_kwh: float,
+    eigenverbrauch_pro_jahr_kwh: float,
+    include_storage: Any,
+    selected_storage_capacity_kwh: float,
+    total_investment_brutto: float,
+    annual_financial_benefit_year1: float,
+    feed_in_tariff_effective: float,
+    maintenance_cost_fixed_pa: float,
+    calculation_date: str,
+) -> Dict[str, Any]:
+    """Stufe Analysen: Break-Even, Tarifvergleich, Degradation, Wartungsplan."""
     # Break-Even Analyse
     try:
         break_even_analyzer = BreakEvenAnalysis(
             investment=total_investment_brutto,
             annual_savings=annual_financial_benefit_year1,
             inflation_rate=inflation_rate_percent,
-            electricity_price_increase=results[
-                "electricity_price_increase_rate_effective_percent"
-            ],
+            electricity_price_increase=electricity_price_increase_rate_effective_percent,
         )
         results["break_even_scenarios"] = break_even_analyzer.calculate_scenarios()
     except Exception as e:
@@ -3691,7 +3803,7 @@ def perform_calculations(
             warranty_power=80,  # Standard 80% nach Garantiezeit
         )
         results["degradation_analysis"] = degradation_analyzer.calculate_degradation(
-            years=results["simulation_period_years_effective"]
+            years=simulation_period_years_effective
         )
     except Exception as e:
         if errors_list is not None:
@@ -3705,14 +3817,14 @@ def perform_calculations(
                 "maintenance_interval_months": 12,
                 "maintenance_cost": maintenance_cost_fixed_pa
                 / 2,  # Hälfte der jährlichen Wartungskosten
-                "last_maintenance_date": datetime.now().strftime("%Y-%m-%d"),
+                "last_maintenance_date": calculation_date,
             },
             {
                 "name": "PV-Module",
                 "maintenance_interval_months": 6,
                 "maintenance_cost": maintenance_cost_fixed_pa
                 / 2,  # Andere Hälfte der jährlichen Wartungskosten
-                "last_maintenance_date": datetime.now().strftime("%Y-%m-%d"),
+                "last_maintenance_date": calculation_date,
             },
         ]
 
@@ -3724,12 +3836,12 @@ def perform_calculations(
                     "maintenance_interval_months": 12,
                     "maintenance_cost": maintenance_cost_fixed_pa
                     * 0.2,  # 20% der jährlichen Wartungskosten
-                    "last_maintenance_date": datetime.now().strftime("%Y-%m-%d"),
+                    "last_maintenance_date": calculation_date,
                 }
             )
 
         maintenance_monitor = MaintenanceMonitoring(
-            components=components, installation_date=datetime.now().strftime("%Y-%m-%d")
+            components=components, installation_date=calculation_date
         )
         results["maintenance_schedule"] = (
             maintenance_monitor.generate_maintenance_schedule()
@@ -3738,6 +3850,23 @@ def perform_calculations(
         if errors_list is not None:
             errors_list.append(f"Fehler bei Wartungsplanerstellung: {str(e)}")
 
+
+def _calc_stage_indicators(
+    results: Dict[str, Any],
+    errors_list: List[str],
+    project_details: Dict[str, Any],
+    global_constants: Dict[str, Any],
+    simulation_period_years_effective: int,
+    annual_consumption_kwh_yr: float,
+    annual_pv_production_kwh: float,
+    eigenverbrauch_pro_jahr_kwh: float,
+    monthly_direct_self_consumption_kwh: List[float],
+    monthly_storage_discharge_for_sc_kwh: List[float],
+    include_storage: Any,
+    selected_storage_capacity_kwh: float,
+    storage_details_from_db: Optional[Dict[str, Any]],
+) -> Dict[str, Any]:
+    """Stufe Abschlusskennzahlen: Autarkie, Speicher, Verschattung."""
     # Standardwerte für Diagrammdaten-Keys setzen, falls sie nicht explizit berechnet wurden
     # Dies ist wichtig, damit analysis.py nicht auf nicht existierende Keys zugreift.
     chart_data_keys_to_ensure = [
@@ -3814,11 +3943,11 @@ def perform_calculations(
             calculated_default_max_cycles_val = default_cycles_from_product_db_val
             if (
                 cycles_per_year_for_default_from_constants_val > 0
-                and results["simulation_period_years_effective"] > 0
+                and simulation_period_years_effective > 0
             ):  # Sicherstellen, dass Divisor > 0
                 calculated_default_max_cycles_val = (
                     cycles_per_year_for_default_from_constants_val
-                    * results["simulation_period_years_effective"]
+                    * simulation_period_years_effective
                 )  # Alternative: Zyklen über Lebensdauer
 
             if storage_max_cycles_raw_val is None:  # Kein Wert in DB
@@ -3858,6 +3987,520 @@ def perform_calculations(
         project_details.get("verschattungsverlust_pct", 0.0) or 0.0
     )
 
+
+_PVGIS_TEXT_KEYS = (
+    "pvgis_cache_only_miss",
+    "pvgis_connection_error",
+    "pvgis_http_error",
+    "pvgis_incomplete_data",
+    "pvgis_invalid_lat_lon",
+    "pvgis_invalid_peak_power",
+    "pvgis_json_decode_error",
+    "pvgis_request_error",
+    "pvgis_timeout_error",
+    "pvgis_unknown_error",
+)
+
+# Reihenfolge = Ausführungsreihenfolge (und Reihenfolge der Keys in results).
+# projections: nur diese Keys der großen Dicts gehen in die Stufe und ihren Cache-Schlüssel.
+_CALCULATION_GRAPH = CalculationGraph(
+    (
+        CalculationStage(
+            "yield",
+            _calc_stage_yield,
+            outputs=(
+                "annual_pv_production_kwh",
+                "monthly_pv_production_kwh",
+                "specific_annual_yield_kwh_per_kwp",
+            ),
+            projections={
+                "project_details": ("latitude", "longitude", "roof_inclination_deg", "roof_orientation"),
+                "global_constants": (
+                    "monthly_production_distribution",
+                    "pvgis_system_loss_default_percent",
+                    "specific_yields_by_orientation_tilt",
+                ),
+                "texts": (
+                    "error_geocoding_conversion_calc",
+                    "pvgis_invalid_lat_lon_range",
+                    "warn_invalid_monthly_distribution",
+                    "warn_pvgis_zero_coords",
+                )
+                + _PVGIS_TEXT_KEYS,
+            },
+        ),
+        CalculationStage(
+            "energy_flow",
+            _calc_stage_energy_flow,
+            outputs=(
+                "monthly_direct_self_consumption_kwh",
+                "monthly_storage_discharge_for_sc_kwh",
+                "eigenverbrauch_pro_jahr_kwh",
+                "netzeinspeisung_kwh",
+            ),
+            projections={
+                "project_details": ("latitude", "load_profile"),
+                "customer_data": ("type",),
+                "global_constants": (
+                    "direct_self_consumption_factor_of_production",
+                    "energy_flow_model",
+                    "monthly_consumption_distribution",
+                    "storage_c_rate",
+                    "storage_cycles_per_year",
+                    "storage_efficiency",
+                    "storage_min_soc_percent",
+                ),
+                "texts": ("warn_invalid_monthly_consumption_distribution",),
+            },
+        ),
+        CalculationStage(
+            "costs",
+            _calc_stage_costs,
+            outputs=("base_matrix_price_netto", "total_investment_netto", "total_investment_brutto"),
+            projections={
+                "project_details": (
+                    "building_height_gt_7m",
+                    "free_roof_area_sqm",
+                    "include_additional_components",
+                )
+                + tuple(OPTIONAL_COMPONENT_COST_KEYS),
+                "economic_data": ("custom_costs_netto",),
+                "global_constants": (
+                    "additional_components_flat_rate_netto",
+                    "misc_costs_flat_rate_netto",
+                    "one_time_bonus_eur",
+                    "scaffolding_cost_per_sqm_gt_7m_netto",
+                ),
+                "texts": (
+                    "error_invalid_price_in_matrix_conversion",
+                    "error_module_count_not_in_matrix",
+                    "error_no_storage_column_or_price_not_found_in_matrix",
+                    "error_price_matrix_not_loaded_or_empty",
+                    "no_storage_option_for_matrix",
+                ),
+            },
+            opaque=("price_matrix_lookup",),
+        ),
+        CalculationStage(
+            "economics_year1",
+            _calc_stage_economics_year1,
+            outputs=(
+                "annual_financial_benefit_year1",
+                "feed_in_tariff_effective",
+                "income_tax_rate_percent",
+                "einspeiseverguetung_eur_per_kwh",
+            ),
+            projections={
+                "project_details": ("feed_in_type",),
+                "customer_data": ("income_tax_rate_percent", "type"),
+            },
+        ),
+        CalculationStage(
+            "simulation",
+            _calc_stage_simulation,
+            outputs=(
+                "cash_flows_initial_investment",
+                "annual_productions_sim",
+                "annual_maintenance_costs_sim",
+                "maintenance_cost_fixed_pa",
+            ),
+            projections={
+                "customer_data": ("type",),
+                "global_constants": (
+                    "einspeiseverguetung_period_years",
+                    "maintenance_costs_base_percent",
+                    "maintenance_fixed_eur_pa",
+                    "maintenance_increase_percent_pa",
+                    "maintenance_variable_eur_per_kwp_pa",
+                    "marktwert_strom_eur_per_kwh_after_eeg",
+                ),
+            },
+        ),
+        CalculationStage(
+            "kpis",
+            _calc_stage_kpis,
+            projections={
+                "project_details": (
+                    "annual_consumption_kwh_yr",
+                    "consumption_heating_kwh_yr",
+                    "electricity_price_kwh",
+                    "future_ev",
+                    "future_hp",
+                ),
+                "global_constants": (
+                    "afa_period_years",
+                    "alternative_investment_interest_rate_percent",
+                    "co2_emission_factor_kg_per_kwh",
+                    "co2_per_car_km_kg",
+                    "co2_per_flight_muc_pmi_kg",
+                    "co2_per_tree_kg_pa",
+                    "default_performance_ratio_percent",
+                    "eauto_annual_km",
+                    "eauto_consumption_kwh_per_100km",
+                    "eauto_pv_share_percent",
+                    "heatpump_cop_factor",
+                    "heatpump_pv_share_percent",
+                    "reference_specific_yield_pr",
+                ),
+                "texts": ("error_irr_calculation", "warn_numpy_financial_missing_for_irr"),
+            },
+        ),
+        CalculationStage("analyses", _calc_stage_analyses),
+        CalculationStage(
+            "indicators",
+            _calc_stage_indicators,
+            projections={
+                "project_details": ("verschattungsverlust_pct",),
+                "global_constants": ("optimal_storage_factor", "storage_cycles_per_year"),
+            },
+        ),
+    )
+)
+
+_LAST_STAGE_TIMINGS: List[StageTiming] = []
+
+
+def _stage_product_fields(
+    details: Optional[Dict[str, Any]], fields: Tuple[str, ...]
+) -> Optional[Dict[str, Any]]:
+    """Nur die Produktfelder, die eine Stufe liest (ohne Bilder/Datenblätter im Cache-Schlüssel)."""
+    if not details:
+        return None
+    subset = {"id": details.get("id")}
+    subset.update((f, details[f]) for f in fields if f in details)
+    return subset
+
+
+def _notify_pvgis_status(
+    project_details: Dict[str, Any],
+    anlage_kwp: float,
+    pvgis_enabled: bool,
+    app_debug_mode_is_enabled: bool,
+) -> None:
+    """PVGIS-Hinweise im UI; außerhalb der Ertragsstufe, damit sie auch bei Cache-Treffern kommen."""
+    if anlage_kwp <= 0:
+        return
+    if (
+        pvgis_enabled
+        and project_details.get("latitude") is not None
+        and project_details.get("longitude") is not None
+    ):
+        # Debug: Zeige PV GIS Status
+        if app_debug_mode_is_enabled and hasattr(st, "sidebar"):
+            st.info(f" DEBUG: PV GIS ist AKTIVIERT (pvgis_enabled={pvgis_enabled})")
+    elif not pvgis_enabled and STREAMLIT_AVAILABLE:
+        # Informative Meldung wenn PV GIS bewusst deaktiviert wurde
+        try:
+            st.info("ℹ PV GIS ist in den Einstellungen DEAKTIVIERT. Verwende manuelle Ertragsberechnung.")
+        except Exception:
+            pass  # Streamlit nicht verfügbar, ignoriere Meldung
+
+
+def _set_last_stage_timings(timings: List[StageTiming]) -> None:
+    global _LAST_STAGE_TIMINGS
+    _LAST_STAGE_TIMINGS = list(timings)
+
+
+def get_last_calculation_stage_timings() -> List[Dict[str, Any]]:
+    """Zeiten je Stufe des letzten perform_calculations-Laufs (ms, aus Cache ja/nein)."""
+    return [t.as_dict() for t in _LAST_STAGE_TIMINGS]
+
+
+def get_calculation_stage_stats() -> Dict[str, Dict[str, int]]:
+    """Cache-Treffer/-Fehlschläge je Stufe seit Prozessstart bzw. letztem Leeren."""
+    return {name: dict(counters) for name, counters in _CALCULATION_GRAPH.stats.items()}
+
+
+def clear_calculation_stage_cache() -> None:
+    _CALCULATION_GRAPH.clear()
+
+
+def perform_calculations(
+    project_data: Dict[str, Any],
+    texts: Dict[str, str],
+    errors_list: List[str],
+    simulation_duration_user: Optional[int] = None,
+    electricity_price_increase_user: Optional[float] = None,
+    settings: Optional[Mapping] = None,
+    context: Optional[Mapping[str, Any]] = None,
+) -> Dict[str, Any]:
+    calc_start = time.perf_counter()
+    results: Dict[str, Any] = {"calculation_errors": errors_list}
+    # Alle Admin-Settings dieses Laufs aus einem Snapshot lesen, damit eine
+    # Berechnung nie zwei Settings-Versionen mischt. Ein Batch-Kontext
+    # (build_batch_context) liefert Settings und Produkte explizit, ohne
+    # Modul-Globals anzufassen, die parallele Sitzungen mitbenutzen.
+    # Solche Läufe (Batch, Sweep, Sizing) rechnen Kandidaten durch und dürfen
+    # das Ergebnis der Nutzer-Sitzung nicht überschreiben.
+    persist_to_session = settings is None and context is None
+    if settings is None and context is not None:
+        settings = batch_context_settings(context)
+    if settings is None:
+        settings = _current_admin_settings_snapshot()
+    load_setting = settings.get if settings is not None else real_load_admin_setting
+    lookup_product = batch_context_product_lookup(context) if context is not None else real_get_product_by_id
+    customer_data = project_data.get("customer_data", {})
+    project_details = project_data.get("project_details", {})
+    economic_data = project_data.get("economic_data", {})
+
+    # KORREKTUR: Definition von module_quantity an den Anfang verschieben
+    # Anlagengröße (Modulanzahl wird früh benötigt)
+    module_quantity = int(project_details.get("module_quantity", 0) or 0)
+    # selected_module_id wird später für die Kapazität benötigt, aber die Anzahl ist jetzt schon da.
+
+    global_constants = load_setting("global_constants")
+    if not isinstance(global_constants, dict) or not global_constants:
+        global_constants = Dummy_load_admin_setting_calc("global_constants")
+        errors_list.append(
+            texts.get(
+                "warn_global_constants_fallback",
+                "Warnung: Fallback für globale Konstanten verwendet.",
+            )
+        )
+
+    app_debug_mode_is_enabled = global_constants.get("app_debug_mode_enabled", False)
+    if not isinstance(app_debug_mode_is_enabled, bool):
+        app_debug_mode_is_enabled = False
+    # --- Preis-Matrix laden (mit Cache) ---
+    price_matrix_excel_bytes = load_setting("price_matrix_excel_bytes", None)
+    price_matrix_csv_content = load_setting("price_matrix_csv_data", "")
+    setting_stamp = getattr(settings, "stamp", None)
+    price_matrix_df_for_lookup, pm_source = load_price_matrix_df_with_cache(
+        price_matrix_excel_bytes if isinstance(price_matrix_excel_bytes, (bytes, bytearray)) else None,
+        price_matrix_csv_content if isinstance(price_matrix_csv_content, str) else None,
+        errors_list,
+        excel_stamp=setting_stamp("price_matrix_excel_bytes") if callable(setting_stamp) else None,
+        csv_stamp=setting_stamp("price_matrix_csv_data") if callable(setting_stamp) else None,
+    )
+    results["price_matrix_source_type"] = pm_source
+    results["price_matrix_loaded_successfully"] = bool(
+        price_matrix_df_for_lookup is not None and not price_matrix_df_for_lookup.empty
+    )
+    # if app_debug_mode_is_enabled: print(f"CALC: Preis-Matrix für Lookup geladen: {results['price_matrix_loaded_successfully']} (Quelle: {results.get('price_matrix_source_type', 'Keine')})") # Bereinigt
+
+    # Einspeisevergütungen laden
+    feed_in_tariffs_block = load_setting(
+        "feed_in_tariffs", Dummy_load_admin_setting_calc("feed_in_tariffs")
+    )
+    einspeiseverguetung_parts_data = (
+        feed_in_tariffs_block.get("parts", [])
+        if isinstance(feed_in_tariffs_block, dict)
+        else []
+    )
+    einspeiseverguetung_full_data = (
+        feed_in_tariffs_block.get("full", [])
+        if isinstance(feed_in_tariffs_block, dict)
+        else []
+    )
+
+    # Globale Konstanten extrahieren mit robusten Fallbacks
+    DEFAULT_YIELD_KWH_PER_KWP_ANNUAL = float(
+        global_constants.get("default_specific_yield_kwh_kwp", 950.0) or 950.0
+    )
+    simulation_period_years_default = int(
+        global_constants.get("simulation_period_years", 20) or 20
+    )
+    results["simulation_period_years_effective"] = (
+        simulation_duration_user
+        if simulation_duration_user is not None
+        else int(
+            economic_data.get(
+                "simulation_period_years", simulation_period_years_default
+            )
+            or simulation_period_years_default
+        )
+    )
+    electricity_price_increase_default_percent = float(
+        global_constants.get("electricity_price_increase_annual_percent", 3.0) or 3.0
+    )
+    results["electricity_price_increase_rate_effective_percent"] = (
+        electricity_price_increase_user
+        if electricity_price_increase_user is not None
+        else float(
+            economic_data.get(
+                "electricity_price_increase_annual_percent",
+                electricity_price_increase_default_percent,
+            )
+            or electricity_price_increase_default_percent
+        )
+    )
+    vat_rate_percent = float(global_constants.get("vat_rate_percent", 0.0) or 0.0)
+    inflation_rate_percent = float(
+        global_constants.get("inflation_rate_percent", 2.0) or 2.0
+    )
+    loan_interest_rate_percent = float(
+        global_constants.get("loan_interest_rate_percent", 4.0) or 4.0
+    )
+    annual_module_degradation_percent = float(
+        global_constants.get("annual_module_degradation_percent", 0.5) or 0.5
+    )
+    annual_degredation_factor = 1.0 - (annual_module_degradation_percent / 100.0)
+    specific_yields_by_orientation_tilt = global_constants.get(
+        "specific_yields_by_orientation_tilt", {}
+    )
+    if not isinstance(
+        specific_yields_by_orientation_tilt, dict
+    ):  # Fallback, falls Typ nicht stimmt
+        specific_yields_by_orientation_tilt = Dummy_load_admin_setting_calc(
+            "global_constants"
+        )["specific_yields_by_orientation_tilt"]
+    global_yield_adjustment_percent = float(
+        global_constants.get("global_yield_adjustment_percent", 0.0) or 0.0
+    )
+
+    # Projektdaten für Verbrauch und Strompreis
+    jahresverbrauch_haushalt = float(
+        project_details.get("annual_consumption_kwh_yr", 0.0) or 0.0
+    )
+    jahresverbrauch_heizung = float(
+        project_details.get("consumption_heating_kwh_yr", 0.0) or 0.0
+    )
+    annual_consumption_kwh_yr = jahresverbrauch_haushalt + jahresverbrauch_heizung
+    electricity_price_kwh = float(
+        project_details.get("electricity_price_kwh", 0.30) or 0.30
+    )
+    results["total_consumption_kwh_yr"] = (
+        annual_consumption_kwh_yr  # Für Diagramme oft benötigt
+    )
+    (
+        results["jahresstromverbrauch_fuer_hochrechnung_kwh"],
+        results["aktueller_strompreis_fuer_hochrechnung_euro_kwh"],
+    ) = (annual_consumption_kwh_yr, electricity_price_kwh)
+
+    # Anlagengröße
+    selected_module_id = project_details.get("selected_module_id")
+    module_details = (
+        lookup_product(selected_module_id) if selected_module_id else None
+    )
+    module_capacity_w = (
+        float(module_details.get("capacity_w", 0.0) or 0.0) if module_details else 0.0
+    )
+    results["anlage_kwp"] = (module_quantity * module_capacity_w) / 1000.0
+
+    # Anlagengröße für erweiterte Berechnungen definieren
+    anlage_kwp = results["anlage_kwp"]
+
+    # Fallback: Neuberechnung, falls 'anlage_kwp' aus project_details fehlt oder 0 ist.
+    # Dies ist die ursprüngliche Logik, die nun als Fallback dient.
+
+    # Hinzufügen von Fehlermeldungen/Warnungen, wenn der Fallback verwendet wird oder null ergibt
+
+    # KORREKTUR: PV GIS Einstellung aus Datenbank laden statt aus global_constants
+    try:
+        if real_load_admin_setting is Dummy_load_admin_setting_calc:
+            raise ImportError("database nicht verfügbar")
+        pvgis_setting_raw = load_setting("pvgis_enabled", "false")  # Default auf false
+        # Boolean-Konvertierung - berücksichtigt String-Werte aus Datenbank
+        if isinstance(pvgis_setting_raw, str):
+            pvgis_enabled = pvgis_setting_raw.lower() in ['true', '1', 'yes', 'on']
+        else:
+            pvgis_enabled = bool(pvgis_setting_raw)
+        
+        # Debug-Info für PV GIS Status
+        if app_debug_mode_is_enabled:
+            debug_msg = f"DEBUG: PV GIS Status - Raw: '{pvgis_setting_raw}', Enabled: {pvgis_enabled}"
+            print(debug_msg)
+            if STREAMLIT_AVAILABLE:
+                st.sidebar.info(debug_msg)
+                
+    except ImportError:
+        # Fallback auf global_constants wenn Datenbank nicht verfügbar
+        pvgis_enabled = bool(global_constants.get("pvgis_enabled", False))  # Default auf false
+        if app_debug_mode_is_enabled:
+            debug_msg = f"DEBUG: PV GIS Fallback - Enabled: {pvgis_enabled} (Database not available)"
+            print(debug_msg)
+            if STREAMLIT_AVAILABLE:
+                st.sidebar.info(debug_msg)
+    pvgis_cache_only = is_cache_only_mode(load_setting("pvgis_cache_only", False))
+    try:
+        amortization_cheat_settings = load_setting("amortization_cheat_settings", None)
+    except Exception:
+        # Cheat-Einstellungen ignorieren, falls Fehler
+        amortization_cheat_settings = None
+
+    # Speicher
+    include_storage = project_details.get("include_storage", False)
+    selected_storage_id = (
+        project_details.get("selected_storage_id") if include_storage else None
+    )
+    # Nutze die explizit im Projekt ausgewählte Kapazität, nicht die aus den Produktdetails für diese Logik
+    selected_storage_capacity_kwh = (
+        float(project_details.get("selected_storage_storage_power_kw", 0.0) or 0.0)
+        if include_storage
+        else 0.0
+    )
+    storage_details_from_db = (
+        lookup_product(selected_storage_id)
+        if selected_storage_id and include_storage
+        else None
+    )
+    selected_inverter_id = project_details.get("selected_inverter_id")
+    inverter_details = (
+        lookup_product(selected_inverter_id) if selected_inverter_id else None
+    )
+    optional_component_details: Dict[str, Optional[Dict[str, Any]]] = {}
+    if project_details.get("include_additional_components", False):
+        for pd_key in OPTIONAL_COMPONENT_COST_KEYS:
+            component_id = project_details.get(pd_key)
+            if component_id:
+                optional_component_details[pd_key] = _stage_product_fields(
+                    lookup_product(component_id), ("additional_cost_netto",)
+                )
+
+    _notify_pvgis_status(project_details, anlage_kwp, pvgis_enabled, app_debug_mode_is_enabled)
+
+    stage_inputs: Dict[str, Any] = {
+        "project_details": project_details,
+        "customer_data": customer_data,
+        "economic_data": economic_data,
+        "global_constants": global_constants,
+        "texts": texts,
+        "app_debug_mode_is_enabled": app_debug_mode_is_enabled,
+        "price_matrix_lookup": get_price_matrix_lookup(price_matrix_df_for_lookup),
+        "price_matrix_fingerprint": (pm_source, get_price_matrix_fingerprint(price_matrix_df_for_lookup)),
+        "einspeiseverguetung_parts_data": einspeiseverguetung_parts_data,
+        "einspeiseverguetung_full_data": einspeiseverguetung_full_data,
+        "amortization_cheat_settings": amortization_cheat_settings,
+        "DEFAULT_YIELD_KWH_PER_KWP_ANNUAL": DEFAULT_YIELD_KWH_PER_KWP_ANNUAL,
+        "simulation_period_years_effective": results["simulation_period_years_effective"],
+        "electricity_price_increase_rate_effective_percent": results[
+            "electricity_price_increase_rate_effective_percent"
+        ],
+        "vat_rate_percent": vat_rate_percent,
+        "inflation_rate_percent": inflation_rate_percent,
+        "loan_interest_rate_percent": loan_interest_rate_percent,
+        "annual_module_degradation_percent": annual_module_degradation_percent,
+        "annual_degredation_factor": annual_degredation_factor,
+        "global_yield_adjustment_percent": global_yield_adjustment_percent,
+        "annual_consumption_kwh_yr": annual_consumption_kwh_yr,
+        "electricity_price_kwh": electricity_price_kwh,
+        "module_quantity": module_quantity,
+        "anlage_kwp": anlage_kwp,
+        "module_details": _stage_product_fields(module_details, ("capacity_w", "additional_cost_netto")),
+        "inverter_details": _stage_product_fields(inverter_details, ("additional_cost_netto",)),
+        "include_storage": include_storage,
+        "selected_storage_capacity_kwh": selected_storage_capacity_kwh,
+        "storage_details_from_db": _stage_product_fields(
+            storage_details_from_db, ("model_name", "power_kw", "additional_cost_netto", "max_cycles")
+        ),
+        "optional_component_details": optional_component_details,
+        "pvgis_enabled": pvgis_enabled,
+        "pvgis_cache_only": pvgis_cache_only,
+        "calculation_date": datetime.now().strftime("%Y-%m-%d"),
+    }
+    inputs_ms = (time.perf_counter() - calc_start) * 1000.0
+    stage_timings = [StageTiming("inputs", inputs_ms, False)]
+    stage_timings += _CALCULATION_GRAPH.run(stage_inputs, results, errors_list)
+    _set_last_stage_timings(stage_timings)
+    if app_debug_mode_is_enabled:
+        print(
+            "CALC: Stufen-Zeiten: "
+            + ", ".join(
+                f"{t.stage}={t.ms:.1f}ms{' (Cache)' if t.cached else ''}"
+                for t in stage_timings
+            )
+        )
+
     # if app_debug_mode_is_enabled: print(f"--- CALCULATIONS.PY: Berechnungen abgeschlossen. Ergebnisse (Auszug): {json.dumps({k: v for k,v in results.items() if not isinstance(v, list) or len(v) < 5}, indent=2, ensure_ascii=False)}") # Bereinigt
     # if app_debug_mode_is_enabled and errors_list: print(f"CALC: Gesammelte Fehler/Hinweise: {errors_list}") # Bereinigt
 
@@ -3865,7 +4508,7 @@ def perform_calculations(
     try:
         import streamlit as st
 
-        if hasattr(st, "session_state"):
+        if persist_to_session and hasattr(st, "session_state"):
             # Zeitstempel für dieses Berechnungsergebnis
             timestamp = datetime.now().isoformat()
 
@@ -3905,6 +4548,199 @@ def perform_calculations(
     return results
 
 
+
+
+# --- Batch-Berechnung (Neubepreisung vieler Projekte) ---
+# Admin-Settings, die perform_calculations liest. Sie werden im Batch einmal
+# geladen und an die Worker-Prozesse übergeben, statt je Projekt die DB zu fragen.
+BATCH_ADMIN_SETTING_KEYS = (
+    "global_constants",
+    "price_matrix_excel_bytes",
+    "price_matrix_csv_data",
+    "feed_in_tariffs",
+    "amortization_cheat_settings",
+    "pvgis_enabled",
+    "pvgis_cache_only",
+)
+
+
+def build_batch_context(texts: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Lädt alles Projektunabhängige einmal: Admin-Settings, Preis-Matrix, Produkte."""
+    snapshot = _current_admin_settings_snapshot()
+    load_setting = snapshot.get if snapshot is not None else real_load_admin_setting
+    settings = {key: load_setting(key, None) for key in BATCH_ADMIN_SETTING_KEYS}
+    if settings.get("feed_in_tariffs") is None:
+        settings["feed_in_tariffs"] = Dummy_load_admin_setting_calc("feed_in_tariffs")
+    products_by_id: Dict[int, Dict[str, Any]] = {}
+    try:
+        for product in real_list_products() or []:
+            if product.get("id") is not None:
+                products_by_id[int(product["id"])] = product
+    except Exception as e_products:
+        print(f"CALC Batch: Produktliste konnte nicht geladen werden: {e_products}")
+
+    matrix_errors: List[str] = []
+    excel_bytes = settings.get("price_matrix_excel_bytes")
+    csv_content = settings.get("price_matrix_csv_data")
+    setting_stamp = getattr(snapshot, "stamp", None)
+    price_matrix_df, price_matrix_source = load_price_matrix_df_with_cache(
+        excel_bytes if isinstance(excel_bytes, (bytes, bytearray)) else None,
+        csv_content if isinstance(csv_content, str) else None,
+        matrix_errors,
+        excel_stamp=setting_stamp("price_matrix_excel_bytes") if callable(setting_stamp) else None,
+        csv_stamp=setting_stamp("price_matrix_csv_data") if callable(setting_stamp) else None,
+    )
+    return {
+        "texts": dict(texts or {}),
+        "settings": settings,
+        "products_by_id": products_by_id,
+        "price_matrix_cache": dict(_PRICE_MATRIX_CACHE),
+        "price_matrix_source": price_matrix_source,
+        "price_matrix_errors": matrix_errors,
+        "has_price_matrix": price_matrix_df is not None,
+    }
+
+
+def batch_context_settings(context: Mapping[str, Any]) -> Dict[str, Any]:
+    """Settings des Batch-Kontexts ohne None-Werte (dann greifen die Defaults von load_setting)."""
+    return {k: v for k, v in (context.get("settings") or {}).items() if v is not None}
+
+
+def batch_context_product_lookup(context: Mapping[str, Any]):
+    """get_product_by_id-Ersatz, der nur im Batch-Kontext nachschlägt (keine DB)."""
+    products_by_id = context.get("products_by_id") or {}
+
+    def _lookup(product_id):
+        try:
+            return products_by_id.get(int(product_id))
+        except (TypeError, ValueError):
+            return None
+
+    return _lookup
+
+
+_BATCH_WORKER_CONTEXT: Dict[str, Any] = {}
+
+
+def _batch_worker_init(context: Dict[str, Any]) -> None:
+    """Initializer der Worker-Prozesse: Kontext einmal pro Prozess übernehmen.
+
+    Der Preis-Matrix-Cache des frischen Prozesses wird mit der bereits geparsten
+    Matrix vorbelegt (nur in diesem Worker, nie im Streamlit-Prozess).
+    """
+    global _BATCH_WORKER_CONTEXT
+    _BATCH_WORKER_CONTEXT = context
+    if context.get("price_matrix_cache") and _PRICE_MATRIX_CACHE.get("df") is None:
+        _PRICE_MATRIX_CACHE.update(context["price_matrix_cache"])
+
+
+def _run_batch_task(func, task: Any) -> Any:
+    """Im Worker: ``func`` mit dem beim Start übernommenen Kontext aufrufen."""
+    return func(task, _BATCH_WORKER_CONTEXT)
+
+
+def _batch_calculate_one(
+    task: Tuple[int, Dict[str, Any], Optional[int], Optional[float]],
+    context: Mapping[str, Any],
+) -> Tuple[int, Dict[str, Any]]:
+    index, project_data, simulation_duration_user, electricity_price_increase_user = task
+    errors: List[str] = []
+    try:
+        results = perform_calculations(
+            project_data,
+            context.get("texts", {}),
+            errors,
+            simulation_duration_user=simulation_duration_user,
+            electricity_price_increase_user=electricity_price_increase_user,
+            context=context,
+        )
+    except Exception as e_batch:
+        errors.append(f"Batch-Berechnung fehlgeschlagen: {e_batch}")
+        results = {"calculation_errors": errors}
+    return index, results
+
+
+def perform_calculations_batch(
+    projects: Iterable[Dict[str, Any]],
+    workers: Optional[int] = None,
+    texts: Optional[Dict[str, str]] = None,
+    simulation_duration_user: Optional[int] = None,
+    electricity_price_increase_user: Optional[float] = None,
+    ordered: bool = True,
+    chunksize: int = 8,
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Berechnet viele Projekte parallel und liefert die Ergebnisse als Iterator.
+
+    Admin-Settings, Preis-Matrix und Produktdaten werden einmal geladen und an
+    die Worker übergeben; danach greift kein Worker mehr auf die Datenbank zu.
+
+    Args:
+        projects: project_data-Dicts wie für perform_calculations.
+        workers: Anzahl Prozesse (None = CPU-Anzahl, <= 1 = im aktuellen Prozess).
+        ordered: True liefert in Eingabereihenfolge, False sobald fertig.
+
+    Yields:
+        (Index des Projekts in ``projects``, results-Dict)
+    """
+    context = build_batch_context(texts)
+    tasks = [
+        (idx, project, simulation_duration_user, electricity_price_increase_user)
+        for idx, project in enumerate(projects)
+    ]
+    yield from run_with_batch_context(
+        _batch_calculate_one,
+        tasks,
+        context,
+        workers=workers,
+        ordered=ordered,
+        chunksize=chunksize,
+    )
+
+
+def run_with_batch_context(
+    func,
+    tasks: List[Any],
+    context: Dict[str, Any],
+    workers: Optional[int] = None,
+    ordered: bool = True,
+    chunksize: int = 8,
+) -> Iterator[Any]:
+    """Führt ``func(task, context)`` für alle Tasks aus.
+
+    ``func`` muss auf Modulebene definiert sein (Pickle) und reicht den Kontext
+    an perform_calculations weiter (``settings=``/``context=``). Bei
+    ``workers <= 1`` läuft alles im aktuellen Prozess, sonst in einem
+    Prozess-Pool, dessen Worker den Kontext einmal beim Start übernehmen.
+    """
+    if not tasks:
+        return
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(int(workers), len(tasks)))
+
+    if workers == 1:
+        for task in tasks:
+            yield func(task, context)
+        return
+
+    # spawn statt fork: der Streamlit-Prozess ist multithreaded und hält
+    # gepoolte SQLite-Verbindungen, die ein geforkter Worker erben würde
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_batch_worker_init,
+        initargs=(context,),
+    ) as executor:
+        run_task = functools.partial(_run_batch_task, func)
+        if ordered:
+            yield from executor.map(run_task, tasks, chunksize=max(1, int(chunksize)))
+        else:
+            futures = [executor.submit(run_task, task) for task in tasks]
+            for future in as_completed(futures):
+                yield future.result()
+
+
 # --- Testlauf für calculations.py (optional, nur für direkte Ausführung) ---
 if __name__ == "__main__":
     print("--- Testlauf für calculations.py (minimal) ---")
@@ -3999,33 +4835,30 @@ class BreakEvenAnalysis:
             },
         }
 
+        annual_savings_adj_list = [
+            self.annual_savings * params["savings_factor"] for params in scenarios.values()
+        ]
+        # Alle Szenarien über max. 30 Jahre in einem Schritt
+        yearly_savings, cumulative, first_year_idx = break_even_search(
+            self.investment,
+            annual_savings_adj_list,
+            [params["electricity_price_increase"] for params in scenarios.values()],
+            self.inflation_rate,
+            years=30,
+        )
+
         results = {}
-        for scenario_name, params in scenarios.items():
-            annual_savings_adj = self.annual_savings * params["savings_factor"]
-            cumulative_savings = 0
+        for row, scenario_name in enumerate(scenarios):
+            annual_savings_adj = annual_savings_adj_list[row]
+            cumulative_savings = float(cumulative[row, -1])
             years_to_break_even = float("inf")
-
-            for year in range(1, 31):  # Max 30 Jahre
-                price_factor = (1 + params["electricity_price_increase"] / 100) ** year
-                inflation_factor = (1 + self.inflation_rate / 100) ** year
-
-                annual_savings_this_year = (
-                    annual_savings_adj * price_factor / inflation_factor
-                )
-                cumulative_savings += annual_savings_this_year
-
-                if (
-                    cumulative_savings >= self.investment
-                    and years_to_break_even == float("inf")
-                ):
-                    years_to_break_even = (
-                        year
-                        + (
-                            self.investment
-                            - (cumulative_savings - annual_savings_this_year)
-                        )
-                        / annual_savings_this_year
-                    )
+            year_idx = int(first_year_idx[row])
+            if year_idx >= 0:
+                annual_savings_this_year = float(yearly_savings[row, year_idx])
+                years_to_break_even = (year_idx + 1) + (
+                    self.investment
+                    - (float(cumulative[row, year_idx]) - annual_savings_this_year)
+                ) / annual_savings_this_year
 
             annual_roi = (annual_savings_adj / self.investment) * 100
 
@@ -19,6 +19,12 @@ import re
 import io
 from datetime import datetime
 
+try:
+    from pdf_page_cache import generate_offer_pdf_cached
+except ImportError:
+    def generate_offer_pdf_cached(generator, *args, force_refresh=False, cache=None, reuse_after_generation=True, **kwargs):
+        return generator(*args, **kwargs)
+
 # =============================================================================
 # ZENTRALE IMPORT-VERWALTUNG - ALLE PDF-SYSTEME AN EINEM ORT
 # =============================================================================
@@ -594,7 +600,8 @@ class PDFSystemManager:
                 system_func = self.get_system('standard')
                 if system_func:
                     print(" Verwende Standard System...")
-                    result = system_func(*args, **kwargs)
+                    # Geteilter PDF-Cache (Schlüssel über alle Eingaben und den DB-Stand)
+                    result = generate_offer_pdf_cached(system_func, *args, reuse_after_generation=False, **kwargs)
                     if result:
                         print(" Standard PDF erfolgreich generiert!")
                         return result
@@ -0,0 +1,437 @@
+# chart_export_engine.py
+"""
+Verzögerter, gebündelter PNG-Export der Plotly-Diagramme für das PDF.
+
+Bisher hat jeder ``render_*_switcher`` im Analyse-Tab sein Diagramm direkt per
+Kaleido (``fig.to_image``) gerastert und die PNG-Bytes in
+``analysis_results["*_chart_bytes"]`` abgelegt – rund 45 Exporte bei jedem
+Streamlit-Rerun, auch wenn gar kein PDF erzeugt wird. Jetzt gilt:
+
+- Der Analyse-Tab legt unter demselben Key nur ein ``DeferredChart`` ab
+  (Figur + Exportgröße). Das kostet keine Rasterung; Prüfungen wie
+  ``results[key] is not None`` ("Diagramm verfügbar") gelten unverändert.
+- Erst wenn ein PDF erzeugt wird, rastert ``materialize_deferred_charts``
+  alle offenen Diagramme eines Ergebnis-Dicts in einem Durchgang und ersetzt
+  sie durch die PNG-Bytes (bzw. None bei Fehlern). Dafür wird ein Kaleido-
+  Prozess einmal gestartet und für alle Diagramme (und spätere PDFs)
+  weiterverwendet.
+- Identische Figuren werden über einen gemeinsamen Bild-Cache
+  (``ChartImageCache``) nur einmal gerastert: Schlüssel ist ein BLAKE2b-
+  Digest über Daten und Layout der Figur (Arrays als Rohbytes, ohne
+  JSON-Serialisierung) plus Exportgröße. Der Cache ist nach Bytes begrenzt
+  (LRU), legt PNGs optional unter ``data/chart_cache/`` ab (bleibt über
+  Sitzungen erhalten) und zählt Treffer für die Anzeige in den Optionen.
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, MutableMapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CHART_CACHE_DIR = os.path.join(BASE_DIR, "data", "chart_cache")
+
+# Obergrenzen für gerasterte Diagramme im Prozess bzw. auf der Platte
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024
+DEFAULT_DISK_BYTES = 256 * 1024 * 1024
+# Nach so vielen Schreibvorgängen wird die Platten-Obergrenze geprüft
+_DISK_PRUNE_INTERVAL = 32
+
+_KALEIDO_LOCK = threading.Lock()
+_KALEIDO_STATE: Dict[str, Any] = {"started": False}
+
+
+@dataclass(frozen=True)
+class DeferredChart:
+    """Noch nicht gerastertes Diagramm (Platzhalter für ``*_chart_bytes``)."""
+
+    figure: Any
+    width: int = 800
+    height: int = 480
+    scale: float = 1.5
+    image_format: str = "png"
+
+    def export_options(self) -> Tuple[Any, ...]:
+        return (self.image_format, self.width, self.height, self.scale)
+
+
+def defer_chart_export(
+    fig: Any,
+    width: int = 800,
+    height: int = 480,
+    scale: float = 1.5,
+    image_format: str = "png",
+) -> Optional[DeferredChart]:
+    """Merkt die Figur für den späteren Export vor (None für fehlende Figur)."""
+    if fig is None:
+        return None
+    return DeferredChart(fig, width, height, scale, image_format)
+
+
+def is_deferred_chart(value: Any) -> bool:
+    return isinstance(value, DeferredChart)
+
+
+def _ensure_warm_kaleido() -> None:
+    """Startet einmal je Prozess einen dauerhaft laufenden Kaleido-Server.
+
+    Kaleido >= 1.1 bietet dafür ``start_sync_server``; ``fig.to_image`` nutzt
+    ihn dann für alle Exporte. Ältere Kaleido-Versionen halten ihren
+    Unterprozess ohnehin nach dem ersten Export offen.
+    """
+    with _KALEIDO_LOCK:
+        if _KALEIDO_STATE["started"]:
+            return
+        _KALEIDO_STATE["started"] = True
+        try:
+            import kaleido
+        except ImportError:
+            return
+        start = getattr(kaleido, "start_sync_server", None)
+        stop = getattr(kaleido, "stop_sync_server", None)
+        if not callable(start):
+            return
+        try:
+            start()
+            if callable(stop):
+                atexit.register(stop)
+        except Exception as e_start:
+            print(f"CHART EXPORT: Kaleido-Server konnte nicht vorab gestartet werden: {e_start}")
+
+
+def _feed_digest(hasher: Any, value: Any) -> None:
+    """Schreibt ``value`` eindeutig (mit Typ-Markern) in ``hasher``."""
+    if isinstance(value, dict):
+        hasher.update(b"{")
+        for key in sorted(value, key=str):
+            _feed_digest(hasher, str(key))
+            _feed_digest(hasher, value[key])
+        hasher.update(b"}")
+    elif isinstance(value, (list, tuple)):
+        hasher.update(b"[")
+        for item in value:
+            _feed_digest(hasher, item)
+        hasher.update(b"]")
+    elif isinstance(value, np.ndarray):
+        hasher.update(f"a{value.dtype.str}{value.shape}".encode("ascii"))
+        if value.dtype == object:
+            _feed_digest(hasher, value.tolist())
+        else:
+            hasher.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, str):
+        encoded = value.encode("utf-8")
+        hasher.update(b"s%d:" % len(encoded))
+        hasher.update(encoded)
+    elif isinstance(value, (bytes, bytearray)):
+        hasher.update(b"b%d:" % len(value))
+        hasher.update(value)
+    else:
+        # Zahlen, bool, None, Datumswerte
+        hasher.update(f"{type(value).__name__}:{value!r};".encode("utf-8"))
+
+
+def figure_digest(fig: Any) -> Optional[str]:
+    """BLAKE2b über ``data`` und ``layout`` der Figur (None, wenn nicht lesbar)."""
+    try:
+        spec = fig.to_plotly_json()
+    except Exception:
+        return None
+    hasher = hashlib.blake2b(digest_size=20)
+    try:
+        _feed_digest(hasher, {"data": spec.get("data"), "layout": spec.get("layout")})
+    except Exception:
+        return None
+    return hasher.hexdigest()
+
+
+def chart_cache_key(chart: DeferredChart) -> Optional[str]:
+    digest = figure_digest(chart.figure)
+    if digest is None:
+        return None
+    image_format, width, height, scale = chart.export_options()
+    return f"{digest}-{image_format}-{width}x{height}-{scale:g}"
+
+
+class ChartImageCache:
+    """Gerasterte Diagramme je Cache-Key: LRU nach Bytes, optional auf Platte."""
+
+    def __init__(
+        self,
+        memory_bytes: int = DEFAULT_MEMORY_BYTES,
+        persist_dir: Optional[str] = None,
+        disk_bytes: int = DEFAULT_DISK_BYTES,
+    ):
+        self.memory_bytes = int(memory_bytes)
+        self.persist_dir = persist_dir
+        self.disk_bytes = int(disk_bytes)
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_size = 0
+        self._disk_writes = 0
+        self._stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0,
+        }
+
+    def _path_for(self, key: str) -> Optional[str]:
+        if not self.persist_dir:
+            return None
+        return os.path.join(self.persist_dir, key[:2], f"{key}.img")
+
+    def _remember(self, key: str, data: bytes) -> None:
+        # Muss unter self._lock laufen
+        if len(data) > self.memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_size -= len(previous)
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+            self._stats["evictions"] += 1
+
+    def get(self, key: Optional[str]) -> Optional[bytes]:
+        if not key:
+            return None
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._stats["hits"] += 1
+                self._stats["memory_hits"] += 1
+                return data
+        path = self._path_for(key)
+        if path is not None:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            if data:
+                try:
+                    os.utime(path, None)  # Zugriffszeit für prune_disk (älteste zuerst)
+                except OSError:
+                    pass
+                with self._lock:
+                    self._remember(key, data)
+                    self._stats["hits"] += 1
+                    self._stats["disk_hits"] += 1
+                return data
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, key: Optional[str], data: Optional[bytes]) -> None:
+        if not key or not data:
+            return
+        with self._lock:
+            self._remember(key, data)
+            self._stats["writes"] += 1
+        path = self._path_for(key)
+        if path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # atomar schreiben, damit parallele Leser nie eine halbe Datei sehen
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except Exception:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+        except OSError as e_write:
+            print(f"CHART CACHE: {path} konnte nicht geschrieben werden: {e_write}")
+            return
+        with self._lock:
+            self._disk_writes += 1
+            prune = self._disk_writes % _DISK_PRUNE_INTERVAL == 0
+        if prune:
+            self.prune_disk()
+
+    def _disk_files(self) -> List[Tuple[float, int, str]]:
+        files = []
+        if not self.persist_dir or not os.path.isdir(self.persist_dir):
+            return files
+        for prefix in os.listdir(self.persist_dir):
+            prefix_dir = os.path.join(self.persist_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if not name.endswith(".img"):
+                    continue
+                path = os.path.join(prefix_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def prune_disk(self) -> int:
+        """Löscht die ältesten Dateien, bis die Platten-Obergrenze eingehalten ist."""
+        files = sorted(self._disk_files())
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in files:
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def clear(self, disk: bool = True) -> None:
+        """Leert den Cache (optional auch die Dateien) und setzt die Zähler zurück."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+            for k in self._stats:
+                self._stats[k] = 0
+        if disk:
+            for _, _, path in self._disk_files():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/Miss-Zähler dieses Prozesses plus Größe des Caches."""
+        with self._lock:
+            result: Dict[str, Any] = dict(self._stats)
+            lookups = result["hits"] + result["misses"]
+            result["hit_rate"] = (result["hits"] / lookups) if lookups else 0.0
+            result["entries"] = len(self._memory)
+            result["memory_bytes_used"] = self._memory_size
+            result["memory_bytes_max"] = self.memory_bytes
+            result["persistent"] = bool(self.persist_dir)
+        return result
+
+
+_CHART_IMAGE_CACHE: Optional[ChartImageCache] = None
+_CHART_IMAGE_CACHE_LOCK = threading.Lock()
+
+
+def _persist_enabled() -> bool:
+    """Platten-Cache abschaltbar über die Umgebungsvariable CHART_CACHE_PERSIST."""
+    env_value = os.environ.get("CHART_CACHE_PERSIST")
+    if env_value is not None and env_value.strip():
+        return env_value.strip().lower() in ("1", "true", "yes", "on")
+    return True
+
+
+def get_chart_image_cache() -> ChartImageCache:
+    """Prozessweite Standard-Instanz (lazy)."""
+    global _CHART_IMAGE_CACHE
+    if _CHART_IMAGE_CACHE is None:
+        with _CHART_IMAGE_CACHE_LOCK:
+            if _CHART_IMAGE_CACHE is None:
+                _CHART_IMAGE_CACHE = ChartImageCache(
+                    persist_dir=CHART_CACHE_DIR if _persist_enabled() else None
+                )
+    return _CHART_IMAGE_CACHE
+
+
+def rasterize_charts(
+    charts: Sequence[Optional[DeferredChart]],
+    errors_list: Optional[List[str]] = None,
+) -> List[Optional[bytes]]:
+    """Rastert alle Diagramme in einem Durchgang (Reihenfolge wie ``charts``).
+
+    Fehlgeschlagene Exporte liefern None; die erste Fehlermeldung landet in
+    ``errors_list``.
+    """
+    cache = get_chart_image_cache()
+    results: List[Optional[bytes]] = [None] * len(charts)
+    pending: Dict[str, List[int]] = {}
+    uncacheable: List[int] = []
+    for position, chart in enumerate(charts):
+        if chart is None:
+            continue
+        key = chart_cache_key(chart)
+        if key is None:
+            uncacheable.append(position)
+        elif key in pending:
+            pending[key].append(position)
+        else:
+            cached = cache.get(key)
+            if cached is not None:
+                results[position] = cached
+            else:
+                pending[key] = [position]
+
+    if not pending and not uncacheable:
+        return results
+    _ensure_warm_kaleido()
+    first_error: Optional[str] = None
+    jobs = [(key, positions) for key, positions in pending.items()] + [(None, [p]) for p in uncacheable]
+    for key, positions in jobs:
+        chart = charts[positions[0]]
+        try:
+            image = chart.figure.to_image(
+                format=chart.image_format, scale=chart.scale, width=chart.width, height=chart.height
+            )
+        except Exception as e_export:
+            if first_error is None:
+                first_error = str(e_export)
+            continue
+        cache.put(key, image)
+        for position in positions:
+            results[position] = image
+    if first_error is not None:
+        print(f"CHART EXPORT: Diagramm-Export fehlgeschlagen (Kaleido?): {first_error}")
+        if errors_list is not None:
+            errors_list.append(f"Diagramm-Export für PDF fehlgeschlagen (Kaleido?). Details: {first_error}")
+    return results
+
+
+def materialize_deferred_charts(
+    results: Optional[MutableMapping[str, Any]],
+    keys: Optional[Sequence[str]] = None,
+    errors_list: Optional[List[str]] = None,
+    keep: Optional[Callable[[DeferredChart], bool]] = None,
+) -> int:
+    """Ersetzt ``DeferredChart``-Werte in ``results`` durch PNG-Bytes (in place).
+
+    Ohne ``keys`` werden alle offenen Diagramme gerastert. Diagramme, für die
+    ``keep`` True liefert (z. B. nativ als Vektor zeichenbar), bleiben
+    unverändert. Rückgabe: Anzahl gerasterter Einträge.
+    """
+    if not results:
+        return 0
+    candidate_keys = list(keys) if keys is not None else list(results.keys())
+    deferred_keys = [
+        key for key in candidate_keys
+        if is_deferred_chart(results.get(key)) and not (keep is not None and keep(results[key]))
+    ]
+    if not deferred_keys:
+        return 0
+    images = rasterize_charts([results[key] for key in deferred_keys], errors_list)
+    for key, image in zip(deferred_keys, images):
+        results[key] = image
+    return len(deferred_keys)
+
+
+def clear_chart_export_cache() -> None:
+    get_chart_image_cache().clear()
@@ -1,13 +1,16 @@
-# database.py (Schema Version 14 - Spaltennamen und last_modified korrigiert)
+# database.py (Schema Version 16 - Revisionszähler für Admin-Settings)
 import sqlite3
 import os
 import traceback
 import json
-from typing import List, Dict, Any, Optional, Union
+import threading
+import time
+import weakref
+from typing import List, Dict, Any, Optional, Union, Callable
 from datetime import datetime
 import io
 
-DB_SCHEMA_VERSION = 14
+DB_SCHEMA_VERSION = 16
 print(f"DATABASE.PY TOP LEVEL: DB_SCHEMA_VERSION ist auf {DB_SCHEMA_VERSION} gesetzt.")
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -264,10 +267,218 @@ INITIAL_ADMIN_SETTINGS: Dict[str, Any] = {
     'active_company_id': None
 }
 
+# --- Verbindungs-Pool ---
+# Statt pro Aufruf eine neue SQLite-Verbindung zu öffnen, werden Verbindungen
+# je DB-Datei in einem Pool gehalten. conn.close() gibt die Verbindung an den
+# Pool zurück (offene Transaktionen werden verworfen, Cursor geschlossen), so
+# bleibt der bestehende Aufrufstil "get_db_connection() ... conn.close()" gültig.
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),          # Leser blockieren Schreiber nicht
+    ("synchronous", "NORMAL"),        # in WAL sicher, deutlich weniger fsyncs
+    ("mmap_size", 256 * 1024 * 1024),
+    ("cache_size", -20000),           # negativ = KiB, also ca. 20 MB Page-Cache
+    ("temp_store", "MEMORY"),
+)
+DB_POOL_MAX_IDLE = 8
+DB_SLOW_QUERY_LOG_MS = float(os.environ.get("DB_SLOW_QUERY_LOG_MS", "250"))
+
+_DB_POOL_LOCK = threading.Lock()
+_DB_POOL: Dict[str, List["PooledConnection"]] = {}
+_DB_POOL_STATS: Dict[str, int] = {"created": 0, "reused": 0, "discarded": 0}
+
+_QUERY_STATS_LOCK = threading.Lock()
+_QUERY_STATS: Dict[str, Dict[str, float]] = {}
+
+_SCHEMA_LOCK = threading.Lock()
+_SCHEMA_READY: set = set()
+
+
+def _record_query_timing(sql: Any, elapsed_ms: float) -> None:
+    statement = " ".join(str(sql).split())[:200]
+    with _QUERY_STATS_LOCK:
+        entry = _QUERY_STATS.get(statement)
+        if entry is None:
+            entry = _QUERY_STATS[statement] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
+        entry["count"] += 1
+        entry["total_ms"] += elapsed_ms
+        if elapsed_ms > entry["max_ms"]:
+            entry["max_ms"] = elapsed_ms
+    if elapsed_ms >= DB_SLOW_QUERY_LOG_MS:
+        print(f"DB LANGSAME ABFRAGE ({elapsed_ms:.1f} ms): {statement}")
+
+
+def get_query_stats(limit: Optional[int] = 20) -> List[Dict[str, Any]]:
+    """Zeitmessung je SQL-Statement (Ausführung ohne Fetch), sortiert nach Gesamtzeit."""
+    with _QUERY_STATS_LOCK:
+        rows = [
+            {
+                "sql": sql,
+                "count": int(entry["count"]),
+                "total_ms": round(entry["total_ms"], 3),
+                "avg_ms": round(entry["total_ms"] / entry["count"], 3) if entry["count"] else 0.0,
+                "max_ms": round(entry["max_ms"], 3),
+            }
+            for sql, entry in _QUERY_STATS.items()
+        ]
+    rows.sort(key=lambda row: row["total_ms"], reverse=True)
+    return rows[:limit] if limit else rows
+
+
+def reset_query_stats() -> None:
+    with _QUERY_STATS_LOCK:
+        _QUERY_STATS.clear()
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor, der die Ausführungszeit jedes Statements in get_query_stats erfasst."""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_query_timing(sql, (time.perf_counter() - start) * 1000.0)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_query_timing(sql, (time.perf_counter() - start) * 1000.0)
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            _record_query_timing(sql_script, (time.perf_counter() - start) * 1000.0)
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3.Connection, deren close() die Verbindung an den Pool zurückgibt."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_path: Optional[str] = None
+        self._in_pool = False
+        self._open_cursors = weakref.WeakSet()
+
+    def cursor(self, factory=TimedCursor):
+        cur = super().cursor(factory)
+        self._open_cursors.add(cur)
+        return cur
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def close(self):
+        _release_db_connection(self)
+
+    def close_physically(self):
+        sqlite3.Connection.close(self)
+
+
+def _open_pooled_connection(db_path: str) -> PooledConnection:
+    conn = sqlite3.connect(db_path, factory=PooledConnection, check_same_thread=False)
+    for pragma, value in SQLITE_PRAGMAS:
+        try:
+            sqlite3.Connection.execute(conn, f"PRAGMA {pragma}={value}").fetchall()
+        except sqlite3.Error as e_pragma:
+            print(f"DB WARNUNG: PRAGMA {pragma} nicht gesetzt: {e_pragma}")
+    conn.pool_path = db_path
+    return conn
+
+
+def _release_db_connection(conn: PooledConnection) -> None:
+    if conn._in_pool:
+        return  # doppeltes close()
+    try:
+        # Nicht zu Ende gelesene SELECTs würden in WAL einen alten Lese-Snapshot festhalten
+        for cur in list(conn._open_cursors):
+            try:
+                cur.close()
+            except sqlite3.Error:
+                pass
+        if conn.in_transaction:
+            conn.rollback()  # Verhalten wie close() ohne commit
+        conn.row_factory = sqlite3.Row
+        conn.text_factory = str
+    except sqlite3.Error:
+        conn.close_physically()
+        return
+    with _DB_POOL_LOCK:
+        idle = _DB_POOL.setdefault(conn.pool_path, [])
+        if len(idle) < DB_POOL_MAX_IDLE:
+            conn._in_pool = True
+            idle.append(conn)
+            return
+        _DB_POOL_STATS["discarded"] += 1
+    conn.close_physically()
+
+
+def close_db_pool() -> None:
+    """Schließt alle Verbindungen im Pool (z.B. vor Restore/Reset der DB-Datei)."""
+    with _DB_POOL_LOCK:
+        pooled = [conn for idle in _DB_POOL.values() for conn in idle]
+        _DB_POOL.clear()
+    for conn in pooled:
+        try:
+            conn.close_physically()
+        except sqlite3.Error:
+            pass
+    with _SCHEMA_LOCK:
+        _SCHEMA_READY.clear()
+
+
+def get_db_pool_stats() -> Dict[str, int]:
+    with _DB_POOL_LOCK:
+        stats = dict(_DB_POOL_STATS)
+        stats["idle"] = sum(len(idle) for idle in _DB_POOL.values())
+    return stats
+
+
+def ensure_schema_once(name: str, create_func: Callable[[sqlite3.Connection], None], conn: sqlite3.Connection) -> None:
+    """Führt DDL/Migrationen ``create_func`` pro DB-Datei und Prozess genau einmal aus."""
+    key = (getattr(conn, "pool_path", None) or DB_PATH, name)
+    if key in _SCHEMA_READY:
+        return
+    with _SCHEMA_LOCK:
+        if key in _SCHEMA_READY:
+            return
+        create_func(conn)
+        _SCHEMA_READY.add(key)
+
+
 def get_db_connection() -> Optional[sqlite3.Connection]:
     try:
         if not os.path.exists(DATA_DIR): os.makedirs(DATA_DIR)
-        conn = sqlite3.connect(DB_PATH)
+        db_path = DB_PATH
+        conn = None
+        with _DB_POOL_LOCK:
+            idle = _DB_POOL.get(db_path)
+            if idle:
+                if os.path.exists(db_path):
+                    conn = idle.pop()
+                    _DB_POOL_STATS["reused"] += 1
+                else:
+                    stale = list(idle)  # Datei wurde gelöscht -> alte Verbindungen verwerfen
+                    idle.clear()
+                    for stale_conn in stale:
+                        stale_conn.close_physically()
+                    with _SCHEMA_LOCK:
+                        for key in [key for key in _SCHEMA_READY if key[0] == db_path]:
+                            _SCHEMA_READY.discard(key)
+        if conn is None:
+            conn = _open_pooled_connection(db_path)
+            with _DB_POOL_LOCK:
+                _DB_POOL_STATS["created"] += 1
+        conn._in_pool = False
         conn.row_factory = sqlite3.Row
         return conn
     except sqlite3.Error as e: print(f"FATAL DB Error: {e}"); traceback.print_exc(); return None
@@ -289,11 +500,27 @@ def get_pdf_template_by_name(template_type: str, name: str) -> Optional[Dict[str
         if conn: 
             conn.close()
 
+def _blob_backup_dir(backup_path: str) -> str:
+    # Produktbilder und Firmenlogos liegen als Dateien im Blob-Store (nur ihr Hash in der DB)
+    return backup_path + ".blobs"
+
 def backup_database(backup_path: str) -> bool:
+    """Sichert die DB nach ``backup_path`` und den Blob-Store nach ``<backup_path>.blobs``."""
     try:
-        import shutil
         if os.path.exists(DB_PATH):
-            shutil.copy2(DB_PATH, backup_path)
+            # Backup-API statt Dateikopie: im WAL-Modus liegen Änderungen ggf. noch in der -wal Datei
+            conn = get_db_connection()
+            if conn is None:
+                return False
+            target = sqlite3.connect(backup_path)
+            try:
+                conn.backup(target)
+            finally:
+                target.close()
+                conn.close()
+            if get_blob_store is not None and os.path.isdir(get_blob_store().base_dir):
+                import shutil
+                shutil.copytree(get_blob_store().base_dir, _blob_backup_dir(backup_path), dirs_exist_ok=True)
             print(f"DB: Backup erfolgreich erstellt: {backup_path}")
             return True
         else:
@@ -303,11 +530,25 @@ def backup_database(backup_path: str) -> bool:
         print(f"DB Fehler backup_database: {e}")
         return False
 
+def _remove_wal_files(db_path: str) -> None:
+    for suffix in ("-wal", "-shm"):
+        try:
+            os.remove(db_path + suffix)
+        except OSError:
+            pass
+
 def restore_database(backup_path: str) -> bool:
     try:
         import shutil
         if os.path.exists(backup_path):
+            close_db_pool()
+            _remove_wal_files(DB_PATH)
             shutil.copy2(backup_path, DB_PATH)
+            blob_backup = _blob_backup_dir(backup_path)
+            if get_blob_store is not None and os.path.isdir(blob_backup):
+                # Blobs sind inhaltsadressiert: vorhandene Dateien bleiben, fehlende kommen dazu
+                shutil.copytree(blob_backup, get_blob_store().base_dir, dirs_exist_ok=True)
+            invalidate_admin_settings_cache()
             print(f"DB: Wiederherstellung erfolgreich von: {backup_path}")
             return True
         else:
@@ -610,7 +851,9 @@ def cleanup_orphaned_files() -> Dict[str, Any]:
 
 def reset_database() -> bool:
     try:
-        # Datenbankdatei löschen
+        # Datenbankdatei löschen (vorher gepoolte Verbindungen schließen)
+        close_db_pool()
+        _remove_wal_files(DB_PATH)
         if os.path.exists(DB_PATH):
             os.remove(DB_PATH)
             print(f"DB: Datenbankdatei {DB_PATH} gelöscht")
@@ -621,7 +864,7 @@ def reset_database() -> bool:
             shutil.rmtree(COMPANY_DOCS_BASE_DIR)
             print(f"DB: Company Documents Verzeichnis {COMPANY_DOCS_BASE_DIR} gelöscht")
         
-        # Datenbank neu initialisieren
+        # Datenbank neu initialisieren (init_db verwirft auch den Settings-Cache)
         init_db()
         print("DB: Datenbank erfolgreich zurückgesetzt und neu initialisiert")
         return True
@@ -633,11 +876,20 @@ import sqlite3
 import os
 import traceback
 import json
-from typing import List, Dict, Any, Optional, Union
+import copy
+import threading
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import List, Dict, Any, Optional, Union, Tuple
 from datetime import datetime
 import io
 
-DB_SCHEMA_VERSION = 14
+try:
+    from blob_store import get_blob_store
+except ImportError:
+    get_blob_store = None
+
+DB_SCHEMA_VERSION = 16
 print(f"DATABASE.PY TOP LEVEL: DB_SCHEMA_VERSION ist auf {DB_SCHEMA_VERSION} gesetzt.")
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -846,6 +1098,74 @@ def _ensure_column_exists(conn: sqlite3.Connection, table_name: str, column_name
             else:
                 print(f"DB FEHLER beim Hinzufügen von Spalte '{column_name}' zu '{table_name}': {e_alter}")
 
+def _migrate_company_logos_to_blob_store_v15(conn: sqlite3.Connection):
+    # Inline-Logos (Base64) in den Blob-Store verschieben, in der Zeile bleibt der Hash
+    if get_blob_store is None:
+        print("DB WARNUNG: blob_store nicht verfügbar, Firmenlogos bleiben inline.")
+        return
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, logo_base64 FROM companies WHERE logo_base64 IS NOT NULL AND logo_base64 != ''")
+    for row in cursor.fetchall():
+        sha = get_blob_store().put_base64(row['logo_base64'])
+        if sha is None:
+            print(f"DB WARNUNG: Logo von Firma ID {row['id']} ist kein gültiges Base64 und bleibt inline.")
+            continue
+        cursor.execute("UPDATE companies SET logo_blob_sha = ?, logo_base64 = NULL WHERE id = ?", (sha, row['id']))
+    conn.commit()
+
+def _externalize_company_logo(company_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Legt ein übergebenes logo_base64 im Blob-Store ab und setzt stattdessen logo_blob_sha."""
+    if get_blob_store is None or "logo_base64" not in company_data:
+        return company_data
+    logo_base64 = company_data.get("logo_base64")
+    if not logo_base64:
+        company_data["logo_blob_sha"] = None
+        return company_data
+    sha = get_blob_store().put_base64(logo_base64)
+    if sha is not None:
+        company_data["logo_blob_sha"] = sha
+        company_data["logo_base64"] = None
+    return company_data
+
+def _hydrate_company_logo(company: Dict[str, Any]) -> Dict[str, Any]:
+    """Füllt logo_base64 aus dem Blob-Store (Lesecache im Prozess)."""
+    if not company.get("logo_base64") and company.get("logo_blob_sha") and get_blob_store is not None:
+        company["logo_base64"] = get_blob_store().get_base64(company["logo_blob_sha"])
+    return company
+
+def prune_unreferenced_blobs() -> int:
+    """Löscht Blobs, auf die weder ein Produkt noch eine Firma mehr verweist.
+
+    Frisch geschriebene Blobs bleiben für ``DEFAULT_PRUNE_GRACE_SECONDS`` erhalten,
+    damit ein paralleles Speichern seinen Blob nicht vor dem Commit verliert.
+    """
+    if get_blob_store is None:
+        return 0
+    from blob_store import DEFAULT_PRUNE_GRACE_SECONDS
+    conn = get_db_connection()
+    if not conn: return 0
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('products', 'companies')")
+        tables = {row[0] for row in cursor.fetchall()}
+        referenced = set()
+        if "products" in tables:
+            cursor.execute("SELECT image_blob_sha FROM products WHERE image_blob_sha IS NOT NULL")
+            referenced.update(row[0] for row in cursor.fetchall())
+        if "companies" in tables:
+            cursor.execute("SELECT logo_blob_sha FROM companies WHERE logo_blob_sha IS NOT NULL")
+            referenced.update(row[0] for row in cursor.fetchall())
+    except Exception as e:
+        # Ohne vollständige Referenzliste lieber nichts löschen
+        print(f"DB Fehler prune_unreferenced_blobs: {e}")
+        return 0
+    finally:
+        conn.close()
+    removed = get_blob_store().delete_unreferenced(referenced, min_age_seconds=DEFAULT_PRUNE_GRACE_SECONDS)
+    if removed:
+        print(f"DB: {removed} nicht mehr referenzierte(r) Blob(s) gelöscht.")
+    return removed
+
 def _add_company_id_to_products_table(conn: sqlite3.Connection):
     cursor = conn.cursor()
     try:
@@ -858,6 +1178,9 @@ def _add_company_id_to_products_table(conn: sqlite3.Connection):
             raise
 
 def init_db():
+    # Schema-Erstellung und Migrationen nur einmal pro Prozess und DB-Datei
+    # (jede neue Streamlit-Session ruft init_db erneut auf)
+    if (DB_PATH, "core") in _SCHEMA_READY: return
     conn = get_db_connection()
     if conn is None: print("DB FEHLER: init_db() kann DB-Verbindung nicht herstellen."); return
     try:
@@ -967,6 +1290,19 @@ def init_db():
                 pass
             current_db_version = 14; print("DB: Schema v14 angewendet (Firmenspezifische Angebotsvorlagen).")
 
+        if current_db_version < 15:
+            _ensure_column_exists(conn, "companies", "logo_blob_sha", "TEXT")
+            _migrate_company_logos_to_blob_store_v15(conn)
+            cursor.execute("UPDATE admin_settings SET value = '15' WHERE key = 'schema_version';")
+            conn.commit()
+            current_db_version = 15; print("DB: Schema v15 angewendet (Firmenlogos im Blob-Store).")
+
+        if current_db_version < 16:
+            _ensure_column_exists(conn, "admin_settings", "revision", "INTEGER DEFAULT 0")
+            cursor.execute("UPDATE admin_settings SET value = '16' WHERE key = 'schema_version';")
+            conn.commit()
+            current_db_version = 16; print("DB: Schema v16 angewendet (Revisionszähler für Admin-Settings).")
+
         # Stelle sicher, dass die SQLite user_version am Ende exakt dem Code-Schema entspricht
         try:
             cursor.execute(f"PRAGMA user_version = {DB_SCHEMA_VERSION};")
@@ -986,35 +1322,243 @@ def init_db():
                 elif value_insert is not None:
                      cursor.execute("INSERT INTO admin_settings (key, value, last_modified) VALUES (?, ?, CURRENT_TIMESTAMP)", (key, value_insert))
                 print(f"DB: Initiale Admin-Einstellung '{key}' hinzugefügt.")
-        conn.commit(); print("DB: Initialisierung abgeschlossen.")
+        conn.commit(); invalidate_admin_settings_cache(); print("DB: Initialisierung abgeschlossen.")
+        with _SCHEMA_LOCK: _SCHEMA_READY.add((DB_PATH, "core"))
     except Exception as e: print(f"DB KRITISCHER FEHLER init_db: {e}"); traceback.print_exc(); conn.rollback()
     finally:
         if conn: conn.close()
 
-def load_admin_setting(key: str, default: Any = None) -> Any:
+# --- Admin-Settings-Cache ---
+# load_admin_setting wird pro Streamlit-Rerun und pro Berechnung sehr oft
+# aufgerufen. Statt jedes Mal eine Verbindung zu öffnen und JSON zu parsen,
+# wird admin_settings einmal komplett geladen; dekodierte Werte werden je Key
+# memoisiert. Invalidierung:
+#   - save_admin_setting (und init_db/Restore/Reset) erhöhen die Version,
+#   - Änderungen durch andere Prozesse erkennt die Dateisignatur der DB
+#     (mtime/Größe inkl. WAL); dann werden nur Keys neu dekodiert, deren
+#     Wert, last_modified oder revision sich geändert hat.
+# Zusätzlich liefert get_admin_setting_stamp je Key einen billigen
+# Versions-Stempel (revision, last_modified, Länge), z. B. als Cache-Schlüssel
+# für die Preis-Matrix statt eines Hashes über den ganzen Inhalt.
+_ADMIN_SETTINGS_LOCK = threading.RLock()
+_ADMIN_SETTINGS_CACHE: Dict[str, Any] = {
+    "version": 0,        # wird bei jeder Änderung erhöht
+    "loaded_version": -1,  # Version, zu der rows/decoded geladen wurden
+    "db_path": None,
+    "file_signature": None,
+    "rows": {},          # key -> (raw_value, last_modified, revision)
+    "decoded": {},       # key -> dekodierter Wert
+    "snapshot": None,    # zuletzt erzeugter AdminSettingsSnapshot
+}
+_DECODE_FAILED = object()
+
+
+def _decode_admin_setting_value(key: str, value_str: Any) -> Any:
+    """Wandelt einen Rohwert aus admin_settings in den Python-Wert um.
+
+    Gibt ``_DECODE_FAILED`` zurück, wenn der Aufrufer den Default liefern soll.
+    """
+    if isinstance(value_str, str) and value_str.strip().startswith(('[', '{')) and value_str.strip().endswith((']', '}')):
+        try: return json.loads(value_str)
+        except json.JSONDecodeError: pass
+    if key in INITIAL_ADMIN_SETTINGS and isinstance(INITIAL_ADMIN_SETTINGS.get(key), bool):
+        try: return bool(int(value_str))
+        except: pass
+    if key == 'active_company_id':
+        try: return int(value_str) if value_str is not None else None
+        except: return _DECODE_FAILED
+    return value_str
+
+
+def _admin_settings_file_signature(db_path: str) -> Optional[Tuple[Any, ...]]:
+    """Billige Änderungserkennung über Dateimetadaten (DB + WAL)."""
+    signature: List[Any] = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            st = os.stat(path)
+            signature.extend((st.st_mtime_ns, st.st_size))
+        except OSError:
+            signature.extend((None, None))
+    return tuple(signature)
+
+
+def invalidate_admin_settings_cache() -> int:
+    """Verwirft den Settings-Cache und gibt die neue Version zurück."""
+    with _ADMIN_SETTINGS_LOCK:
+        _ADMIN_SETTINGS_CACHE["version"] += 1
+        _ADMIN_SETTINGS_CACHE["file_signature"] = None
+        _ADMIN_SETTINGS_CACHE["snapshot"] = None
+        return _ADMIN_SETTINGS_CACHE["version"]
+
+
+def get_admin_settings_version() -> int:
+    """Aktuelle Version der Admin-Settings (prüft vorher auf externe Änderungen)."""
+    with _ADMIN_SETTINGS_LOCK:
+        _ensure_admin_settings_loaded()
+        return _ADMIN_SETTINGS_CACHE["version"]
+
+
+def _ensure_admin_settings_loaded() -> bool:
+    """Lädt admin_settings komplett, falls der Cache veraltet ist.
+
+    Muss unter ``_ADMIN_SETTINGS_LOCK`` aufgerufen werden.
+    """
+    cache = _ADMIN_SETTINGS_CACHE
+    signature = _admin_settings_file_signature(DB_PATH)
+    if (
+        cache["loaded_version"] == cache["version"]
+        and cache["db_path"] == DB_PATH
+        and cache["file_signature"] == signature
+    ):
+        return True
+
     conn = get_db_connection()
-    if conn is None: return default
+    if conn is None:
+        return False
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT value FROM admin_settings WHERE key = ?", (key,))
-        row = cursor.fetchone()
-        if row and row['value'] is not None:
-            value_str = row['value']
-            if isinstance(value_str, str) and value_str.strip().startswith(('[', '{')) and value_str.strip().endswith((']', '}')):
-                try: return json.loads(value_str)
-                except json.JSONDecodeError: pass
-            if key in INITIAL_ADMIN_SETTINGS and isinstance(INITIAL_ADMIN_SETTINGS.get(key), bool):
-                try: return bool(int(value_str))
-                except: pass
-            if key == 'active_company_id':
-                try: return int(value_str) if value_str is not None else None
-                except: return default
-            return value_str
-        if key == 'active_company_id' and row and row['value'] is None: return None
-        return default
-    except Exception as e: print(f"DB Fehler load_admin_setting '{key}': {e}"); return default
+        # SELECT *: vor der v16-Migration gibt es die Spalte revision noch nicht
+        cursor.execute("SELECT * FROM admin_settings")
+        new_rows = {
+            row['key']: (row['value'], row['last_modified'], row['revision'] if 'revision' in row.keys() else None)
+            for row in cursor.fetchall()
+        }
+    except Exception as e:
+        print(f"DB Fehler beim Laden der Admin-Settings: {e}")
+        return False
     finally:
-        if conn: conn.close()
+        conn.close()
+
+    old_rows = cache["rows"] if cache["db_path"] == DB_PATH else {}
+    decoded = cache["decoded"] if cache["db_path"] == DB_PATH else {}
+    changed = [key for key in set(old_rows) | set(new_rows) if old_rows.get(key) != new_rows.get(key)]
+    for key in changed:
+        decoded.pop(key, None)
+    if changed and cache["loaded_version"] == cache["version"]:
+        # Änderung durch einen anderen Prozess: Version erhöhen, damit
+        # Snapshot-Nutzer den Wechsel erkennen.
+        cache["version"] += 1
+    if changed or cache["db_path"] != DB_PATH:
+        cache["snapshot"] = None
+    cache["rows"] = new_rows
+    cache["decoded"] = decoded
+    cache["db_path"] = DB_PATH
+    cache["file_signature"] = signature
+    cache["loaded_version"] = cache["version"]
+    return True
+
+
+def _cached_admin_setting(key: str) -> Any:
+    """Dekodierter Wert aus dem Cache (ohne Kopie) oder ``_DECODE_FAILED``/None.
+
+    Muss unter ``_ADMIN_SETTINGS_LOCK`` nach ``_ensure_admin_settings_loaded`` laufen.
+    """
+    decoded = _ADMIN_SETTINGS_CACHE["decoded"]
+    if key in decoded:
+        return decoded[key]
+    row = _ADMIN_SETTINGS_CACHE["rows"].get(key)
+    if row is None:
+        return _DECODE_FAILED
+    raw_value = row[0]
+    if raw_value is None:
+        value = None if key == 'active_company_id' else _DECODE_FAILED
+    else:
+        value = _decode_admin_setting_value(key, raw_value)
+    decoded[key] = value
+    return value
+
+
+def _admin_setting_stamp_from_row(row: Optional[Tuple[Any, ...]]) -> Optional[str]:
+    if row is None:
+        return None
+    raw_value, last_modified, revision = row
+    size = len(raw_value) if isinstance(raw_value, (str, bytes, bytearray)) else -1
+    return f"{revision or 0}:{last_modified}:{size}"
+
+
+def get_admin_setting_stamp(key: str) -> Optional[str]:
+    """Versions-Stempel eines Settings (None, wenn der Key fehlt).
+
+    Ändert sich bei jedem save_admin_setting des Keys (Revisionszähler), ohne
+    dass der Wert selbst gelesen oder gehasht werden muss.
+    """
+    with _ADMIN_SETTINGS_LOCK:
+        if not _ensure_admin_settings_loaded():
+            return None
+        return _admin_setting_stamp_from_row(_ADMIN_SETTINGS_CACHE["rows"].get(key))
+
+
+class AdminSettingsSnapshot(Mapping):
+    """Unveränderliche Sicht auf alle Admin-Settings einer Version.
+
+    Eine Berechnung liest alle Einstellungen aus demselben Snapshot und mischt
+    so nie zwei Versionen. ``get`` verhält sich wie ``load_admin_setting``,
+    gibt aber die geteilten Werte ohne Kopie zurück – sie sind als
+    schreibgeschützt zu behandeln. ``stamp`` liefert den Versions-Stempel
+    eines Keys zu dieser Version (siehe get_admin_setting_stamp).
+    """
+
+    __slots__ = ("_values", "version", "_stamps")
+
+    def __init__(self, values: Dict[str, Any], version: int = 0, stamps: Optional[Dict[str, str]] = None):
+        object.__setattr__(self, "_values", MappingProxyType(dict(values)))
+        object.__setattr__(self, "version", int(version))
+        object.__setattr__(self, "_stamps", dict(stamps or {}))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("AdminSettingsSnapshot ist unveränderlich.")
+
+    def __getitem__(self, key: str) -> Any:
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def stamp(self, key: str) -> Optional[str]:
+        return self._stamps.get(key)
+
+    def __reduce__(self):
+        # MappingProxyType ist nicht picklebar (ProcessPool-Worker)
+        return (AdminSettingsSnapshot, (dict(self._values), self.version, self._stamps))
+
+    def __repr__(self) -> str:
+        return f"AdminSettingsSnapshot(version={self.version}, keys={len(self._values)})"
+
+
+def get_admin_settings_snapshot() -> AdminSettingsSnapshot:
+    """Snapshot aller Admin-Settings der aktuellen Version (gecacht bis zur nächsten Änderung)."""
+    with _ADMIN_SETTINGS_LOCK:
+        if not _ensure_admin_settings_loaded():
+            return AdminSettingsSnapshot({}, _ADMIN_SETTINGS_CACHE["version"])
+        snapshot = _ADMIN_SETTINGS_CACHE["snapshot"]
+        if snapshot is not None and snapshot.version == _ADMIN_SETTINGS_CACHE["version"]:
+            return snapshot
+        values = {}
+        stamps = {}
+        for key, row in _ADMIN_SETTINGS_CACHE["rows"].items():
+            value = _cached_admin_setting(key)
+            if value is not _DECODE_FAILED:
+                values[key] = value
+            stamps[key] = _admin_setting_stamp_from_row(row)
+        snapshot = AdminSettingsSnapshot(values, _ADMIN_SETTINGS_CACHE["version"], stamps)
+        _ADMIN_SETTINGS_CACHE["snapshot"] = snapshot
+        return snapshot
+
+
+def load_admin_setting(key: str, default: Any = None) -> Any:
+    with _ADMIN_SETTINGS_LOCK:
+        if not _ensure_admin_settings_loaded():
+            return default
+        value = _cached_admin_setting(key)
+    if value is _DECODE_FAILED:
+        return default
+    # Aufrufer dürfen Listen/Dicts verändern, ohne den Cache zu verfälschen
+    if isinstance(value, (dict, list)):
+        return copy.deepcopy(value)
+    return value
 
 def save_admin_setting(key: str, value: Any) -> bool:
     conn = get_db_connection()
@@ -1031,18 +1575,21 @@ def save_admin_setting(key: str, value: Any) -> bool:
             print(f"DB DEBUG: save_admin_setting - Länge von value_to_save für '{key}': {len(str(value_to_save))} Zeichen.")
             # print(f"DB DEBUG: save_admin_setting - Inhalt für '{key}' (erste 200 Zeichen): {str(value_to_save)[:200]}") # Bei Bedarf einkommentieren
 
+        # revision zählt jede Speicherung hoch (Versions-Stempel für Caches)
         sql_query = """
-        INSERT INTO admin_settings (key, value, last_modified) 
-        VALUES (?, ?, CURRENT_TIMESTAMP) 
+        INSERT INTO admin_settings (key, value, last_modified, revision) 
+        VALUES (?, ?, CURRENT_TIMESTAMP, 1) 
         ON CONFLICT(key) DO UPDATE SET 
         value=excluded.value, 
-        last_modified=CURRENT_TIMESTAMP 
+        last_modified=CURRENT_TIMESTAMP, 
+        revision=COALESCE(admin_settings.revision, 0) + 1 
         """
         # Standardisierung der Einrückung, um mögliche Probleme zu beheben
         params_for_sql = (key, None if (value_to_save is None and key in ['active_company_id', 'price_matrix_csv_data']) else value_to_save)
         print(f"DB DEBUG: save_admin_setting - Versuche SQL auszuführen für Key '{key}'. Wert None? {params_for_sql[1] is None}")
         cursor.execute(sql_query, params_for_sql)
         conn.commit()
+        invalidate_admin_settings_cache()
         print(f"DB ERFOLG: save_admin_setting - Einstellung '{key}' erfolgreich gespeichert.")
         return True
     except Exception as e: 
@@ -1053,6 +1600,47 @@ def save_admin_setting(key: str, value: Any) -> bool:
     finally:
         if conn: conn.close()
 
+def reserve_offer_number_suffixes(count: int = 1, default: int = 1000) -> List[int]:
+    """Zählt ``offer_number_suffix`` atomar um ``count`` hoch und liefert die reservierten Suffixe.
+
+    Anders als load_admin_setting/save_admin_setting (Cache pro Prozess, Lesen und
+    Schreiben getrennt) läuft das in einer ``BEGIN IMMEDIATE``-Transaktion direkt
+    auf der DB, sodass parallele Prozesse nie dieselbe Nummer erhalten.
+    """
+    count = max(0, int(count))
+    if count == 0:
+        return []
+    conn = get_db_connection()
+    if conn is None:
+        print("DB FEHLER: reserve_offer_number_suffixes - Keine DB-Verbindung.")
+        return []
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT value FROM admin_settings WHERE key = 'offer_number_suffix'")
+        row = cursor.fetchone()
+        try:
+            current = int(str(row[0])) if row is not None and row[0] is not None else int(default)
+        except ValueError:
+            current = int(default)
+        cursor.execute("""
+        INSERT INTO admin_settings (key, value, last_modified, revision)
+        VALUES ('offer_number_suffix', ?, CURRENT_TIMESTAMP, 1)
+        ON CONFLICT(key) DO UPDATE SET
+        value=excluded.value,
+        last_modified=CURRENT_TIMESTAMP,
+        revision=COALESCE(admin_settings.revision, 0) + 1
+        """, (current + count,))
+        conn.commit()
+        invalidate_admin_settings_cache()
+        return list(range(current + 1, current + count + 1))
+    except Exception as e:
+        print(f"DB FEHLER: reserve_offer_number_suffixes - Exception: {e}")
+        conn.rollback()
+        return []
+    finally:
+        if conn: conn.close()
+
 def add_pdf_template(template_type: str, name: str, content: Optional[str]=None, image_data: Optional[bytes]=None) -> Optional[int]:
     conn = get_db_connection()
     if not conn: return None
@@ -1164,7 +1752,8 @@ def add_company(company_data: Dict[str, Any]) -> Optional[int]:
 
 
     now = datetime.now().isoformat()
-    fields = ["name", "logo_base64", "street", "zip_code", "city", "phone", "email", "website",
+    company_data = _externalize_company_logo(dict(company_data))
+    fields = ["name", "logo_base64", "logo_blob_sha", "street", "zip_code", "city", "phone", "email", "website",
               "tax_id", "commercial_register", "bank_details", "pdf_footer_text",
               "is_default", "created_at", "updated_at"]
     
@@ -1219,7 +1808,7 @@ def list_companies() -> List[Dict[str, Any]]:
     try:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM companies ORDER BY name COLLATE NOCASE")
-        return [dict(row) for row in cursor.fetchall()]
+        return [_hydrate_company_logo(dict(row)) for row in cursor.fetchall()]
     except Exception as e: print(f"DB Fehler list_companies: {e}"); return []
     finally:
         if conn: conn.close()
@@ -1230,7 +1819,7 @@ def get_company(company_id: int) -> Optional[Dict[str, Any]]:
     try:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM companies WHERE id = ?", (company_id,))
-        row = cursor.fetchone(); return dict(row) if row else None
+        row = cursor.fetchone(); return _hydrate_company_logo(dict(row)) if row else None
     except Exception as e: print(f"DB Fehler get_company (ID: {company_id}): {e}"); return None
     finally:
         if conn: conn.close()
@@ -1240,10 +1829,10 @@ def update_company(company_id: int, company_data: Dict[str, Any]) -> bool:
     if not conn: return False
     now_iso = datetime.now().isoformat()
     
-    update_data_db = company_data.copy()
+    update_data_db = _externalize_company_logo(company_data.copy())
     update_data_db["updated_at"] = now_iso
     
-    allowed_fields_for_update = ["name", "logo_base64", "street", "zip_code", "city", "phone",
+    allowed_fields_for_update = ["name", "logo_base64", "logo_blob_sha", "street", "zip_code", "city", "phone",
                                  "email", "website", "tax_id", "commercial_register",
                                  "bank_details", "pdf_footer_text", "is_default", "updated_at"]
     fields_to_set_parts = []
@@ -1268,7 +1857,10 @@ def update_company(company_id: int, company_data: Dict[str, Any]) -> bool:
 
         cursor.execute(stmt, values_for_set)
         conn.commit()
-        return cursor.rowcount > 0
+        updated = cursor.rowcount > 0
+        if updated and "logo_blob_sha" in update_data_db:
+            prune_unreferenced_blobs()
+        return updated
     except sqlite3.IntegrityError as e_int: print(f"DB Integritätsfehler update_company (ID {company_id}): {e_int}"); conn.rollback(); return False
     except Exception as e: print(f"DB Fehler update_company (ID {company_id}): {e}"); conn.rollback(); return False
     finally:
@@ -1292,6 +1884,7 @@ def delete_company(company_id: int) -> bool:
                 except ValueError: pass
 
             if active_id == company_id: save_admin_setting('active_company_id', None)
+            prune_unreferenced_blobs()
             return True
         return False
     except Exception as e: print(f"DB Fehler delete_company (ID: {company_id}): {e}"); conn.rollback(); return False
@@ -1329,7 +1922,7 @@ def get_active_company() -> Optional[Dict[str, Any]]:
         cursor.execute("SELECT * FROM companies WHERE is_default = 1 LIMIT 1")
         row = cursor.fetchone()
         if row:
-            default_company = dict(row)
+            default_company = _hydrate_company_logo(dict(row))
             save_admin_setting('active_company_id', default_company['id']) 
             return default_company
     except Exception as e: print(f"DB Fehler get_active_company (Fallback): {e}")
@@ -1701,29 +2294,34 @@ def get_company_documents(company_id: int, doc_type: Optional[str] = None) -> Li
     """
     return list_company_documents(company_id, doc_type)
 
+def _create_crm_customers_table(conn: sqlite3.Connection) -> None:
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS crm_customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            first_name TEXT,
+            last_name TEXT,
+            email TEXT,
+            phone TEXT,
+            address TEXT,
+            status TEXT DEFAULT 'active',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            notes TEXT,
+            project_data TEXT
+        )
+    ''')
+    conn.commit()
+
 def get_all_active_customers() -> List[Dict[str, Any]]:
     """Gibt alle aktiven Kunden aus der CRM-Datenbank zurück"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db_connection()
+        if not conn:
+            return []
+        ensure_schema_once("crm_customers", _create_crm_customers_table, conn)
         cursor = conn.cursor()
         
-        # Versuche zuerst die Tabelle zu erstellen falls sie nicht existiert
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS crm_customers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                first_name TEXT,
-                last_name TEXT,
-                email TEXT,
-                phone TEXT,
-                address TEXT,
-                status TEXT DEFAULT 'active',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                notes TEXT,
-                project_data TEXT
-            )
-        ''')
-        
         cursor.execute('''
             SELECT id, first_name, last_name, email, phone, address, status, 
                    created_at, updated_at, notes, project_data
@@ -1761,26 +2359,12 @@ def get_all_active_customers() -> List[Dict[str, Any]]:
 def create_customer(customer_data: Dict[str, Any]) -> bool:
     """Erstellt einen neuen Kunden in der CRM-Datenbank"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db_connection()
+        if not conn:
+            return False
+        ensure_schema_once("crm_customers", _create_crm_customers_table, conn)
         cursor = conn.cursor()
         
-        # Tabelle erstellen falls sie nicht existiert
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS crm_customers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                first_name TEXT,
-                last_name TEXT,
-                email TEXT,
-                phone TEXT,
-                address TEXT,
-                status TEXT DEFAULT 'active',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                notes TEXT,
-                project_data TEXT
-            )
-        ''')
-        
         cursor.execute('''
             INSERT INTO crm_customers (first_name, last_name, email, phone, address, notes, project_data)
             VALUES (?, ?, ?, ?, ?, ?, ?)
@@ -1857,26 +2441,12 @@ def update_customer(customer_id: int, customer_data: Dict[str, Any]) -> bool:
 def get_customer_by_id(customer_id: int) -> Optional[Dict[str, Any]]:
     """Gibt einen spezifischen Kunden basierend auf der ID zurück"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db_connection()
+        if not conn:
+            return None
+        ensure_schema_once("crm_customers", _create_crm_customers_table, conn)
         cursor = conn.cursor()
         
-        # Versuche zuerst die Tabelle zu erstellen falls sie nicht existiert
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS crm_customers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                first_name TEXT,
-                last_name TEXT,
-                email TEXT,
-                phone TEXT,
-                address TEXT,
-                status TEXT DEFAULT 'active',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                notes TEXT,
-                project_data TEXT
-            )
-        ''')
-        
         cursor.execute('''
             SELECT id, first_name, last_name, email, phone, address, status, 
                    created_at, updated_at, notes, project_data
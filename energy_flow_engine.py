@@ -0,0 +1,320 @@
+# energy_flow_engine.py
+"""
+Stündliche Energiefluss-Simulation (8760 Schritte) für PV, Verbrauch und Speicher.
+
+Ersetzt die monatliche Eigenverbrauchs-/Speicher-Abschätzung in
+``calculations.perform_calculations``. Ein Jahr wird in einem Durchlauf
+über 8760 Stunden simuliert:
+
+- PV-Erzeugung: Monatserträge (PVGIS oder manuell) werden über einen
+  Sonnenstands-Tagesgang (abhängig vom Breitengrad) mit reproduzierbarer
+  Tag-zu-Tag-Schwankung auf Stunden verteilt.
+- Verbrauch: Standardlastprofile H0 (Haushalt) und G0 (Gewerbe), auf die
+  vorgegebenen Monatsverbräuche skaliert.
+- Speicher: SOC mit Kapazität, Lade-/Entladeleistung, Wirkungsgrad und
+  Mindest-SOC.
+- Netz: Einspeisung und Netzbezug als Rest.
+
+Alles außer der SOC-Rekursion ist mit NumPy vektorisiert; die Profile werden
+pro Breitengrad/Profiltyp nur einmal erzeugt (lru_cache). Ein Lauf liegt damit
+im Bereich weniger Millisekunden und ist für die Live-Vorschau geeignet.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+HOURS_PER_YEAR = 8760
+DAYS_PER_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+# Referenzjahr beginnt an einem Montag (wie 2018), Schaltjahre werden ignoriert
+_REFERENCE_YEAR_FIRST_WEEKDAY = 0
+
+# Monatsindex je Stunde (0..11) und Stundengrenzen je Monat
+_MONTH_OF_DAY = np.repeat(np.arange(12), DAYS_PER_MONTH)
+MONTH_OF_HOUR = np.repeat(_MONTH_OF_DAY, 24)
+MONTH_HOUR_BOUNDARIES = np.concatenate(([0], np.cumsum(np.array(DAYS_PER_MONTH) * 24)))
+
+# --- Tagesgänge der Standardlastprofile (Anteile je Stunde, Stunde 0 = 00:00-01:00) ---
+# Angelehnt an die BDEW-Profile; Reihenfolge: Werktag, Samstag, Sonntag
+_H0_DAY_SHAPES = {
+    "winter": (
+        (0.55, 0.45, 0.40, 0.38, 0.38, 0.45, 0.70, 0.95, 0.95, 0.85, 0.80, 0.85,
+         0.95, 0.90, 0.80, 0.80, 0.90, 1.20, 1.45, 1.45, 1.30, 1.10, 0.90, 0.70),
+        (0.60, 0.50, 0.42, 0.40, 0.38, 0.40, 0.50, 0.70, 0.95, 1.05, 1.05, 1.10,
+         1.15, 1.05, 0.95, 0.90, 0.95, 1.20, 1.40, 1.40, 1.25, 1.10, 0.95, 0.75),
+        (0.65, 0.52, 0.44, 0.40, 0.38, 0.38, 0.42, 0.55, 0.80, 1.05, 1.15, 1.25,
+         1.35, 1.15, 0.95, 0.90, 0.95, 1.15, 1.35, 1.35, 1.20, 1.05, 0.90, 0.70),
+    ),
+    "summer": (
+        (0.55, 0.45, 0.40, 0.38, 0.38, 0.45, 0.65, 0.85, 0.85, 0.80, 0.78, 0.85,
+         0.95, 0.88, 0.80, 0.78, 0.85, 1.00, 1.15, 1.20, 1.20, 1.15, 0.95, 0.72),
+        (0.60, 0.50, 0.42, 0.40, 0.38, 0.40, 0.48, 0.65, 0.88, 0.98, 1.00, 1.05,
+         1.10, 1.00, 0.90, 0.85, 0.88, 1.00, 1.12, 1.15, 1.15, 1.10, 0.95, 0.75),
+        (0.65, 0.52, 0.44, 0.40, 0.38, 0.38, 0.40, 0.52, 0.75, 0.98, 1.08, 1.18,
+         1.28, 1.10, 0.92, 0.85, 0.88, 1.00, 1.12, 1.15, 1.12, 1.05, 0.90, 0.70),
+    ),
+}
+_H0_DAY_SHAPES["transition"] = tuple(
+    tuple((w + s) / 2.0 for w, s in zip(day_w, day_s))
+    for day_w, day_s in zip(_H0_DAY_SHAPES["winter"], _H0_DAY_SHAPES["summer"])
+)
+
+_G0_DAY_SHAPES = {
+    "winter": (
+        (0.40, 0.38, 0.37, 0.37, 0.38, 0.45, 0.70, 1.10, 1.45, 1.60, 1.65, 1.65,
+         1.55, 1.55, 1.60, 1.55, 1.45, 1.25, 0.95, 0.75, 0.62, 0.55, 0.48, 0.43),
+        (0.40, 0.38, 0.37, 0.37, 0.38, 0.42, 0.52, 0.70, 0.90, 1.05, 1.10, 1.10,
+         1.00, 0.85, 0.70, 0.60, 0.55, 0.52, 0.50, 0.48, 0.46, 0.44, 0.42, 0.40),
+        (0.38, 0.37, 0.36, 0.36, 0.36, 0.37, 0.38, 0.40, 0.42, 0.45, 0.47, 0.48,
+         0.48, 0.46, 0.45, 0.44, 0.44, 0.45, 0.45, 0.44, 0.42, 0.40, 0.39, 0.38),
+    ),
+    "summer": (
+        (0.40, 0.38, 0.37, 0.37, 0.38, 0.45, 0.68, 1.05, 1.40, 1.58, 1.65, 1.68,
+         1.60, 1.60, 1.62, 1.55, 1.42, 1.18, 0.90, 0.70, 0.58, 0.52, 0.46, 0.42),
+        (0.40, 0.38, 0.37, 0.37, 0.38, 0.42, 0.50, 0.68, 0.88, 1.02, 1.08, 1.08,
+         0.98, 0.82, 0.68, 0.58, 0.54, 0.50, 0.48, 0.46, 0.45, 0.43, 0.41, 0.40),
+        (0.38, 0.37, 0.36, 0.36, 0.36, 0.37, 0.38, 0.40, 0.42, 0.45, 0.47, 0.48,
+         0.48, 0.46, 0.45, 0.44, 0.44, 0.45, 0.45, 0.44, 0.42, 0.40, 0.39, 0.38),
+    ),
+}
+_G0_DAY_SHAPES["transition"] = tuple(
+    tuple((w + s) / 2.0 for w, s in zip(day_w, day_s))
+    for day_w, day_s in zip(_G0_DAY_SHAPES["winter"], _G0_DAY_SHAPES["summer"])
+)
+
+STANDARD_LOAD_PROFILES = {"H0": _H0_DAY_SHAPES, "G0": _G0_DAY_SHAPES}
+
+_PV_WEATHER_SEED = 8760
+
+
+def _season_index_of_day() -> np.ndarray:
+    """0 = Winter (1.11.-20.3.), 1 = Sommer (15.5.-14.9.), 2 = Übergang."""
+    doy = np.arange(365)
+    season = np.full(365, 2, dtype=np.int64)
+    season[(doy >= 304) | (doy < 79)] = 0
+    season[(doy >= 134) & (doy < 257)] = 1
+    return season
+
+
+@lru_cache(maxsize=8)
+def _normalized_load_shape(profile: str) -> np.ndarray:
+    """Stündliches Lastprofil (Summe 1.0) für ein Referenzjahr."""
+    shapes = STANDARD_LOAD_PROFILES.get(profile.upper(), _H0_DAY_SHAPES)
+    # Tabelle [Saison, Tagtyp, Stunde]
+    table = np.array(
+        [shapes["winter"], shapes["summer"], shapes["transition"]], dtype=float
+    )
+    weekday = (np.arange(365) + _REFERENCE_YEAR_FIRST_WEEKDAY) % 7
+    day_type = np.where(weekday == 6, 2, np.where(weekday == 5, 1, 0))
+    daily = table[_season_index_of_day(), day_type]  # (365, 24)
+    if profile.upper() == "H0":
+        # BDEW-Dynamisierungsfunktion für H0
+        t = np.arange(1, 366, dtype=float)
+        dyn = (
+            -3.92e-10 * t**4 + 3.2e-7 * t**3 - 7.02e-5 * t**2 + 2.1e-3 * t + 1.24
+        )
+        daily = daily * dyn[:, None]
+    hourly = daily.reshape(-1)
+    hourly = hourly / hourly.sum()
+    hourly.setflags(write=False)
+    return hourly
+
+
+@lru_cache(maxsize=64)
+def _normalized_pv_shape(latitude_rounded: float) -> np.ndarray:
+    """Stündlicher Sonnenstands-Tagesgang (sin der Sonnenhöhe, >= 0)."""
+    lat = np.radians(latitude_rounded)
+    day = np.arange(365, dtype=float)
+    declination = np.radians(23.45) * np.sin(2.0 * np.pi * (284.0 + day + 1.0) / 365.0)
+    hour_angle = np.radians(15.0 * (np.arange(24, dtype=float) + 0.5 - 12.0))
+    sin_alt = (
+        np.sin(lat) * np.sin(declination)[:, None]
+        + np.cos(lat) * np.cos(declination)[:, None] * np.cos(hour_angle)[None, :]
+    )
+    # Tag-zu-Tag-Schwankung (Bewölkung) mit festem Seed, damit Ergebnisse
+    # reproduzierbar bleiben; die Monatssummen werden später ohnehin normiert.
+    weather = np.random.default_rng(_PV_WEATHER_SEED).gamma(2.0, 0.5, size=365)
+    hourly = (np.clip(sin_alt, 0.0, None) * weather[:, None]).reshape(-1)
+    hourly.setflags(write=False)
+    return hourly
+
+
+def _scale_to_monthly(shape: np.ndarray, monthly_kwh: Sequence[float]) -> np.ndarray:
+    """Skaliert ein Stundenprofil so, dass die Monatssummen ``monthly_kwh`` ergeben."""
+    monthly = np.asarray(monthly_kwh, dtype=float)
+    shape_sums = np.add.reduceat(shape, MONTH_HOUR_BOUNDARIES[:-1])
+    factors = np.divide(monthly, shape_sums, out=np.zeros(12), where=shape_sums > 0)
+    return shape * factors[MONTH_OF_HOUR]
+
+
+def standard_load_profile(
+    annual_kwh: float,
+    profile: str = "H0",
+    monthly_kwh: Optional[Sequence[float]] = None,
+) -> np.ndarray:
+    """Stündlicher Verbrauch (kWh) nach Standardlastprofil.
+
+    Wenn ``monthly_kwh`` gesetzt ist, werden die Monatssummen darauf skaliert
+    (Tagesgang bleibt erhalten), sonst wird auf ``annual_kwh`` normiert.
+    """
+    shape = _normalized_load_shape(str(profile or "H0").upper())
+    if monthly_kwh is not None and len(monthly_kwh) == 12:
+        return _scale_to_monthly(shape, monthly_kwh)
+    return shape * float(annual_kwh)
+
+
+def pv_hourly_profile(monthly_kwh: Sequence[float], latitude: float = 51.0) -> np.ndarray:
+    """Verteilt Monatserträge (kWh) über den Sonnenstands-Tagesgang auf 8760 Stunden."""
+    try:
+        lat = float(latitude)
+    except (TypeError, ValueError):
+        lat = 51.0
+    if not -66.0 <= lat <= 66.0:
+        lat = 51.0
+    return _scale_to_monthly(_normalized_pv_shape(round(lat, 1)), monthly_kwh)
+
+
+def _monthly_sums(hourly: np.ndarray) -> List[float]:
+    return np.add.reduceat(hourly, MONTH_HOUR_BOUNDARIES[:-1]).tolist()
+
+
+def simulate_energy_flows(
+    pv_kwh: np.ndarray,
+    load_kwh: np.ndarray,
+    battery_capacity_kwh: float = 0.0,
+    charge_power_kw: Optional[float] = None,
+    discharge_power_kw: Optional[float] = None,
+    charge_efficiency: float = 0.9,
+    min_soc_percent: float = 0.0,
+    initial_soc_percent: float = 0.0,
+) -> Dict[str, Any]:
+    """Simuliert die Energieflüsse eines Jahres in einem Durchlauf über 8760 Stunden.
+
+    Konvention wie bisher in perform_calculations: Der Ladewirkungsgrad wird
+    beim Laden angewendet (``geladen_netto = pv_überschuss * charge_efficiency``),
+    die Entladung erfolgt verlustfrei aus dem Speicherinhalt.
+
+    Returns:
+        Dict mit Jahreswerten (``*_kwh``), Monatslisten (``monthly_*``) und
+        den Stundenreihen unter ``hourly`` (NumPy-Arrays).
+    """
+    pv = np.asarray(pv_kwh, dtype=float)
+    load = np.asarray(load_kwh, dtype=float)
+
+    direct = np.minimum(pv, load)
+    surplus = pv - direct
+    deficit = load - direct
+
+    capacity = max(0.0, float(battery_capacity_kwh or 0.0))
+    if capacity > 0.0:
+        eff = float(charge_efficiency) if charge_efficiency and charge_efficiency > 0 else 1.0
+        p_charge = float(charge_power_kw) if charge_power_kw and charge_power_kw > 0 else capacity
+        p_discharge = (
+            float(discharge_power_kw) if discharge_power_kw and discharge_power_kw > 0 else capacity
+        )
+        soc_min = capacity * min(max(float(min_soc_percent or 0.0), 0.0), 100.0) / 100.0
+        soc = min(max(capacity * float(initial_soc_percent or 0.0) / 100.0, soc_min), capacity)
+
+        # Die SOC-Rekursion ist sequentiell; auf Python-Floats ist das deutlich
+        # schneller als Einzelzugriffe auf NumPy-Arrays.
+        surplus_list = surplus.tolist()
+        deficit_list = deficit.tolist()
+        charge_in = [0.0] * HOURS_PER_YEAR
+        discharge_out = [0.0] * HOURS_PER_YEAR
+        soc_list = [0.0] * HOURS_PER_YEAR
+        for h in range(len(surplus_list)):
+            s = surplus_list[h]
+            if s > 0.0:
+                room = capacity - soc
+                if room > 0.0:
+                    brutto = s if s < p_charge else p_charge
+                    if brutto * eff > room:
+                        brutto = room / eff
+                    charge_in[h] = brutto
+                    soc += brutto * eff
+            else:
+                d = deficit_list[h]
+                if d > 0.0:
+                    available = soc - soc_min
+                    if available > 0.0:
+                        out = d if d < p_discharge else p_discharge
+                        if out > available:
+                            out = available
+                        discharge_out[h] = out
+                        soc -= out
+            soc_list[h] = soc
+        charge_brutto = np.array(charge_in)
+        discharge = np.array(discharge_out)
+        soc_arr = np.array(soc_list)
+        charge_netto = charge_brutto * eff
+    else:
+        charge_brutto = np.zeros_like(pv)
+        charge_netto = charge_brutto
+        discharge = np.zeros_like(pv)
+        soc_arr = np.zeros_like(pv)
+
+    feed_in = surplus - charge_brutto
+    grid_import = deficit - discharge
+
+    pv_total = float(pv.sum())
+    load_total = float(load.sum())
+    self_consumption = float(direct.sum() + discharge.sum())
+    return {
+        "pv_production_kwh": pv_total,
+        "consumption_kwh": load_total,
+        "direct_self_consumption_kwh": float(direct.sum()),
+        "storage_charge_kwh": float(charge_netto.sum()),
+        "storage_discharge_kwh": float(discharge.sum()),
+        "feed_in_kwh": float(feed_in.sum()),
+        "grid_import_kwh": float(grid_import.sum()),
+        "self_consumption_kwh": self_consumption,
+        "self_consumption_rate_percent": (self_consumption / pv_total * 100.0) if pv_total > 0 else 0.0,
+        "autarky_rate_percent": (self_consumption / load_total * 100.0) if load_total > 0 else 0.0,
+        "battery_full_cycles": (float(discharge.sum()) / capacity) if capacity > 0 else 0.0,
+        "battery_avg_soc_percent": (float(soc_arr.mean()) / capacity * 100.0) if capacity > 0 else 0.0,
+        "monthly_direct_self_consumption_kwh": _monthly_sums(direct),
+        "monthly_storage_charge_kwh": _monthly_sums(charge_netto),
+        "monthly_storage_discharge_kwh": _monthly_sums(discharge),
+        "monthly_feed_in_kwh": _monthly_sums(feed_in),
+        "monthly_grid_import_kwh": _monthly_sums(grid_import),
+        "hourly": {
+            "pv_kwh": pv,
+            "load_kwh": load,
+            "direct_self_consumption_kwh": direct,
+            "storage_charge_kwh": charge_netto,
+            "storage_discharge_kwh": discharge,
+            "soc_kwh": soc_arr,
+            "feed_in_kwh": feed_in,
+            "grid_import_kwh": grid_import,
+        },
+    }
+
+
+def simulate_year_from_monthly(
+    monthly_pv_kwh: Sequence[float],
+    monthly_consumption_kwh: Sequence[float],
+    latitude: float = 51.0,
+    load_profile: str = "H0",
+    battery_capacity_kwh: float = 0.0,
+    charge_power_kw: Optional[float] = None,
+    discharge_power_kw: Optional[float] = None,
+    charge_efficiency: float = 0.9,
+    min_soc_percent: float = 0.0,
+) -> Dict[str, Any]:
+    """Komfortfunktion: Monatswerte -> Stundenprofile -> Simulation."""
+    pv = pv_hourly_profile(monthly_pv_kwh, latitude)
+    load = standard_load_profile(
+        float(sum(monthly_consumption_kwh)), load_profile, monthly_consumption_kwh
+    )
+    return simulate_energy_flows(
+        pv,
+        load,
+        battery_capacity_kwh=battery_capacity_kwh,
+        charge_power_kw=charge_power_kw,
+        discharge_power_kw=discharge_power_kw,
+        charge_efficiency=charge_efficiency,
+        min_soc_percent=min_soc_percent,
+    )
@@ -0,0 +1,190 @@
+# monte_carlo_engine.py
+"""
+Vektorisierte Monte-Carlo-Risikoanalyse für PV-Investitionen.
+
+Statt pro Simulation Parameter zu ziehen und den Kapitalwert in einer
+verschachtelten Jahresschleife zu berechnen, wird hier blockweise gerechnet:
+
+1. Parametermatrix ``(n_sims, n_params)`` aus korrelierten Normalverteilungen
+   (Cholesky-Zerlegung der Korrelationsmatrix) ziehen.
+2. Strompreispfade ``(n_sims, jahre)`` mit jährlicher Volatilität um die
+   gezogene mittlere Preissteigerung erzeugen.
+3. Cashflow- und Diskontierungsmatrizen bilden und in einem Schritt zum NPV
+   reduzieren.
+4. Sensitivitäten als Korrelation (Rang-basiert) zwischen Parametern und NPV.
+
+100.000 Simulationen über 25 Jahre benötigen damit deutlich unter einer Sekunde.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Reihenfolge der Parameter in der Ziehungsmatrix
+PARAMETER_NAMES = (
+    "investment_factor",
+    "yield_factor",
+    "discount_rate",
+    "price_increase",
+    "lifetime_years",
+)
+
+PARAMETER_LABELS = {
+    "investment_factor": "Investitionskosten",
+    "yield_factor": "Jährlicher Nutzen",
+    "discount_rate": "Diskontierungsrate",
+    "price_increase": "Strompreissteigerung",
+    "lifetime_years": "Anlagenlebensdauer",
+}
+
+# Korrelationen zwischen den (standardisierten) Parametern:
+# Zinsniveau und Strompreissteigerung laufen tendenziell gemeinsam (Inflation).
+DEFAULT_CORRELATION = np.array(
+    [
+        # inv   yield  disc   price  life
+        [1.00, 0.00, 0.00, 0.00, 0.00],
+        [0.00, 1.00, 0.00, 0.00, 0.00],
+        [0.00, 0.00, 1.00, 0.40, 0.00],
+        [0.00, 0.00, 0.40, 1.00, 0.00],
+        [0.00, 0.00, 0.00, 0.00, 1.00],
+    ]
+)
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+
+def _rank(values: np.ndarray) -> np.ndarray:
+    """Rangtransformation spaltenweise (für Spearman-Korrelation)."""
+    order = np.argsort(values, axis=0)
+    ranks = np.empty_like(order, dtype=float)
+    rows = np.arange(values.shape[0], dtype=float)
+    for col in range(values.shape[1]):
+        ranks[order[:, col], col] = rows
+    return ranks
+
+
+def _spearman_against(params: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """Spearman-Korrelation jeder Parameterspalte mit ``target``."""
+    ranked = _rank(np.column_stack([params, target]))
+    ranked -= ranked.mean(axis=0)
+    norms = np.sqrt((ranked**2).sum(axis=0))
+    norms[norms == 0] = 1.0
+    return (ranked[:, :-1] * ranked[:, -1:]).sum(axis=0) / (norms[:-1] * norms[-1])
+
+
+def run_monte_carlo(
+    investment: float,
+    savings_year1: float,
+    feed_in_revenue_year1: float = 0.0,
+    maintenance_year1: float = 0.0,
+    n_simulations: int = 10_000,
+    confidence_level: float = 95.0,
+    lifetime_years: int = 25,
+    discount_rate_mean: float = 0.04,
+    discount_rate_std: float = 0.01,
+    price_increase_mean: float = 0.03,
+    price_increase_std: float = 0.01,
+    price_volatility: float = 0.02,
+    investment_rel_std: float = 0.10,
+    yield_rel_std: float = 0.15,
+    lifetime_spread_years: int = 5,
+    degradation_rate: float = 0.005,
+    maintenance_increase: float = 0.02,
+    correlation: Optional[np.ndarray] = None,
+    seed: Optional[int] = 42,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    keep_distribution: bool = True,
+) -> Dict[str, Any]:
+    """Batched Monte-Carlo über NPV.
+
+    ``savings_year1`` (Eigenverbrauchsersparnis) wächst mit dem simulierten
+    Strompreispfad, ``feed_in_revenue_year1`` bleibt nominal konstant; beide
+    werden mit Ertragsfaktor und Degradation skaliert. Wartungskosten steigen
+    mit ``maintenance_increase``.
+    """
+    start = time.perf_counter()
+    n_simulations = max(1, int(n_simulations))
+    max_years = int(lifetime_years) + max(0, int(lifetime_spread_years))
+    years = np.arange(1, max_years + 1, dtype=float)
+
+    corr = DEFAULT_CORRELATION if correlation is None else np.asarray(correlation, dtype=float)
+    chol = np.linalg.cholesky(corr)
+    rng = np.random.default_rng(seed)
+
+    degradation_curve = (1.0 - degradation_rate) ** (years - 1.0)
+    maintenance_curve = maintenance_year1 * (1.0 + maintenance_increase) ** (years - 1.0)
+
+    npv_chunks: List[np.ndarray] = []
+    param_chunks: List[np.ndarray] = []
+    remaining = n_simulations
+    while remaining > 0:
+        n = min(remaining, max(1, int(chunk_size)))
+        remaining -= n
+
+        z = rng.standard_normal((n, len(PARAMETER_NAMES))) @ chol.T
+        params = np.empty_like(z)
+        params[:, 0] = 1.0 + investment_rel_std * z[:, 0]
+        params[:, 1] = np.clip(1.0 + yield_rel_std * z[:, 1], 0.0, None)
+        params[:, 2] = np.clip(discount_rate_mean + discount_rate_std * z[:, 2], -0.5, None)
+        params[:, 3] = price_increase_mean + price_increase_std * z[:, 3]
+        # Lebensdauer: diskret, symmetrisch um lifetime_years (Normal -> gerundet)
+        spread = max(0, int(lifetime_spread_years))
+        params[:, 4] = np.clip(
+            np.rint(lifetime_years + (spread / 2.0) * z[:, 4]),
+            max(1, lifetime_years - spread),
+            lifetime_years + spread,
+        )
+
+        # Strompreispfad: Jahr 1 = heutiger Preis, danach jährliche Steigerung + Rauschen
+        growth = params[:, 3:4] + price_volatility * rng.standard_normal((n, max_years - 1))
+        price_index = np.ones((n, max_years))
+        np.cumprod(1.0 + growth, axis=1, out=price_index[:, 1:])
+
+        production_scale = params[:, 1:2] * degradation_curve  # (n, jahre)
+        cash_flows = (
+            savings_year1 * production_scale * price_index
+            + feed_in_revenue_year1 * production_scale
+            - maintenance_curve
+        )
+        cash_flows *= years <= params[:, 4:5]  # Jahre nach Lebensende ausblenden
+
+        discount = np.exp(-np.log1p(params[:, 2:3]) * years)
+        npv = (cash_flows * discount).sum(axis=1) - investment * params[:, 0]
+
+        npv_chunks.append(npv)
+        param_chunks.append(params)
+
+    npv_all = np.concatenate(npv_chunks)
+    params_all = np.concatenate(param_chunks)
+
+    alpha = (100.0 - float(confidence_level)) / 2.0
+    lower, upper, var_5, p50 = np.percentile(npv_all, [alpha, 100.0 - alpha, 5.0, 50.0])
+
+    coefficients = _spearman_against(params_all, npv_all)
+    sensitivity = [
+        {
+            "parameter": PARAMETER_LABELS[name],
+            "impact": float(round(coef, 3)),
+        }
+        for name, coef in zip(PARAMETER_NAMES, coefficients)
+    ]
+    sensitivity.sort(key=lambda item: abs(item["impact"]), reverse=True)
+
+    result: Dict[str, Any] = {
+        "npv_mean": float(npv_all.mean()),
+        "npv_std": float(npv_all.std()),
+        "npv_median": float(p50),
+        "npv_lower_bound": float(lower),
+        "npv_upper_bound": float(upper),
+        "var_5": float(var_5),
+        "success_probability": float((npv_all > 0).mean() * 100.0),
+        "sensitivity_analysis": sensitivity,
+        "n_simulations": n_simulations,
+        "computation_time_ms": (time.perf_counter() - start) * 1000.0,
+    }
+    if keep_distribution:
+        result["npv_distribution"] = npv_all
+    return result
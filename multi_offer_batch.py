@@ -0,0 +1,765 @@
+# multi_offer_batch.py
+"""
+Headless Batch-Erzeugung von Multi-Firmen-Angeboten (ohne Streamlit).
+
+MultiCompanyOfferGenerator.generate_multi_offers hat die Firmen bisher seriell
+abgearbeitet und dabei pro Firma Firmendaten, Produkte, Templates und
+Session-Werte erneut geladen. Bei 10–20 Firmen dauerte das Minuten.
+
+Ablauf hier:
+1. ``build_batch_context`` sammelt alle gemeinsamen Eingaben einmal
+   (Berechnungsergebnisse, Einstellungen, Texte, PDF-Templates, Firmen,
+   kategorisierte Produkte) in einem picklebaren Dict.
+2. ``generate_multi_offers_batch`` bereitet die Angebotsdaten je Firma im
+   Hauptprozess vor (Produktrotation, Produktdaten aus dem Katalog, atomar
+   reservierte Angebotsnummern) und rendert die PDFs in einem Prozess-Pool. Der Kontext wird jedem Worker nur
+   einmal übergeben; der Worker wärmt dabei Produktkatalog, Layout- und
+   Hintergrund-Cache vor.
+3. Fortschritt kommt über ``progress_callback(erledigt, gesamt, firmenname, ok)``
+   im aufrufenden Thread zurück. Jedes PDF wird sofort in ein
+   ``StreamingOfferBundle`` (ZIP in einer Spool-Temp-Datei) geschrieben und
+   danach freigegeben.
+
+Die Funktionen für Rotation, Preisstaffelung und Datenaufbereitung sind die
+bisherigen Methoden des Generators (der sie jetzt hierher delegiert).
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import logging
+import multiprocessing
+import os
+import random
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from database import (
+        list_companies,
+        get_company,
+        load_admin_setting,
+        save_admin_setting,
+        list_company_documents,
+        reserve_offer_number_suffixes,
+    )
+    from pdf_generator import generate_offer_pdf_with_main_templates as generate_offer_pdf, format_offer_number
+    from product_db import get_product_by_id, list_products
+except ImportError as e:
+    print(f"multi_offer_batch: Import-Fehler: {e}")
+    list_companies = get_company = load_admin_setting = save_admin_setting = None  # type: ignore
+    list_company_documents = generate_offer_pdf = get_product_by_id = list_products = None  # type: ignore
+    reserve_offer_number_suffixes = format_offer_number = None  # type: ignore
+
+try:
+    from pdf_page_cache import generate_offer_pdf_cached
+except ImportError:
+    def generate_offer_pdf_cached(generator, *args, force_refresh=False, cache=None, reuse_after_generation=True, **kwargs):  # type: ignore
+        return generator(*args, **kwargs)
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+COORDS_DIR = Path(_BASE_DIR) / "coords"
+BG_DIR = Path(_BASE_DIR) / "pdf_templates_static" / "notext"
+
+DEFAULT_SELECTED_SECTIONS = [
+    "ProjectOverview", "TechnicalComponents", "CostDetails",
+    "Economics", "SimulationDetails", "CO2Savings",
+    "Visualizations", "FutureAspects",
+]
+
+PRICE_FIELDS = [
+    'total_investment_netto',
+    'total_investment_brutto',
+    'module_cost_total',
+    'inverter_cost_total',
+    'storage_cost_total',
+    'additional_costs',
+    'installation_cost',
+    'total_cost_euro',
+    'wallbox_cost',
+    'ems_cost',
+    'optimizer_cost',
+    'carport_cost',
+    'notstrom_cost',
+    'tierabwehr_cost',
+]
+
+ADDITIONAL_COMPONENT_KEYS = [
+    'selected_wallbox_id',
+    'selected_ems_id',
+    'selected_optimizer_id',
+    'selected_carport_id',
+    'selected_notstrom_id',
+    'selected_tierabwehr_id',
+]
+
+
+def categorize_products(all_products: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Teilt Produkte in module / inverter / storage auf (für die Produktrotation)."""
+    categorized = {"module": [], "inverter": [], "storage": []}
+    for p in all_products or []:
+        cat = (p.get("category") or "Sonstiges").lower()
+        if "modul" in cat:
+            categorized["module"].append(p)
+        elif "wechselrichter" in cat:
+            categorized["inverter"].append(p)
+        elif "speicher" in cat or "battery" in cat:
+            categorized["storage"].append(p)
+    return categorized
+
+
+def rotate_products_for_company(
+    products: Dict[str, List[Dict[str, Any]]], company_index: int, base_settings: Dict
+) -> Dict:
+    """
+    Vollständig flexible Produktrotation für verschiedene Firmen
+    company_index: 0 = erste Firma, 1 = zweite Firma, etc.
+    Unterstützt: Lineare Rotation, Zufällige Auswahl, Kategorie-spezifische Schritte
+    """
+    rotated_settings = base_settings.copy()
+
+    if not base_settings.get("enable_product_rotation", False):
+        return rotated_settings
+
+    try:
+        rotation_mode = base_settings.get("rotation_mode", "linear")
+
+        for category in ["module", "inverter", "storage"]:
+            base_id_key = f"selected_{category}_id"
+            base_id = base_settings.get(base_id_key)
+
+            if not base_id or category not in products:
+                continue
+
+            available_products = products[category]
+            if len(available_products) <= 1:
+                # Nur ein Produkt verfügbar - behalte das Original
+                logging.info(f"Produktrotation {category}: Nur 1 Produkt verfügbar, behalte Original")
+                continue
+
+            # Finde Index des Basisprodukts
+            base_index = next((i for i, p in enumerate(available_products) if p.get("id") == base_id), -1)
+            if base_index == -1:
+                logging.warning(f"Produktrotation {category}: Basisprodukt nicht gefunden")
+                continue
+
+            # Bestimme Rotation-Schritt basierend auf Modus
+            if rotation_mode == "kategorie-spezifisch":
+                rotation_step = base_settings.get(f"{category}_rotation_step", 1)
+            elif rotation_mode == "zufällig":
+                rotation_step = random.randint(1, len(available_products) - 1)
+            else:  # linear
+                rotation_step = base_settings.get("product_rotation_step", 1)
+
+            new_index = (base_index + (company_index * rotation_step)) % len(available_products)
+            rotated_product = available_products[new_index]
+            rotated_settings[base_id_key] = rotated_product.get("id")
+
+            logging.info(f"Produktrotation {category}: Firma {company_index+1} -> {rotated_product.get('model_name', 'Unknown')} (Schritt: {rotation_step}, Verfügbare: {len(available_products)})")
+
+    except Exception as e:
+        logging.warning(f"Fehler bei Produktrotation: {e}")
+
+    return rotated_settings
+
+
+def apply_price_scaling(company_index: int, base_settings: Dict, calc_results: Dict) -> Dict:
+    """
+    Vollständig flexible Preisstaffelung für verschiedene Firmen
+    Unterstützt: Linear, Exponentiell, Custom-Faktoren
+    company_index: 0 = erste Firma, 1 = zweite Firma, etc.
+    """
+    if company_index == 0:
+        return calc_results  # Erste Firma behält Originalpreis
+
+    price_increment = base_settings.get("price_increment_percent", 0)
+    if price_increment == 0:
+        return calc_results  # Keine Preissteigerung
+
+    scaled_results = calc_results.copy()
+
+    try:
+        calc_mode = base_settings.get("price_calculation_mode", "linear")
+
+        if calc_mode == "linear":
+            price_factor = 1.0 + (company_index * price_increment / 100.0)
+        elif calc_mode == "exponentiell":
+            exponent = base_settings.get("price_exponent", 1.03)
+            price_factor = exponent ** company_index
+        elif calc_mode == "custom":
+            try:
+                custom_factors = json.loads(base_settings.get("custom_price_factors", "[1.0]"))
+                price_factor = custom_factors[company_index] if company_index < len(custom_factors) else custom_factors[-1]
+            except Exception:
+                # Fallback auf linear
+                price_factor = 1.0 + (company_index * price_increment / 100.0)
+        else:
+            price_factor = 1.0
+
+        logging.info(f"Preisstaffelung: Firma {company_index+1}, Modus: {calc_mode}, Faktor: {price_factor:.3f}")
+
+        for field in PRICE_FIELDS:
+            if field in scaled_results and isinstance(scaled_results[field], (int, float)):
+                scaled_results[field] = scaled_results[field] * price_factor
+
+        # Längere Amortisationszeit durch höhere Kosten (maximal 50% länger)
+        if 'amortization_time_years' in scaled_results and isinstance(scaled_results['amortization_time_years'], (int, float)):
+            scaled_results['amortization_time_years'] = scaled_results['amortization_time_years'] * min(price_factor, 1.5)
+
+        # ROI anpassen (niedriger durch höhere Investition); Ersparnisse bleiben gleich
+        for roi_field in ['roi_percent_year1', 'roi_percent_year10', 'roi_percent_year20']:
+            if roi_field in scaled_results and isinstance(scaled_results[roi_field], (int, float)):
+                scaled_results[roi_field] = scaled_results[roi_field] / price_factor
+
+    except Exception as e:
+        logging.warning(f"Fehler bei Preisstaffelung für Firma {company_index+1}: {e}")
+
+    return scaled_results
+
+
+def prepare_offer_data(
+    customer_data: Dict,
+    company: Dict,
+    settings: Dict,
+    project_data: Dict,
+    get_product_func: Optional[Callable[[Any], Optional[Dict]]] = None,
+) -> Dict:
+    """Bereitet die Angebotsdaten für PDF-Generierung vor"""
+    get_product_func = get_product_func or get_product_by_id
+    offer_data = {
+        "customer_data": customer_data,
+        "company_data": company,
+        "offer_date": datetime.now().strftime("%d.%m.%Y"),
+        "module_quantity": settings.get("module_quantity", 20),
+        "include_storage": settings.get("include_storage", True),
+    }
+
+    if project_data:
+        offer_data["project_data"] = project_data
+        if project_data.get("consumption_data"):
+            offer_data["consumption_data"] = project_data["consumption_data"]
+        if project_data.get("calculation_results"):
+            offer_data["calculation_results"] = project_data["calculation_results"]
+
+    # KRITISCH: Die PDF-Generierung erwartet die Produktdetails in "project_details"
+    project_details = {
+        "module_quantity": settings.get("module_quantity", 20),
+        "include_storage": settings.get("include_storage", True),
+        "include_additional_components": True,  # Zusatzkomponenten aktivieren
+    }
+
+    # Fallback: Verwende Produktauswahl aus project_data falls verfügbar
+    existing_project_details = project_data.get("project_details", {}) if project_data else {}
+
+    try:
+        module_id = settings.get("selected_module_id") or existing_project_details.get("selected_module_id")
+        if module_id:
+            offer_data["selected_module"] = get_product_func(module_id)
+            project_details["selected_module_id"] = module_id
+
+        inverter_id = settings.get("selected_inverter_id") or existing_project_details.get("selected_inverter_id")
+        if inverter_id:
+            offer_data["selected_inverter"] = get_product_func(inverter_id)
+            project_details["selected_inverter_id"] = inverter_id
+
+        storage_id = settings.get("selected_storage_id") or existing_project_details.get("selected_storage_id")
+        if storage_id:
+            storage_product = get_product_func(storage_id)
+            offer_data["selected_storage"] = storage_product
+            project_details["selected_storage_id"] = storage_id
+            if storage_product:
+                project_details["selected_storage_storage_power_kw"] = storage_product.get("storage_power_kw", 0)
+
+        # Zusatzkomponenten (Wallbox, EMS, etc.) aus Projektdaten übertragen
+        for comp_key in ADDITIONAL_COMPONENT_KEYS:
+            comp_id = existing_project_details.get(comp_key)
+            if comp_id:
+                project_details[comp_key] = comp_id
+                comp_product = get_product_func(comp_id)
+                if comp_product:
+                    offer_data[comp_key.replace('_id', '')] = comp_product
+
+        if existing_project_details:
+            if "module_quantity" not in settings and "module_quantity" in existing_project_details:
+                project_details["module_quantity"] = existing_project_details["module_quantity"]
+                offer_data["module_quantity"] = existing_project_details["module_quantity"]
+
+            if "include_storage" not in settings and "include_storage" in existing_project_details:
+                project_details["include_storage"] = existing_project_details["include_storage"]
+                offer_data["include_storage"] = existing_project_details["include_storage"]
+
+            for field in ["include_additional_components", "visualize_roof_in_pdf_satellite", "satellite_image_base64_data"]:
+                if field in existing_project_details:
+                    project_details[field] = existing_project_details[field]
+    except Exception as e:
+        logging.warning(f"Produktdaten konnten nicht geladen werden: {e}")
+
+    offer_data["project_details"] = project_details
+    return offer_data
+
+
+def _load_pdf_templates() -> Dict[str, Any]:
+    """Erstes verfügbares Titelbild-/Titel-/Anschreiben-Template aus den Admin-Einstellungen."""
+    templates = {"title_image": None, "offer_title": None, "cover_letter": None}
+    if not callable(load_admin_setting):
+        return templates
+    try:
+        for key, setting in (
+            ("title_image", "pdf_title_image_templates"),
+            ("offer_title", "pdf_offer_title_templates"),
+            ("cover_letter", "pdf_cover_letter_templates"),
+        ):
+            values = load_admin_setting(setting, []) or []
+            templates[key] = values[0] if values else None
+    except Exception as e:
+        logging.warning(f"Fehler beim Laden der Templates: {e}")
+    return templates
+
+
+def build_batch_context(
+    customer_data: Dict,
+    project_data: Dict,
+    settings: Dict,
+    calc_results: Optional[Dict],
+    company_ids: List[int],
+    texts: Optional[Dict[str, str]] = None,
+    extend_all: bool = False,
+    company_extended: Optional[Dict[int, bool]] = None,
+    section_order: Optional[List[str]] = None,
+    inclusion_extras: Optional[Dict[str, Any]] = None,
+    products: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+    live_pricing: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Sammelt alle gemeinsamen Eingaben für die Batch-Erzeugung (einmal, picklebar).
+
+    ``live_pricing``: ``st.session_state['live_pricing_calculations']`` des Aufrufers.
+    Fehlt ``final_price`` in ``calc_results``, liest der PDF-Generator ihn sonst aus
+    der Session, die es in den Workern nicht gibt; daher wird er hier übernommen.
+    """
+    companies: Dict[int, Dict[str, Any]] = {}
+    try:
+        wanted = set(company_ids)
+        for company in (list_companies() if callable(list_companies) else []) or []:
+            if company.get("id") in wanted:
+                companies[company["id"]] = company
+    except Exception as e:
+        logging.warning(f"Konnte Firmen nicht laden: {e}")
+    for company_id in company_ids:
+        if company_id not in companies:
+            try:
+                companies[company_id] = (get_company(company_id) if callable(get_company) else None) or {}
+            except Exception as e:
+                logging.warning(f"Konnte Firma {company_id} nicht laden: {e}")
+                companies[company_id] = {}
+
+    if products is None:
+        try:
+            products = categorize_products(list_products() if callable(list_products) else [])
+        except Exception as e:
+            logging.warning(f"Konnte Produkte nicht laden: {e}")
+            products = {"module": [], "inverter": [], "storage": []}
+
+    calc_results = dict(calc_results or {})
+    live_final_price = (live_pricing or {}).get("final_price")
+    if calc_results.get("final_price") in (None, 0, 0.0) and isinstance(live_final_price, (int, float)) and live_final_price > 0:
+        calc_results["final_price"] = live_final_price
+
+    return {
+        "customer_data": dict(customer_data or {}),
+        "project_data": dict(project_data or {}),
+        "settings": dict(settings or {}),
+        "calc_results": calc_results,
+        "texts": dict(texts or {}),
+        "extend_all": bool(extend_all),
+        "company_extended": dict(company_extended or {}),
+        "inclusion_extras": {
+            **(inclusion_extras or {}),
+            "custom_section_order": section_order if isinstance(section_order, list) else [],
+        },
+        "templates": _load_pdf_templates(),
+        "companies": companies,
+        "products": products,
+    }
+
+
+def _fallback_calc_results(offer_data: Dict) -> Dict:
+    logging.warning("Keine echten Berechnungsergebnisse verfügbar - verwende Mock-Daten")
+    quantity = offer_data.get('module_quantity', 20)
+    return {
+        'anlage_kwp': quantity * 0.4,  # Geschätzt
+        'annual_pv_production_kwh': quantity * 400,
+        'total_investment_netto': quantity * 750,
+        'amortization_time_years': 12.5,
+        'self_supply_rate_percent': 65.0,
+        'annual_financial_benefit_year1': 1200,
+    }
+
+
+def render_company_offer(context: Dict[str, Any], offer_data: Dict, company: Dict, company_index: int = 0,
+                         offer_number: Optional[str] = None) -> Optional[bytes]:
+    """Generiert das PDF für eine Firma mit firmenspezifischen Produkten und Preisen.
+
+    ``offer_number``: vorab reservierte Angebotsnummer (siehe ``reserve_offer_numbers``);
+    ohne sie zählt der PDF-Generator die Nummer selbst hoch.
+    """
+    if not callable(generate_offer_pdf):
+        raise RuntimeError("PDF-Generator nicht verfügbar")
+
+    base_settings = context.get("settings", {})
+    calc_results = context.get("calc_results") or _fallback_calc_results(offer_data)
+    calc_results = apply_price_scaling(company_index, base_settings, calc_results)
+
+    # Die PDF-Funktion erwartet project_data mit customer_data und project_details
+    pdf_project_data = {
+        "customer_data": offer_data.get("customer_data", {}),
+        "project_details": offer_data.get("project_details", {}),
+        "consumption_data": offer_data.get("consumption_data", {}),
+        "calculation_results": offer_data.get("calculation_results", {}),
+    }
+    original_project_data = offer_data.get("project_data") or {}
+    for key in ["address", "roof_data", "location_data", "technical_specs"]:
+        if key in original_project_data:
+            pdf_project_data[key] = original_project_data[key]
+
+    # Verfügbare Charts aus analysis_results
+    available_charts = [k for k in calc_results.keys() if k.endswith('_chart_bytes') and calc_results[k] is not None]
+
+    pdf_options = base_settings.get("pdf_options", {})
+    selected_sections = pdf_options.get("selected_sections", DEFAULT_SELECTED_SECTIONS)
+    charts_to_include = available_charts if pdf_options.get("include_charts", True) else []
+    if not pdf_options.get("include_visualizations", True):
+        # Technische Visualisierungen entfernen
+        charts_to_include = [c for c in charts_to_include if not any(
+            vis_key in c for vis_key in ['daily_production', 'weekly_production', 'yearly_production']
+        )]
+
+    # Extended-Flag pro Firma (oder Master "Alle erweitern")
+    is_extended = bool(context.get("extend_all") or context.get("company_extended", {}).get(company.get("id", 0), False))
+
+    include_all_docs = bool(pdf_options.get("include_all_documents", False))
+    company_doc_ids: List[int] = []
+    if is_extended and include_all_docs and callable(list_company_documents):
+        try:
+            docs = list_company_documents(company.get("id", 0), None) or []
+            company_doc_ids = [d.get("id") for d in docs if isinstance(d, dict) and d.get("id") is not None]
+        except Exception as _e_docs:
+            logging.warning(f"Konnte Firmendokumente nicht laden: {_e_docs}")
+
+    templates = context.get("templates", {})
+    # Geteilter PDF-Cache: trifft nur, solange DB-Stand und alle Eingaben unverändert sind
+    return generate_offer_pdf_cached(
+        generate_offer_pdf,
+        reuse_after_generation=False,  # finales Angebot: jede Erzeugung vergibt eine neue Nummer
+        project_data=pdf_project_data,
+        analysis_results=calc_results,
+        company_info=company,
+        company_logo_base64=company.get("logo_base64"),  # pro Firma
+        selected_title_image_b64=None,
+        selected_offer_title_text=f"Ihr individuelles Solaranlagen-Angebot von {company.get('name', 'Unser Unternehmen')}",
+        selected_cover_letter_text="Sehr geehrte Damen und Herren,\n\nvielen Dank für Ihr Interesse an nachhaltiger Solarenergie.",
+        sections_to_include=selected_sections,
+        inclusion_options={
+            "include_company_logo": pdf_options.get("include_company_logo", True),
+            "include_product_images": pdf_options.get("include_product_images", True),
+            "include_all_documents": include_all_docs,
+            "company_document_ids_to_include": company_doc_ids,
+            "selected_charts_for_pdf": charts_to_include if is_extended else [],
+            "include_optional_component_details": pdf_options.get("include_optional_component_details", True),
+            # Erweiterte Ausgabe ab Seite 7
+            "append_additional_pages_after_main6": is_extended,
+            "selected_title_image_template": templates.get("title_image"),
+            "selected_offer_title_template": templates.get("offer_title"),
+            "selected_cover_letter_template": templates.get("cover_letter"),
+            "use_templates": True,
+            **context.get("inclusion_extras", {}),
+            **({"offer_number": offer_number} if offer_number else {}),
+        },
+        texts=context.get("texts", {}),
+        list_products_func=list_products if callable(list_products) else lambda: [],
+        get_product_by_id_func=get_product_by_id if callable(get_product_by_id) else lambda x: {},
+        load_admin_setting_func=load_admin_setting if callable(load_admin_setting) else lambda k, d=None: d,
+        save_admin_setting_func=save_admin_setting if callable(save_admin_setting) else lambda k, v: None,
+        db_list_company_documents_func=list_company_documents if callable(list_company_documents) else lambda cid, dtype=None: [],
+        active_company_id=company.get("id", 1),
+    )
+
+
+def offer_filename(company_name: str, customer_data: Dict) -> str:
+    return f"Angebot_{company_name}_{customer_data.get('last_name', 'Kunde')}.pdf"
+
+
+def build_offers_zip(generated_pdfs: List[Dict]) -> bytes:
+    """Erstellt ZIP-Datei mit allen PDFs"""
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for pdf_info in generated_pdfs:
+            zip_file.writestr(pdf_info["filename"], pdf_info["pdf_content"])
+    return zip_buffer.getvalue()
+
+
+# ZIP bis zu dieser Größe im RAM halten, darüber in eine Temp-Datei auslagern
+BUNDLE_SPOOL_MAX_BYTES = 16 * 1024 * 1024
+BUNDLE_CHUNK_SIZE = 1024 * 1024
+
+
+class StreamingOfferBundle:
+    """ZIP-Archiv, in das jedes Angebot sofort nach dem Erzeugen geschrieben wird.
+
+    Die PDF-Bytes werden danach nicht mehr gehalten; der Speicherbedarf ist durch
+    das größte einzelne Angebot (plus ``BUNDLE_SPOOL_MAX_BYTES``) begrenzt.
+    Doppelte Dateinamen werden durchnummeriert.
+    """
+
+    def __init__(self, spool_max_bytes: int = BUNDLE_SPOOL_MAX_BYTES):
+        self._file = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes, mode="w+b", suffix=".zip")
+        self._zip: Optional[zipfile.ZipFile] = zipfile.ZipFile(self._file, "w", zipfile.ZIP_DEFLATED)
+        self.filenames: List[str] = []
+        self.total_pdf_bytes = 0
+
+    def __enter__(self) -> "StreamingOfferBundle":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.filenames)
+
+    def _unique_name(self, filename: str) -> str:
+        if filename not in self.filenames:
+            return filename
+        stem, ext = os.path.splitext(filename)
+        n = 2
+        while f"{stem} ({n}){ext}" in self.filenames:
+            n += 1
+        return f"{stem} ({n}){ext}"
+
+    def add(self, filename: str, pdf_content: bytes) -> str:
+        """Schreibt ein PDF ins Archiv und gibt den verwendeten Dateinamen zurück."""
+        if self._zip is None:
+            raise ValueError("Bundle ist bereits abgeschlossen")
+        name = self._unique_name(filename)
+        self._zip.writestr(name, pdf_content)
+        self.filenames.append(name)
+        self.total_pdf_bytes += len(pdf_content)
+        return name
+
+    def finalize(self) -> None:
+        """Schreibt das ZIP-Inhaltsverzeichnis; danach sind keine ``add``-Aufrufe mehr möglich."""
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+    @property
+    def size(self) -> int:
+        self.finalize()
+        self._file.seek(0, os.SEEK_END)
+        return self._file.tell()
+
+    def fileobj(self) -> BinaryIO:
+        """Dateihandle auf das fertige ZIP (an Position 0); für st.download_button getvalue() verwenden."""
+        self.finalize()
+        self._file.seek(0)
+        return self._file  # type: ignore[return-value]
+
+    def iter_chunks(self, chunk_size: int = BUNDLE_CHUNK_SIZE) -> Iterator[bytes]:
+        """Liefert das fertige ZIP in Blöcken (für Streaming-Downloads)."""
+        handle = self.fileobj()
+        while True:
+            chunk = handle.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def iter_entries(self) -> Iterator[Tuple[str, bytes]]:
+        """Liest die PDFs einzeln wieder aus (z. B. zum Ablegen in der Kundenakte)."""
+        with zipfile.ZipFile(self.fileobj(), "r") as zf:
+            for name in self.filenames:
+                yield name, zf.read(name)
+
+    def getvalue(self) -> bytes:
+        return self.fileobj().read()
+
+    def close(self) -> None:
+        try:
+            self.finalize()
+        finally:
+            self._file.close()
+
+
+# --- Worker-Seite ---------------------------------------------------------
+
+_WORKER_CONTEXT: Optional[Dict[str, Any]] = None
+
+
+def _warm_worker_caches() -> None:
+    """Lädt Produktkatalog, Admin-Settings, Koordinaten-Layouts und Hintergründe einmal pro Worker."""
+    try:
+        from product_db import get_product_catalog
+        get_product_catalog().list()
+    except Exception:
+        pass
+    try:
+        from database import get_admin_settings_snapshot
+        get_admin_settings_snapshot()
+    except Exception:
+        pass
+    try:
+        from pdf_template_engine.layout_cache import get_page_layout
+        from pdf_template_engine.background_cache import get_background_cache
+        for page_num in range(1, 7):
+            get_page_layout(COORDS_DIR / f"seite{page_num}.yml")
+        if BG_DIR.is_dir():
+            get_background_cache().get(BG_DIR)
+    except Exception:
+        pass
+
+
+def _init_worker(context: Dict[str, Any]) -> None:
+    global _WORKER_CONTEXT
+    _WORKER_CONTEXT = context
+    _warm_worker_caches()
+
+
+def _render_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    context = _WORKER_CONTEXT or {}
+    company = job["company"]
+    try:
+        pdf_content = render_company_offer(context, job["offer_data"], company, job["company_index"], job.get("offer_number"))
+        return {**_job_result(job), "pdf_content": pdf_content, "error": None if pdf_content else "PDF leer"}
+    except Exception as e:
+        logging.error(f"Fehler bei PDF-Generierung für {job['company_name']}: {e}")
+        return {**_job_result(job), "pdf_content": None, "error": str(e)}
+
+
+def _job_result(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {"company_index": job["company_index"], "company_id": job["company_id"], "company_name": job["company_name"], "filename": job["filename"]}
+
+
+# --- Batch-API ------------------------------------------------------------
+
+def build_company_jobs(context: Dict[str, Any], company_ids: List[int]) -> List[Dict[str, Any]]:
+    """Bereitet pro Firma Einstellungen (Produktrotation) und Angebotsdaten vor."""
+    jobs = []
+    customer_data = context.get("customer_data", {})
+    for i, company_id in enumerate(company_ids):
+        company = context.get("companies", {}).get(company_id) or {}
+        company_name = company.get("name", f"Firma_{company_id}")
+        company_settings = rotate_products_for_company(context.get("products", {}), i, context.get("settings", {}))
+        offer_data = prepare_offer_data(customer_data, company, company_settings, context.get("project_data", {}))
+        jobs.append({
+            "company_index": i,
+            "company_id": company_id,
+            "company_name": company_name,
+            "company": company,
+            "offer_data": offer_data,
+            "filename": offer_filename(company_name, customer_data),
+        })
+    return jobs
+
+
+def reserve_offer_numbers(jobs: List[Dict[str, Any]]) -> None:
+    """Vergibt im Hauptprozess je Job eine eindeutige Angebotsnummer (``job["offer_number"]``).
+
+    Die Worker haben eigene Admin-Settings-Caches; würden sie die Nummer selbst
+    (lesen, +1, speichern) hochzählen, bekämen parallele Angebote dieselbe Nummer.
+    """
+    if not jobs or not callable(reserve_offer_number_suffixes) or not callable(format_offer_number):
+        return
+    suffixes = reserve_offer_number_suffixes(len(jobs))
+    if len(suffixes) != len(jobs):
+        logging.warning("Angebotsnummern konnten nicht reserviert werden; der PDF-Generator vergibt sie selbst.")
+        return
+    for job, suffix in zip(jobs, suffixes):
+        job["offer_number"] = format_offer_number(suffix)
+
+
+def default_worker_count(job_count: int) -> int:
+    return max(1, min(job_count, os.cpu_count() or 1, 8))
+
+
+def generate_multi_offers_batch(
+    context: Dict[str, Any],
+    company_ids: List[int],
+    max_workers: Optional[int] = None,
+    progress_callback: Optional[Callable[[int, int, str, bool], None]] = None,
+    errors_list: Optional[List[str]] = None,
+    bundle: Optional[StreamingOfferBundle] = None,
+) -> Dict[str, Any]:
+    """Rendert die Angebote aller Firmen (parallel) und schreibt sie in ein ZIP-Bundle.
+
+    Jedes PDF landet sofort nach dem Erzeugen im ``StreamingOfferBundle`` und
+    wird danach verworfen; die Ergebnis-Einträge enthalten nur noch Dateiname
+    und Größe. ``max_workers=1`` rendert seriell im aktuellen Prozess. Startet
+    der Pool nicht (z. B. eingeschränkte Umgebung), wird ebenfalls seriell
+    weitergearbeitet.
+    Rückgabe: ``{"generated": [...], "failed": [...], "bundle": StreamingOfferBundle}``
+    in der Reihenfolge der Firmenauswahl.
+    """
+    if errors_list is None:
+        errors_list = []
+    if bundle is None:
+        bundle = StreamingOfferBundle()
+    jobs = build_company_jobs(context, company_ids)
+    reserve_offer_numbers(jobs)
+    total = len(jobs)
+    results: Dict[int, Dict[str, Any]] = {}
+
+    def _collect(result: Dict[str, Any]) -> None:
+        pdf_content = result.pop("pdf_content", None)
+        ok = bool(pdf_content)
+        if ok:
+            try:
+                result["filename"] = bundle.add(result["filename"], pdf_content)
+                result["pdf_size"] = len(pdf_content)
+            except Exception as e:
+                ok = False
+                result["error"] = f"ZIP-Schreiben fehlgeschlagen: {e}"
+        result["ok"] = ok
+        del pdf_content
+        results[result["company_index"]] = result
+        if progress_callback:
+            try:
+                progress_callback(len(results), total, result["company_name"], ok)
+            except Exception:
+                pass
+
+    workers = max_workers or default_worker_count(total)
+    pending = list(jobs)
+    if workers > 1 and total > 1:
+        try:
+            # "spawn": keine geerbten SQLite-Verbindungen/Streamlit-Threads im Worker
+            mp_context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                                     initializer=_init_worker, initargs=(context,)) as pool:
+                futures = {pool.submit(_render_job, job): job for job in jobs}
+                for future in as_completed(futures):
+                    # Future sofort freigeben, damit das PDF nicht bis zum Ende im Speicher bleibt
+                    futures.pop(future)
+                    _collect(future.result())
+            pending = []
+        except Exception as e:
+            errors_list.append(f"Parallele Angebotserzeugung fehlgeschlagen, seriell fortgesetzt: {e}")
+            pending = [job for job in jobs if job["company_index"] not in results]
+
+    if pending:
+        global _WORKER_CONTEXT
+        previous_context, _WORKER_CONTEXT = _WORKER_CONTEXT, context
+        try:
+            for job in pending:
+                _collect(_render_job(job))
+        finally:
+            _WORKER_CONTEXT = previous_context
+
+    bundle.finalize()
+    ordered = [results[i] for i in sorted(results)]
+    generated = [r for r in ordered if r["ok"]]
+    failed = [r for r in ordered if not r["ok"]]
+    for r in failed:
+        errors_list.append(f"PDF für {r['company_name']} konnte nicht erstellt werden: {r.get('error')}")
+    return {"generated": generated, "failed": failed, "bundle": bundle}
@@ -9,8 +9,6 @@ import os
 import tempfile
 from datetime import datetime
 import streamlit as st
-import zipfile
-import io
 import re
 from typing import Dict, List, Any
 import traceback
@@ -28,13 +26,20 @@ try:
         get_db_connection,
         list_companies,
         get_company,
-        load_admin_setting,
-        save_admin_setting,
-        list_company_documents,
     )
     from calculations import perform_calculations, calculate_offer_details
-    from pdf_generator import generate_offer_pdf_with_main_templates as generate_offer_pdf, create_offer_pdf, merge_pdfs
-    from product_db import get_product_by_id, list_products
+    from pdf_generator import create_offer_pdf, merge_pdfs
+    from product_db import list_products
+    from multi_offer_batch import (
+        categorize_products,
+        rotate_products_for_company,
+        apply_price_scaling,
+        prepare_offer_data,
+        build_batch_context,
+        render_company_offer,
+        build_offers_zip,
+        generate_multi_offers_batch,
+    )
     
     # PDF Output Directory - lokale Definition statt Import
     PDF_OUTPUT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "pdf_output")
@@ -78,17 +83,7 @@ class MultiCompanyOfferGenerator:
     def load_all_products(self) -> Dict[str, List[Dict[str, Any]]]:
         """Lädt alle Produkte und kategorisiert sie."""
         try:
-            all_products = list_products() if callable(list_products) else []
-            categorized = {"module": [], "inverter": [], "storage": []}
-            for p in all_products:
-                cat = p.get("category", "Sonstiges").lower()
-                if "modul" in cat:
-                    categorized["module"].append(p)
-                elif "wechselrichter" in cat:
-                    categorized["inverter"].append(p)
-                elif "speicher" in cat or "battery" in cat:
-                    categorized["storage"].append(p)
-            return categorized
+            return categorize_products(list_products() if callable(list_products) else [])
         except Exception as e:
             st.warning(f"Konnte Produkte nicht laden: {e}")
             return {"module": [], "inverter": [], "storage": []}
@@ -576,8 +571,6 @@ class MultiCompanyOfferGenerator:
         
         customer_data = st.session_state.multi_offer_customer_data
         selected_companies = st.session_state.multi_offer_selected_companies
-        settings = st.session_state.multi_offer_settings
-        project_data = st.session_state.get("multi_offer_project_data", {})
         
         if not customer_data or not selected_companies:
             st.error("Kundendaten oder Firmenauswahl fehlt!")
@@ -585,57 +578,41 @@ class MultiCompanyOfferGenerator:
         
         if st.button(" Angebote für alle Firmen erstellen", type="primary"):
             
+            bundle = None
             try:
                 # Fortschrittsanzeige
                 progress_bar = st.progress(0)
                 status_text = st.empty()
                 
-                generated_pdfs = []
                 total_companies = len(selected_companies)
-                
-                for i, company_id in enumerate(selected_companies):
-                    company_name = f"Firma_{company_id}"  # Fallback-Name sofort setzen
-                    try:
-                        # Company-Daten laden
-                        company = get_company(company_id) if callable(get_company) else {}
-                        company_name = company.get("name", f"Firma_{company_id}")  # Überschreibe mit echtem Namen
-                        
-                        status_text.text(f"Erstelle Angebot für {company_name} (Firma {i+1}/{total_companies})...")
-                        
-                        # NEUE FEATURE: Produktrotation für diese Firma
-                        company_settings = self.get_rotated_products_for_company(i, settings)
-                          # PDF-Generierung vorbereiten mit firmenspezifischen Produkten
-                        offer_data = self._prepare_offer_data(customer_data, company, company_settings, project_data, i)
-                        
-                        # PDF generieren mit company_index für Preisstaffelung
-                        pdf_content = self._generate_company_pdf(offer_data, company, i)
-                        
-                        if pdf_content:
-                            generated_pdfs.append({
-                                "company_name": company_name,
-                                "pdf_content": pdf_content,
-                                "filename": f"Angebot_{company_name}_{customer_data.get('last_name', 'Kunde')}.pdf"
-                            })
-                            st.success(f" PDF für {company_name} erstellt")
-                        else:
-                            st.error(f" PDF für {company_name} konnte nicht erstellt werden")                        # Fortschritt aktualisieren
-                        progress_bar.progress((i + 1) / total_companies)
-                        
-                    except Exception as e:
-                        # Sichere Verwendung von company_name - falls nicht definiert, Fallback verwenden
-                        safe_company_name = locals().get('company_name', f"Firma_{company_id}")
-                        st.error(f"Fehler bei {safe_company_name}: {str(e)}")
-                        logging.error(f"Fehler bei PDF-Generierung für {safe_company_name}: {e}")
-                        logging.error(f"Exception Typ: {type(e).__name__}")
-                        logging.error(f"Verfügbare lokale Variablen: {list(locals().keys())}")
-                        # Ausführlichere Fehlerbehandlung für company_name Probleme
-                        if "company_name" in str(e):
-                            logging.error(f"COMPANY_NAME DEBUG: company_id={company_id}, locals company_name: {locals().get('company_name', 'NOT_FOUND')}")
-                        continue  # Weiter mit der nächsten Firma
-                
+                status_text.text(f"Erstelle Angebote für {total_companies} Firmen...")
+
+                def _on_progress(done: int, total: int, company_name: str, ok: bool) -> None:
+                    if ok:
+                        st.success(f" PDF für {company_name} erstellt")
+                    else:
+                        st.error(f" PDF für {company_name} konnte nicht erstellt werden")
+                    status_text.text(f"{done}/{total} Angebote fertig ({company_name})")
+                    progress_bar.progress(done / total)
+
+                # Gemeinsame Eingaben einmal sammeln, Firmen parallel rendern
+                batch_errors: List[str] = []
+                batch = generate_multi_offers_batch(
+                    self._build_batch_context(selected_companies),
+                    selected_companies,
+                    progress_callback=_on_progress,
+                    errors_list=batch_errors,
+                )
+                for err in batch_errors:
+                    logging.error(err)
+                generated_pdfs = batch["generated"]
+
                 # ZIP-Download erstellen
+                bundle = batch["bundle"]
                 if generated_pdfs:
-                    zip_content = self._create_zip_download(generated_pdfs)
+                    # st.download_button akzeptiert keine SpooledTemporaryFile und kopiert
+                    # die Daten ohnehin in den Speicher – daher das fertige ZIP als Bytes
+                    zip_content = bundle.getvalue()
                     
                     st.success(f" {len(generated_pdfs)} Angebote erfolgreich erstellt!")
                     st.download_button(
@@ -713,10 +690,9 @@ class MultiCompanyOfferGenerator:
                                 # Alle erzeugten PDFs in Kundenakte ablegen
                                 if crm_customer_id:
                                     saved_docs = 0
-                                    for item in generated_pdfs:
+                                    for filename, pdf_bytes in bundle.iter_entries():
                                         try:
-                                            pdf_bytes = item.get('bytes')
-                                            filename = item.get('filename') or f"Angebot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+                                            filename = filename or f"Angebot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
                                             if isinstance(pdf_bytes, (bytes, bytearray)):
                                                 add_customer_document(crm_customer_id, pdf_bytes, display_name=filename, doc_type="offer_pdf", project_id=crm_project_id, suggested_filename=filename)
                                                 saved_docs += 1
@@ -741,408 +717,52 @@ class MultiCompanyOfferGenerator:
             except Exception as e:
                 st.error(f"Fehler bei der PDF-Generierung: {str(e)}")
                 logging.error(f"Fehler in generate_multi_offers: {e}")
+            finally:
+                # Spool-Datei auch bei Fehlern freigeben
+                if bundle is not None:
+                    bundle.close()
 
     def get_rotated_products_for_company(self, company_index: int, base_settings: Dict) -> Dict:
-        """
-        Vollständig flexible Produktrotation für verschiedene Firmen
-        company_index: 0 = erste Firma, 1 = zweite Firma, etc.
-        Unterstützt: Lineare Rotation, Zufällige Auswahl, Kategorie-spezifische Schritte
-        """
-        rotated_settings = base_settings.copy()
-        
-        if not base_settings.get("enable_product_rotation", False):
-            return rotated_settings
-        
-        try:
-            rotation_mode = base_settings.get("rotation_mode", "linear")
-            
-            # Kategorien mit individuellen Rotation-Schritten
-            categories = ["module", "inverter", "storage"]
-            
-            for category in categories:
-                base_id_key = f"selected_{category}_id"
-                base_id = base_settings.get(base_id_key)
-                
-                if not base_id or category not in self.products:
-                    continue
-                
-                available_products = self.products[category]
-                if len(available_products) <= 1:
-                    # Nur ein Produkt verfügbar - behalte das Original
-                    logging.info(f"Produktrotation {category}: Nur 1 Produkt verfügbar, behalte Original")
-                    continue
-                
-                # Finde Index des Basisprodukts
-                base_index = -1
-                for i, product in enumerate(available_products):
-                    if product.get("id") == base_id:
-                        base_index = i
-                        break
-                
-                if base_index == -1:
-                    logging.warning(f"Produktrotation {category}: Basisprodukt nicht gefunden")
-                    continue
-                
-                # Bestimme Rotation-Schritt basierend auf Modus
-                if rotation_mode == "kategorie-spezifisch":
-                    rotation_step = base_settings.get(f"{category}_rotation_step", 1)
-                elif rotation_mode == "zufällig":
-                    import random
-                    rotation_step = random.randint(1, len(available_products) - 1)
-                else:  # linear
-                    rotation_step = base_settings.get("product_rotation_step", 1)
-                
-                # Berechne neuen Index mit flexiblem Schritt
-                new_index = (base_index + (company_index * rotation_step)) % len(available_products)
-                rotated_product = available_products[new_index]
-                rotated_settings[base_id_key] = rotated_product.get("id")
-                
-                logging.info(f"Produktrotation {category}: Firma {company_index+1} -> {rotated_product.get('model_name', 'Unknown')} (Schritt: {rotation_step}, Verfügbare: {len(available_products)})")
-        
-        except Exception as e:
-            logging.warning(f"Fehler bei Produktrotation: {e}")
-        
-        return rotated_settings
+        """Produktrotation für Firma ``company_index`` (siehe multi_offer_batch.rotate_products_for_company)."""
+        return rotate_products_for_company(self.products, company_index, base_settings)
 
     def apply_price_scaling(self, company_index: int, base_settings: Dict, calc_results: Dict) -> Dict:
-        """
-        Vollständig flexible Preisstaffelung für verschiedene Firmen
-        Unterstützt: Linear, Exponentiell, Custom-Faktoren
-        company_index: 0 = erste Firma, 1 = zweite Firma, etc.
-        """
-        if company_index == 0:
-            return calc_results  # Erste Firma behält Originalpreis
-        
-        price_increment = base_settings.get("price_increment_percent", 0)
-        if price_increment == 0:
-            return calc_results  # Keine Preissteigerung
-        
-        scaled_results = calc_results.copy()
-        
-        try:
-            # Bestimme Preisfaktor basierend auf Berechnungsmodus
-            calc_mode = base_settings.get("price_calculation_mode", "linear")
-            
-            if calc_mode == "linear":
-                price_factor = 1.0 + (company_index * price_increment / 100.0)
-            elif calc_mode == "exponentiell":
-                exponent = base_settings.get("price_exponent", 1.03)
-                price_factor = exponent ** company_index
-            elif calc_mode == "custom":
-                try:
-                    import json
-                    custom_factors = json.loads(base_settings.get("custom_price_factors", "[1.0]"))
-                    price_factor = custom_factors[company_index] if company_index < len(custom_factors) else custom_factors[-1]
-                except:
-                    # Fallback auf linear
-                    price_factor = 1.0 + (company_index * price_increment / 100.0)
-            else:
-                price_factor = 1.0
-            
-            logging.info(f"Preisstaffelung: Firma {company_index+1}, Modus: {calc_mode}, Faktor: {price_factor:.3f}")
-            
-            # Preisbezogene Felder skalieren
-            price_fields = [
-                'total_investment_netto',
-                'total_investment_brutto', 
-                'module_cost_total',
-                'inverter_cost_total',
-                'storage_cost_total',
-                'additional_costs',
-                'installation_cost',
-                'total_cost_euro',
-                'wallbox_cost',
-                'ems_cost',
-                'optimizer_cost',
-                'carport_cost',
-                'notstrom_cost',
-                'tierabwehr_cost'
-            ]
-            
-            for field in price_fields:
-                if field in scaled_results and isinstance(scaled_results[field], (int, float)):
-                    original_value = scaled_results[field]
-                    scaled_results[field] = original_value * price_factor
-                    
-            # Wirtschaftlichkeitsberechnungen intelligent anpassen
-            if 'amortization_time_years' in scaled_results and isinstance(scaled_results['amortization_time_years'], (int, float)):
-                # Längere Amortisationszeit durch höhere Kosten (aber begrenzt)
-                amort_factor = min(price_factor, 1.5)  # Maximal 50% längere Amortisation
-                scaled_results['amortization_time_years'] = scaled_results['amortization_time_years'] * amort_factor
-            
-            # ROI anpassen (niedriger durch höhere Investition)
-            roi_fields = ['roi_percent_year1', 'roi_percent_year10', 'roi_percent_year20']
-            for roi_field in roi_fields:
-                if roi_field in scaled_results and isinstance(scaled_results[roi_field], (int, float)):
-                    scaled_results[roi_field] = scaled_results[roi_field] / price_factor
-              # Jährliche Ersparnisse bleiben gleich (da gleiche Anlage, nur teurer)
-            # annual_savings bleibt unverändert
-                
-        except Exception as e:
-            logging.warning(f"Fehler bei Preisstaffelung für Firma {company_index+1}: {e}")
-        
-        return scaled_results
+        """Preisstaffelung für Firma ``company_index`` (siehe multi_offer_batch.apply_price_scaling)."""
+        return apply_price_scaling(company_index, base_settings, calc_results)
 
     def _prepare_offer_data(self, customer_data: Dict, company: Dict, settings: Dict, project_data: Dict, company_index: int = 0) -> Dict:
         """Bereitet die Angebotsdaten für PDF-Generierung vor"""
-        # Basis-Angebotsdaten
-        offer_data = {
-            "customer_data": customer_data,
-            "company_data": company,
-            "offer_date": datetime.now().strftime("%d.%m.%Y"),
-            "module_quantity": settings.get("module_quantity", 20),
-            "include_storage": settings.get("include_storage", True),
-        }
-        
-        # Projektdaten hinzufügen
-        if project_data:
-            offer_data["project_data"] = project_data
-            
-            # Verbrauchsdaten
-            if project_data.get("consumption_data"):
-                offer_data["consumption_data"] = project_data["consumption_data"]
-            
-            # Berechnungen
-            if project_data.get("calculation_results"):
-                offer_data["calculation_results"] = project_data["calculation_results"]        # KRITISCH: Produktdetails für PDF-Generierung vorbereiten
-        # Die PDF-Generierung erwartet diese Daten in "project_details"
-        project_details = {
-            "module_quantity": settings.get("module_quantity", 20),
-            "include_storage": settings.get("include_storage", True),
-            "include_additional_components": True,  # Zusatzkomponenten aktivieren
-        }
-        
-        # Fallback: Verwende Produktauswahl aus project_data falls verfügbar
-        existing_project_details = project_data.get("project_details", {}) if project_data else {}
-        
-        # Produktdaten hinzufügen
-        try:
-            # Modul
-            module_id = settings.get("selected_module_id") or existing_project_details.get("selected_module_id")
-            if module_id:
-                offer_data["selected_module"] = get_product_by_id(module_id)
-                project_details["selected_module_id"] = module_id
-            
-            # Wechselrichter
-            inverter_id = settings.get("selected_inverter_id") or existing_project_details.get("selected_inverter_id")
-            if inverter_id:
-                offer_data["selected_inverter"] = get_product_by_id(inverter_id)
-                project_details["selected_inverter_id"] = inverter_id
-            
-            # Speicher
-            storage_id = settings.get("selected_storage_id") or existing_project_details.get("selected_storage_id")
-            if storage_id:
-                offer_data["selected_storage"] = get_product_by_id(storage_id)
-                project_details["selected_storage_id"] = storage_id
-                  # Speicher-spezifische Details
-                storage_product = get_product_by_id(storage_id)
-                if storage_product:
-                    project_details["selected_storage_storage_power_kw"] = storage_product.get("storage_power_kw", 0)
-            
-            # Zusatzkomponenten (Wallbox, EMS, etc.) aus Projektdaten übertragen
-            additional_components = [
-                'selected_wallbox_id',
-                'selected_ems_id', 
-                'selected_optimizer_id',
-                'selected_carport_id',
-                'selected_notstrom_id',
-                'selected_tierabwehr_id'
-            ]
-            
-            for comp_key in additional_components:
-                comp_id = existing_project_details.get(comp_key)
-                if comp_id:
-                    project_details[comp_key] = comp_id
-                    # Produktdaten auch zu offer_data hinzufügen für Vollständigkeit
-                    comp_product = get_product_by_id(comp_id)
-                    if comp_product:
-                        offer_data[comp_key.replace('_id', '')] = comp_product
-            
-            # Weitere wichtige Felder aus existing_project_details übernehmen
-            if existing_project_details:
-                # Übernehme Modulanzahl falls nicht in settings
-                if "module_quantity" not in settings and "module_quantity" in existing_project_details:
-                    project_details["module_quantity"] = existing_project_details["module_quantity"]
-                    offer_data["module_quantity"] = existing_project_details["module_quantity"]
-                
-                # Übernehme Speicher-Einstellung falls nicht in settings
-                if "include_storage" not in settings and "include_storage" in existing_project_details:
-                    project_details["include_storage"] = existing_project_details["include_storage"]
-                    offer_data["include_storage"] = existing_project_details["include_storage"]
-                
-                # Übernehme zusätzliche Komponenten-Einstellungen
-                for field in ["include_additional_components", "visualize_roof_in_pdf_satellite", "satellite_image_base64_data"]:
-                    if field in existing_project_details:
-                        project_details[field] = existing_project_details[field]
-        except Exception as e:
-            logging.warning(f"Produktdaten konnten nicht geladen werden: {e}")
-        
-        # Project_details zu offer_data hinzufügen (KRITISCH für PDF-Generierung)
-        offer_data["project_details"] = project_details
-        
-        return offer_data
+        return prepare_offer_data(customer_data, company, settings, project_data)
+
+    def _build_batch_context(self, company_ids: List[int]) -> Dict[str, Any]:
+        """Überträgt den Session State in den Streamlit-unabhängigen Batch-Kontext."""
+        calc_results = st.session_state.get('calculation_results', {}) or st.session_state.get('multi_offer_calc_results', {})
+        return build_batch_context(
+            customer_data=st.session_state.get("multi_offer_customer_data", {}),
+            project_data=st.session_state.get("multi_offer_project_data", {}),
+            settings=st.session_state.get("multi_offer_settings", {}),
+            calc_results=calc_results,
+            company_ids=company_ids,
+            texts=st.session_state.get("TEXTS", {}),
+            extend_all=bool(st.session_state.get("multi_offer_extend_all", False)),
+            company_extended=st.session_state.get("multi_offer_company_extended", {}),
+            section_order=st.session_state.get('pdf_section_order', []),
+            live_pricing=st.session_state.get('live_pricing_calculations', {}),
+            inclusion_extras={
+                'financing_config': st.session_state.get('financing_config', {}),
+                'chart_config': st.session_state.get('chart_config', {}),
+                'custom_content_items': st.session_state.get('custom_content_items', []),
+                'pdf_editor_config': st.session_state.get('pdf_editor_config', {}),
+                'pdf_design_config': st.session_state.get('pdf_design_config', {}),
+            },
+            products=self.products,
+        )
 
     def _generate_company_pdf(self, offer_data: Dict, company: Dict, company_index: int = 0) -> bytes:
         """Generiert PDF für eine spezifische Firma mit firmenspezifischen Produkten und Preisen"""
         try:
-            # PDF-Generierung über generate_offer_pdf mit allen 16 erforderlichen Parametern
-            if callable(generate_offer_pdf):
-                  # Vorbereitung der Berechnungsergebnisse - ECHTE DATEN verwenden!
-                calc_results = st.session_state.get('calculation_results', {})
-                
-                # Fallback: Multi-Offer spezifische Berechnungen
-                if not calc_results:
-                    calc_results = st.session_state.get('multi_offer_calc_results', {})
-                
-                # Als letzter Fallback Mock-Daten, aber mit Warnung
-                if not calc_results:
-                    logging.warning("Keine echten Berechnungsergebnisse verfügbar - verwende Mock-Daten")
-                    calc_results = {
-                        'anlage_kwp': offer_data.get('module_quantity', 20) * 0.4,  # Geschätzt
-                        'annual_pv_production_kwh': offer_data.get('module_quantity', 20) * 400,
-                        'total_investment_netto': offer_data.get('module_quantity', 20) * 750,
-                        'amortization_time_years': 12.5,
-                        'self_supply_rate_percent': 65.0,
-                        'annual_financial_benefit_year1': 1200
-                    }
-                else:
-                    logging.info(f"Verwende echte Berechnungsergebnisse mit {len(calc_results)} Feldern")
-
-                # NEUE FEATURE: Preisstaffelung anwenden
-                base_settings = st.session_state.get("multi_offer_settings", {})
-                calc_results = self.apply_price_scaling(company_index, base_settings, calc_results)
-                
-                logging.info(f"PDF-Generierung für Firma {company_index+1}: Preise angepasst")# KRITISCH: PDF-kompatible Datenstruktur erstellen
-                # Die PDF-Funktion erwartet project_data mit customer_data und project_details
-                pdf_project_data = {
-                    "customer_data": offer_data.get("customer_data", {}),
-                    "project_details": offer_data.get("project_details", {}),
-                    # Weitere Felder aus offer_data übernehmen
-                    "consumption_data": offer_data.get("consumption_data", {}),
-                    "calculation_results": offer_data.get("calculation_results", {})
-                }
-                  # Falls ursprüngliche project_data vorhanden, deren Struktur beibehalten
-                if "project_data" in offer_data and offer_data["project_data"]:
-                    original_project_data = offer_data["project_data"]
-                    # Wichtige Felder aus original_project_data übernehmen
-                    for key in ["address", "roof_data", "location_data", "technical_specs"]:
-                        if key in original_project_data:
-                            pdf_project_data[key] = original_project_data[key]
-                  # DEBUG: Ausgabe der PDF-Datenstruktur
-                logging.info(f"Multi-Offer PDF Datenstruktur:")
-                logging.info(f"  project_details keys: {list(pdf_project_data.get('project_details', {}).keys())}")
-                logging.info(f"  selected_module_id: {pdf_project_data.get('project_details', {}).get('selected_module_id', 'NICHT GESETZT')}")
-                logging.info(f"  selected_inverter_id: {pdf_project_data.get('project_details', {}).get('selected_inverter_id', 'NICHT GESETZT')}")
-                logging.info(f"  selected_storage_id: {pdf_project_data.get('project_details', {}).get('selected_storage_id', 'NICHT GESETZT')}")
-                  # KRITISCH: Verfügbare Charts aus analysis_results extrahieren
-                available_charts = []
-                if calc_results and isinstance(calc_results, dict):
-                    # Chart-Keys aus analysis_results finden
-                    chart_keys = [k for k in calc_results.keys() if k.endswith('_chart_bytes') and calc_results[k] is not None]
-                    available_charts = chart_keys
-                    logging.info(f"Multi-Offer PDF: {len(available_charts)} Charts gefunden: {chart_keys}")
-                
-                # PDF-Templates aus Admin-Einstellungen laden
-                try:
-                    # Templates laden (falls verfügbar)
-                    title_image_templates = load_admin_setting("pdf_title_image_templates", []) if callable(load_admin_setting) else []
-                    offer_title_templates = load_admin_setting("pdf_offer_title_templates", []) if callable(load_admin_setting) else []
-                    cover_letter_templates = load_admin_setting("pdf_cover_letter_templates", []) if callable(load_admin_setting) else []
-                    
-                    # Erstes verfügbares Template verwenden
-                    selected_title_image = title_image_templates[0] if title_image_templates else None
-                    selected_offer_title = offer_title_templates[0] if offer_title_templates else None
-                    selected_cover_letter = cover_letter_templates[0] if cover_letter_templates else None
-                    
-                    logging.info(f"Templates geladen: Titelbild={bool(selected_title_image)}, Titel={bool(selected_offer_title)}, Anschreiben={bool(selected_cover_letter)}")
-                except Exception as e:
-                    logging.warning(f"Fehler beim Laden der Templates: {e}")
-                    selected_title_image = selected_offer_title = selected_cover_letter = None
-                  # NEUE FEATURE: Benutzerdefinierten PDF-Optionen aus Einstellungen verwenden
-                base_settings = st.session_state.get("multi_offer_settings", {})
-                pdf_options = base_settings.get("pdf_options", {})
-                
-                # Sektionen aus Benutzereinstellungen
-                selected_sections = pdf_options.get("selected_sections", [
-                    "ProjectOverview", "TechnicalComponents", "CostDetails",
-                    "Economics", "SimulationDetails", "CO2Savings", 
-                    "Visualizations", "FutureAspects"
-                ])
-                
-                # Charts basierend auf Benutzereinstellungen filtern
-                charts_to_include = available_charts if pdf_options.get("include_charts", True) else []
-                if not pdf_options.get("include_visualizations", True):
-                    # Technische Visualisierungen entfernen
-                    charts_to_include = [c for c in charts_to_include if not any(
-                        vis_key in c for vis_key in ['daily_production', 'weekly_production', 'yearly_production']
-                    )]
-                
-                # Wichtig: Logo/Firmendaten müssen pro Firma gesetzt werden – kein Global-Fallback der Hauptfirma
-                # Extended-Flag pro Firma bestimmen (oder Master "Alle erweitern")
-                is_extended = bool(st.session_state.get("multi_offer_extend_all", False) or 
-                                   st.session_state.get("multi_offer_company_extended", {}).get(company.get("id", 0), False))
-
-                # Company-Dokumente IDs ermitteln, wenn erweitert und Anhänge gewünscht
-                base_settings = st.session_state.get("multi_offer_settings", {})
-                pdf_options = base_settings.get("pdf_options", {})
-                include_all_docs = bool(pdf_options.get("include_all_documents", False))
-                company_doc_ids: list[int] = []
-                if is_extended and include_all_docs and callable(list_company_documents):
-                    try:
-                        docs = list_company_documents(company.get("id", 0), None) or []
-                        company_doc_ids = [d.get("id") for d in docs if isinstance(d, dict) and d.get("id") is not None]
-                    except Exception as _e_docs:
-                        logging.warning(f"Konnte Firmendokumente nicht laden: {_e_docs}")
-
-                # Drag&Drop-Reihenfolge und erweiterte Konfigurationen (Finanzierung, Design, Custom Content) aus globalem State
-                custom_section_order = st.session_state.get('pdf_section_order', [])
-                inclusion_extras = {
-                    'financing_config': st.session_state.get('financing_config', {}),
-                    'chart_config': st.session_state.get('chart_config', {}),
-                    'custom_content_items': st.session_state.get('custom_content_items', []),
-                    'pdf_editor_config': st.session_state.get('pdf_editor_config', {}),
-                    'pdf_design_config': st.session_state.get('pdf_design_config', {}),
-                    'custom_section_order': custom_section_order if isinstance(custom_section_order, list) else []
-                }
-                pdf_content = generate_offer_pdf(
-                    project_data=pdf_project_data,  # Korrekt strukturierte Daten
-                    analysis_results=calc_results,
-                    company_info=company,  # wird im Generator in project_data.company_information injiziert
-                    company_logo_base64=company.get("logo_base64"),  # pro Firma
-                    selected_title_image_b64=None,
-                    selected_offer_title_text=f"Ihr individuelles Solaranlagen-Angebot von {company.get('name', 'Unser Unternehmen')}",
-                    selected_cover_letter_text="Sehr geehrte Damen und Herren,\n\nvielen Dank für Ihr Interesse an nachhaltiger Solarenergie.",
-                    sections_to_include=selected_sections,  # Benutzerdef. Sektionen
-                    inclusion_options={
-                        "include_company_logo": pdf_options.get("include_company_logo", True),
-                        "include_product_images": pdf_options.get("include_product_images", True),
-                        "include_all_documents": include_all_docs,
-                        "company_document_ids_to_include": company_doc_ids,
-                        "selected_charts_for_pdf": charts_to_include if is_extended else [],
-                        "include_optional_component_details": pdf_options.get("include_optional_component_details", True),
-                        # Erweiterte Ausgabe ab Seite 7
-                        "append_additional_pages_after_main6": is_extended,
-                        # Templates hinzufügen
-                        "selected_title_image_template": selected_title_image,
-                        "selected_offer_title_template": selected_offer_title,
-                        "selected_cover_letter_template": selected_cover_letter,
-                        "use_templates": True,
-                        # DnD & Advanced Configs
-                        **inclusion_extras
-                    },
-                    texts=st.session_state.get("TEXTS", {}),
-                    list_products_func=list_products if callable(list_products) else lambda: [],
-                    get_product_by_id_func=get_product_by_id if callable(get_product_by_id) else lambda x: {},
-                    load_admin_setting_func=load_admin_setting if callable(load_admin_setting) else lambda k, d=None: d,
-                    save_admin_setting_func=save_admin_setting if callable(save_admin_setting) else lambda k, v: None,
-                    db_list_company_documents_func=list_company_documents if callable(list_company_documents) else lambda cid, dtype=None: [],
-                    active_company_id=company.get("id", 1)
-                )
-                return pdf_content
-            else:
-                st.error("PDF-Generator nicht verfügbar")
-                return None
-                
+            context = self._build_batch_context([company.get("id")] if company.get("id") is not None else [])
+            return render_company_offer(context, offer_data, company, company_index)
         except Exception as e:
             logging.error(f"Fehler bei PDF-Generierung: {e}")
             st.error(f"PDF-Generierung fehlgeschlagen: {str(e)}")
@@ -1150,17 +770,7 @@ class MultiCompanyOfferGenerator:
 
     def _create_zip_download(self, generated_pdfs: List[Dict]) -> bytes:
         """Erstellt ZIP-Datei mit allen PDFs"""
-        zip_buffer = io.BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for pdf_info in generated_pdfs:
-                zip_file.writestr(
-                    pdf_info["filename"],
-                    pdf_info["pdf_content"]
-                )
-        
-        zip_buffer.seek(0)
-        return zip_buffer.getvalue()
+        return build_offers_zip(generated_pdfs)
 
     def render_ui(self):
         """Hauptfunktion für die UI-Darstellung"""
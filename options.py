@@ -195,6 +195,35 @@ def render_options(texts: Dict[str, str], **kwargs): # KORREKTUR: **kwargs hinzu
             # Flag zurücksetzen
             del st.session_state['pvgis_settings_saved']
 
+        # PVGIS-Cache (persistente Zwischenspeicherung der API-Antworten)
+        st.markdown("---")
+        st.markdown("**PV-Gis Cache:**")
+        try:
+            from pvgis_cache import get_pvgis_cache
+            pvgis_cache = get_pvgis_cache()
+        except ImportError:
+            pvgis_cache = None
+
+        current_cache_only = convert_to_bool(load_admin_setting('pvgis_cache_only', False))
+        cache_only = st.checkbox(
+            " Offline-Modus (nur Cache verwenden)",
+            value=current_cache_only,
+            key='pvgis_cache_only_checkbox',
+            help="Es werden keine Anfragen an PV-Gis gesendet. Nur bereits gecachte Standorte liefern PV-Gis-Werte, sonst wird manuell gerechnet."
+        )
+        if cache_only != current_cache_only:
+            save_admin_setting('pvgis_cache_only', "true" if cache_only else "false")
+
+        if pvgis_cache is not None:
+            cache_stats = pvgis_cache.stats()
+            col_cache1, col_cache2, col_cache3 = st.columns(3)
+            col_cache1.metric("Einträge", cache_stats.get("entries", 0))
+            col_cache2.metric("Treffer / Fehlzugriffe", f"{cache_stats.get('hits', 0)} / {cache_stats.get('misses', 0)}")
+            col_cache3.metric("Trefferquote", f"{cache_stats.get('hit_rate', 0.0) * 100:.0f} %")
+            if st.button(" PV-Gis Cache leeren", key="pvgis_cache_clear_button"):
+                pvgis_cache.clear()
+                st.success(" PV-Gis Cache wurde geleert.")
+
     # === PDF DESIGN & LAYOUT ===
     with st.expander("PDF Design & Layout", expanded=False):
         st.subheader("PDF Design & Layout")
@@ -217,6 +246,25 @@ def render_options(texts: Dict[str, str], **kwargs): # KORREKTUR: **kwargs hinzu
         if selected_theme:
             st.session_state["pdf_theme_name"] = selected_theme
 
+        # Diagramm-Cache (gerasterte PDF-Diagramme)
+        st.markdown("---")
+        st.markdown("**Diagramm-Cache:**")
+        try:
+            from chart_export_engine import get_chart_image_cache
+            chart_cache = get_chart_image_cache()
+        except ImportError:
+            chart_cache = None
+
+        if chart_cache is not None:
+            chart_cache_stats = chart_cache.stats()
+            col_chart1, col_chart2, col_chart3 = st.columns(3)
+            col_chart1.metric("Einträge (Speicher)", f"{chart_cache_stats.get('entries', 0)} / {chart_cache_stats.get('memory_bytes_used', 0) / 1024 / 1024:.1f} MB")
+            col_chart2.metric("Treffer / Fehlzugriffe", f"{chart_cache_stats.get('hits', 0)} / {chart_cache_stats.get('misses', 0)}")
+            col_chart3.metric("Trefferquote", f"{chart_cache_stats.get('hit_rate', 0.0) * 100:.0f} %")
+            if st.button(" Diagramm-Cache leeren", key="chart_cache_clear_button"):
+                chart_cache.clear()
+                st.success(" Diagramm-Cache wurde geleert.")
+
     # ===  UI/UX EXPERIENCE EINSTELLUNGEN ===
     with st.expander(" UI/UX EXPERIENCE", expanded=False):
         st.markdown("**Personalisierung der Benutzeroberfläche**")
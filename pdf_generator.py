@@ -15,11 +15,23 @@ import io
 import math
 import traceback
 from calculations_extended import run_all_extended_analyses
+from chart_export_engine import DeferredChart, materialize_deferred_charts, rasterize_charts
 from datetime import datetime
 from typing import Any, Dict, List, Optional, Union, Callable
 from pathlib import Path
 from theming.pdf_styles import get_theme
 
+# Optional: native Vektor-Diagramme (ReportLab-Graphics statt Kaleido-PNG)
+try:
+    from vector_chart_engine import chart_spec_from_figure, figure_to_drawing
+    _VECTOR_CHARTS_AVAILABLE = True
+except ImportError:
+    _VECTOR_CHARTS_AVAILABLE = False
+    def chart_spec_from_figure(*args, **kwargs):
+        return None
+    def figure_to_drawing(*args, **kwargs):
+        return None
+
 # Optional PDF Templates import
 try:
     from pdf_templates import get_cover_letter_template, get_project_summary_template
@@ -409,115 +421,6 @@ def generate_offer_pdf_with_main_templates(
             use_modern_design=use_modern_design, **kwargs,
         )
 
-    # Hilfsfunktion: Zusatzseiten mit Footer "Angebot, <Datum>" und "Seite x von XX" versehen
-    def _overlay_footer_page_numbers(pdf_bytes: bytes, start_number: int, total_pages: int, logo_b64: Optional[str] = None, footer_left_text: Optional[str] = None) -> bytes:
-        try:
-            if not pdf_bytes:
-                return pdf_bytes
-            # ReportLab/PyPDF verfügbar?
-            if not _PYPDF_AVAILABLE or not _REPORTLAB_AVAILABLE:
-                return pdf_bytes
-            reader = PdfReader(io.BytesIO(pdf_bytes))
-            writer = PdfWriter()
-            # Erstelle einmal einen leeren Overlay-Buffer; pro Seite neu befüllen
-            from reportlab.pdfgen import canvas as _rl_canvas
-            from reportlab.lib.colors import black, white, HexColor, Color
-            from datetime import datetime as _dt
-            date_text = f"Angebot, {_dt.now().strftime('%d.%m.%Y')}"
-            for idx, page in enumerate(reader.pages):
-                # Seitengröße erfassen
-                box = page.mediabox
-                pw = float(box.width)
-                ph = float(box.height)
-                # Overlay-PDF mit gleicher Seitengröße erzeugen
-                overlay_buf = io.BytesIO()
-                canv = _rl_canvas.Canvas(overlay_buf, pagesize=(pw, ph))
-                # Dekoratives Dreieck oben rechts (wie Hauptseiten)
-                try:
-                    tri = _rl_canvas.Path()
-                except Exception:
-                    tri = None
-                accent = Color(27/255.0, 54/255.0, 112/255.0)
-                try:
-                    canv.saveState()
-                    canv.setFillColor(accent)
-                    canv.setStrokeColor(accent)
-                    size = 36.0
-                    x0, y0 = pw, ph
-                    p = canv.beginPath()
-                    p.moveTo(x0, y0)
-                    p.lineTo(x0 - size, y0)
-                    p.lineTo(x0, y0 - size)
-                    p.close()
-                    canv.drawPath(p, stroke=0, fill=1)
-                finally:
-                    try:
-                        canv.restoreState()
-                    except Exception:
-                        pass
-
-                # Footer-Hintergrundleiste (minimal bläulicher als Primärfarbe)
-                bar_height = 36
-                try:
-                    # Primärfarbe leicht in Richtung Blau schieben
-                    _hex = str(PRIMARY_COLOR_HEX).strip()
-                    if _hex.startswith('#') and len(_hex) == 7:
-                        r = int(_hex[1:3], 16); g = int(_hex[3:5], 16); b = int(_hex[5:7], 16)
-                        b = min(255, b + 16)  # +16 Blauanteil
-                        footer_hex = f"#{r:02X}{g:02X}{b:02X}"
-                    else:
-                        footer_hex = _hex
-                    canv.setFillColor(HexColor(footer_hex))
-                except Exception:
-                    # Fallback dunkelblau
-                    canv.setFillColor(HexColor('#1B3670'))
-                canv.setStrokeColor(HexColor('#000000'))
-                canv.rect(0, 0, pw, bar_height, stroke=0, fill=1)
-                # Footer-Text-Style (weiß)
-                font_name = "Helvetica-Bold"; font_size = 9
-                canv.setFillColor(white)
-                canv.setFont(font_name, font_size)
-                # Firmenlogo oben links (optional)
-                if logo_b64:
-                    try:
-                        img_bytes = base64.b64decode(logo_b64)
-                        img = ImageReader(io.BytesIO(img_bytes))
-                        max_w, max_h = 120, 50
-                        # Position: 20pt vom linken Rand, 20pt vom oberen Rand (unterhalb)
-                        canv.drawImage(img, 20, ph - 20 - max_h, width=max_w, height=max_h, preserveAspectRatio=True, mask='auto')
-                    except Exception:
-                        pass
-                # Zentrierter Datums-Text (vertikal mittig in der Leiste)
-                center_y = float(bar_height) / 2.0
-                tw = canv.stringWidth(date_text, font_name, font_size)
-                canv.drawString((pw - tw) / 2.0, center_y, date_text)
-                # Linker Footer-Text: Kundenname, falls vorhanden
-                if footer_left_text:
-                    try:
-                        canv.drawString(20, center_y, str(footer_left_text))
-                    except Exception:
-                        pass
-                # Rechte Nummer "Seite x von XX"
-                page_num = start_number + idx
-                right_text = f"Seite {page_num} von {total_pages}"
-                tw_r = canv.stringWidth(right_text, font_name, font_size)
-                canv.drawString(pw - 18 - tw_r, center_y, right_text)
-                canv.showPage(); canv.save()
-                # Overlay zurück an den Anfang und mergen
-                overlay_buf.seek(0)
-                ov_reader = PdfReader(overlay_buf)
-                ov_page = ov_reader.pages[0]
-                try:
-                    page.merge_page(ov_page)
-                except Exception:
-                    # Fallback für ältere PyPDF2 APIs
-                    page.mergePage(ov_page)  # type: ignore
-                writer.add_page(page)
-            out_buf = io.BytesIO(); writer.write(out_buf)
-            return out_buf.getvalue()
-        except Exception:
-            return pdf_bytes
-
     try:
         from pypdf import PdfReader, PdfWriter
         base_reader = PdfReader(io.BytesIO(main6))
@@ -525,8 +428,8 @@ def generate_offer_pdf_with_main_templates(
         for p in base_reader.pages: writer.add_page(p)
         if additional_pdf:
             # Seitenanzahl ermitteln (gesamt = 6 + n)
-            tmp_reader = PdfReader(io.BytesIO(additional_pdf))
-            total_pages = 6 + len(tmp_reader.pages)
+            add_reader = PdfReader(io.BytesIO(additional_pdf))
+            total_pages = 6 + len(add_reader.pages)
             # Zusatzseiten mit Footer versehen: Startnummer = 7
             logo_b64 = None
             try:
@@ -544,15 +447,132 @@ def generate_offer_pdf_with_main_templates(
                 footer_left = ' '.join(name_parts)
             except Exception:
                 footer_left = None
-            additional_pdf = _overlay_footer_page_numbers(additional_pdf, start_number=7, total_pages=total_pages, logo_b64=logo_b64, footer_left_text=footer_left)
-            add_reader = PdfReader(io.BytesIO(additional_pdf))
-            for p in add_reader.pages: writer.add_page(p)
+            _append_pages_with_footer(writer, add_reader.pages, start_number=7, total_pages=total_pages, logo_b64=logo_b64, footer_left_text=footer_left)
         buf = io.BytesIO(); writer.write(buf)
         return buf.getvalue()
     except Exception:
         # Falls Zusammenführen fehlschlägt, gib die 6 Seiten zurück
         return main6
 
+
+def _footer_bar_hex() -> str:
+    """Primärfarbe minimal in Richtung Blau verschoben (Footer-Leiste der Zusatzseiten)."""
+    try:
+        _hex = str(PRIMARY_COLOR_HEX).strip()
+        if _hex.startswith('#') and len(_hex) == 7:
+            r = int(_hex[1:3], 16); g = int(_hex[3:5], 16); b = int(_hex[5:7], 16)
+            b = min(255, b + 16)  # +16 Blauanteil
+            return f"#{r:02X}{g:02X}{b:02X}"
+        return _hex
+    except Exception:
+        return '#1B3670'
+
+
+def _render_footer_overlay(
+    page_sizes: List[tuple],
+    start_number: int,
+    total_pages: int,
+    logo_b64: Optional[str] = None,
+    footer_left_text: Optional[str] = None,
+) -> bytes:
+    """Rendert den Footer "Angebot, <Datum>" / "Seite x von XX" für alle Seiten in einem Canvas-Durchlauf.
+
+    Eine Overlay-Seite je Eintrag in ``page_sizes`` (Breite, Höhe). Das Logo wird
+    nur einmal dekodiert; ReportLab bettet es einmal ein und referenziert es auf
+    jeder Seite.
+    """
+    buf = io.BytesIO()
+    canv = canvas.Canvas(buf, pagesize=page_sizes[0] if page_sizes else A4)
+    date_text = f"Angebot, {datetime.now().strftime('%d.%m.%Y')}"
+    accent = colors.Color(27/255.0, 54/255.0, 112/255.0)
+    try:
+        bar_color = HexColor(_footer_bar_hex())
+    except Exception:
+        # Fallback dunkelblau
+        bar_color = HexColor('#1B3670')
+    logo_img = None
+    if logo_b64:
+        try:
+            logo_img = ImageReader(io.BytesIO(base64.b64decode(logo_b64)))
+        except Exception:
+            logo_img = None
+    font_name = "Helvetica-Bold"; font_size = 9
+    bar_height = 36
+    center_y = float(bar_height) / 2.0
+    date_tw = canv.stringWidth(date_text, font_name, font_size)
+    for idx, (pw, ph) in enumerate(page_sizes):
+        canv.setPageSize((pw, ph))
+        # Dekoratives Dreieck oben rechts (wie Hauptseiten)
+        canv.saveState()
+        canv.setFillColor(accent)
+        canv.setStrokeColor(accent)
+        size = 36.0
+        p = canv.beginPath()
+        p.moveTo(pw, ph)
+        p.lineTo(pw - size, ph)
+        p.lineTo(pw, ph - size)
+        p.close()
+        canv.drawPath(p, stroke=0, fill=1)
+        canv.restoreState()
+        # Footer-Hintergrundleiste
+        canv.setFillColor(bar_color)
+        canv.setStrokeColor(HexColor('#000000'))
+        canv.rect(0, 0, pw, bar_height, stroke=0, fill=1)
+        # Footer-Text-Style (weiß)
+        canv.setFillColor(colors.white)
+        canv.setFont(font_name, font_size)
+        # Firmenlogo oben links (optional), 20pt vom linken und oberen Rand
+        if logo_img is not None:
+            try:
+                max_w, max_h = 120, 50
+                canv.drawImage(logo_img, 20, ph - 20 - max_h, width=max_w, height=max_h, preserveAspectRatio=True, mask='auto')
+            except Exception:
+                logo_img = None
+        # Zentrierter Datums-Text (vertikal mittig in der Leiste)
+        canv.drawString((pw - date_tw) / 2.0, center_y, date_text)
+        # Linker Footer-Text: Kundenname, falls vorhanden
+        if footer_left_text:
+            canv.drawString(20, center_y, str(footer_left_text))
+        # Rechte Nummer "Seite x von XX"
+        right_text = f"Seite {start_number + idx} von {total_pages}"
+        tw_r = canv.stringWidth(right_text, font_name, font_size)
+        canv.drawString(pw - 18 - tw_r, center_y, right_text)
+        canv.showPage()
+    canv.save()
+    return buf.getvalue()
+
+
+def _append_pages_with_footer(
+    writer: Any,
+    pages: Any,
+    start_number: int,
+    total_pages: int,
+    logo_b64: Optional[str] = None,
+    footer_left_text: Optional[str] = None,
+) -> None:
+    """Hängt ``pages`` an ``writer`` an und stempelt dabei den Footer (Seite für Seite gepaart).
+
+    Schlägt das Rendern des Footers fehl, werden die Seiten ohne Footer angehängt.
+    """
+    pages = list(pages)
+    footer_pages: List[Any] = []
+    if pages and _PYPDF_AVAILABLE and _REPORTLAB_AVAILABLE:
+        try:
+            sizes = [(float(p.mediabox.width), float(p.mediabox.height)) for p in pages]
+            overlay = _render_footer_overlay(sizes, start_number, total_pages, logo_b64, footer_left_text)
+            footer_pages = list(PdfReader(io.BytesIO(overlay)).pages)
+        except Exception as e_footer:
+            print(f"pdf_generator: Footer-Overlay fehlgeschlagen: {e_footer}")
+            footer_pages = []
+    for idx, page in enumerate(pages):
+        if idx < len(footer_pages):
+            try:
+                page.merge_page(footer_pages[idx])
+            except Exception:
+                pass
+        writer.add_page(page)
+
+
 _PDF_GENERATOR_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Da pdf_generator.py im selben Verzeichnis wie der data/ Ordner liegt, ist der Basis-Pfad korrekt
 PRODUCT_DATASHEETS_BASE_DIR_PDF_GEN = os.path.join(_PDF_GENERATOR_BASE_DIR, "data", "product_datasheets")
@@ -948,6 +968,26 @@ def _get_image_flowable(image_data_input: Optional[Union[str, bytes]], desired_w
             flowables.append(Paragraph(f"<i>({caption_text_fb}: {get_text(texts, 'image_not_available_pdf', 'Bild nicht verfügbar')})</i>", STYLES['ImageCaption']))
     return flowables
 
+def _can_draw_natively(chart: DeferredChart) -> bool:
+    return _VECTOR_CHARTS_AVAILABLE and chart_spec_from_figure(chart.figure) is not None
+
+
+def _get_chart_flowables(chart_value: Any, desired_width: float, texts: Dict[str, str], max_height: Optional[float] = None, align: str = 'CENTER') -> List[Any]:
+    """Diagramm als Flowable: vorgemerkte Plotly-Figuren nativ als Vektorgrafik,
+    sonst (3D, Fehler, PNG-Bytes) wie bisher als Rasterbild."""
+    if isinstance(chart_value, DeferredChart):
+        aspect = chart_value.height / float(chart_value.width) if chart_value.width > 0 else 0.6
+        width, height = desired_width, desired_width * aspect
+        if max_height and height > max_height:
+            height = max_height
+            width = height / aspect if aspect > 0 else desired_width
+        drawing = figure_to_drawing(chart_value.figure, width, height) if _VECTOR_CHARTS_AVAILABLE else None
+        if drawing is not None:
+            drawing.hAlign = align.upper()
+            return [drawing]
+        chart_value = rasterize_charts([chart_value])[0]
+    return _get_image_flowable(chart_value, desired_width, texts, max_height=max_height, align=align)
+
 def _draw_cover_page(c: canvas.Canvas, theme: Dict, offer_data: Dict):
     c.setFont(theme["fonts"]["family_main"], 40)
     c.setFillColor(theme["colors"]["primary"])
@@ -1269,13 +1309,16 @@ def _replace_placeholders(text_template: str, customer_data: Dict, company_info:
         processed_text = processed_text.replace(placeholder, str(value_repl))
     return processed_text
 
+def format_offer_number(suffix: int) -> str:
+    return f"AN{datetime.now().year}-{int(suffix):04d}"
+
 def _get_next_offer_number(texts: Dict[str,str], load_admin_setting_func: Callable, save_admin_setting_func: Callable) -> str:
     try:
         current_suffix_obj = load_admin_setting_func('offer_number_suffix', 1000)
         current_suffix = int(str(current_suffix_obj)) if current_suffix_obj is not None else 1000
         next_suffix = current_suffix + 1
         save_admin_setting_func('offer_number_suffix', next_suffix)
-        return f"AN{datetime.now().year}-{next_suffix:04d}"
+        return format_offer_number(next_suffix)
     except Exception: 
         return f"AN{datetime.now().strftime('%Y%m%d-%H%M%S')}"
 
@@ -1507,6 +1550,13 @@ def generate_offer_pdf(
     texts: Dict[str, str],
     use_modern_design: bool = True,    **kwargs
 ) -> Optional[bytes]:
+    # Im Analyse-Tab vorgemerkte Diagramme erst jetzt gebündelt rastern (in place,
+    # damit weitere PDFs derselben Analyse die PNG-Bytes wiederverwenden)
+    # Einfache 2D-Diagramme bleiben vorgemerkt und werden im Story-Aufbau als
+    # Vektorgrafik gezeichnet (siehe _get_chart_flowables)
+    if isinstance(analysis_results, dict):
+        native_charts = _VECTOR_CHARTS_AVAILABLE and bool((inclusion_options or {}).get("native_vector_charts", True))
+        materialize_deferred_charts(analysis_results, keep=_can_draw_natively if native_charts else None)
     # Frühzeitige Delegation: Verwende standardmäßig den neuen 6-Seiten-Template-Flow
     # Verhindere Rekursion mittels Flag 'disable_main_template_combiner'
     if not kwargs.get('disable_main_template_combiner'):
@@ -1609,7 +1659,8 @@ def generate_offer_pdf(
         _update_styles_with_dynamic_colors(design_settings)
     
     main_offer_buffer = io.BytesIO()
-    offer_number_final = _get_next_offer_number(texts, load_admin_setting_func, save_admin_setting_func)
+    # Vorab vergebene Nummer (Multi-Angebots-Batch reserviert sie im Hauptprozess) hat Vorrang
+    offer_number_final = inclusion_options.get("offer_number") or _get_next_offer_number(texts, load_admin_setting_func, save_admin_setting_func)
     
     include_company_logo_opt = inclusion_options.get("include_company_logo", True)
     include_product_images_opt = inclusion_options.get("include_product_images", True)
@@ -2115,9 +2166,12 @@ def generate_offer_pdf(
                     co2_chart_bytes = current_analysis_results_pdf.get('co2_savings_chart_bytes')
                     if co2_chart_bytes:
                         try:
-                            co2_img = ImageReader(io.BytesIO(co2_chart_bytes))
-                            co2_image = Image(co2_img, width=16*cm, height=10*cm)
-                            section_elements.append(co2_image)
+                            if isinstance(co2_chart_bytes, DeferredChart):
+                                section_elements.extend(_get_chart_flowables(co2_chart_bytes, 16*cm, texts, max_height=10*cm))
+                            else:
+                                co2_img = ImageReader(io.BytesIO(co2_chart_bytes))
+                                co2_image = Image(co2_img, width=16*cm, height=10*cm)
+                                section_elements.append(co2_image)
                             section_elements.append(Spacer(1, 0.2 * cm))
                         except Exception as e:
                             print(f"Fehler beim Einfügen der CO₂-Grafik: {e}")
@@ -2179,7 +2233,7 @@ def generate_offer_pdf(
                             continue # Überspringe dieses Diagramm, wenn nicht vom Nutzer ausgewählt
 
                         chart_image_bytes = current_analysis_results_pdf.get(chart_key)
-                        if chart_image_bytes and isinstance(chart_image_bytes, bytes):
+                        if chart_image_bytes and isinstance(chart_image_bytes, (bytes, DeferredChart)):
                             # NEUE SEITE wenn bereits 3 Diagramme auf aktueller Seite
                             if current_page_chart_count >= charts_per_page:
                                 story.append(PageBreak())
@@ -2199,7 +2253,7 @@ def generate_offer_pdf(
                             chart_width = available_width_content * 0.6  # Reduziert von 0.7 auf 0.6
                             max_height = 5*cm  # Reduziert von 6cm auf 5cm für mehr Platz
                             
-                            img_flowables_chart = _get_image_flowable(chart_image_bytes, chart_width, texts, max_height=max_height, align='CENTER')
+                            img_flowables_chart = _get_chart_flowables(chart_image_bytes, chart_width, texts, max_height=max_height, align='CENTER')
                             if img_flowables_chart: 
                                 chart_elements.extend(img_flowables_chart)
                                 chart_elements.append(Spacer(1, 0.2*cm))
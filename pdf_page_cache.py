@@ -0,0 +1,391 @@
+# pdf_page_cache.py
+"""
+Seitenweiser Render-Cache für die PDF-Vorschau.
+
+Bisher hat ``PDFPreviewEngine`` bei jeder Aktualisierung alle Seiten mit
+150 DPI neu gerastert (bis zu 20 Seiten, auch wenn nur eine angezeigt wurde)
+und fertige PDFs in einem Dict mit maximal 10 Einträgen abgelegt, das nach
+dem zehnten PDF einfach nichts mehr aufnahm. Jetzt gilt:
+
+- Jede Seite bekommt einen Inhalts-Digest (BLAKE2b über Seitengröße,
+  entpackten Content-Stream und die Rohdaten aller referenzierten Bilder und
+  Form-XObjects). Gerastert wird nur, was unter ``(Digest, DPI)`` noch nicht im
+  Cache liegt – nach einer Änderung also nur die Seiten, die sich tatsächlich
+  verändert haben; Seiten mit identischem Inhalt (auch aus älteren PDFs)
+  kommen direkt aus dem Cache.
+- Zuerst werden kleine Vorschaubilder (``THUMBNAIL_DPI``) erzeugt, die volle
+  Auflösung (``FULL_DPI``) nur für Seiten, die wirklich groß angezeigt werden.
+- PDFs und Seitenbilder liegen in je einem nach Bytes begrenzten LRU
+  (``ChartImageCache`` ohne Plattenablage) statt im festen 10er-Dict.
+
+Das Angebots-PDF selbst entsteht weiterhin in einem Durchgang (der
+Seitenumbruch der ReportLab-Story hängt vom gesamten Inhalt ab); der
+Seiten-Digest sorgt dafür, dass unveränderte Seiten trotzdem nicht erneut
+gerastert werden.
+
+Fertige PDFs werden über ``generate_offer_pdf_cached`` zwischen Vorschau,
+zentralem PDF-System und Multi-Angebot geteilt. Schlüssel ist
+``offer_pdf_fingerprint``: ein kanonischer Digest über *alle* Argumente des
+Generators (Projekt, Analyse inkl. Diagrammen, Firma, Texte, Vorlagen,
+Optionen) plus Layout-Version (``PDF_LAYOUT_VERSION``, Signaturen der
+Vorlagen-Dateien und Generator-Module) und den Stand der App-DB, aus der der
+Generator Produkte, Dokumente und Admin-Settings nachlädt. Jede Änderung
+ergibt einen neuen Schlüssel – ein erzwungenes Neuerzeugen ist damit nicht
+mehr nötig.
+"""
+
+from __future__ import annotations
+
+import datetime as _dt
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from chart_export_engine import ChartImageCache, DeferredChart, chart_cache_key
+
+try:
+    from database import DB_PATH
+    _DATABASE_AVAILABLE = True
+except ImportError:
+    _DATABASE_AVAILABLE = False
+
+try:
+    import fitz  # PyMuPDF
+    _FITZ_AVAILABLE = True
+except ImportError:
+    fitz = None  # type: ignore
+    _FITZ_AVAILABLE = False
+
+THUMBNAIL_DPI = 60
+FULL_DPI = 150
+
+DEFAULT_PDF_CACHE_BYTES = 48 * 1024 * 1024
+DEFAULT_PAGE_IMAGE_CACHE_BYTES = 96 * 1024 * 1024
+_MAX_DIGEST_ENTRIES = 64
+
+# Bei Layout-Änderungen im Generator erhöhen, die nicht an den unten
+# überwachten Dateien erkennbar sind
+PDF_LAYOUT_VERSION = 1
+
+BASE_DIR = Path(os.path.dirname(os.path.abspath(__file__)))
+# Vorlagen und Generator-Module, deren Änderung jedes gecachte PDF ungültig macht
+_LAYOUT_DIRS = (
+    BASE_DIR / "coords",
+    BASE_DIR / "pdf_templates_static" / "notext",
+    BASE_DIR / "pdf_template_engine",
+    BASE_DIR / "theming",
+)
+_LAYOUT_FILES = (
+    BASE_DIR / "pdf_generator.py",
+    BASE_DIR / "pdf_styles.py",
+    BASE_DIR / "vector_chart_engine.py",
+    BASE_DIR / "chart_export_engine.py",
+)
+
+
+def pdf_digest(pdf_bytes: bytes) -> str:
+    return hashlib.blake2b(pdf_bytes, digest_size=20).hexdigest()
+
+
+def _page_digest(document: Any, page: Any) -> str:
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update(repr(tuple(page.rect)).encode("ascii"))
+    hasher.update(page.read_contents() or b"")
+    referenced = {img[0] for img in page.get_images(full=True)}
+    referenced.update(xobj[0] for xobj in page.get_xobjects())
+    for xref in sorted(x for x in referenced if x > 0):
+        hasher.update(b"x")
+        hasher.update(document.xref_stream_raw(xref) or b"")
+    return hasher.hexdigest()
+
+
+# --- Kanonischer Fingerprint der Generator-Eingaben ---
+
+def _feed_canonical(hasher: Any, value: Any) -> None:
+    """Schreibt ``value`` eindeutig und reihenfolgeunabhängig (Dicts, Sets) in ``hasher``.
+
+    Unbekannte Objekte gehen mit ``repr`` ein; enthält das eine Speicheradresse,
+    trifft der Schlüssel nie – das kostet ein Neuerzeugen, liefert aber nie ein
+    veraltetes PDF.
+    """
+    if value is None or isinstance(value, (bool, int, float, complex)):
+        hasher.update(f"{type(value).__name__}:{value!r};".encode("utf-8"))
+    elif isinstance(value, str):
+        encoded = value.encode("utf-8")
+        hasher.update(b"s%d:" % len(encoded))
+        hasher.update(encoded)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        hasher.update(b"b%d:" % len(data))
+        hasher.update(data)
+    elif isinstance(value, dict):
+        hasher.update(b"{")
+        for key in sorted(value, key=lambda k: (type(k).__name__, str(k))):
+            _feed_canonical(hasher, key)
+            _feed_canonical(hasher, value[key])
+        hasher.update(b"}")
+    elif isinstance(value, (list, tuple)):
+        hasher.update(b"[" if isinstance(value, list) else b"(")
+        for item in value:
+            _feed_canonical(hasher, item)
+        hasher.update(b"]")
+    elif isinstance(value, (set, frozenset)):
+        hasher.update(b"<")
+        for item in sorted(value, key=lambda v: (type(v).__name__, repr(v))):
+            _feed_canonical(hasher, item)
+        hasher.update(b">")
+    elif isinstance(value, np.generic):
+        _feed_canonical(hasher, value.item())
+    elif isinstance(value, np.ndarray):
+        hasher.update(f"a{value.dtype.str}{value.shape}".encode("ascii"))
+        if value.dtype == object:
+            _feed_canonical(hasher, value.tolist())
+        else:
+            hasher.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, pd.DataFrame):
+        hasher.update(b"df")
+        _feed_canonical(hasher, [str(c) for c in value.columns])
+        _feed_canonical(hasher, value.index.to_numpy())
+        for column in value.columns:
+            _feed_canonical(hasher, value[column].to_numpy())
+    elif isinstance(value, pd.Series):
+        hasher.update(b"ser")
+        _feed_canonical(hasher, value.index.to_numpy())
+        _feed_canonical(hasher, value.to_numpy())
+    elif isinstance(value, DeferredChart):
+        # Figur-Digest statt Rasterung; ohne lesbare Figur nie als Treffer werten
+        hasher.update(b"chart:")
+        hasher.update((chart_cache_key(value) or f"unreadable:{id(value)}").encode("ascii"))
+    elif isinstance(value, (_dt.datetime, _dt.date, _dt.time)):
+        hasher.update(f"t:{value.isoformat()};".encode("ascii"))
+    elif isinstance(value, Path):
+        _feed_canonical(hasher, str(value))
+    elif callable(value):
+        # Callbacks (load_admin_setting_func & Co.): Identität über den Namen
+        name = f"{getattr(value, '__module__', '')}.{getattr(value, '__qualname__', type(value).__name__)}"
+        hasher.update(f"f:{name};".encode("utf-8"))
+    else:
+        hasher.update(f"o:{type(value).__name__}:{value!r};".encode("utf-8"))
+
+
+def _file_signature(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def layout_signature() -> Tuple[Any, ...]:
+    """Layout-Version: Konstante plus Größe/mtime aller Vorlagen- und Generator-Dateien."""
+    entries: List[Any] = [PDF_LAYOUT_VERSION]
+    for directory in _LAYOUT_DIRS:
+        try:
+            names = sorted(name for name in os.listdir(directory) if not name.startswith("."))
+        except OSError:
+            names = []
+        for name in names:
+            path = directory / name
+            if path.is_file():
+                entries.append((str(path.relative_to(BASE_DIR)), _file_signature(path)))
+    entries.extend((path.name, _file_signature(path)) for path in _LAYOUT_FILES)
+    return tuple(entries)
+
+
+def database_signature() -> Tuple[Any, ...]:
+    """Größe/mtime der App-DB (inkl. WAL): Produkte, Firmendokumente und
+    Admin-Settings, die der Generator selbst nachlädt, sind so mit abgedeckt."""
+    if not _DATABASE_AVAILABLE:
+        return ()
+    return tuple(_file_signature(Path(path)) for path in (DB_PATH, DB_PATH + "-wal"))
+
+
+def _live_final_price(args: Sequence[Any], kwargs: Dict[str, Any]) -> Any:
+    """``final_price`` aus der Streamlit-Session, falls der Generator darauf zurückfällt.
+
+    pdf_generator liest ``st.session_state['live_pricing_calculations']``, wenn
+    ``analysis_results`` keinen Endpreis enthält; dieser Wert muss dann in den Schlüssel.
+    """
+    analysis_results = kwargs.get("analysis_results", args[1] if len(args) > 1 else None)
+    if isinstance(analysis_results, dict) and analysis_results.get("final_price") not in (None, 0, 0.0):
+        return None
+    try:
+        import streamlit as st
+        live = st.session_state.get("live_pricing_calculations", {}) if hasattr(st, "session_state") else {}
+        return live.get("final_price") if isinstance(live, dict) else None
+    except Exception:
+        return None
+
+
+def offer_pdf_fingerprint(generator: Any = None, *args: Any, **kwargs: Any) -> str:
+    """Kanonischer Schlüssel über alle Generator-Argumente, Layout-Version und DB-Stand.
+
+    ``generator`` (die aufgerufene Funktion) geht mit ein, damit z. B. Vorlagen-
+    und Legacy-Generator nie denselben Eintrag teilen. Außerdem enthalten: das
+    Tagesdatum (steht im PDF) und ein ``final_price`` aus der Session, den der
+    Generator außerhalb seiner Argumente liest.
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    _feed_canonical(hasher, generator)
+    _feed_canonical(hasher, list(args))
+    _feed_canonical(hasher, kwargs)
+    _feed_canonical(hasher, layout_signature())
+    _feed_canonical(hasher, database_signature())
+    _feed_canonical(hasher, _dt.date.today())
+    _feed_canonical(hasher, _live_final_price(args, kwargs))
+    return hasher.hexdigest()
+
+
+class PreviewPageCache:
+    """Vorschau-PDFs und gerasterte Seiten (PNG) je Inhalts-Digest und DPI."""
+
+    def __init__(
+        self,
+        pdf_bytes: int = DEFAULT_PDF_CACHE_BYTES,
+        page_image_bytes: int = DEFAULT_PAGE_IMAGE_CACHE_BYTES,
+    ):
+        self.pdfs = ChartImageCache(memory_bytes=pdf_bytes)
+        self.page_images = ChartImageCache(memory_bytes=page_image_bytes)
+        self._lock = threading.Lock()
+        self._page_digests: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._stats = {"pages_rendered": 0, "pages_reused": 0}
+
+    # --- fertige PDFs ---
+
+    def get_pdf(self, key: Optional[str]) -> Optional[bytes]:
+        return self.pdfs.get(key)
+
+    def put_pdf(self, key: Optional[str], pdf_bytes: Optional[bytes]) -> None:
+        self.pdfs.put(key, pdf_bytes)
+
+    # --- Seiten ---
+
+    def page_digests(self, pdf_bytes: bytes, document: Any = None) -> List[str]:
+        """Inhalts-Digest je Seite (pro PDF nur einmal berechnet)."""
+        if not _FITZ_AVAILABLE or not pdf_bytes:
+            return []
+        key = pdf_digest(pdf_bytes)
+        with self._lock:
+            digests = self._page_digests.get(key)
+            if digests is not None:
+                self._page_digests.move_to_end(key)
+                return digests
+        own_document = document is None
+        if own_document:
+            document = fitz.open(stream=pdf_bytes, filetype="pdf")
+        try:
+            digests = [_page_digest(document, document[i]) for i in range(len(document))]
+        finally:
+            if own_document:
+                document.close()
+        with self._lock:
+            self._page_digests[key] = digests
+            while len(self._page_digests) > _MAX_DIGEST_ENTRIES:
+                self._page_digests.popitem(last=False)
+        return digests
+
+    def page_count(self, pdf_bytes: bytes) -> int:
+        return len(self.page_digests(pdf_bytes))
+
+    def render_pages(
+        self, pdf_bytes: bytes, pages: Sequence[int], dpi: int = THUMBNAIL_DPI
+    ) -> List[Optional[bytes]]:
+        """PNG-Bytes der Seiten ``pages`` (0-basiert); gerastert werden nur Cache-Fehltreffer."""
+        if not _FITZ_AVAILABLE or not pdf_bytes:
+            return [None for _ in pages]
+        digests = self.page_digests(pdf_bytes)
+        results: List[Optional[bytes]] = []
+        missing: List[int] = []
+        for position, page_num in enumerate(pages):
+            if not 0 <= page_num < len(digests):
+                results.append(None)
+                continue
+            image = self.page_images.get(f"{digests[page_num]}-{dpi}")
+            results.append(image)
+            if image is None:
+                missing.append(position)
+        if missing:
+            document = fitz.open(stream=pdf_bytes, filetype="pdf")
+            try:
+                for position in missing:
+                    page_num = pages[position]
+                    image = document[page_num].get_pixmap(dpi=dpi).tobytes("png")
+                    self.page_images.put(f"{digests[page_num]}-{dpi}", image)
+                    results[position] = image
+            finally:
+                document.close()
+        with self._lock:
+            self._stats["pages_rendered"] += len(missing)
+            self._stats["pages_reused"] += len(pages) - len(missing)
+        return results
+
+    def clear(self) -> None:
+        self.pdfs.clear(disk=False)
+        self.page_images.clear(disk=False)
+        with self._lock:
+            self._page_digests.clear()
+            for k in self._stats:
+                self._stats[k] = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result: Dict[str, Any] = dict(self._stats)
+        result["pdf"] = self.pdfs.stats()
+        result["page_images"] = self.page_images.stats()
+        return result
+
+
+_PREVIEW_PAGE_CACHE: Optional[PreviewPageCache] = None
+_PREVIEW_PAGE_CACHE_LOCK = threading.Lock()
+
+
+def get_preview_page_cache() -> PreviewPageCache:
+    """Prozessweite Standard-Instanz (lazy)."""
+    global _PREVIEW_PAGE_CACHE
+    if _PREVIEW_PAGE_CACHE is None:
+        with _PREVIEW_PAGE_CACHE_LOCK:
+            if _PREVIEW_PAGE_CACHE is None:
+                _PREVIEW_PAGE_CACHE = PreviewPageCache()
+    return _PREVIEW_PAGE_CACHE
+
+
+def generate_offer_pdf_cached(
+    generator: Callable[..., Optional[bytes]],
+    *args: Any,
+    force_refresh: bool = False,
+    cache: Optional[PreviewPageCache] = None,
+    reuse_after_generation: bool = True,
+    **kwargs: Any,
+) -> Optional[bytes]:
+    """Ruft ``generator(*args, **kwargs)`` nur auf, wenn zu den Eingaben noch kein PDF vorliegt.
+
+    Mit ``reuse_after_generation`` (Vorschau) wird das PDF zusätzlich unter dem
+    Schlüssel nach der Erzeugung abgelegt: ein identischer Folgeaufruf trifft
+    dann und liefert dasselbe PDF samt bereits vergebener Angebotsnummer.
+    Finale Angebote (zentrales PDF-System, Multi-Angebot) schalten das ab –
+    jede Erzeugung zählt die Angebotsnummer in der DB hoch, ändert damit den
+    DB-Stand im Schlüssel und bekommt so immer eine neue Nummer.
+    """
+    cache = cache or get_preview_page_cache()
+    cache_key = offer_pdf_fingerprint(generator, *args, **kwargs)
+    if not force_refresh:
+        cached_pdf = cache.get_pdf(cache_key)
+        if cached_pdf:
+            return cached_pdf
+    pdf_bytes = generator(*args, **kwargs)
+    if pdf_bytes:
+        cache.put_pdf(cache_key, pdf_bytes)
+        if reuse_after_generation:
+            # Der Generator selbst ändert Eingaben: er rastert vorgemerkte Diagramme
+            # in analysis_results (in place) und zählt die Angebotsnummer in der DB
+            # hoch. Der nächste identische Aufruf soll trotzdem treffen.
+            updated_key = offer_pdf_fingerprint(generator, *args, **kwargs)
+            if updated_key != cache_key:
+                cache.put_pdf(updated_key, pdf_bytes)
+    return pdf_bytes
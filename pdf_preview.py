@@ -18,6 +18,7 @@ try:
     from reportlab.pdfgen import canvas
     from PIL import Image
     import fitz  # PyMuPDF für PDF-zu-Bild-Konvertierung
+    from pdf_page_cache import FULL_DPI, THUMBNAIL_DPI, generate_offer_pdf_cached, get_preview_page_cache
     PDF_PREVIEW_AVAILABLE = True
 except ImportError:
     PDF_PREVIEW_AVAILABLE = False
@@ -26,9 +27,10 @@ class PDFPreviewEngine:
     """Engine für PDF-Vorschau mit Cache und Optimierungen"""
     
     def __init__(self):
-        self.cache = {}
-        self.max_cache_size = 10
-        self.preview_dpi = 150  # DPI für Vorschau-Bilder
+        # PDFs und Seitenbilder: nach Bytes begrenzter LRU, seitenweise nach Inhalt
+        self.cache = get_preview_page_cache()
+        self.preview_dpi = FULL_DPI  # DPI für Vorschau-Bilder in voller Größe
+        self.thumbnail_dpi = THUMBNAIL_DPI  # DPI für die schnellen Vorschaubilder
         
     def generate_preview_pdf(
         self,
@@ -40,21 +42,12 @@ class PDFPreviewEngine:
         force_refresh: bool = False,
         **kwargs
     ) -> Optional[bytes]:
-        """Generiert ein Vorschau-PDF"""
+        """Generiert ein Vorschau-PDF (aus dem geteilten PDF-Cache, wenn die Eingaben unverändert sind)"""
         try:
-            # Cache-Key erstellen
-            cache_key = self._create_cache_key(project_data, inclusion_options)
-            
-            # Cache umgehen, wenn explizit angefordert
-            if force_refresh and cache_key in self.cache:
-                self.cache.pop(cache_key, None)
-
-            # Aus Cache laden wenn vorhanden
-            if cache_key in self.cache:
-                return self.cache[cache_key]
-            
-            # PDF generieren
-            pdf_bytes = generate_offer_pdf(
+            return generate_offer_pdf_cached(
+                generate_offer_pdf,
+                force_refresh=force_refresh,
+                cache=self.cache,
                 project_data=project_data,
                 analysis_results=analysis_results,
                 company_info=company_info,
@@ -63,45 +56,40 @@ class PDFPreviewEngine:
                 **kwargs
             )
             
-            # In Cache speichern
-            if pdf_bytes and len(self.cache) < self.max_cache_size:
-                self.cache[cache_key] = pdf_bytes
-            
-            return pdf_bytes
-            
         except Exception as e:
             st.error(f"Fehler bei PDF-Generierung: {e}")
             return None
     
-    def _create_cache_key(self, project_data: Dict, options: Dict) -> str:
-        """Erstellt einen eindeutigen Cache-Key"""
-        # Vereinfachter Key basierend auf wichtigen Parametern
-        key_parts = [
-            project_data.get('customer_data', {}).get('last_name', ''),
-            str(project_data.get('project_details', {}).get('module_quantity', 0)),
-            str(options.get('include_charts', False)),
-            str(options.get('include_all_documents', False))
-        ]
-        return "_".join(key_parts)
-    
-    def pdf_to_images(self, pdf_bytes: bytes, max_pages: int = 5) -> List[Image.Image]:
-        """Konvertiert PDF-Seiten zu Bildern für Vorschau"""
+    def page_count(self, pdf_bytes: bytes) -> int:
+        """Seitenzahl des PDFs (aus dem Seiten-Digest-Cache)"""
+        if not PDF_PREVIEW_AVAILABLE or not pdf_bytes:
+            return 0
+        try:
+            return self.cache.page_count(pdf_bytes)
+        except Exception as e:
+            st.error(f"Fehler beim Lesen des PDFs: {e}")
+            return 0
+
+    def pdf_to_images(
+        self,
+        pdf_bytes: bytes,
+        max_pages: int = 5,
+        dpi: Optional[int] = None,
+        pages: Optional[List[int]] = None,
+    ) -> List[Image.Image]:
+        """Konvertiert PDF-Seiten zu Bildern für Vorschau.
+
+        Ohne ``pages`` die ersten ``max_pages`` Seiten; ohne ``dpi`` als schnelle
+        Vorschaubilder. Unveränderte Seiten kommen aus dem Seiten-Cache.
+        """
         if not PDF_PREVIEW_AVAILABLE or not pdf_bytes:
             return []
         
         try:
-            images = []
-            pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
-            
-            for page_num in range(min(len(pdf_document), max_pages)):
-                page = pdf_document[page_num]
-                pix = page.get_pixmap(dpi=self.preview_dpi)
-                img_data = pix.tobytes("png")
-                img = Image.open(io.BytesIO(img_data))
-                images.append(img)
-            
-            pdf_document.close()
-            return images
+            if pages is None:
+                pages = list(range(min(self.cache.page_count(pdf_bytes), max_pages)))
+            rendered = self.cache.render_pages(pdf_bytes, pages, dpi=dpi or self.thumbnail_dpi)
+            return [Image.open(io.BytesIO(img_data)) for img_data in rendered if img_data]
             
         except Exception as e:
             st.error(f"Fehler bei PDF-zu-Bild-Konvertierung: {e}")
@@ -177,6 +165,13 @@ def render_pdf_preview_interface(
             value=True
         )
         
+        high_resolution = st.checkbox(
+            "Hohe Auflösung",
+            value=False,
+            help=f"Seiten mit {FULL_DPI} statt {THUMBNAIL_DPI} DPI rastern (langsamer)"
+        )
+        preview_dpi = engine.preview_dpi if high_resolution else engine.thumbnail_dpi
+        
         # Manuelle Aktualisierung
         update_preview = st.button(
             " Vorschau aktualisieren",
@@ -209,7 +204,7 @@ def render_pdf_preview_interface(
                     company_info=company_info,
                     inclusion_options=inclusion_options,
                     texts=texts,
-                    force_refresh=True,
+                    force_refresh=False,  # Schlüssel deckt alle Eingaben ab
                     company_logo_base64=company_info.get('logo_base64'),
                     selected_title_image_b64=None,
                     selected_offer_title_text="Ihr Photovoltaik-Angebot",
@@ -237,7 +232,7 @@ def render_pdf_preview_interface(
             with preview_container:
                 if preview_mode == "Schnellvorschau":
                     # Erste Seiten als Bilder anzeigen
-                    images = engine.pdf_to_images(pdf_bytes, max_pages=3)
+                    images = engine.pdf_to_images(pdf_bytes, max_pages=3, dpi=preview_dpi)
                     
                     if images:
                         for idx, img in enumerate(images):
@@ -264,17 +259,17 @@ def render_pdf_preview_interface(
                     st.markdown(pdf_display, unsafe_allow_html=True)
                 
                 elif preview_mode == "Seitenweise":
-                    # Seitenweise Navigation
-                    images = engine.pdf_to_images(pdf_bytes, max_pages=20)
+                    # Seitenweise Navigation: nur die angezeigte Seite rastern (volle Auflösung)
+                    total_pages = min(engine.page_count(pdf_bytes), 20)
                     
-                    if images:
-                        total_pages = len(images)
+                    if total_pages:
                         
                         # Seitennavigation
                         col_prev, col_page, col_next = st.columns([1, 2, 1])
                         
                         if 'preview_current_page' not in st.session_state:
                             st.session_state.preview_current_page = 0
+                        st.session_state.preview_current_page = min(st.session_state.preview_current_page, total_pages - 1)
                         
                         with col_prev:
                             if st.button(" Zurück", disabled=st.session_state.preview_current_page == 0):
@@ -299,12 +294,14 @@ def render_pdf_preview_interface(
                                 st.rerun()
                         
                         # Aktuelle Seite anzeigen
-                        current_img = images[st.session_state.preview_current_page]
-                        width = int(current_img.width * preview_zoom / 100)
-                        height = int(current_img.height * preview_zoom / 100)
-                        img_resized = current_img.resize((width, height))
-                        
-                        st.image(img_resized, use_column_width=True)
+                        page_images = engine.pdf_to_images(pdf_bytes, dpi=engine.preview_dpi, pages=[st.session_state.preview_current_page])
+                        if page_images:
+                            current_img = page_images[0]
+                            width = int(current_img.width * preview_zoom / 100)
+                            height = int(current_img.height * preview_zoom / 100)
+                            img_resized = current_img.resize((width, height))
+                            
+                            st.image(img_resized, use_column_width=True)
                         st.caption(f"Seite {st.session_state.preview_current_page + 1} von {total_pages}")
         
         # Download-Button
@@ -0,0 +1,166 @@
+"""
+pdf_template_engine/background_cache.py
+
+Wiederverwendbare Hintergrund-Seiten für merge_with_background.
+
+Bisher wurden nt_nt_01.pdf … nt_nt_06.pdf und haus.pdf für jedes Angebot neu
+mit ``PdfReader`` geöffnet und das Haus-Motiv (30 %, zentriert) jedes Mal neu
+auf Seite 1 transformiert. Hier wird jedes Hintergrundverzeichnis einmal pro
+Prozess geparst:
+
+- Seiten 2–6: die erste Seite der jeweiligen Vorlage
+- Seite 1: Vorlage + Haus bereits zusammengesetzt
+- Seiteninhalt bereits dekodiert (einmal geschrieben und als fertige
+  Basisseite wieder eingelesen)
+
+Pro Angebot wird die Basisseite nur noch in den ``PdfWriter`` kopiert
+(``add_page`` klont sie) und das Overlay auf die Kopie gestempelt; die
+gecachten Seiten selbst bleiben unverändert. Ändert sich eine der Dateien
+(mtime_ns/Größe), wird das Verzeichnis neu eingelesen.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from pypdf import PdfReader, PdfWriter, Transformation
+
+if TYPE_CHECKING:  # pragma: no cover
+    from pypdf import PageObject
+
+HOUSE_SCALE = 0.3  # 70% kleiner
+
+
+def background_candidates(bg_dir: Path, page_num: int) -> List[Path]:
+    # Unterstütze beide Muster: nt_nt_XX.pdf und nt_XX.pdf
+    return [bg_dir / f"nt_nt_{page_num:02d}.pdf", bg_dir / f"nt_{page_num:02d}.pdf"]
+
+
+def _file_signature(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _directory_signature(bg_dir: Path) -> Tuple[Optional[Tuple[int, int]], ...]:
+    paths = [p for n in range(1, 7) for p in background_candidates(bg_dir, n)]
+    paths.append(bg_dir / "haus.pdf")
+    return tuple(_file_signature(p) for p in paths)
+
+
+def _read_first_page(path: Path) -> Optional[PageObject]:
+    if not path.exists():
+        return None
+    try:
+        return PdfReader(str(path)).pages[0]
+    except Exception:
+        return None
+
+
+def _prepare_base_page(base_page: PageObject, house_page: Optional[PageObject] = None) -> PageObject:
+    """Erzeugt eine fertige Basisseite: Inhalt einmal dekodiert, optional mit haus.pdf.
+
+    ``merge_page`` dekodiert den Inhalt der Basisseite bei jedem Aufruf; liegt er
+    bereits unkomprimiert vor, entfällt das. haus.pdf wird skaliert und zentriert
+    daraufgelegt. Das Ergebnis wird geschrieben und als eigenständige Seite
+    wieder eingelesen.
+    """
+    writer = PdfWriter()
+    page = writer.add_page(base_page)
+    if house_page is not None:
+        try:
+            bw = float(page.mediabox.width)
+            bh = float(page.mediabox.height)
+            hw = float(house_page.mediabox.width)
+            hh = float(house_page.mediabox.height)
+            tx = (bw - hw * HOUSE_SCALE) / 2.0
+            ty = (bh - hh * HOUSE_SCALE) / 2.0
+            t = Transformation().scale(HOUSE_SCALE, HOUSE_SCALE).translate(tx, ty)
+            page.merge_transformed_page(house_page, t)
+        except Exception:
+            # Fallback: unskaliert mergen
+            try:
+                page.merge_page(house_page)
+            except Exception:
+                pass
+    else:
+        contents = page.get_contents()
+        if contents is not None:
+            page.replace_contents(contents)
+    buf = io.BytesIO()
+    writer.write(buf)
+    return PdfReader(io.BytesIO(buf.getvalue())).pages[0]
+
+
+@dataclass
+class BackgroundSet:
+    signature: Tuple[Optional[Tuple[int, int]], ...]
+    pages: Tuple[Optional[PageObject], ...]  # Index 0 = Seite 1 (ggf. inkl. Haus)
+
+
+def load_background_set(bg_dir: Path) -> BackgroundSet:
+    signature = _directory_signature(bg_dir)
+    pages: List[Optional[PageObject]] = []
+    for page_num in range(1, 7):
+        bg_page = None
+        for cand in background_candidates(bg_dir, page_num):
+            bg_page = _read_first_page(cand)
+            if bg_page is not None:
+                break
+        if page_num == 1:
+            # Reihenfolge: Basis (nt_nt_01.pdf) -> haus.pdf -> Overlay
+            house_page = _read_first_page(bg_dir / "haus.pdf")
+            if bg_page is None:
+                # Kein Standard-Hintergrund: haus.pdf direkt als Basis
+                bg_page, house_page = house_page, None
+            if bg_page is not None:
+                bg_page = _prepare_base_page(bg_page, house_page)
+        elif bg_page is not None:
+            bg_page = _prepare_base_page(bg_page)
+        pages.append(bg_page)
+    return BackgroundSet(signature=signature, pages=tuple(pages))
+
+
+class BackgroundCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sets: Dict[str, BackgroundSet] = {}
+        self.stats = {"hits": 0, "loads": 0}
+
+    def get(self, bg_dir: Path) -> BackgroundSet:
+        bg_dir = Path(bg_dir)
+        key = os.path.abspath(str(bg_dir))
+        signature = _directory_signature(bg_dir)
+        with self._lock:
+            cached = self._sets.get(key)
+            if cached is not None and cached.signature == signature:
+                self.stats["hits"] += 1
+                return cached
+        loaded = load_background_set(bg_dir)
+        with self._lock:
+            self._sets[key] = loaded
+            self.stats["loads"] += 1
+        return loaded
+
+    def add_page_copy(self, writer: PdfWriter, page: PageObject) -> PageObject:
+        """Klont eine gecachte Seite in ``writer`` (pypdf-Reader sind nicht threadsicher)."""
+        with self._lock:
+            return writer.add_page(page)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sets.clear()
+
+
+_BACKGROUND_CACHE = BackgroundCache()
+
+
+def get_background_cache() -> BackgroundCache:
+    return _BACKGROUND_CACHE
@@ -17,7 +17,7 @@ from reportlab.lib.utils import ImageReader
 import base64
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.colors import Color
-from pypdf import PdfReader, PdfWriter, Transformation
+from pypdf import PdfReader, PdfWriter
 try:
     # PageObject ist optional (ältere pypdf-Versionen können es anders exportieren)
     from pypdf import PageObject  # type: ignore
@@ -25,7 +25,8 @@ except Exception:  # pragma: no cover
     PageObject = None  # type: ignore
 from pathlib import Path
 
-from .placeholders import PLACEHOLDER_MAPPING
+from .layout_cache import get_page_layout
+from .background_cache import get_background_cache
 
 # Optional: Admin-Settings laden, um Overlay-Verhalten dynamisch zu steuern
 try:
@@ -137,14 +138,6 @@ def parse_coords_file(path: Path) -> List[Dict[str, Any]]:
     return elements
 
 
-def int_to_color(value: int) -> Color:
-    """Wandelt einen Integer (0xRRGGBB) in reportlab Color um."""
-    r = ((value >> 16) & 0xFF) / 255.0
-    g = ((value >> 8) & 0xFF) / 255.0
-    b = (value & 0xFF) / 255.0
-    return Color(r, g, b)
-
-
 def _draw_company_logo(c: canvas.Canvas, dynamic_data: Dict[str, str], page_width: float, page_height: float) -> None:
     """Zeichnet das Firmenlogo links oben, wenn company_logo_b64 vorhanden ist."""
     b64 = dynamic_data.get("company_logo_b64") or ""
@@ -275,6 +268,17 @@ def _draw_top_right_triangle(c: canvas.Canvas, page_width: float, page_height: f
     finally:
         c.restoreState()
 
+# Keys, die innerhalb ihrer Box horizontal zentriert werden sollen (Seite 2 Pfeile)
+_CENTER_KEYS = frozenset({
+    "direct_consumption_quote_prod_percent",
+    "battery_use_quote_prod_percent",
+    "feed_in_quote_prod_percent_number",
+    "battery_cover_consumption_percent",
+    "grid_consumption_rate_percent",
+    "direct_cover_consumption_percent_number",
+})
+
+
 def generate_overlay(coords_dir: Path, dynamic_data: Dict[str, str], total_pages: int = 6) -> bytes:
     """Erzeugt ein Overlay-PDF für sechs Seiten anhand der coords-Dateien.
 
@@ -285,7 +289,8 @@ def generate_overlay(coords_dir: Path, dynamic_data: Dict[str, str], total_pages
     page_width, page_height = A4
     for i in range(1, 7):
         yml_path = coords_dir / f"seite{i}.yml"
-        elements = parse_coords_file(yml_path)
+        # Vorkompiliertes Layout (Fonts/Farben/Positionen aufgelöst, Cache nach mtime)
+        layout = get_page_layout(yml_path)
         # Firmenlogo für jede Seite zuerst zeichnen
         _draw_company_logo(c, dynamic_data, page_width, page_height)
         # Dreieck oben rechts auf allen Seiten 1-6
@@ -296,70 +301,31 @@ def generate_overlay(coords_dir: Path, dynamic_data: Dict[str, str], total_pages
         # Produktbilder auf Seite 4 (optional aus Produkt-DB)
         if i == 4:
             _draw_page4_component_images(c, dynamic_data, page_width, page_height)
-        # Keys, die innerhalb ihrer Box horizontal zentriert werden sollen (Seite 2 Pfeile)
-        center_keys = {
-            "direct_consumption_quote_prod_percent",
-            "battery_use_quote_prod_percent",
-            "feed_in_quote_prod_percent_number",
-            "battery_cover_consumption_percent",
-            "grid_consumption_rate_percent",
-            "direct_cover_consumption_percent_number",
-        }
-
-        for elem in elements:
-            text = elem.get("text", "")
-            key = PLACEHOLDER_MAPPING.get(text)
-            draw_text = dynamic_data.get(key, text) if key else text
-            pos = elem.get("position", (0, 0, 0, 0))
-            if len(pos) == 4:
-                x0, y0, x1, y1 = pos
-                draw_x = x0
-                draw_y = page_height - y1  # Koordinaten invertieren (oben links)
-            else:
-                draw_x = 0
-                draw_y = 0
-            font_name = elem.get("font", "Helvetica")
-            font_size = float(elem.get("font_size", 10.0))
-            try:
-                c.setFont(font_name, font_size)
-            except Exception:
-                c.setFont("Helvetica", font_size)
-            color_int = int(elem.get("color", 0))
-            c.setFillColor(int_to_color(color_int))
+
+        for elem in layout.elements:
+            key = elem.key
+            draw_text = dynamic_data.get(key, elem.text) if key else elem.text
+            c.setFont(elem.font_name, elem.font_size)
+            c.setFillColor(elem.color)
             # Auf Seite 1 die großen KPI-%-Texte (54%, 42%) nicht zusätzlich zeichnen,
             # da diese jetzt im Donut-Zentrum erscheinen sollen.
             if i == 1 and key in {"self_supply_rate_percent", "self_consumption_percent"}:
                 continue
             # Dynamische Seitennummerierung unten rechts ersetzen
             # Heuristik: Originaleintrag ist die Ziffer der Seite ("1".."6") in Weiß nahe der Fußzeile rechts.
-            try:
-                raw = (text or "").strip()
-                is_footer_num = (
-                    not key and raw.isdigit() and int(raw) == i and
-                    len(pos) == 4 and (pos[3] >= 780.0) and  # y1 nahe Fußzeile
-                    (pos[0] >= 520.0) and  # rechtsbündiger Bereich
-                    color_int == 0xFFFFFF
-                )
-            except Exception:
-                is_footer_num = False
-
-            if is_footer_num:
+            if elem.footer_page_number == i:
                 page_num_text = f"Seite {i} von {int(total_pages) if isinstance(total_pages, (int, float)) else total_pages}"
                 # Rechtsbündig an x1 ausrichten
                 try:
-                    c.drawRightString(x1, draw_y, page_num_text)
+                    c.drawRightString(elem.position[2], elem.draw_y, page_num_text)
                 except Exception:
-                    c.drawString(draw_x, draw_y, page_num_text)
+                    c.drawString(elem.draw_x, elem.draw_y, page_num_text)
+            elif key in _CENTER_KEYS and elem.has_box:
+                tw = c.stringWidth(str(draw_text), elem.font_name, elem.font_size)
+                mid_x = (elem.position[0] + elem.position[2]) / 2.0
+                c.drawString(mid_x - tw / 2.0, elem.draw_y, str(draw_text))
             else:
-                if key in center_keys and len(pos) == 4:
-                    try:
-                        tw = c.stringWidth(str(draw_text), font_name, font_size)
-                        mid_x = (x0 + x1) / 2.0
-                        c.drawString(mid_x - tw / 2.0, draw_y, str(draw_text))
-                    except Exception:
-                        c.drawString(draw_x, draw_y, str(draw_text))
-                else:
-                    c.drawString(draw_x, draw_y, str(draw_text))
+                c.drawString(elem.draw_x, elem.draw_y, str(draw_text))
         c.showPage()
     c.save()
     return buffer.getvalue()
@@ -413,88 +379,24 @@ def _draw_page4_component_images(c: canvas.Canvas, dynamic_data: Dict[str, str],
 
 
 def merge_with_background(overlay_bytes: bytes, bg_dir: Path) -> bytes:
-    """Verschmilzt das Overlay mit nt_nt_01.pdf … nt_nt_06.pdf aus bg_dir."""
+    """Verschmilzt das Overlay mit nt_nt_01.pdf … nt_nt_06.pdf aus bg_dir.
+
+    Die Hintergründe (Seite 1 inkl. haus.pdf) kommen aus dem BackgroundCache und
+    werden nur einmal pro Prozess geparst; gestempelt wird auf Kopien.
+    """
     overlay_reader = PdfReader(io.BytesIO(overlay_bytes))
+    background_cache = get_background_cache()
+    backgrounds = background_cache.get(bg_dir)
     writer = PdfWriter()
     for page_num in range(1, 7):
-        # Unterstütze beide Muster: nt_nt_XX.pdf und nt_XX.pdf
-        candidates = [bg_dir / f"nt_nt_{page_num:02d}.pdf", bg_dir / f"nt_{page_num:02d}.pdf"]
-        bg_page = None
-        for cand in candidates:
-            if cand.exists():
-                try:
-                    bg_reader = PdfReader(str(cand))
-                    bg_page = bg_reader.pages[0]
-                    break
-                except Exception:
-                    continue
-        # Fallback: Wenn kein Hintergrund vorhanden/lesbar ist, füge nur Overlay-Seite ein
         ov_page = overlay_reader.pages[page_num - 1]
-
-        # Optional: Auf Seite 1 zusätzlich eine weitere statische PDF (haus.pdf) mergen
-        # Reihenfolge: Basis (nt_nt_01.pdf) -> haus.pdf -> Overlay
-        extra_bg_page = None
-        if page_num == 1:
-            haus_path = bg_dir / "haus.pdf"
-            if haus_path.exists():
-                try:
-                    haus_reader = PdfReader(str(haus_path))
-                    extra_bg_page = haus_reader.pages[0]
-                except Exception:
-                    extra_bg_page = None
-
-        # Falls kein Standard-Hintergrund vorhanden ist, aber haus.pdf existiert, nutze diese als Basis
-        base_page = bg_page
-        if base_page is None and extra_bg_page is not None:
-            base_page = extra_bg_page
-            extra_bg_page = None  # bereits als Basis gesetzt
-
+        base_page = backgrounds.pages[page_num - 1]
         if base_page is not None:
-            # Falls eine zusätzliche Haus-Seite vorhanden ist, zuerst darüber legen (skaliert 30% und zentriert)
-            if extra_bg_page is not None:
-                try:
-                    bw = float(base_page.mediabox.width)
-                    bh = float(base_page.mediabox.height)
-                    hw = float(extra_bg_page.mediabox.width)
-                    hh = float(extra_bg_page.mediabox.height)
-                    scale = 0.3  # 70% kleiner
-                    tx = (bw - hw * scale) / 2.0
-                    ty = (bh - hh * scale) / 2.0
-                    t = Transformation().scale(scale, scale).translate(tx, ty)
-                    base_page.merge_transformed_page(extra_bg_page, t)
-                except Exception:
-                    # Fallback: unskaliert mergen
-                    try:
-                        base_page.merge_page(extra_bg_page)
-                    except Exception:
-                        pass
-            # Overlay über den zusammengesetzten Hintergrund legen
-            base_page.merge_page(ov_page)
-            writer.add_page(base_page)
+            # Overlay über den (ggf. mit haus.pdf zusammengesetzten) Hintergrund legen
+            page = background_cache.add_page_copy(writer, base_page)
+            page.merge_page(ov_page)
         else:
-            # Kein Standard-Hintergrund: nur haus.pdf (falls vorhanden) als Basis, skaliert, dann Overlay
-            if extra_bg_page is not None and PageObject is not None:
-                try:
-                    # Erzeuge leere Basis-Seite in A4 (oder Größe des Overlay)
-                    try:
-                        bw = float(ov_page.mediabox.width)
-                        bh = float(ov_page.mediabox.height)
-                    except Exception:
-                        bw, bh = A4
-                    base = PageObject.create_blank_page(width=bw, height=bh)  # type: ignore
-                    hw = float(extra_bg_page.mediabox.width)
-                    hh = float(extra_bg_page.mediabox.height)
-                    scale = 0.3
-                    tx = (bw - hw * scale) / 2.0
-                    ty = (bh - hh * scale) / 2.0
-                    t = Transformation().scale(scale, scale).translate(tx, ty)
-                    base.merge_transformed_page(extra_bg_page, t)
-                    base.merge_page(ov_page)
-                    writer.add_page(base)
-                    continue
-                except Exception:
-                    pass
-            # Fallback: nur Overlay
+            # Fallback: Wenn kein Hintergrund vorhanden/lesbar ist, füge nur Overlay-Seite ein
             writer.add_page(ov_page)
     out = io.BytesIO()
     writer.write(out)
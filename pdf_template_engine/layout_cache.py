@@ -0,0 +1,259 @@
+"""
+pdf_template_engine/layout_cache.py
+
+Vorkompilierte Koordinaten-Layouts für den Overlay-Renderer.
+
+generate_overlay hat bisher bei jeder PDF-Erzeugung coords/seite1.yml …
+seite6.yml (bzw. coords_wp/wp_seite1.yml …) neu gelesen und per Regex geparst; unbekannte Schriftnamen wie
+"Helvetica-Regular" lösten dabei in ReportLab jedes Mal eine teure
+AFM-Dateisuche aus. Hier werden die Dateien einmal in unveränderliche
+Strukturen übersetzt:
+
+- Positionen als float, y bereits in ReportLab-Koordinaten (unten links)
+- Schriftnamen gegen ReportLab aufgelöst (Fallback "Helvetica")
+- Farben als fertige ``Color``-Objekte (int_to_color)
+- Platzhalter-Key aus PLACEHOLDER_MAPPING bereits nachgeschlagen
+
+Der Speicher-Cache ist nach Dateipfad geschlüsselt und wird über
+(mtime_ns, Größe) validiert; ändert sich eine Datei, wird nur sie neu
+kompiliert. Für schnelle Kaltstarts kann per CLI eine JSON-Datei
+(``layout_cache.json`` im coords-Verzeichnis) erzeugt werden, deren Einträge
+zusätzlich über SHA-256 des Dateiinhalts abgesichert sind:
+
+    python -m pdf_template_engine.layout_cache coords coords_wp
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from reportlab.lib.colors import Color
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+
+from .placeholders import PLACEHOLDER_MAPPING
+
+LAYOUT_CACHE_FILENAME = "layout_cache.json"
+LAYOUT_CACHE_FORMAT_VERSION = 1
+DEFAULT_FONT = "Helvetica"
+
+
+@dataclass(frozen=True)
+class LayoutElement:
+    text: str
+    key: Optional[str]          # Platzhalter-Key aus PLACEHOLDER_MAPPING
+    position: Tuple[float, ...]  # Originalkoordinaten (x0, y0, x1, y1), oben links
+    draw_x: float
+    draw_y: float               # bereits invertiert (ReportLab: unten links)
+    font_name: str              # aufgelöst, garantiert in ReportLab verfügbar
+    font_size: float
+    color_int: int
+    color: Color
+    footer_page_number: Optional[int]  # Seitenziffer in der Fußzeile (wird ersetzt)
+
+    @property
+    def has_box(self) -> bool:
+        return len(self.position) == 4
+
+
+@dataclass(frozen=True)
+class PageLayout:
+    path: str
+    signature: Tuple[int, int]  # (mtime_ns, Größe)
+    content_sha256: str
+    elements: Tuple[LayoutElement, ...]
+
+
+_FONT_RESOLUTION: Dict[str, str] = {}
+
+
+def resolve_font_name(font_name: Optional[str]) -> str:
+    """Gibt den Schriftnamen zurück, falls ReportLab ihn kennt, sonst Helvetica."""
+    name = (font_name or DEFAULT_FONT).strip() or DEFAULT_FONT
+    resolved = _FONT_RESOLUTION.get(name)
+    if resolved is None:
+        try:
+            pdfmetrics.getFont(name)
+            resolved = name
+        except Exception:
+            resolved = DEFAULT_FONT
+        _FONT_RESOLUTION[name] = resolved
+    return resolved
+
+
+def int_to_color(value: int) -> Color:
+    """Wandelt einen Integer (0xRRGGBB) in reportlab Color um."""
+    r = ((value >> 16) & 0xFF) / 255.0
+    g = ((value >> 8) & 0xFF) / 255.0
+    b = (value & 0xFF) / 255.0
+    return Color(r, g, b)
+
+
+def _footer_page_number(text: str, key: Optional[str], position: Tuple[float, ...], color_int: int) -> Optional[int]:
+    """Heuristik für die Seitenziffer unten rechts (weiß, nahe Fußzeile, rechtsbündig)."""
+    raw = (text or "").strip()
+    if key or not raw.isdigit() or len(position) != 4:
+        return None
+    if position[3] >= 780.0 and position[0] >= 520.0 and color_int == 0xFFFFFF:
+        return int(raw)
+    return None
+
+
+def compile_elements(raw_elements: List[Dict[str, Any]], page_height: float = A4[1]) -> Tuple[LayoutElement, ...]:
+    compiled = []
+    for elem in raw_elements:
+        text = elem.get("text", "")
+        key = PLACEHOLDER_MAPPING.get(text)
+        position = tuple(float(v) for v in elem.get("position", (0, 0, 0, 0)))
+        if len(position) == 4:
+            draw_x, draw_y = position[0], page_height - position[3]
+        else:
+            draw_x, draw_y = 0.0, 0.0
+        try:
+            color_int = int(elem.get("color", 0))
+        except (TypeError, ValueError):
+            color_int = 0
+        compiled.append(
+            LayoutElement(
+                text=text,
+                key=key,
+                position=position,
+                draw_x=draw_x,
+                draw_y=draw_y,
+                font_name=resolve_font_name(elem.get("font", DEFAULT_FONT)),
+                font_size=float(elem.get("font_size", 10.0)),
+                color_int=color_int,
+                color=int_to_color(color_int),
+                footer_page_number=_footer_page_number(text, key, position, color_int),
+            )
+        )
+    return tuple(compiled)
+
+
+def _file_signature(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _sha256_file(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+class LayoutCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._layouts: Dict[str, PageLayout] = {}
+        # coords-Verzeichnis -> Inhalt von layout_cache.json (Dateiname -> Eintrag)
+        self._disk_entries: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"hits": 0, "compiled": 0, "disk_hits": 0}
+
+    def _disk_entry(self, path: Path) -> Optional[Dict[str, Any]]:
+        directory = str(path.parent)
+        entries = self._disk_entries.get(directory)
+        if entries is None:
+            entries = {}
+            cache_file = path.parent / LAYOUT_CACHE_FILENAME
+            try:
+                data = json.loads(cache_file.read_text(encoding="utf-8"))
+                if data.get("format_version") == LAYOUT_CACHE_FORMAT_VERSION:
+                    entries = data.get("files", {}) or {}
+            except (OSError, ValueError):
+                entries = {}
+            self._disk_entries[directory] = entries
+        return entries.get(path.name)
+
+    def get_page_layout(self, path: Path) -> PageLayout:
+        # Import hier, um den Zirkelimport mit dynamic_overlay zu vermeiden
+        from .dynamic_overlay import parse_coords_file
+
+        path = Path(path)
+        cache_key = os.path.abspath(str(path))
+        signature = _file_signature(path)
+        with self._lock:
+            layout = self._layouts.get(cache_key)
+            if layout is not None and layout.signature == signature:
+                self.stats["hits"] += 1
+                return layout
+            if signature is None:
+                layout = PageLayout(cache_key, (0, 0), "", ())
+                self._layouts[cache_key] = layout
+                return layout
+
+            raw_elements = None
+            content_sha = _sha256_file(path)
+            entry = self._disk_entry(path)
+            if entry and entry.get("sha256") == content_sha:
+                raw_elements = entry.get("elements")
+                self.stats["disk_hits"] += 1
+            if raw_elements is None:
+                raw_elements = parse_coords_file(path)
+                self.stats["compiled"] += 1
+            layout = PageLayout(cache_key, signature, content_sha, compile_elements(raw_elements))
+            self._layouts[cache_key] = layout
+            return layout
+
+    def clear(self) -> None:
+        with self._lock:
+            self._layouts.clear()
+            self._disk_entries.clear()
+
+
+_LAYOUT_CACHE = LayoutCache()
+
+
+def get_page_layout(path: Path) -> PageLayout:
+    """Kompiliertes Layout einer Koordinatendatei (seiteX.yml, wp_seiteX.yml; neu kompiliert, sobald sich die Datei ändert)."""
+    return _LAYOUT_CACHE.get_page_layout(path)
+
+
+def get_layout_cache() -> LayoutCache:
+    return _LAYOUT_CACHE
+
+
+def write_layout_cache(coords_dir: Path) -> Path:
+    """Parst alle *seite*.yml eines Verzeichnisses und schreibt layout_cache.json.
+
+    Das Muster deckt sowohl ``coords/seiteX.yml`` als auch ``coords_wp/wp_seiteX.yml`` ab.
+    """
+    from .dynamic_overlay import parse_coords_file
+
+    coords_dir = Path(coords_dir)
+    files: Dict[str, Any] = {}
+    for yml_path in sorted(coords_dir.glob("*seite*.yml")):
+        elements = parse_coords_file(yml_path)
+        for elem in elements:
+            if "position" in elem:
+                elem["position"] = list(elem["position"])
+        files[yml_path.name] = {"sha256": _sha256_file(yml_path), "elements": elements}
+    target = coords_dir / LAYOUT_CACHE_FILENAME
+    tmp = target.with_suffix(".json.tmp")
+    tmp.write_text(
+        json.dumps({"format_version": LAYOUT_CACHE_FORMAT_VERSION, "files": files}, ensure_ascii=False),
+        encoding="utf-8",
+    )
+    os.replace(tmp, target)
+    return target
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Kompiliert coords/seiteX.yml bzw. coords_wp/wp_seiteX.yml in layout_cache.json")
+    parser.add_argument("coords_dirs", nargs="+", help="z.B. coords coords_wp")
+    args = parser.parse_args(argv)
+    for directory in args.coords_dirs:
+        target = write_layout_cache(Path(directory))
+        print(f"Layout-Cache geschrieben: {target}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
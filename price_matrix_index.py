@@ -0,0 +1,113 @@
+# price_matrix_index.py
+"""
+Kompakte Lookup-Struktur für die Modul-Preis-Matrix.
+
+perform_calculations hat den Matrixpreis bisher mit
+``df[df.index <= module_quantity].iloc[-1]`` gesucht: Boolesche Maske über
+alle Zeilen plus DataFrame-Kopie je Aufruf, obwohl es nur um die
+"nächstkleinere Modulanzahl" geht. ``PriceMatrixIndex`` wird einmal je
+geladener Matrix gebaut (``load_price_matrix_df_with_cache``) und hält:
+
+- die Modulanzahlen (Index) als sortiertes Array mit der Zeilenposition,
+- die Preise als 2-D-Float-Array (Zeilen × Spalten),
+- die Spaltennamen normalisiert (strip/lower) -> Spaltenposition.
+
+Eine Abfrage ist dann ein ``np.searchsorted`` plus Array-Zugriff; mit
+``prices`` lassen sich viele Modulanzahlen und Speicherspalten auf einmal
+nachschlagen (Batch, Sweeps, Größenoptimierung).
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+
+def normalize_column_name(name: object) -> str:
+    return str(name).strip().lower()
+
+
+class PriceMatrixIndex:
+    def __init__(self, module_counts: np.ndarray, columns: Sequence[str], values: np.ndarray):
+        # Zeilen in Matrix-Reihenfolge; die Suche nutzt eine sortierte Sicht darauf
+        self.module_counts = np.asarray(module_counts, dtype=float)
+        self.columns = tuple(columns)
+        self.values = np.asarray(values, dtype=float)
+        order = np.argsort(self.module_counts, kind="stable")
+        self._sorted_counts = self.module_counts[order]
+        # Wie iloc[-1] der gefilterten Matrix: die letzte Zeile (in Matrix-
+        # Reihenfolge), deren Modulanzahl <= Abfrage ist
+        self._last_position = np.maximum.accumulate(order) if len(order) else order
+        self._column_positions: Dict[str, int] = {}
+        for position, name in enumerate(self.columns):
+            self._column_positions[normalize_column_name(name)] = position
+
+    @classmethod
+    def from_frame(cls, df: Optional[pd.DataFrame]) -> Optional["PriceMatrixIndex"]:
+        """Baut den Index aus der geparsten Matrix (None bei leerer Matrix).
+
+        Nicht-numerische Einträge werden zu NaN (wie eine leere Zelle).
+        """
+        if df is None or df.empty:
+            return None
+        module_counts = pd.to_numeric(pd.Series(df.index), errors="coerce").to_numpy(dtype=float)
+        values = df.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+        return cls(module_counts, [str(c) for c in df.columns], values)
+
+    def __len__(self) -> int:
+        return len(self.module_counts)
+
+    def floor_positions(self, module_counts: Union[float, Sequence[float], np.ndarray]) -> np.ndarray:
+        """Zeilenposition je Modulanzahl (nächstkleinere oder gleiche Stufe), -1 wenn keine."""
+        queries = np.asarray(module_counts, dtype=float)
+        k = np.searchsorted(self._sorted_counts, queries, side="right") - 1
+        if not len(self._last_position):
+            return np.full(queries.shape, -1, dtype=int)
+        return np.where(k >= 0, self._last_position[np.maximum(k, 0)], -1)
+
+    def floor_position(self, module_count: float) -> int:
+        return int(self.floor_positions(module_count))
+
+    def column_position(self, name: object) -> Optional[int]:
+        return self._column_positions.get(normalize_column_name(name))
+
+    def module_count_at(self, position: int) -> int:
+        return int(self.module_counts[position])
+
+    def value(self, position: int, column_position: Optional[int]) -> float:
+        if position < 0 or column_position is None:
+            return float("nan")
+        return float(self.values[position, column_position])
+
+    def prices(
+        self,
+        module_counts: Union[float, Sequence[float], np.ndarray],
+        columns: Union[str, Sequence[str]],
+        fallback_column: Optional[str] = None,
+    ) -> np.ndarray:
+        """Vektorisierte Matrixpreise: Form ``(len(module_counts), len(columns))``.
+
+        Fehlt eine Spalte oder ist ihr Preis leer (NaN), wird ``fallback_column``
+        (z. B. "Ohne Speicher") verwendet; ohne Treffer bleibt NaN.
+        """
+        if isinstance(columns, str):
+            columns = [columns]
+        positions = self.floor_positions(np.atleast_1d(np.asarray(module_counts, dtype=float)))
+        valid_rows = positions >= 0
+        rows = np.maximum(positions, 0)
+        fallback_position = self.column_position(fallback_column) if fallback_column is not None else None
+        if fallback_position is not None:
+            fallback = np.where(valid_rows, self.values[rows, fallback_position], np.nan)
+        else:
+            fallback = np.full(len(rows), np.nan)
+        result = np.empty((len(rows), len(columns)), dtype=float)
+        for j, column in enumerate(columns):
+            column_position = self.column_position(column)
+            if column_position is None:
+                result[:, j] = fallback
+                continue
+            prices = np.where(valid_rows, self.values[rows, column_position], np.nan)
+            result[:, j] = np.where(np.isnan(prices), fallback, prices)
+        return result
@@ -0,0 +1,107 @@
+# price_matrix_sidecar.py
+"""
+Persistente Ablage der geparsten Modul-Preis-Matrix als NPZ-Datei.
+
+Der Prozess-Cache in ``load_price_matrix_df_with_cache`` hilft erst ab der
+zweiten Berechnung; nach jedem Neustart (Streamlit-Reload, neue Worker)
+musste die Matrix wieder mit ``pd.read_excel`` geparst werden. Hier wird das
+Ergebnis neben der DB unter ``data/price_matrix_cache/`` abgelegt:
+
+- Dateiname aus Quelle ("Excel"/"CSV") und Cache-Schlüssel (Revisions-Stempel
+  aus ``admin_settings`` oder Inhalts-Hash), ein neuer Upload erzeugt also
+  automatisch eine neue Datei,
+- Inhalt: Index (Modulanzahlen), je Spalte ein Array mit ihrem dtype und die
+  Spaltennamen; geladen wird mit ``allow_pickle=False``,
+- Schreiben atomar über Temp-Datei + ``os.replace``, ältere Dateien derselben
+  Quelle werden dabei entfernt.
+
+Fehler beim Lesen/Schreiben sind nie fatal: dann wird wie bisher geparst.
+"""
+
+from __future__ import annotations
+
+import glob
+import hashlib
+import os
+import tempfile
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PRICE_MATRIX_SIDECAR_DIR = os.path.join(BASE_DIR, "data", "price_matrix_cache")
+
+_SIDECAR_FORMAT = 1
+
+
+def _sidecar_path(source: str, cache_key: str, directory: Optional[str] = None) -> str:
+    digest = hashlib.blake2b(str(cache_key).encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(directory or PRICE_MATRIX_SIDECAR_DIR, f"{source.lower()}_{digest}.npz")
+
+
+def load_price_matrix_sidecar(
+    source: str, cache_key: Optional[str], directory: Optional[str] = None
+) -> Optional[pd.DataFrame]:
+    """Geparste Matrix zu ``cache_key`` oder None (nicht vorhanden/unlesbar)."""
+    if not cache_key:
+        return None
+    path = _sidecar_path(source, cache_key, directory)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["format"]) != _SIDECAR_FORMAT or str(data["cache_key"]) != str(cache_key):
+                return None
+            columns = [str(name) for name in data["columns"]]
+            frame = pd.DataFrame(
+                {name: data[f"col_{i}"] for i, name in enumerate(columns)},
+                index=pd.Index(data["index"], name=str(data["index_name"]) or None),
+            )
+        return frame if not frame.empty else None
+    except Exception as e_load:
+        print(f"PRICE MATRIX SIDECAR: {path} nicht lesbar ({e_load}), Matrix wird neu geparst.")
+        return None
+
+
+def save_price_matrix_sidecar(
+    source: str, cache_key: Optional[str], df: Optional[pd.DataFrame], directory: Optional[str] = None
+) -> bool:
+    """Legt die geparste Matrix ab; ersetzt ältere Dateien derselben Quelle."""
+    if not cache_key or df is None or df.empty:
+        return False
+    path = _sidecar_path(source, cache_key, directory)
+    target_dir = os.path.dirname(path)
+    arrays = {
+        "format": np.asarray(_SIDECAR_FORMAT),
+        "cache_key": np.asarray(str(cache_key)),
+        "index": df.index.to_numpy(),
+        "index_name": np.asarray(df.index.name or ""),
+        "columns": np.asarray([str(c) for c in df.columns]),
+    }
+    for i, name in enumerate(df.columns):
+        column = df[name].to_numpy()
+        if column.dtype == object:
+            return False  # nur numerische Matrizen (ohne Pickle) ablegen
+        arrays[f"col_{i}"] = column
+    try:
+        os.makedirs(target_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=target_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                np.savez(handle, **arrays)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        for old_path in glob.glob(os.path.join(target_dir, f"{source.lower()}_*.npz")):
+            if old_path != path:
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+        return True
+    except Exception as e_save:
+        print(f"PRICE MATRIX SIDECAR: {path} konnte nicht geschrieben werden: {e_save}")
+        return False
@@ -8,17 +8,28 @@ import json
 from typing import Dict, List, Optional, Any, Union, Tuple
 import traceback
 import os
+import threading
+import time
 import sys # KORREKTUR: sys-Modul importieren
 
 # Datenbankverbindung und Verfügbarkeitsstatus
 DB_AVAILABLE = False
 get_db_connection_safe_pd = None
+ensure_schema_once = None
+
+_prune_unreferenced_blobs = None
+
+try:
+    from blob_store import get_blob_store
+except ImportError:
+    get_blob_store = None
 # ... (Rest des Moduls bis zum if __name__ == "__main__": Block bleibt unverändert) ...
 
 # --- (Beginn des unveränderten Codes bis zum if __name__ Block) ---
 try:
-    from database import get_db_connection, init_db 
+    from database import get_db_connection, init_db, ensure_schema_once, prune_unreferenced_blobs
     get_db_connection_safe_pd = get_db_connection
+    _prune_unreferenced_blobs = prune_unreferenced_blobs
     DB_AVAILABLE = True
 except ImportError as e:
     def _dummy_get_db_connection_ie(): 
@@ -60,7 +71,8 @@ def create_product_table(conn: sqlite3.Connection):
             created_at TEXT DEFAULT CURRENT_TIMESTAMP, 
             updated_at TEXT DEFAULT CURRENT_TIMESTAMP, 
             datasheet_link_db_path TEXT, 
-            additional_cost_netto REAL DEFAULT 0.0 
+            additional_cost_netto REAL DEFAULT 0.0,
+            image_blob_sha TEXT
         )
     """)
     conn.commit()
@@ -81,7 +93,8 @@ def _migrate_product_table_columns(conn: sqlite3.Connection):
         "pros": "TEXT", "cons": "TEXT", "rating": "REAL", "image_base64": "TEXT",
         "created_at": "TEXT", "updated_at": "TEXT", 
         "datasheet_link_db_path": "TEXT",
-        "additional_cost_netto": "REAL"
+        "additional_cost_netto": "REAL",
+        "image_blob_sha": "TEXT"
     }
 
     if 'added_date' in existing_columns and 'created_at' not in existing_columns:
@@ -129,14 +142,228 @@ def _migrate_product_table_columns(conn: sqlite3.Connection):
                 else: print(f"product_db.py: Fehler beim Hinzufügen von Spalte '{col_name}': {e}"); traceback.print_exc()
             except Exception as e_general_add: print(f"product_db.py: Allgemeiner Fehler beim Hinzufügen der Spalte '{col_name}': {e_general_add}"); traceback.print_exc()
     conn.commit()
+    _migrate_product_images_to_blob_store(conn)
+
+def _migrate_product_images_to_blob_store(conn: sqlite3.Connection):
+    # Inline gespeicherte Base64-Bilder in den Blob-Store verschieben; in der Zeile bleibt nur der Hash
+    if get_blob_store is None: return
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM products WHERE image_base64 IS NOT NULL AND image_base64 != ''")
+    product_ids = [row[0] for row in cursor.fetchall()]
+    moved = 0
+    for product_id in product_ids:  # zeilenweise, damit nie alle Bilder gleichzeitig im Speicher liegen
+        cursor.execute("SELECT image_base64 FROM products WHERE id = ?", (product_id,))
+        row = cursor.fetchone()
+        sha = get_blob_store().put_base64(row[0] if row else None)
+        if sha is None:
+            print(f"product_db.py: Bild von Produkt ID {product_id} ist kein gültiges Base64 und bleibt inline.")
+            continue
+        cursor.execute("UPDATE products SET image_blob_sha = ?, image_base64 = NULL WHERE id = ?", (sha, product_id))
+        moved += 1
+    if moved:
+        conn.commit()
+        print(f"product_db.py: {moved} Produktbild(er) in den Blob-Store verschoben.")
+
+def _externalize_product_image(product_data: Dict[str, Any]) -> None:
+    # Neues Bild (image_base64) im Blob-Store ablegen und nur den Hash speichern
+    if get_blob_store is None or 'image_base64' not in product_data: return
+    image_base64 = product_data.get('image_base64')
+    if not image_base64:
+        product_data['image_blob_sha'] = None
+        return
+    sha = get_blob_store().put_base64(image_base64)
+    if sha is not None:
+        product_data['image_blob_sha'] = sha
+        product_data['image_base64'] = None
+
+def _ensure_product_table(conn: sqlite3.Connection):
+    # DDL und Spaltenmigration nur einmal pro Prozess und DB-Datei statt bei jedem Lesezugriff
+    if ensure_schema_once is None:
+        create_product_table(conn)
+    else:
+        ensure_schema_once("products", create_product_table, conn)
+
+# --- In-Memory-Produktkatalog ---
+# Die UI fragt Produkte pro Rerun/Render sehr oft ab (Auswahllisten,
+# Datenblätter, Multi-Angebot). Der Katalog lädt die Tabelle einmal und
+# beantwortet Lookups über Dict-Indizes. add/update/delete erhöhen die
+# Generation; Änderungen außerhalb dieses Moduls werden über einen
+# Fingerprint (Anzahl, max. ID, max. updated_at) spätestens nach
+# PRODUCT_CATALOG_RECHECK_SECONDS erkannt.
+PRODUCT_CATALOG_RECHECK_SECONDS = 5.0
+_NOCASE_TABLE = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def _nocase(value: Any) -> str:
+    """Entspricht SQLite COLLATE NOCASE (nur ASCII wird gefaltet)."""
+    return str(value or "").translate(_NOCASE_TABLE)
+
+
+class ProductCatalog:
+    def __init__(self, recheck_seconds: float = PRODUCT_CATALOG_RECHECK_SECONDS):
+        self.recheck_seconds = recheck_seconds
+        self.generation = 0
+        self._lock = threading.RLock()
+        self._loaded_generation = -1
+        self._fingerprint: Optional[Tuple[Any, ...]] = None
+        self._checked_at = 0.0
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+        self._by_model_name: Dict[str, int] = {}
+        self._by_category: Dict[str, List[int]] = {}
+        self._by_company: Dict[Any, List[int]] = {}
+        self._sorted_ids: List[int] = []
+        self._categories: List[str] = []
+        self._inline_image_ids: set = set()
+
+    def invalidate(self) -> int:
+        """Markiert den Katalog als veraltet; nächster Zugriff lädt neu."""
+        with self._lock:
+            self.generation += 1
+            return self.generation
+
+    @staticmethod
+    def _read_fingerprint(cursor) -> Tuple[Any, ...]:
+        cursor.execute("SELECT COUNT(*), MAX(id), MAX(updated_at) FROM products")
+        return tuple(cursor.fetchone())
+
+    def _ensure_fresh(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded_generation == self.generation and now - self._checked_at < self.recheck_seconds:
+                return True
+            conn = get_db_connection_safe_pd()
+            if conn is None:
+                print("product_db.ProductCatalog: DB nicht verfügbar.")
+                return False
+            try:
+                _ensure_product_table(conn)
+                cursor = conn.cursor()
+                fingerprint = self._read_fingerprint(cursor)
+                if self._loaded_generation == self.generation and fingerprint == self._fingerprint:
+                    self._checked_at = now
+                    return True
+                # Projektion ohne Inline-Bilddaten; Bilder werden erst bei Einzelabruf geladen
+                cursor.execute("PRAGMA table_info(products)")
+                columns = [col_info[1] for col_info in cursor.fetchall() if col_info[1] != "image_base64"]
+                cursor.execute(
+                    f"SELECT {', '.join(columns)}, (image_base64 IS NOT NULL AND image_base64 != '') AS has_inline_image "
+                    "FROM products ORDER BY id"
+                )
+                rows = [dict(row) for row in cursor.fetchall()]
+            except sqlite3.Error as e:
+                print(f"product_db.ProductCatalog: SQLite Fehler beim Laden: {e}"); traceback.print_exc()
+                return False
+            finally:
+                conn.close()
+            self._build_indexes(rows)
+            if self._loaded_generation == self.generation:
+                self.generation += 1  # externe Änderung erkannt
+            self._loaded_generation = self.generation
+            self._fingerprint = fingerprint
+            self._checked_at = now
+            return True
+
+    def _build_indexes(self, rows: List[Dict[str, Any]]) -> None:
+        self._inline_image_ids = {row["id"] for row in rows if row.pop("has_inline_image", 0)}
+        # stabile Sortierung über die nach id geladenen Zeilen, wie ORDER BY model_name COLLATE NOCASE
+        rows_sorted = sorted(rows, key=lambda row: _nocase(row.get("model_name")))
+        by_model_name: Dict[str, int] = {}
+        for row in rows:  # bei Namensgleichheit (NOCASE) gewinnt die kleinste id
+            by_model_name.setdefault(_nocase(row.get("model_name")), row["id"])
+        by_category: Dict[str, List[int]] = {}
+        by_company: Dict[Any, List[int]] = {}
+        for row in rows_sorted:
+            by_category.setdefault(row.get("category"), []).append(row["id"])
+            by_company.setdefault(row.get("company_id"), []).append(row["id"])
+        self._by_id = {row["id"]: row for row in rows}
+        self._by_model_name = by_model_name
+        self._by_category = by_category
+        self._by_company = by_company
+        self._sorted_ids = [row["id"] for row in rows_sorted]
+        self._categories = sorted(
+            (category for category in by_category if category), key=_nocase
+        )
+
+    def _with_image(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Kopie eines Produkts inkl. ``image_base64`` (lazy aus Blob-Store bzw. DB)."""
+        product = dict(row)
+        sha = product.get("image_blob_sha")
+        image_base64 = None
+        if sha and get_blob_store is not None:
+            image_base64 = get_blob_store().get_base64(sha)
+        elif product["id"] in self._inline_image_ids:
+            image_base64 = _load_inline_product_image(product["id"])
+        product["image_base64"] = image_base64
+        return product
+
+    def get_by_id(self, product_id: Union[int, float]) -> Optional[Dict[str, Any]]:
+        if not self._ensure_fresh():
+            return None
+        row = self._by_id.get(int(product_id))
+        return self._with_image(row) if row else None
+
+    def get_by_model_name(self, model_name: str) -> Optional[Dict[str, Any]]:
+        if not self._ensure_fresh():
+            return None
+        product_id = self._by_model_name.get(_nocase(model_name.strip()))
+        return self._with_image(self._by_id[product_id]) if product_id is not None else None
+
+    def list(self, category: Optional[str] = None, company_id: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """Produkte sortiert nach Modellname, ohne Bilddaten (``image_base64`` fehlt);
+        None, falls der Katalog nicht geladen werden kann."""
+        if not self._ensure_fresh():
+            return None
+        with self._lock:
+            if category:
+                ids = self._by_category.get(category, [])
+                if company_id is not None:
+                    allowed = set(self._by_company.get(company_id, []))
+                    ids = [product_id for product_id in ids if product_id in allowed]
+            elif company_id is not None:
+                ids = self._by_company.get(company_id, [])
+            else:
+                ids = self._sorted_ids
+            return [dict(self._by_id[product_id]) for product_id in ids]
+
+    def names(self, category: Optional[str] = None) -> List[str]:
+        """Sortierte Modellnamen, z.B. für Auswahllisten."""
+        if not self._ensure_fresh():
+            return []
+        with self._lock:
+            ids = self._by_category.get(category, []) if category else self._sorted_ids
+            return [self._by_id[product_id].get("model_name") for product_id in ids]
+
+    def categories(self) -> Optional[List[str]]:
+        if not self._ensure_fresh():
+            return None
+        return list(self._categories)
+
+
+_PRODUCT_CATALOG = ProductCatalog()
+
+
+def _load_inline_product_image(product_id: int) -> Optional[str]:
+    # Nur für Altbestand, der nicht in den Blob-Store migriert werden konnte
+    conn = get_db_connection_safe_pd()
+    if conn is None: return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT image_base64 FROM products WHERE id = ?", (int(product_id),)); row = cursor.fetchone()
+        return row[0] if row else None
+    except sqlite3.Error as e: print(f"product_db._load_inline_product_image: SQLite Fehler für ID {product_id}: {e}"); return None
+    finally: conn.close()
+
+
+def get_product_catalog() -> ProductCatalog:
+    return _PRODUCT_CATALOG
 
 def add_product(product_data: Dict[str, Any]) -> Optional[int]:
     conn = get_db_connection_safe_pd()
     if conn is None: print("product_db.add_product: DB nicht verfügbar."); return None
-    create_product_table(conn)
+    _ensure_product_table(conn)
     cursor = conn.cursor()
     now_iso = datetime.now().isoformat()
-    all_db_columns = {"id", "category", "model_name", "brand", "price_euro", "capacity_w", "storage_power_kw", "power_kw", "max_cycles", "warranty_years", "length_m", "width_m", "weight_kg", "efficiency_percent", "origin_country", "description", "pros", "cons", "rating", "image_base64", "created_at", "updated_at", "datasheet_link_db_path", "additional_cost_netto"}
+    all_db_columns = {"id", "category", "model_name", "brand", "price_euro", "capacity_w", "storage_power_kw", "power_kw", "max_cycles", "warranty_years", "length_m", "width_m", "weight_kg", "efficiency_percent", "origin_country", "description", "pros", "cons", "rating", "image_base64", "created_at", "updated_at", "datasheet_link_db_path", "additional_cost_netto", "image_blob_sha"}
     insert_data: Dict[str, Any] = {}
     if not product_data.get('category'): print(f"product_db.add_product: FEHLER - 'category' ist Pflicht. Produkt: {product_data.get('model_name', 'N/A')}"); conn.close(); return None
     if not product_data.get('model_name'): print(f"product_db.add_product: FEHLER - 'model_name' ist Pflicht. Daten: {product_data}"); conn.close(); return None
@@ -148,12 +375,13 @@ def add_product(product_data: Dict[str, Any]) -> Optional[int]:
             elif col_name in ["price_euro", "capacity_w", "storage_power_kw", "power_kw", "length_m", "width_m", "weight_kg", "efficiency_percent", "rating", "additional_cost_netto"]: insert_data[col_name] = 0.0
             elif col_name in ["max_cycles", "warranty_years"]: insert_data[col_name] = 0
             else: insert_data[col_name] = None 
+    _externalize_product_image(insert_data)
     cursor.execute("SELECT id FROM products WHERE model_name = ?", (insert_data['model_name'],))
     if cursor.fetchone(): print(f"product_db.add_product: Fehler - Produkt mit Modellname '{insert_data['model_name']}' existiert bereits."); conn.close(); return None
     fields = ', '.join(insert_data.keys()); placeholders = ', '.join(['?'] * len(insert_data))
     try:
         cursor.execute(f"INSERT INTO products ({fields}) VALUES ({placeholders})", list(insert_data.values()))
-        conn.commit(); product_id = cursor.lastrowid
+        conn.commit(); product_id = cursor.lastrowid; _PRODUCT_CATALOG.invalidate()
         print(f"product_db.add_product: Produkt '{insert_data['model_name']}' erfolgreich mit ID {product_id} hinzugefügt."); return product_id
     except sqlite3.Error as e: print(f"product_db.add_product: SQLite Fehler bei INSERT von '{insert_data.get('model_name', 'N/A')}': {e}"); traceback.print_exc(); conn.rollback(); return None
     finally: conn.close()
@@ -161,7 +389,7 @@ def add_product(product_data: Dict[str, Any]) -> Optional[int]:
 def update_product(product_id: Union[int, float], product_data: Dict[str, Any]) -> bool:
     conn = get_db_connection_safe_pd(); 
     if conn is None: print("product_db.update_product: DB nicht verfügbar."); return False
-    create_product_table(conn); cursor = conn.cursor(); now_iso = datetime.now().isoformat()
+    _ensure_product_table(conn); cursor = conn.cursor(); now_iso = datetime.now().isoformat()
     if 'last_updated' in product_data: product_data['updated_at'] = product_data.pop('last_updated')
     product_data['updated_at'] = now_iso 
     cursor.execute("PRAGMA table_info(products)"); db_columns = [col_info[1] for col_info in cursor.fetchall()]
@@ -171,11 +399,15 @@ def update_product(product_id: Union[int, float], product_data: Dict[str, Any])
         cursor.execute("SELECT id FROM products WHERE model_name = ? AND id != ?", (product_data['model_name'], int(product_id)))
         if cursor.fetchone(): print(f"product_db.update_product: Fehler - Modellname '{product_data['model_name']}' existiert bereits für anderes Produkt."); conn.close(); return False
     update_data = {k: v for k, v in product_data.items() if k in db_columns and k != 'id'}
+    _externalize_product_image(update_data)
     if not update_data: print(f"product_db.update_product: Keine gültigen Felder zum Aktualisieren für ID {product_id}."); conn.close(); return False 
     fields_to_set = [f"{k}=?" for k in update_data.keys()]; values = list(update_data.values()); values.append(int(product_id))
     try:
-        cursor.execute(f"UPDATE products SET {', '.join(fields_to_set)} WHERE id=?", values); conn.commit()
-        if cursor.rowcount > 0: print(f"product_db.update_product: Produkt ID {product_id} erfolgreich aktualisiert."); return True
+        cursor.execute(f"UPDATE products SET {', '.join(fields_to_set)} WHERE id=?", values); conn.commit(); _PRODUCT_CATALOG.invalidate()
+        if cursor.rowcount > 0:
+            print(f"product_db.update_product: Produkt ID {product_id} erfolgreich aktualisiert.")
+            if 'image_blob_sha' in update_data and _prune_unreferenced_blobs is not None: _prune_unreferenced_blobs()  # altes Bild ggf. verwaist
+            return True
         else: print(f"product_db.update_product: Produkt ID {product_id} nicht gefunden."); return False
     except sqlite3.Error as e: print(f"product_db.update_product: SQLite Fehler für ID {product_id}: {e}"); traceback.print_exc(); conn.rollback(); return False
     finally: conn.close()
@@ -183,19 +415,23 @@ def update_product(product_id: Union[int, float], product_data: Dict[str, Any])
 def delete_product(product_id: Union[int, float]) -> bool:
     conn = get_db_connection_safe_pd(); 
     if conn is None: print("product_db.delete_product: DB nicht verfügbar."); return False
-    create_product_table(conn); cursor = conn.cursor()
+    _ensure_product_table(conn); cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM products WHERE id=?", (int(product_id),)); conn.commit(); deleted_count = cursor.rowcount
-        if deleted_count > 0: print(f"product_db.delete_product: Produkt ID {product_id} erfolgreich gelöscht.")
+        cursor.execute("DELETE FROM products WHERE id=?", (int(product_id),)); conn.commit(); deleted_count = cursor.rowcount; _PRODUCT_CATALOG.invalidate()
+        if deleted_count > 0:
+            print(f"product_db.delete_product: Produkt ID {product_id} erfolgreich gelöscht.")
+            if _prune_unreferenced_blobs is not None: _prune_unreferenced_blobs()  # Bild ggf. verwaist
         else: print(f"product_db.delete_product: Produkt ID {product_id} nicht gefunden, nichts gelöscht.")
         return deleted_count > 0
     except sqlite3.Error as e: print(f"product_db.delete_product: SQLite Fehler für ID {product_id}: {e}"); traceback.print_exc(); conn.rollback(); return False
     finally: conn.close()
 
 def list_products(category: Optional[str] = None, company_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    products = _PRODUCT_CATALOG.list(category=category, company_id=company_id)
+    if products is not None: return products
     conn = get_db_connection_safe_pd(); 
     if conn is None: print("product_db.list_products: DB nicht verfügbar."); return []
-    create_product_table(conn); cursor = conn.cursor()
+    _ensure_product_table(conn); cursor = conn.cursor()
     query = "SELECT * FROM products"; params: List[Any] = [] 
     conditions = []
 
@@ -218,33 +454,42 @@ def list_products(category: Optional[str] = None, company_id: Optional[int] = No
     finally: conn.close()
 
 def get_product_by_id(product_id: Union[int, float]) -> Optional[Dict[str, Any]]:
+    if _PRODUCT_CATALOG._ensure_fresh(): return _PRODUCT_CATALOG.get_by_id(product_id)
     conn = get_db_connection_safe_pd(); 
     if conn is None: print("product_db.get_product_by_id: DB nicht verfügbar."); return None
-    create_product_table(conn); cursor = conn.cursor()
+    _ensure_product_table(conn); cursor = conn.cursor()
     try:
         cursor.execute("SELECT * FROM products WHERE id=?", (int(product_id),)); row = cursor.fetchone()
-        return dict(row) if row else None
+        return _hydrate_product_image(dict(row)) if row else None
     except sqlite3.Error as e: print(f"product_db.get_product_by_id: SQLite Fehler für ID {product_id}: {e}"); traceback.print_exc(); return None
     finally: conn.close()
 
 def get_product_by_model_name(model_name: str) -> Optional[Dict[str, Any]]:
     if not model_name or not model_name.strip(): print("product_db.get_product_by_model_name: Modellname darf nicht leer sein."); return None
+    if _PRODUCT_CATALOG._ensure_fresh(): return _PRODUCT_CATALOG.get_by_model_name(model_name)
     conn = get_db_connection_safe_pd(); 
     if conn is None: print("product_db.get_product_by_model_name: DB nicht verfügbar."); return None
-    create_product_table(conn); cursor = conn.cursor()
+    _ensure_product_table(conn); cursor = conn.cursor()
     try:
         cursor.execute("SELECT * FROM products WHERE model_name=? COLLATE NOCASE", (model_name.strip(),)); row = cursor.fetchone()
-        return dict(row) if row else None
+        return _hydrate_product_image(dict(row)) if row else None
     except sqlite3.Error as e: print(f"product_db.get_product_by_model_name: SQLite Fehler für Modell '{model_name}': {e}"); traceback.print_exc(); return None
     finally: conn.close()
 
+def _hydrate_product_image(product: Dict[str, Any]) -> Dict[str, Any]:
+    if not product.get('image_base64') and product.get('image_blob_sha') and get_blob_store is not None:
+        product['image_base64'] = get_blob_store().get_base64(product['image_blob_sha'])
+    return product
+
 def update_product_image(product_id: Union[int, float], image_base64: Optional[str]) -> bool:
     return update_product(int(product_id), {"image_base64": image_base64})
 
 def list_product_categories() -> List[str]:
+    categories = _PRODUCT_CATALOG.categories()
+    if categories is not None: return categories
     conn = get_db_connection_safe_pd(); 
     if conn is None: print("product_db.list_product_categories: DB nicht verfügbar."); return []
-    create_product_table(conn); cursor = conn.cursor()
+    _ensure_product_table(conn); cursor = conn.cursor()
     try:
         cursor.execute("SELECT DISTINCT category FROM products WHERE category IS NOT NULL AND category != '' ORDER BY category COLLATE NOCASE"); rows = cursor.fetchall()
         return [row['category'] for row in rows] 
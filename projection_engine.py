@@ -0,0 +1,230 @@
+# projection_engine.py
+"""
+Vektorisierte Mehrjahres-Hochrechnung für perform_calculations.
+
+Die Simulation über die Laufzeit (Ertrag mit Degradation, Strompreis,
+Einspeisevergütung, Wartung, Cashflows), die Diskontierung für NPV/LCOE, die
+Kostenhochrechnung ohne PV und die Break-Even-Suche liefen bisher als
+Python-Schleifen über die Jahre. Hier wird jede Größe als NumPy-Vektor über
+die Jahre gebildet:
+
+- Wachstums-/Diskontfaktoren als geometrische Reihe ``basis ** k``
+- Jahreswerte als elementweise Produkte der Faktorvektoren
+- kumulierte Cashflows und Summen über ``np.cumsum``
+- Break-Even als erster Index, an dem die kumulierte Ersparnis die
+  Investition erreicht
+
+Alle Parameter außer der Laufzeit dürfen auch 1-D-Arrays sein (ein Wert je
+Szenario); die Ergebnisse haben dann die Form ``(szenarien, jahre)``. So
+lassen sich viele Varianten (Live-Vorschau, Parameter-Sweeps) in einem
+Aufruf rechnen statt Jahr für Jahr und Variante für Variante.
+
+Die Ergebnisse sind bitgleich zur bisherigen Schleife: Potenzen werden wie
+dort mit Python-``**`` gebildet (``np.power`` weicht bei gebrochenen Basen im
+letzten Bit ab) und je Basis gecacht, Summen laufen über ``np.cumsum`` in
+derselben Reihenfolge.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+ArrayLike = Union[float, Sequence[float], np.ndarray]
+
+
+@lru_cache(maxsize=1024)
+def power_series(base: float, start: int, count: int) -> np.ndarray:
+    """``base ** k`` für k = start … start + count - 1 (schreibgeschützt, gecacht)."""
+    count = max(int(count), 0)
+    series = np.fromiter((base ** k for k in range(start, start + count)), dtype=float, count=count)
+    series.flags.writeable = False
+    return series
+
+
+def power_matrix(bases: ArrayLike, start: int, count: int) -> np.ndarray:
+    """Wie ``power_series``, für ein Array von Basen eine Zeile je Basis."""
+    arr = np.asarray(bases, dtype=float)
+    if arr.ndim == 0:
+        return power_series(float(arr), start, count)
+    rows = {b: power_series(b, start, count) for b in set(arr.tolist())}
+    return np.array([rows[b] for b in arr.tolist()], dtype=float).reshape(len(arr), max(int(count), 0))
+
+
+def _column(value: ArrayLike) -> np.ndarray:
+    # Skalar -> (1,), Array (n,) -> (n, 1): broadcastet gegen die Jahresachse
+    return np.asarray(value, dtype=float)[..., np.newaxis]
+
+
+def sequential_sum(values: np.ndarray, start: Any = 0.0) -> Any:
+    """Summe entlang der Jahresachse in Schleifenreihenfolge (``start + v0 + v1 + …``)."""
+    values = np.asarray(values, dtype=float)
+    if values.ndim <= 1:
+        if len(values) == 0:
+            return start
+        return float(np.cumsum(np.concatenate(([start], values)))[-1])
+    starts = np.broadcast_to(_column(start), values.shape[:-1] + (1,))
+    return np.cumsum(np.concatenate((starts, values), axis=-1), axis=-1)[..., -1]
+
+
+@dataclass(frozen=True)
+class FinancialProjection:
+    """Jahresvektoren der Simulation (letzte Achse: Index 0 = Jahr 1)."""
+
+    productions_kwh: np.ndarray
+    elec_prices: np.ndarray
+    feed_in_tariffs: np.ndarray
+    feed_in_revenue: np.ndarray
+    maintenance_costs: np.ndarray
+    benefits: np.ndarray
+    cash_flows: np.ndarray
+    cash_flows_with_investment: np.ndarray  # Jahr 0 = -Investition
+    cumulative_cash_flows: np.ndarray  # inkl. Jahr 0
+
+    @property
+    def years(self) -> int:
+        return self.cash_flows.shape[-1]
+
+
+def project_financials(
+    years: int,
+    investment: ArrayLike,
+    annual_production_kwh: ArrayLike,
+    degradation_factor: ArrayLike,
+    self_consumption_kwh: ArrayLike,
+    feed_in_kwh: ArrayLike,
+    electricity_price_kwh: ArrayLike,
+    electricity_price_increase_percent: ArrayLike,
+    feed_in_tariff_eur_per_kwh: ArrayLike,
+    feed_in_tariff_period_years: ArrayLike,
+    market_price_after_eeg_eur_per_kwh: ArrayLike,
+    maintenance_year1: ArrayLike,
+    maintenance_increase_rate: ArrayLike,
+    feed_in_tax_rate: Optional[ArrayLike] = None,
+) -> FinancialProjection:
+    """Cashflow-Simulation über ``years`` Jahre.
+
+    ``maintenance_increase_rate`` als Anteil (0.02), Strompreissteigerung in
+    Prozent. ``feed_in_tax_rate`` (Anteil) nur bei gewerblichen Kunden, sonst
+    ``None``.
+    """
+    years = max(int(years), 0)
+    production_y1 = np.asarray(annual_production_kwh, dtype=float)
+    production = _column(production_y1) * power_matrix(degradation_factor, 0, years)
+
+    # Anteile von EV und Einspeisung bleiben über die Jahre konstant zur Produktion
+    has_production = production_y1 > 0
+    safe_production = np.where(has_production, production_y1, 1.0)
+    ev_share = np.where(has_production, np.asarray(self_consumption_kwh, dtype=float) / safe_production, 0.0)
+    feed_in_share = np.where(has_production, np.asarray(feed_in_kwh, dtype=float) / safe_production, 0.0)
+
+    price_increase_base = 1 + np.asarray(electricity_price_increase_percent, dtype=float) / 100.0
+    elec_prices = _column(electricity_price_kwh) * power_matrix(price_increase_base, 0, years)
+    # Fester Tarif im EEG-Zeitraum, danach Marktwert
+    feed_in_tariffs = np.where(
+        np.arange(1, years + 1) > _column(feed_in_tariff_period_years),
+        _column(market_price_after_eeg_eur_per_kwh),
+        _column(feed_in_tariff_eur_per_kwh),
+    )
+
+    cost_savings = (production * _column(ev_share)) * elec_prices
+    feed_in_revenue = (production * _column(feed_in_share)) * feed_in_tariffs
+    maintenance = _column(maintenance_year1) * power_matrix(
+        1 + np.asarray(maintenance_increase_rate, dtype=float), 0, years
+    )
+
+    shape = np.broadcast_shapes(
+        production.shape, elec_prices.shape, feed_in_tariffs.shape, maintenance.shape
+    )
+    benefits = cost_savings + feed_in_revenue
+    if feed_in_tax_rate is not None:
+        benefits = benefits + feed_in_revenue * _column(feed_in_tax_rate)
+    else:
+        benefits = benefits + 0.0
+    benefits = np.broadcast_to(benefits, shape).copy()
+    feed_in_revenue = np.broadcast_to(feed_in_revenue, shape).copy()
+    cash_flows = benefits - maintenance
+    year0 = np.broadcast_to(-_column(investment), shape[:-1] + (1,))
+    with_investment = np.concatenate((year0, cash_flows), axis=-1)
+    return FinancialProjection(
+        productions_kwh=np.broadcast_to(production, shape).copy(),
+        elec_prices=np.broadcast_to(elec_prices, shape).copy(),
+        feed_in_tariffs=np.broadcast_to(feed_in_tariffs, shape).copy(),
+        feed_in_revenue=feed_in_revenue,
+        maintenance_costs=np.broadcast_to(maintenance, shape).copy(),
+        benefits=benefits,
+        cash_flows=cash_flows,
+        cash_flows_with_investment=with_investment,
+        cumulative_cash_flows=np.cumsum(with_investment, axis=-1),
+    )
+
+
+def discount_factors(rate: ArrayLike, years: int) -> np.ndarray:
+    """``(1 + rate) ** t`` für t = 1 … years."""
+    return power_matrix(1 + np.asarray(rate, dtype=float), 1, years)
+
+
+def net_present_value(cash_flows_with_investment: np.ndarray, rate: ArrayLike) -> Any:
+    """Kapitalwert wie in perform_calculations (Startwert ``-cf[0]``, ab Jahr 1 diskontiert)."""
+    cash_flows = np.asarray(cash_flows_with_investment, dtype=float)
+    terms = cash_flows[..., 1:] / discount_factors(rate, cash_flows.shape[-1] - 1)
+    start = -cash_flows[..., 0]
+    return sequential_sum(terms, start=float(start) if start.ndim == 0 else start)
+
+
+def levelized_cost(
+    investment: ArrayLike,
+    productions_kwh: np.ndarray,
+    maintenance_costs: np.ndarray,
+    rate: ArrayLike,
+    years: int,
+) -> Any:
+    """Stromgestehungskosten: (Investition + diskontierte Wartung) / diskontierte Produktion."""
+    productions_kwh = np.asarray(productions_kwh, dtype=float)
+    maintenance_costs = np.asarray(maintenance_costs, dtype=float)
+    n = min(productions_kwh.shape[-1], maintenance_costs.shape[-1], max(int(years), 0))
+    discount = discount_factors(rate, n)
+    production = sequential_sum(productions_kwh[..., :n] / discount)
+    costs = sequential_sum(maintenance_costs[..., :n] / discount, start=investment)
+    if np.ndim(production) == 0:
+        return costs / production if production > 0 else float("inf")
+    return np.where(production > 0, costs / np.where(production > 0, production, 1.0), np.inf)
+
+
+def project_costs_without_pv(
+    annual_consumption_kwh: float,
+    price_kwh: float,
+    price_increase_percent: float,
+    years: int,
+) -> Tuple[np.ndarray, float, float]:
+    """Stromkosten ohne PV je Jahr sowie Summen mit und ohne Preissteigerung."""
+    years = max(int(years), 0)
+    base_cost = annual_consumption_kwh * price_kwh
+    costs = base_cost * power_series(1 + price_increase_percent / 100.0, 0, years)
+    total_without_increase = sequential_sum(np.full(years, base_cost, dtype=float))
+    return costs, sequential_sum(costs), total_without_increase
+
+
+def break_even_search(
+    investment: float,
+    annual_savings: Sequence[float],
+    price_increase_percent: Sequence[float],
+    inflation_percent: float,
+    years: int = 30,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Break-Even für mehrere Szenarien auf einmal (eine Zeile je Szenario).
+
+    Liefert reale Jahresersparnis und kumulierte Ersparnis (Spalten = Jahr
+    1 … years) sowie je Szenario den Index des ersten Jahres, in dem die
+    kumulierte Ersparnis die Investition erreicht (-1: nicht erreicht).
+    """
+    inflation = power_series(1 + inflation_percent / 100, 1, years)
+    price_factors = power_matrix(1 + np.asarray(price_increase_percent, dtype=float) / 100, 1, years)
+    yearly = (_column(annual_savings) * price_factors) / inflation
+    cumulative = np.cumsum(yearly, axis=1)
+    reached = cumulative >= investment
+    first = np.where(reached.any(axis=1), reached.argmax(axis=1), -1)
+    return yearly, cumulative, first
@@ -12,6 +12,8 @@ import plotly.graph_objects as go
 from typing import Dict, Any, Optional
 import math # <--- KORREKTUR: Fehlender Import hinzugefügt
 
+from chart_export_engine import DeferredChart, defer_chart_export
+
 # Hilfsfunktion für Texte innerhalb dieses Moduls
 def get_text_pv_viz(texts: Dict[str, str], key: str, fallback_text: Optional[str] = None) -> str:
     """
@@ -31,19 +33,22 @@ def get_text_pv_viz(texts: Dict[str, str], key: str, fallback_text: Optional[str
     return texts.get(key, fallback_text)
 
 # Hilfsfunktion für den Export von Plotly-Figuren
-def _export_plotly_fig_to_bytes_pv_viz(fig: Optional[go.Figure], texts: Dict[str, str]) -> Optional[bytes]:
+def _defer_plotly_fig_export_pv_viz(fig: Optional[go.Figure], texts: Dict[str, str]) -> Optional[DeferredChart]:
     """
-    Exportiert eine Plotly-Figur als PNG-Bild-Bytes.
+    Merkt eine Plotly-Figur für den PNG-Export beim PDF-Erstellen vor.
+
+    Gerastert wird erst gebündelt in ``materialize_deferred_charts``; Fehler
+    dort führen zu einem fehlenden Bild im PDF.
 
     Args:
         fig (Optional[go.Figure]): Die zu exportierende Plotly-Figur.
-        texts (Dict[str,str]): Das Text-Dictionary für Fehlermeldungen.
+        texts (Dict[str,str]): Das Text-Dictionary (für einheitliche Signatur).
 
     Returns:
-        Optional[bytes]: Die Bild-Bytes im PNG-Format oder None bei einem Fehler.
+        Optional[DeferredChart]: Platzhalter für die Bild-Bytes oder None ohne Figur.
     """
-    if fig is None:
-        return None
+    # Erhöhe die Skalierung und definiere eine Standardgröße für bessere Qualität im PDF
+    return defer_chart_export(fig, width=900, height=550, scale=2)
     try:
         # Erhöhe die Skalierung und definiere eine Standardgröße für bessere Qualität im PDF
         img_bytes = fig.to_image(format="png", scale=2, width=900, height=550)
@@ -85,7 +90,7 @@ def render_yearly_production_pv_data(analysis_results: Dict[str, Any], texts: Di
         fig_fallback_yearly = go.Figure()
         fig_fallback_yearly.update_layout(title=get_text_pv_viz(texts, "viz_data_unavailable_title", "Daten nicht verfügbar"))
         st.plotly_chart(fig_fallback_yearly, use_container_width=True, key="pv_visuals_yearly_prod_fallback")
-        analysis_results['yearly_production_chart_bytes'] = _export_plotly_fig_to_bytes_pv_viz(fig_fallback_yearly, texts)
+        analysis_results['yearly_production_chart_bytes'] = _defer_plotly_fig_export_pv_viz(fig_fallback_yearly, texts)
         return
 
     fig_yearly_prod = go.Figure()
@@ -114,7 +119,7 @@ def render_yearly_production_pv_data(analysis_results: Dict[str, Any], texts: Di
         margin=dict(l=10, r=10, t=50, b=10), showlegend=True
     )
     st.plotly_chart(fig_yearly_prod, use_container_width=True, key="pv_visuals_yearly_prod")
-    analysis_results['yearly_production_chart_bytes'] = _export_plotly_fig_to_bytes_pv_viz(fig_yearly_prod, texts)
+    analysis_results['yearly_production_chart_bytes'] = _defer_plotly_fig_export_pv_viz(fig_yearly_prod, texts)
 
 
 def render_break_even_pv_data(analysis_results: Dict[str, Any], texts: Dict[str, str]):
@@ -140,7 +145,7 @@ def render_break_even_pv_data(analysis_results: Dict[str, Any], texts: Dict[str,
         fig_fallback_break_even = go.Figure()
         fig_fallback_break_even.update_layout(title=get_text_pv_viz(texts, "viz_data_unavailable_title", "Daten nicht verfügbar"))
         st.plotly_chart(fig_fallback_break_even, use_container_width=True, key="pv_visuals_break_even_fallback")
-        analysis_results['break_even_chart_bytes'] = _export_plotly_fig_to_bytes_pv_viz(fig_fallback_break_even, texts)
+        analysis_results['break_even_chart_bytes'] = _defer_plotly_fig_export_pv_viz(fig_fallback_break_even, texts)
         return
 
     cashflow_data = [float(cf) if isinstance(cf, (int,float)) and not (math.isnan(cf) or math.isinf(cf)) else 0.0 for cf in cashflow_data_raw]
@@ -166,7 +171,7 @@ def render_break_even_pv_data(analysis_results: Dict[str, Any], texts: Dict[str,
         margin=dict(l=0, r=0, b=0, t=50)
     )
     st.plotly_chart(fig_break_even, use_container_width=True, key="pv_visuals_break_even")
-    analysis_results['break_even_chart_bytes'] = _export_plotly_fig_to_bytes_pv_viz(fig_break_even, texts)
+    analysis_results['break_even_chart_bytes'] = _defer_plotly_fig_export_pv_viz(fig_break_even, texts)
 
 def render_amortisation_pv_data(analysis_results: Dict[str, Any], texts: Dict[str, str]):
     """
@@ -196,7 +201,7 @@ def render_amortisation_pv_data(analysis_results: Dict[str, Any], texts: Dict[st
         fig_fallback_amort = go.Figure()
         fig_fallback_amort.update_layout(title=get_text_pv_viz(texts, "viz_data_unavailable_title", "Daten nicht verfügbar"))
         st.plotly_chart(fig_fallback_amort, use_container_width=True, key="pv_visuals_amortisation_fallback")
-        analysis_results['amortisation_chart_bytes'] = _export_plotly_fig_to_bytes_pv_viz(fig_fallback_amort, texts)
+        analysis_results['amortisation_chart_bytes'] = _defer_plotly_fig_export_pv_viz(fig_fallback_amort, texts)
         return
 
     annual_benefits = [float(b) if isinstance(b, (int, float)) and not (math.isnan(b) or math.isinf(b)) else 0.0 for b in annual_benefits_raw]
@@ -230,7 +235,7 @@ def render_amortisation_pv_data(analysis_results: Dict[str, Any], texts: Dict[st
         margin=dict(l=0, r=0, b=0, t=50)
     )
     st.plotly_chart(fig_amort, use_container_width=True, key="pv_visuals_amortisation")
-    analysis_results['amortisation_chart_bytes'] = _export_plotly_fig_to_bytes_pv_viz(fig_amort, texts)
+    analysis_results['amortisation_chart_bytes'] = _defer_plotly_fig_export_pv_viz(fig_amort, texts)
 
 def render_co2_savings_visualization(analysis_results: Dict[str, Any], texts: Dict[str, str]) -> None:
     """
@@ -381,7 +386,7 @@ def render_co2_savings_visualization(analysis_results: Dict[str, Any], texts: Di
     st.plotly_chart(fig_co2, use_container_width=True, key="co2_savings_3d_viz")
     
     # Export für PDF
-    analysis_results['co2_savings_chart_bytes'] = _export_plotly_fig_to_bytes_pv_viz(fig_co2, texts)
+    analysis_results['co2_savings_chart_bytes'] = _defer_plotly_fig_export_pv_viz(fig_co2, texts)
     
     # Zusätzliche Info-Boxen
     col1, col2, col3 = st.columns(3)
@@ -0,0 +1,347 @@
+# pvgis_cache.py
+"""
+Persistenter Cache für PVGIS-Antworten (SQLite).
+
+PVGIS liefert für identische Standort-/Ausrichtungsparameter immer dieselben
+Ertragsdaten. Statt bei jedem perform_calculations-Lauf einen blockierenden
+HTTP-Request abzusetzen, werden die bereits ausgewerteten Ergebnisse hier
+zwischengespeichert:
+
+- Schlüssel: SHA-256 über die normalisierten Request-Parameter
+  (Koordinaten gerundet, Winkel als int, Verluste/Leistung gerundet).
+- TTL: Einträge älter als ``ttl_seconds`` gelten als veraltet.
+- Größenbegrenzung: Überschreitet der Cache ``max_entries``, werden die am
+  längsten nicht genutzten Einträge entfernt (LRU über ``last_access``).
+- Offline-Modus: ``get(..., allow_stale=True)`` liefert auch abgelaufene
+  Einträge, damit ohne Netz ("cache-only") weiter gerechnet werden kann.
+- Hit/Miss-Zähler für die Anzeige in den Optionen.
+- Speicher-Stufe: zuletzt genutzte Einträge liegen zusätzlich im Prozess,
+  damit z. B. Modulanzahl-Sweeps ganz ohne Datenbankzugriff auskommen.
+
+Entstanden aus dem Entwurf unter ``notwendig oder nicht/keine ahnung/enhancements``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+PVGIS_CACHE_DB_PATH = os.path.join(DATA_DIR, "pvgis_cache.db")
+
+# PVGIS-TMY-Daten ändern sich praktisch nie - 30 Tage sind unkritisch
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 2000
+# Anzahl Einträge, die zusätzlich im Prozessspeicher gehalten werden
+DEFAULT_MEMORY_ENTRIES = 256
+
+# Nur diese Parameter beeinflussen das Ergebnis; alles andere (outputformat, browser) nicht
+_RELEVANT_PARAM_KEYS = (
+    "lat",
+    "lon",
+    "peakpower",
+    "loss",
+    "pvtechchoice",
+    "mountingplace",
+    "angle",
+    "aspect",
+)
+
+
+def normalize_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Bringt Request-Parameter in eine stabile, vergleichbare Form.
+
+    Koordinaten werden auf 4 Nachkommastellen (~10 m) gerundet, damit
+    Geocoding-Rauschen nicht zu Cache-Misses führt.
+    """
+    normalized: Dict[str, Any] = {}
+    for key in _RELEVANT_PARAM_KEYS:
+        if key not in params or params[key] is None:
+            continue
+        value = params[key]
+        try:
+            if key in ("lat", "lon"):
+                value = round(float(value), 4)
+            elif key in ("angle", "aspect"):
+                value = int(round(float(value)))
+            elif key == "loss":
+                value = round(float(value), 2)
+            elif key == "peakpower":
+                value = round(float(value), 4)
+            else:
+                value = str(value).strip().lower()
+        except (TypeError, ValueError):
+            value = str(value)
+        normalized[key] = value
+    return normalized
+
+
+def make_cache_key(params: Dict[str, Any]) -> str:
+    """SHA-256 über die normalisierten Parameter."""
+    serialized = json.dumps(normalize_params(params), sort_keys=True).encode("utf-8")
+    return hashlib.sha256(serialized).hexdigest()
+
+
+class PVGISCache:
+    """SQLite-basierter PVGIS-Cache mit TTL, LRU-Begrenzung und Statistik."""
+
+    def __init__(
+        self,
+        db_path: str = PVGIS_CACHE_DB_PATH,
+        ttl_seconds: int = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+    ):
+        self.db_path = db_path
+        self.ttl_seconds = int(ttl_seconds)
+        self.max_entries = int(max_entries)
+        self.memory_entries = int(memory_entries)
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "misses": 0,
+            "stale_hits": 0,
+            "writes": 0,
+            "evictions": 0,
+        }
+        self._initialized = False
+
+    # --- interne Helfer ---
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        if not self._initialized:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS pvgis_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    params TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hit_count INTEGER DEFAULT 0
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_pvgis_cache_last_access ON pvgis_cache (last_access)"
+            )
+            conn.commit()
+            self._initialized = True
+        return conn
+
+    def _remember(self, key: str, created_at: float, payload: Dict[str, Any]) -> None:
+        if self.memory_entries <= 0:
+            return
+        self._memory[key] = (created_at, payload)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_if_needed(self, conn: sqlite3.Connection) -> None:
+        if self.max_entries <= 0:
+            return
+        row = conn.execute("SELECT COUNT(*) FROM pvgis_cache").fetchone()
+        overflow = (row[0] if row else 0) - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM pvgis_cache WHERE cache_key IN ("
+                "SELECT cache_key FROM pvgis_cache ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+            self._stats["evictions"] += overflow
+
+    # --- öffentliche API ---
+    def get(self, params: Dict[str, Any], allow_stale: bool = False) -> Optional[Dict[str, Any]]:
+        """Liefert den gecachten Eintrag oder None.
+
+        Mit ``allow_stale=True`` werden auch abgelaufene Einträge geliefert
+        (Offline-/Cache-only-Modus).
+        """
+        key = make_cache_key(params)
+        now = time.time()
+        with self._lock:
+            memo = self._memory.get(key)
+            if memo is not None:
+                created_at, payload = memo
+                is_expired = self.ttl_seconds > 0 and (now - created_at) > self.ttl_seconds
+                if not is_expired:
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    return dict(payload)
+            try:
+                conn = self._connect()
+            except sqlite3.Error as e:
+                print(f"PVGIS-Cache: DB nicht verfügbar ({e})")
+                self._stats["misses"] += 1
+                return None
+            try:
+                row = conn.execute(
+                    "SELECT payload, created_at FROM pvgis_cache WHERE cache_key = ?",
+                    (key,),
+                ).fetchone()
+                if row is None:
+                    self._stats["misses"] += 1
+                    return None
+                payload_text, created_at = row
+                is_expired = self.ttl_seconds > 0 and (now - float(created_at)) > self.ttl_seconds
+                if is_expired and not allow_stale:
+                    self._stats["misses"] += 1
+                    return None
+                try:
+                    payload = json.loads(payload_text)
+                except json.JSONDecodeError:
+                    conn.execute("DELETE FROM pvgis_cache WHERE cache_key = ?", (key,))
+                    conn.commit()
+                    self._stats["misses"] += 1
+                    return None
+                conn.execute(
+                    "UPDATE pvgis_cache SET last_access = ?, hit_count = hit_count + 1 WHERE cache_key = ?",
+                    (now, key),
+                )
+                conn.commit()
+                self._stats["hits"] += 1
+                if is_expired:
+                    self._stats["stale_hits"] += 1
+                else:
+                    self._remember(key, float(created_at), payload)
+                return dict(payload)
+            except sqlite3.Error as e:
+                print(f"PVGIS-Cache: Lesefehler ({e})")
+                self._stats["misses"] += 1
+                return None
+            finally:
+                conn.close()
+
+    def set(self, params: Dict[str, Any], data: Dict[str, Any]) -> None:
+        """Schreibt ein Ergebnis in den Cache (Fehler werden ignoriert)."""
+        key = make_cache_key(params)
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connect()
+            except sqlite3.Error as e:
+                print(f"PVGIS-Cache: DB nicht verfügbar ({e})")
+                return
+            try:
+                conn.execute(
+                    """
+                    INSERT INTO pvgis_cache (cache_key, params, payload, created_at, last_access, hit_count)
+                    VALUES (?, ?, ?, ?, ?, 0)
+                    ON CONFLICT(cache_key) DO UPDATE SET
+                        payload = excluded.payload,
+                        created_at = excluded.created_at,
+                        last_access = excluded.last_access
+                    """,
+                    (
+                        key,
+                        json.dumps(normalize_params(params), sort_keys=True),
+                        json.dumps(data),
+                        now,
+                        now,
+                    ),
+                )
+                self._evict_if_needed(conn)
+                conn.commit()
+                self._stats["writes"] += 1
+                self._remember(key, now, dict(data))
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                # Caching ist eine reine Performance-Maßnahme
+                print(f"PVGIS-Cache: Schreibfehler ({e})")
+            finally:
+                conn.close()
+
+    def purge_expired(self) -> int:
+        """Entfernt abgelaufene Einträge, gibt die Anzahl zurück."""
+        if self.ttl_seconds <= 0:
+            return 0
+        with self._lock:
+            try:
+                conn = self._connect()
+            except sqlite3.Error:
+                return 0
+            try:
+                cur = conn.execute(
+                    "DELETE FROM pvgis_cache WHERE created_at < ?",
+                    (time.time() - self.ttl_seconds,),
+                )
+                conn.commit()
+                return cur.rowcount or 0
+            except sqlite3.Error:
+                return 0
+            finally:
+                conn.close()
+
+    def clear(self) -> None:
+        """Leert den Cache vollständig und setzt die Zähler zurück."""
+        with self._lock:
+            try:
+                conn = self._connect()
+            except sqlite3.Error:
+                return
+            try:
+                conn.execute("DELETE FROM pvgis_cache")
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"PVGIS-Cache: Fehler beim Leeren ({e})")
+            finally:
+                conn.close()
+            self._memory.clear()
+            for k in self._stats:
+                self._stats[k] = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/Miss-Zähler dieses Prozesses plus Größe des Caches."""
+        with self._lock:
+            result: Dict[str, Any] = dict(self._stats)
+            lookups = result["hits"] + result["misses"]
+            result["hit_rate"] = (result["hits"] / lookups) if lookups else 0.0
+            result["entries"] = 0
+            try:
+                conn = self._connect()
+                try:
+                    row = conn.execute("SELECT COUNT(*) FROM pvgis_cache").fetchone()
+                    result["entries"] = row[0] if row else 0
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                pass
+            result["ttl_seconds"] = self.ttl_seconds
+            result["max_entries"] = self.max_entries
+            return result
+
+
+_DEFAULT_CACHE: Optional[PVGISCache] = None
+_DEFAULT_CACHE_LOCK = threading.Lock()
+
+
+def get_pvgis_cache() -> PVGISCache:
+    """Prozessweite Standard-Instanz (lazy)."""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        with _DEFAULT_CACHE_LOCK:
+            if _DEFAULT_CACHE is None:
+                _DEFAULT_CACHE = PVGISCache()
+    return _DEFAULT_CACHE
+
+
+def is_cache_only_mode(setting_value: Any = None) -> bool:
+    """Offline-Modus: Umgebungsvariable PVGIS_CACHE_ONLY oder Admin-Setting."""
+    env_value = os.environ.get("PVGIS_CACHE_ONLY")
+    if env_value is not None and env_value.strip():
+        return env_value.strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(setting_value, str):
+        return setting_value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(setting_value)
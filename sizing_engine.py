@@ -0,0 +1,434 @@
+# sizing_engine.py
+"""
+Optimale Anlagengröße: Modulanzahl × Speicher.
+
+Sucht für ein Projekt die Kombination aus Modulanzahl (Stufen der
+Preis-Matrix) und Speicher (Produktkatalog, inkl. "ohne Speicher"), die
+Kapitalwert, IRR oder Autarkie maximiert. Jeder Kandidat wird mit
+perform_calculations bewertet; statt alle Kombinationen durchzurechnen:
+
+1. Grob: jede ``step``-te Modulstufe für alle Speicher.
+2. Beschränken (Branch-and-Bound):
+   - Budget: Die Investition steigt mit der Modulanzahl. Überschreitet ein
+     Kandidat das Budget, werden alle größeren Modulstufen mit diesem
+     Speicher verworfen; die größte bezahlbare Stufe wird per Bisektion
+     gesucht und bewertet.
+   - Speicher: Nur die ``refine_storage_options`` besten Speicher aus der
+     Grobsuche werden verfeinert.
+3. Fein: Musterschritt-Suche um das beste Grob-Ergebnis je Speicher mit
+   halbierter Schrittweite bis zur Nachbarstufe.
+
+Dachfläche (``calculate_roof_usage``) und ``max_modules`` begrenzen die
+Modulachse vorab. ``SizingResult`` meldet, wie viele Berechnungen gegenüber
+dem vollständigen Raster gespart wurden.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from calculations import (
+    build_batch_context,
+    perform_calculations,
+    run_with_batch_context,
+)
+
+try:
+    from calculations_extended import calculate_roof_usage
+except ImportError:
+    calculate_roof_usage = None  # type: ignore
+
+OBJECTIVES = {
+    "npv": "npv_value",
+    "irr": "irr_percent",
+    "autarky": "self_supply_rate_percent",
+}
+
+STORAGE_CATEGORIES = ("Batteriespeicher", "Speicher")
+
+SIZING_METRICS = (
+    "npv_value",
+    "irr_percent",
+    "self_supply_rate_percent",
+    "amortization_time_years",
+    "total_investment_netto",
+    "total_investment_brutto",
+    "anlage_kwp",
+)
+
+DEFAULT_MAX_MODULES = 60
+DEFAULT_COARSE_POINTS = 6
+DEFAULT_REFINE_STORAGE_OPTIONS = 2
+
+
+@dataclass(frozen=True)
+class StorageOption:
+    storage_id: Optional[int]
+    model_name: str
+    capacity_kwh: float
+
+    @property
+    def label(self) -> str:
+        if self.storage_id is None:
+            return "Ohne Speicher"
+        return f"{self.model_name} ({self.capacity_kwh:g} kWh)"
+
+
+NO_STORAGE = StorageOption(None, "Ohne Speicher", 0.0)
+
+
+@dataclass
+class SizingCandidate:
+    module_quantity: int
+    storage: StorageOption
+    metrics: Dict[str, float]
+    objective_value: float
+    feasible: bool
+    reason: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "module_quantity": self.module_quantity,
+            "storage": self.storage.label,
+            "storage_id": self.storage.storage_id,
+            "objective_value": self.objective_value,
+            "feasible": self.feasible,
+            "reason": self.reason,
+            **self.metrics,
+        }
+
+
+@dataclass
+class SizingResult:
+    objective: str
+    best: Optional[SizingCandidate]
+    evaluated: List[SizingCandidate]
+    module_counts: Tuple[int, ...]
+    storage_options: Tuple[StorageOption, ...]
+    pruned_by_budget: int = 0
+    pruned_storage_options: int = 0
+    elapsed_s: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def search_space_size(self) -> int:
+        return len(self.module_counts) * len(self.storage_options)
+
+    @property
+    def evaluations(self) -> int:
+        return len(self.evaluated)
+
+    @property
+    def evaluations_saved(self) -> int:
+        return self.search_space_size - self.evaluations
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "objective": self.objective,
+            "best": self.best.as_dict() if self.best else None,
+            "search_space_size": self.search_space_size,
+            "evaluations": self.evaluations,
+            "evaluations_saved": self.evaluations_saved,
+            "pruned_by_budget": self.pruned_by_budget,
+            "pruned_storage_options": self.pruned_storage_options,
+            "elapsed_s": round(self.elapsed_s, 3),
+        }
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame([c.as_dict() for c in self.evaluated])
+
+
+def candidate_module_counts(
+    price_matrix_df: Optional[pd.DataFrame],
+    min_modules: int = 1,
+    max_modules: Optional[int] = None,
+) -> List[int]:
+    """Modulstufen der Preis-Matrix (ohne Matrix: jede Anzahl) im erlaubten Bereich."""
+    upper = max_modules if max_modules is not None else DEFAULT_MAX_MODULES
+    if price_matrix_df is not None and not price_matrix_df.empty:
+        counts = set()
+        for value in price_matrix_df.index:
+            try:
+                counts.add(int(value))
+            except (TypeError, ValueError):
+                continue
+        if max_modules is None:
+            upper = max(counts, default=upper)
+        return sorted(n for n in counts if max(1, min_modules) <= n <= upper)
+    return list(range(max(1, min_modules), upper + 1))
+
+
+def storage_options_from_catalog(
+    products_by_id: Dict[int, Dict[str, Any]],
+    storage_ids: Optional[Sequence[int]] = None,
+    include_no_storage: bool = True,
+) -> List[StorageOption]:
+    """Speicher aus dem Produktkatalog, nach Kapazität sortiert."""
+    options = [NO_STORAGE] if include_no_storage else []
+    wanted = set(int(i) for i in storage_ids) if storage_ids is not None else None
+    catalog = []
+    for product_id, product in products_by_id.items():
+        if product.get("category") not in STORAGE_CATEGORIES:
+            continue
+        if wanted is not None and int(product_id) not in wanted:
+            continue
+        capacity = float(product.get("storage_power_kw") or 0.0)
+        if capacity <= 0:
+            continue
+        catalog.append(StorageOption(int(product_id), str(product.get("model_name") or product_id), capacity))
+    options.extend(sorted(catalog, key=lambda o: (o.capacity_kwh, o.model_name)))
+    return options
+
+
+def max_modules_for_roof(
+    project_details: Dict[str, Any],
+    products_by_id: Dict[int, Dict[str, Any]],
+    roof_area_m2: Optional[float] = None,
+) -> Optional[int]:
+    """Modulanzahl, die auf die freie Dachfläche passt (None: unbekannt)."""
+    if calculate_roof_usage is None:
+        return None
+    area = roof_area_m2 if roof_area_m2 is not None else project_details.get("free_roof_area_sqm")
+    try:
+        module = products_by_id.get(int(project_details.get("selected_module_id")))
+    except (TypeError, ValueError):
+        module = None
+    try:
+        area = float(area or 0.0)
+        length = float((module or {}).get("length_m") or 0.0)
+        width = float((module or {}).get("width_m") or 0.0)
+    except (TypeError, ValueError):
+        return None
+    if area <= 0 or length <= 0 or width <= 0:
+        return None
+    return calculate_roof_usage(area, length, width)
+
+
+def _apply_candidate(project_data: Dict[str, Any], module_quantity: int, storage: Dict[str, Any]) -> Dict[str, Any]:
+    project_details = dict(project_data.get("project_details", {}))
+    project_details["module_quantity"] = int(module_quantity)
+    if storage.get("storage_id") is None:
+        project_details["include_storage"] = False
+    else:
+        project_details["include_storage"] = True
+        project_details["selected_storage_id"] = storage["storage_id"]
+        project_details["selected_storage_name"] = storage["model_name"]
+        project_details["selected_storage_storage_power_kw"] = storage["capacity_kwh"]
+    return {**project_data, "project_details": project_details}
+
+
+def _sizing_task(task: Dict[str, Any], context: Dict[str, Any]) -> Tuple[Tuple[int, int], Dict[str, float], List[str]]:
+    settings = {k: v for k, v in (context.get("settings") or {}).items() if v is not None}
+    errors: List[str] = []
+    metrics: Dict[str, float] = {}
+    try:
+        results = perform_calculations(
+            _apply_candidate(task["project_data"], task["module_quantity"], task["storage"]),
+            context.get("texts", {}),
+            errors,
+            simulation_duration_user=task["simulation_duration_user"],
+            settings=settings,
+            context=context,
+        )
+        for key in SIZING_METRICS:
+            try:
+                metrics[key] = float(results.get(key))
+            except (TypeError, ValueError):
+                metrics[key] = float("nan")
+    except Exception as e_sizing:
+        errors.append(f"Größenoptimierung: Berechnung fehlgeschlagen: {e_sizing}")
+        metrics = {key: float("nan") for key in SIZING_METRICS}
+    return task["key"], metrics, errors
+
+
+class _SizingSearch:
+    def __init__(self, project_data, context, module_counts, storage_options, objective_key,
+                 budget_eur, budget_metric, simulation_duration_user, workers):
+        self.project_data = project_data
+        self.context = context
+        self.module_counts = module_counts
+        self.storage_options = storage_options
+        self.objective_key = objective_key
+        self.budget_eur = budget_eur
+        self.budget_metric = budget_metric
+        self.simulation_duration_user = simulation_duration_user
+        self.workers = workers
+        self.evaluated: Dict[Tuple[int, int], SizingCandidate] = {}
+        # Erste Modulstufe je Speicher, ab der das Budget überschritten ist
+        self.budget_limit = {si: len(module_counts) for si in range(len(storage_options))}
+        self.errors: List[str] = []
+
+    def allowed(self, mi: int, si: int) -> bool:
+        return 0 <= mi < self.budget_limit[si]
+
+    def evaluate(self, keys: Sequence[Tuple[int, int]]) -> None:
+        pending = [k for k in dict.fromkeys(keys) if k not in self.evaluated and self.allowed(*k)]
+        if not pending:
+            return
+        tasks = [
+            {
+                "key": (mi, si),
+                "module_quantity": self.module_counts[mi],
+                "storage": {
+                    "storage_id": self.storage_options[si].storage_id,
+                    "model_name": self.storage_options[si].model_name,
+                    "capacity_kwh": self.storage_options[si].capacity_kwh,
+                },
+                "project_data": self.project_data,
+                "simulation_duration_user": self.simulation_duration_user,
+            }
+            for mi, si in pending
+        ]
+        for (mi, si), metrics, errors in run_with_batch_context(
+            _sizing_task, tasks, self.context, workers=self.workers, ordered=False, chunksize=1
+        ):
+            value = metrics.get(self.objective_key, float("nan"))
+            feasible, reason = True, None
+            investment = metrics.get(self.budget_metric, float("nan"))
+            if self.budget_eur is not None and investment > self.budget_eur:
+                feasible, reason = False, "budget"
+                self.budget_limit[si] = min(self.budget_limit[si], mi)
+            elif math.isnan(value):
+                feasible, reason = False, "kein Zielwert"
+            if any(e.startswith("Größenoptimierung:") for e in errors):
+                self.errors.extend(errors)
+            self.evaluated[(mi, si)] = SizingCandidate(
+                self.module_counts[mi], self.storage_options[si], metrics,
+                value if feasible else float("-inf"), feasible, reason,
+            )
+
+    def score(self, mi: int, si: int) -> float:
+        candidate = self.evaluated.get((mi, si))
+        return candidate.objective_value if candidate is not None else float("-inf")
+
+    def best_for_storage(self, si: int) -> Optional[int]:
+        scored = [(c.objective_value, mi) for (mi, s), c in self.evaluated.items() if s == si and c.feasible]
+        return max(scored)[1] if scored else None
+
+
+def optimize_system_size(
+    project_data: Dict[str, Any],
+    objective: str = "npv",
+    budget_eur: Optional[float] = None,
+    budget_metric: str = "total_investment_brutto",
+    roof_area_m2: Optional[float] = None,
+    min_modules: int = 1,
+    max_modules: Optional[int] = None,
+    storage_ids: Optional[Sequence[int]] = None,
+    include_no_storage: bool = True,
+    coarse_points: int = DEFAULT_COARSE_POINTS,
+    refine_storage_options: int = DEFAULT_REFINE_STORAGE_OPTIONS,
+    exhaustive: bool = False,
+    texts: Optional[Dict[str, str]] = None,
+    simulation_duration_user: Optional[int] = None,
+    workers: int = 1,
+    errors_list: Optional[List[str]] = None,
+) -> SizingResult:
+    """Sucht Modulanzahl und Speicher mit dem besten Zielwert.
+
+    Args:
+        objective: "npv", "irr" oder "autarky".
+        budget_eur: Obergrenze für ``budget_metric`` (Standard: Bruttoinvestition).
+        roof_area_m2: freie Dachfläche (Standard: ``free_roof_area_sqm`` im Projekt).
+        storage_ids: nur diese Speicher prüfen (Standard: alle im Katalog).
+        exhaustive: alle Kombinationen rechnen (Referenz für die gesparten Berechnungen).
+        workers: Prozesse je Suchschritt (1 = im aktuellen Prozess).
+    """
+    start = time.perf_counter()
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unbekanntes Ziel '{objective}' (erlaubt: {', '.join(OBJECTIVES)})")
+    context = build_batch_context(texts)
+    products_by_id = context.get("products_by_id", {})
+    project_details = project_data.get("project_details", {})
+
+    roof_limit = max_modules_for_roof(project_details, products_by_id, roof_area_m2)
+    if roof_limit is not None:
+        max_modules = roof_limit if max_modules is None else min(max_modules, roof_limit)
+    price_matrix_df = (context.get("price_matrix_cache") or {}).get("df")
+    module_counts = candidate_module_counts(price_matrix_df, min_modules, max_modules)
+    storage_options = storage_options_from_catalog(products_by_id, storage_ids, include_no_storage)
+
+    search = _SizingSearch(
+        project_data, context, module_counts, storage_options, OBJECTIVES[objective],
+        budget_eur, budget_metric, simulation_duration_user, workers,
+    )
+    n_modules, n_storage = len(module_counts), len(storage_options)
+    pruned_storage = 0
+
+    if exhaustive:
+        search.evaluate([(mi, si) for mi in range(n_modules) for si in range(n_storage)])
+    elif n_modules and n_storage:
+        # 1. Grobsuche, aufsteigend, damit die Budgetgrenze früh greift
+        step = max(1, math.ceil((n_modules - 1) / max(1, coarse_points - 1)))
+        coarse = sorted(set(range(0, n_modules, step)) | {n_modules - 1})
+        for mi in coarse:
+            search.evaluate([(mi, si) for si in range(n_storage)])
+
+        # Budgetgrenze je Speicher per Bisektion exakt bestimmen: mit Budget
+        # liegt das Optimum oft auf der größten noch bezahlbaren Modulstufe
+        for si in range(n_storage):
+            lower = max(
+                (mi for (mi, s), c in search.evaluated.items() if s == si and c.reason != "budget"),
+                default=-1,
+            )
+            while search.budget_limit[si] - lower > 1:
+                middle = (lower + search.budget_limit[si]) // 2
+                search.evaluate([(middle, si)])
+                if search.allowed(middle, si):
+                    lower = middle
+
+        # 2. Nur die besten Speicher weiter verfolgen
+        ranked = sorted(
+            (si for si in range(n_storage) if search.best_for_storage(si) is not None),
+            key=lambda si: search.score(search.best_for_storage(si), si),
+            reverse=True,
+        )
+        kept = ranked[: max(1, refine_storage_options)]
+        pruned_storage = n_storage - len(kept)
+
+        # 3. Feinsuche (Musterschritt mit Halbierung) je verbliebenem Speicher
+        for si in kept:
+            best_mi = search.best_for_storage(si)
+            local_step = step
+            while local_step >= 1 and best_mi is not None:
+                neighbours = [best_mi - local_step, best_mi + local_step]
+                search.evaluate([(mi, si) for mi in neighbours])
+                moved = max(neighbours, key=lambda mi: search.score(mi, si))
+                if search.score(moved, si) > search.score(best_mi, si):
+                    best_mi = moved
+                else:
+                    local_step //= 2
+
+    feasible = [c for c in search.evaluated.values() if c.feasible]
+    best = max(feasible, key=lambda c: c.objective_value) if feasible else None
+    evaluated = sorted(
+        search.evaluated.values(), key=lambda c: (c.storage.capacity_kwh, c.storage.model_name, c.module_quantity)
+    )
+    # Wegen Budgetgrenze nie gerechnete Kombinationen
+    pruned_by_budget = sum(
+        1
+        for si, limit in search.budget_limit.items()
+        for mi in range(limit, n_modules)
+        if (mi, si) not in search.evaluated
+    )
+    result = SizingResult(
+        objective=objective,
+        best=best,
+        evaluated=evaluated,
+        module_counts=tuple(module_counts),
+        storage_options=tuple(storage_options),
+        pruned_by_budget=pruned_by_budget,
+        pruned_storage_options=pruned_storage,
+        elapsed_s=time.perf_counter() - start,
+        errors=search.errors,
+    )
+    if errors_list is not None:
+        errors_list.extend(search.errors)
+        if best is None:
+            errors_list.append("Größenoptimierung: kein zulässiger Kandidat gefunden (Budget/Dachfläche prüfen).")
+    return result
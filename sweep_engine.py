@@ -0,0 +1,302 @@
+# sweep_engine.py
+"""
+Parameter-Sweeps / Sensitivitätsraster über perform_calculations.
+
+Statt einzelne, von Hand zusammengestellte Szenarien jeweils komplett neu zu
+rechnen, wird ein Raster aus Achsen aufgespannt (z. B. Modulanzahl ×
+Strompreissteigerung) und jeder Rasterpunkt mit perform_calculations
+berechnet:
+
+- Admin-Settings, Preis-Matrix und Produkte werden einmal geladen
+  (``build_batch_context``) und an alle Worker übergeben.
+- Das Raster wird nach den "physikalischen" Achsen (Modulanzahl, Speicher)
+  gruppiert. Innerhalb einer Gruppe ändern sich nur wirtschaftliche Größen;
+  Ertrag, Energiefluss und Kosten kommen dann aus dem Stufen-Cache von
+  perform_calculations und werden nicht neu gerechnet.
+- Gruppen (bei wenigen Gruppen: Teilstücke davon) laufen parallel in einem
+  Prozess-Pool, sobald das Raster groß genug ist, dass sich der Start der
+  Worker lohnt (``default_worker_count``); kleine Raster bleiben im Prozess.
+
+Ergebnis ist ein ``SweepResult`` mit einem NumPy-Array je Kennzahl (eine
+Dimension je Achse) sowie ``to_frame`` (lange Tabelle) und ``heatmap_frame``
+(2-D-DataFrame, direkt für eine Heatmap im Analyse-Tab).
+"""
+
+from __future__ import annotations
+
+import copy
+import itertools
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from calculations import (
+    build_batch_context,
+    perform_calculations,
+    run_with_batch_context,
+)
+
+# Unterstützte Achsen und ihre Beschriftung
+SWEEP_AXES = {
+    "module_quantity": "Modulanzahl",
+    "storage_kwh": "Speicherkapazität (kWh)",
+    "electricity_price_increase_percent": "Strompreissteigerung (% p.a.)",
+    "feed_in_tariff_ct_per_kwh": "Einspeisevergütung (ct/kWh)",
+    "loan_interest_rate_percent": "Kalkulationszins (%)",
+}
+
+# Achsen, die Ertrag, Energiefluss und Kosten verändern (äußere Schleife)
+PHYSICAL_AXES = ("module_quantity", "storage_kwh")
+
+DEFAULT_SWEEP_METRICS = (
+    "npv_value",
+    "irr_percent",
+    "amortization_time_years",
+    "lcoe_euro_per_kwh",
+    "total_investment_netto",
+    "annual_financial_benefit_year1",
+    "self_supply_rate_percent",
+)
+
+# Ein Rasterpunkt kostet wenige Millisekunden, der Start eines Spawn-Workers
+# (Import von calculations & Co.) dagegen Sekunden. Erst ab so vielen Punkten
+# je Worker ist der Pool schneller als die Schleife im aktuellen Prozess.
+MIN_POINTS_PER_WORKER = 250
+
+GridIndex = Tuple[int, ...]
+
+
+def default_worker_count(point_count: int) -> int:
+    """Worker-Anzahl für ``point_count`` Rasterpunkte (1 = im aktuellen Prozess)."""
+    return max(1, min(point_count // MIN_POINTS_PER_WORKER, os.cpu_count() or 1))
+
+
+@dataclass(frozen=True)
+class SweepAxis:
+    name: str
+    values: Tuple[float, ...]
+
+    def __post_init__(self):
+        if self.name not in SWEEP_AXES:
+            raise ValueError(f"Unbekannte Sweep-Achse '{self.name}' (erlaubt: {', '.join(SWEEP_AXES)})")
+        if not self.values:
+            raise ValueError(f"Sweep-Achse '{self.name}' hat keine Werte")
+        object.__setattr__(self, "values", tuple(self.values))
+
+    @property
+    def label(self) -> str:
+        return SWEEP_AXES[self.name]
+
+
+def _normalize_axes(axes: Any) -> Tuple[SweepAxis, ...]:
+    if isinstance(axes, Mapping):
+        axes = [SweepAxis(name, tuple(values)) for name, values in axes.items()]
+    normalized = tuple(a if isinstance(a, SweepAxis) else SweepAxis(*a) for a in axes)
+    names = [a.name for a in normalized]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Doppelte Sweep-Achse: {names}")
+    return normalized
+
+
+def apply_sweep_point(
+    project_data: Dict[str, Any],
+    settings: Dict[str, Any],
+    point: Mapping[str, Any],
+) -> Tuple[Dict[str, Any], Dict[str, Any], Optional[float]]:
+    """Überträgt die Achsenwerte eines Rasterpunkts auf Kopien von Projekt und Settings.
+
+    Rückgabe: (project_data, settings, electricity_price_increase_user).
+    """
+    project_data = copy.deepcopy(project_data)
+    project_details = project_data.setdefault("project_details", {})
+    settings = dict(settings)
+    price_increase = None
+    for name, value in point.items():
+        if name == "module_quantity":
+            project_details["module_quantity"] = int(value)
+        elif name == "storage_kwh":
+            project_details["include_storage"] = float(value) > 0
+            project_details["selected_storage_storage_power_kw"] = float(value)
+        elif name == "electricity_price_increase_percent":
+            price_increase = float(value)
+        elif name == "feed_in_tariff_ct_per_kwh":
+            # Ein Tarif für alle Anlagengrößen, Teil- und Volleinspeisung
+            flat = [{"kwp_max": float("inf"), "ct_per_kwh": float(value)}]
+            settings["feed_in_tariffs"] = {"parts": flat, "full": list(flat)}
+        elif name == "loan_interest_rate_percent":
+            global_constants = dict(settings.get("global_constants") or {})
+            global_constants["loan_interest_rate_percent"] = float(value)
+            settings["global_constants"] = global_constants
+    return project_data, settings, price_increase
+
+
+def _metric_value(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _sweep_task(task: Dict[str, Any], context: Dict[str, Any]) -> List[Tuple[GridIndex, Tuple[float, ...], List[str]]]:
+    """Rechnet alle Punkte einer Gruppe (gleiche physikalische Achsenwerte)."""
+    texts = context.get("texts", {})
+    # None-Werte entfernen, damit die Defaults von load_setting greifen
+    base_settings = {k: v for k, v in (context.get("settings") or {}).items() if v is not None}
+    metrics = task["metrics"]
+    rows = []
+    for index, point in task["points"]:
+        errors: List[str] = []
+        try:
+            project_data, settings, price_increase = apply_sweep_point(
+                task["project_data"], base_settings, point
+            )
+            results = perform_calculations(
+                project_data,
+                texts,
+                errors,
+                simulation_duration_user=task["simulation_duration_user"],
+                electricity_price_increase_user=price_increase,
+                settings=settings,
+                context=context,
+            )
+            values = tuple(_metric_value(results.get(m)) for m in metrics)
+        except Exception as e_sweep:
+            errors.append(f"Sweep-Berechnung fehlgeschlagen: {e_sweep}")
+            values = tuple(float("nan") for _ in metrics)
+        rows.append((index, values, errors))
+    return rows
+
+
+def build_sweep_tasks(
+    axes: Sequence[SweepAxis],
+    project_data: Dict[str, Any],
+    metrics: Sequence[str],
+    simulation_duration_user: Optional[int] = None,
+    workers: int = 1,
+) -> List[Dict[str, Any]]:
+    """Teilt das Raster in Aufgaben: eine je physikalischer Kombination.
+
+    Gibt es weniger Gruppen als Worker, werden die Gruppen weiter geteilt,
+    damit alle Kerne beschäftigt sind.
+    """
+    physical = [i for i, a in enumerate(axes) if a.name in PHYSICAL_AXES]
+    groups: Dict[GridIndex, List[Tuple[GridIndex, Dict[str, Any]]]] = {}
+    for index in itertools.product(*(range(len(a.values)) for a in axes)):
+        point = {a.name: a.values[i] for a, i in zip(axes, index)}
+        groups.setdefault(tuple(index[i] for i in physical), []).append((index, point))
+
+    total = sum(len(points) for points in groups.values())
+    chunk = max(1, math.ceil(total / max(1, workers))) if len(groups) < workers else total
+    tasks = []
+    for points in groups.values():
+        for start in range(0, len(points), chunk):
+            tasks.append({
+                "points": points[start:start + chunk],
+                "project_data": project_data,
+                "metrics": tuple(metrics),
+                "simulation_duration_user": simulation_duration_user,
+            })
+    return tasks
+
+
+@dataclass
+class SweepResult:
+    axes: Tuple[SweepAxis, ...]
+    metrics: Dict[str, np.ndarray]  # je Kennzahl ein Array der Form ``shape``
+    errors: Dict[GridIndex, List[str]] = field(default_factory=dict)
+    elapsed_s: float = 0.0
+
+    @property
+    def dims(self) -> Tuple[str, ...]:
+        return tuple(a.name for a in self.axes)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return tuple(len(a.values) for a in self.axes)
+
+    @property
+    def coords(self) -> Dict[str, Tuple[float, ...]]:
+        return {a.name: a.values for a in self.axes}
+
+    def to_frame(self) -> pd.DataFrame:
+        """Lange Tabelle: MultiIndex über alle Achsen, eine Spalte je Kennzahl."""
+        index = pd.MultiIndex.from_product([a.values for a in self.axes], names=list(self.dims))
+        return pd.DataFrame({m: values.reshape(-1) for m, values in self.metrics.items()}, index=index)
+
+    def heatmap_frame(self, metric: str, x: str, y: str, **fixed: Any) -> pd.DataFrame:
+        """2-D-Schnitt für eine Heatmap: Zeilen = ``y``, Spalten = ``x``.
+
+        Übrige Achsen werden über ``fixed`` (Achsenname=Wert) festgelegt,
+        sonst auf ihren ersten Wert.
+        """
+        if x == y or x not in self.dims or y not in self.dims:
+            raise ValueError(f"Ungültige Heatmap-Achsen x='{x}', y='{y}' (verfügbar: {self.dims})")
+        selector: List[Any] = []
+        for axis in self.axes:
+            if axis.name in (x, y):
+                selector.append(slice(None))
+            elif axis.name in fixed:
+                selector.append(axis.values.index(fixed[axis.name]))
+            else:
+                selector.append(0)
+        plane = self.metrics[metric][tuple(selector)]
+        if self.dims.index(x) < self.dims.index(y):
+            plane = plane.T
+        x_axis = self.axes[self.dims.index(x)]
+        y_axis = self.axes[self.dims.index(y)]
+        frame = pd.DataFrame(plane, index=list(y_axis.values), columns=list(x_axis.values))
+        frame.index.name = y_axis.label
+        frame.columns.name = x_axis.label
+        return frame
+
+
+def run_parameter_sweep(
+    project_data: Dict[str, Any],
+    axes: Any,
+    metrics: Sequence[str] = DEFAULT_SWEEP_METRICS,
+    texts: Optional[Dict[str, str]] = None,
+    simulation_duration_user: Optional[int] = None,
+    workers: Optional[int] = None,
+    errors_list: Optional[List[str]] = None,
+) -> SweepResult:
+    """Berechnet das volle Raster über ``axes`` für ein Projekt.
+
+    Args:
+        project_data: Basisprojekt wie für perform_calculations.
+        axes: ``{"module_quantity": [10, 20], ...}`` oder Liste von ``SweepAxis``.
+        metrics: Keys aus dem results-Dict von perform_calculations.
+        workers: Anzahl Prozesse (None = nach Rastergröße, siehe
+            ``default_worker_count``; 1 = im aktuellen Prozess).
+
+    Returns:
+        SweepResult; Rasterpunkte mit Fehlermeldungen stehen in ``errors``
+        (und werden zusätzlich in ``errors_list`` gezählt).
+    """
+    start = time.perf_counter()
+    axes = _normalize_axes(axes)
+    if not axes:
+        raise ValueError("Mindestens eine Sweep-Achse erforderlich")
+    metrics = tuple(metrics)
+    shape = tuple(len(a.values) for a in axes)
+    if workers is None:
+        workers = default_worker_count(int(np.prod(shape)))
+    values = {m: np.full(shape, np.nan) for m in metrics}
+    errors: Dict[GridIndex, List[str]] = {}
+
+    context = build_batch_context(texts)
+    tasks = build_sweep_tasks(axes, project_data, metrics, simulation_duration_user, workers)
+    for rows in run_with_batch_context(_sweep_task, tasks, context, workers=workers, ordered=False, chunksize=1):
+        for index, row_values, row_errors in rows:
+            for metric, value in zip(metrics, row_values):
+                values[metric][index] = value
+            if row_errors:
+                errors[index] = row_errors
+
+    if errors and errors_list is not None:
+        errors_list.append(f"Sweep: {len(errors)} von {int(np.prod(shape))} Rasterpunkten mit Meldungen")
+    return SweepResult(axes=axes, metrics=values, errors=errors, elapsed_s=time.perf_counter() - start)
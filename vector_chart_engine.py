@@ -0,0 +1,451 @@
+# vector_chart_engine.py
+"""
+Native Vektor-Diagramme (ReportLab-Graphics) für die PDF-Erstellung.
+
+Bisher wurde jedes PDF-Diagramm als Plotly-Figur gebaut und über Kaleido
+(Headless-Browser) als PNG gerastert – langsam, speicherhungrig und der
+fehleranfälligste Teil der Installation. Für die einfachen 2D-Diagrammarten
+zeichnet dieses Modul die Figur direkt als ReportLab-``Drawing``:
+
+- Balken (gruppiert oder gestapelt), Linien, Flächen (auch gestapelt) und
+  Kombinationen daraus auf einer gemeinsamen Achse,
+- Kreis- und Ringdiagramme (Donut wie ``_draw_donut`` in
+  ``pdf_template_engine/dynamic_overlay.py``, aber als echter Ring statt
+  weiß ausgestanztem Loch, damit er auch auf farbigem Hintergrund stimmt).
+
+``chart_spec_from_figure`` liest Daten, Farben, Namen und Stapelmodus aus der
+Plotly-Figur (auch Plotly-6-Typed-Arrays); alles andere (3D, Heatmaps,
+Subplots, zweite y-Achse, horizontale Balken, reine Marker) liefert None und
+bleibt beim Kaleido-Export. Ein ``Drawing`` ist ein Platypus-Flowable, landet
+also als Vektorgrafik im PDF (scharf bei jedem Zoom) und entsteht in
+Millisekunden.
+"""
+
+from __future__ import annotations
+
+import base64
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from reportlab.graphics.shapes import Drawing, Group, Line, PolyLine, Polygon, Rect, String, Wedge
+from reportlab.lib import colors
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+CHART_KINDS = ("bar", "line", "area", "pie", "donut")
+
+# Plotly-Standardfarben, falls Figur und Template keine colorway setzen
+DEFAULT_COLORWAY = (
+    "#636efa", "#EF553B", "#00cc96", "#ab63fa", "#FFA15A",
+    "#19d3f3", "#FF6692", "#B6E880", "#FF97FF", "#FECB52",
+)
+
+FONT_NAME = "Helvetica"
+GRID_COLOR = colors.Color(0.88, 0.89, 0.91)
+AXIS_COLOR = colors.Color(0.45, 0.47, 0.50)
+TEXT_COLOR = colors.Color(0.20, 0.22, 0.25)
+
+
+@dataclass
+class ChartSeries:
+    name: str
+    values: List[float]
+    kind: str = "bar"  # bar | line | area
+    color: Optional[str] = None
+
+
+@dataclass
+class VectorChartSpec:
+    """Zeichenfertige Beschreibung eines 2D-Diagramms."""
+
+    kind: str  # einer aus CHART_KINDS (bei Kombinationen die erste Reihe)
+    categories: List[str]
+    series: List[ChartSeries]
+    stacked: bool = False
+    hole: float = 0.0  # Donut: Innenradius relativ zum Außenradius
+    slice_colors: List[Optional[str]] = field(default_factory=list)
+    clockwise: bool = False
+    y_title: str = ""
+    show_legend: bool = True
+
+
+# --- Plotly-Figur -> Spec ---
+
+def _array(value: Any) -> Optional[List[Any]]:
+    """1-D-Werteliste aus Listen, NumPy-Arrays oder Plotly-Typed-Arrays."""
+    if value is None:
+        return None
+    if isinstance(value, dict) and "bdata" in value:
+        # Plotly >= 6 kodiert Arrays als {"dtype": "f8", "bdata": "<base64>"}
+        arr = np.frombuffer(base64.b64decode(value["bdata"]), dtype=np.dtype(value.get("dtype", "f8")))
+        if value.get("shape") and "," in str(value["shape"]):
+            return None
+        return arr.tolist()
+    if isinstance(value, np.ndarray):
+        return value.tolist() if value.ndim == 1 else None
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    if hasattr(value, "tolist"):
+        return list(value.tolist())
+    return None
+
+
+def _float(value: Any) -> float:
+    try:
+        result = float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+    return result
+
+
+def _category_label(value: Any) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _title_text(title: Any) -> str:
+    if isinstance(title, dict):
+        return str(title.get("text") or "")
+    return str(title or "")
+
+
+def _colorway(layout: Dict[str, Any]) -> Sequence[str]:
+    colorway = layout.get("colorway")
+    if not colorway:
+        template_layout = (layout.get("template") or {}).get("layout") or {}
+        colorway = template_layout.get("colorway")
+    return list(colorway) if colorway else list(DEFAULT_COLORWAY)
+
+
+def _trace_color(trace: Dict[str, Any], key: str) -> Optional[str]:
+    value = (trace.get(key) or {}).get("color")
+    return value if isinstance(value, str) else None
+
+
+def _pie_spec(trace: Dict[str, Any], layout: Dict[str, Any]) -> Optional[VectorChartSpec]:
+    values = _array(trace.get("values"))
+    if not values:
+        return None
+    labels = _array(trace.get("labels")) or [str(i + 1) for i in range(len(values))]
+    if len(labels) != len(values):
+        return None
+    slice_colors = _array((trace.get("marker") or {}).get("colors")) or []
+    slices = [
+        (str(label), _float(value), slice_colors[i] if i < len(slice_colors) else None)
+        for i, (label, value) in enumerate(zip(labels, values))
+    ]
+    slices = [s for s in slices if math.isfinite(s[1]) and s[1] > 0]
+    if not slices:
+        return None
+    if trace.get("sort", True):
+        slices.sort(key=lambda s: s[1], reverse=True)
+    colorway = _colorway(layout)
+    hole = float(trace.get("hole") or 0.0)
+    return VectorChartSpec(
+        kind="donut" if hole > 0 else "pie",
+        categories=[s[0] for s in slices],
+        series=[ChartSeries(str(trace.get("name") or ""), [s[1] for s in slices], kind="pie")],
+        hole=min(max(hole, 0.0), 0.9),
+        slice_colors=[s[2] or colorway[i % len(colorway)] for i, s in enumerate(slices)],
+        clockwise=trace.get("direction", "counterclockwise") == "clockwise",
+        show_legend=layout.get("showlegend", True) is not False,
+    )
+
+
+def chart_spec_from_figure(fig: Any) -> Optional[VectorChartSpec]:
+    """Spec aus einer Plotly-Figur oder None, wenn die Figur nicht nativ darstellbar ist."""
+    try:
+        figure = fig.to_plotly_json()
+    except Exception:
+        return None
+    layout = figure.get("layout") or {}
+    traces = [t for t in (figure.get("data") or []) if t.get("visible", True) is True]
+    if not traces:
+        return None
+    types = {t.get("type") or "scatter" for t in traces}
+    if types == {"pie"}:
+        return _pie_spec(traces[0], layout) if len(traces) == 1 else None
+    if not types <= {"bar", "scatter"}:
+        return None
+
+    colorway = _colorway(layout)
+    categories: Optional[List[str]] = None
+    series: List[ChartSeries] = []
+    stacked = False
+    for index, trace in enumerate(traces):
+        # Subplots und zweite y-Achse bleiben beim Raster-Export
+        if trace.get("xaxis", "x") != "x" or trace.get("yaxis", "y") != "y":
+            return None
+        y_values = _array(trace.get("y"))
+        if not y_values:
+            return None
+        x_values = _array(trace.get("x")) or list(range(len(y_values)))
+        if len(x_values) != len(y_values):
+            return None
+        labels = [_category_label(x) for x in x_values]
+        if categories is None:
+            categories = labels
+        elif labels != categories:
+            return None
+        trace_type = trace.get("type") or "scatter"
+        if trace_type == "bar":
+            if trace.get("orientation") == "h":
+                return None
+            kind = "bar"
+            color = _trace_color(trace, "marker")
+            stacked = stacked or layout.get("barmode") in ("stack", "relative")
+        else:
+            mode = trace.get("mode") or "lines"
+            if "lines" not in mode:
+                return None
+            kind = "area" if trace.get("fill") in ("tozeroy", "tonexty") or trace.get("stackgroup") else "line"
+            color = _trace_color(trace, "line") or _trace_color(trace, "marker")
+            stacked = stacked or bool(trace.get("stackgroup"))
+        series.append(ChartSeries(
+            name=str(trace.get("name") or f"Reihe {index + 1}"),
+            values=[_float(v) for v in y_values],
+            kind=kind,
+            color=color or colorway[index % len(colorway)],
+        ))
+    yaxis = layout.get("yaxis") or {}
+    return VectorChartSpec(
+        kind=series[0].kind,
+        categories=categories or [],
+        series=series,
+        stacked=stacked,
+        y_title=_title_text(yaxis.get("title")),
+        show_legend=layout.get("showlegend", len(series) > 1) is not False and len(series) > 1,
+    )
+
+
+# --- Zeichnen ---
+
+def to_reportlab_color(value: Any, fallback: colors.Color = AXIS_COLOR) -> colors.Color:
+    """Plotly-Farbangabe (Hex, Name, ``rgb()``/``rgba()``) als ReportLab-Farbe."""
+    if not isinstance(value, str):
+        return fallback
+    text = value.strip()
+    match = re.match(r"rgba?\(([^)]*)\)", text)
+    if match:
+        try:
+            parts = [float(p) for p in match.group(1).split(",")]
+            alpha = parts[3] if len(parts) > 3 else 1.0
+            return colors.Color(parts[0] / 255.0, parts[1] / 255.0, parts[2] / 255.0, alpha=alpha)
+        except (ValueError, IndexError):
+            return fallback
+    try:
+        return colors.toColor(text)
+    except Exception:
+        return fallback
+
+
+def format_tick(value: float) -> str:
+    """Achsenbeschriftung im deutschen Format (Tausenderpunkt, Dezimalkomma)."""
+    if abs(value) >= 1e6:
+        return f"{value / 1e6:,.1f} Mio.".replace(",", "X").replace(".", ",").replace("X", ".")
+    decimals = 0 if float(value).is_integer() or abs(value) >= 100 else (1 if abs(value) >= 1 else 2)
+    return f"{value:,.{decimals}f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def nice_ticks(low: float, high: float, count: int = 5) -> List[float]:
+    """Runde Achsenwerte (1/2/5 × 10^k), die [low, high] abdecken."""
+    if not (math.isfinite(low) and math.isfinite(high)):
+        return [0.0, 1.0]
+    if high <= low:
+        high = low + (abs(low) or 1.0)
+    raw_step = (high - low) / max(count, 1)
+    magnitude = 10 ** math.floor(math.log10(raw_step))
+    step = next(m * magnitude for m in (1, 2, 2.5, 5, 10) if m * magnitude >= raw_step)
+    first = math.floor(low / step + 1e-9)
+    last = math.ceil(high / step - 1e-9)
+    return [round(i * step, 10) for i in range(first, max(last, first + 1) + 1)]
+
+
+def _value_range(spec: VectorChartSpec) -> Tuple[float, float]:
+    low, high = 0.0, 0.0
+    n = len(spec.categories)
+    if spec.stacked:
+        for kinds in (("bar",), ("area",)):
+            stacked_series = [s for s in spec.series if s.kind in kinds]
+            for i in range(n):
+                column = [s.values[i] for s in stacked_series if math.isfinite(s.values[i])]
+                high = max(high, sum(v for v in column if v > 0))
+                low = min(low, sum(v for v in column if v < 0))
+    for s in spec.series:
+        finite = [v for v in s.values if math.isfinite(v)]
+        if finite and (not spec.stacked or s.kind == "line"):
+            high = max(high, max(finite))
+            low = min(low, min(finite))
+    return low, high
+
+
+def _legend(items: Sequence[Tuple[str, colors.Color]], x: float, y: float, width: float, font_size: float) -> Group:
+    group = Group()
+    box = font_size * 0.9
+    cursor_x = x
+    for label, color in items:
+        label = label if len(label) <= 28 else label[:27] + "…"
+        item_width = box + 3 + stringWidth(label, FONT_NAME, font_size) + 10
+        if cursor_x + item_width > x + width and cursor_x > x:
+            break  # eine Zeile; der Rest passt nicht
+        group.add(Rect(cursor_x, y, box, box, fillColor=color, strokeColor=None))
+        group.add(String(cursor_x + box + 3, y + 0.5, label, fontName=FONT_NAME, fontSize=font_size, fillColor=TEXT_COLOR))
+        cursor_x += item_width
+    return group
+
+
+def _draw_cartesian(spec: VectorChartSpec, width: float, height: float, font_size: float) -> Drawing:
+    drawing = Drawing(width, height)
+    n = len(spec.categories)
+    low, high = _value_range(spec)
+    ticks = nice_ticks(low, high)
+    y_min, y_max = ticks[0], ticks[-1]
+    tick_labels = [format_tick(t) for t in ticks]
+
+    legend_height = font_size * 2 if spec.show_legend else 0.0
+    y_title_width = font_size * 1.6 if spec.y_title else 0.0
+    left = y_title_width + max(stringWidth(t, FONT_NAME, font_size) for t in tick_labels) + 5
+    bottom = legend_height + font_size * 2
+    top = font_size * 0.8
+    plot_w = max(width - left - 6, 10.0)
+    plot_h = max(height - bottom - top, 10.0)
+
+    def y_pos(value: float) -> float:
+        return bottom + (value - y_min) / (y_max - y_min) * plot_h
+
+    for tick, label in zip(ticks, tick_labels):
+        y = y_pos(tick)
+        drawing.add(Line(left, y, left + plot_w, y, strokeColor=AXIS_COLOR if tick == 0 else GRID_COLOR, strokeWidth=0.6 if tick == 0 else 0.4))
+        drawing.add(String(left - 3, y - font_size * 0.35, label, fontName=FONT_NAME, fontSize=font_size, fillColor=TEXT_COLOR, textAnchor="end"))
+    if spec.y_title:
+        title = Group(String(0, 0, spec.y_title, fontName=FONT_NAME, fontSize=font_size, fillColor=TEXT_COLOR, textAnchor="middle"))
+        title.transform = (0, 1, -1, 0, font_size, bottom + plot_h / 2)
+        drawing.add(title)
+
+    slot = plot_w / max(n, 1)
+    centers = [left + slot * (i + 0.5) for i in range(n)]
+    label_width = max((stringWidth(c, FONT_NAME, font_size) for c in spec.categories), default=0) + 4
+    label_step = max(1, math.ceil(label_width / slot)) if slot > 0 else 1
+    for i in range(0, n, label_step):
+        drawing.add(String(centers[i], bottom - font_size * 1.3, spec.categories[i], fontName=FONT_NAME, fontSize=font_size, fillColor=TEXT_COLOR, textAnchor="middle"))
+
+    zero_y = y_pos(min(max(0.0, y_min), y_max))
+    bars = [s for s in spec.series if s.kind == "bar"]
+    if bars:
+        group_width = slot * 0.75
+        bar_width = group_width if spec.stacked else group_width / len(bars)
+        positive_top = [zero_y] * n
+        negative_top = [zero_y] * n
+        for b, s in enumerate(bars):
+            fill = to_reportlab_color(s.color)
+            for i, value in enumerate(s.values):
+                if not math.isfinite(value) or value == 0:
+                    continue
+                if spec.stacked:
+                    x = centers[i] - group_width / 2
+                    base = positive_top[i] if value > 0 else negative_top[i]
+                    end = base + (y_pos(value) - zero_y)
+                    if value > 0:
+                        positive_top[i] = end
+                    else:
+                        negative_top[i] = end
+                else:
+                    x = centers[i] - group_width / 2 + b * bar_width
+                    base, end = zero_y, y_pos(value)
+                drawing.add(Rect(x, min(base, end), bar_width, abs(end - base), fillColor=fill, strokeColor=None))
+
+    stack_base = [zero_y] * n
+    for s in spec.series:
+        if s.kind not in ("line", "area"):
+            continue
+        color = to_reportlab_color(s.color)
+        points: List[Tuple[float, float]] = []
+        segments: List[List[Tuple[float, float]]] = []
+        bases: List[List[float]] = []
+        base_segment: List[float] = []
+        for i, value in enumerate(s.values):
+            if not math.isfinite(value):
+                if points:
+                    segments.append(points)
+                    bases.append(base_segment)
+                points, base_segment = [], []
+                continue
+            base = stack_base[i] if (spec.stacked and s.kind == "area") else zero_y
+            y = base + (y_pos(value) - zero_y)
+            points.append((centers[i], y))
+            base_segment.append(base)
+            if spec.stacked and s.kind == "area":
+                stack_base[i] = y
+        if points:
+            segments.append(points)
+            bases.append(base_segment)
+        for segment, segment_base in zip(segments, bases):
+            if s.kind == "area":
+                outline = [c for p in segment for c in p]
+                outline += [c for x_base in zip(reversed([p[0] for p in segment]), reversed(segment_base)) for c in x_base]
+                fill = colors.Color(color.red, color.green, color.blue, alpha=0.35)
+                drawing.add(Polygon(outline, fillColor=fill, strokeColor=None))
+            if len(segment) > 1:
+                drawing.add(PolyLine([c for p in segment for c in p], strokeColor=color, strokeWidth=1.2))
+            else:
+                drawing.add(Rect(segment[0][0] - 1, segment[0][1] - 1, 2, 2, fillColor=color, strokeColor=None))
+
+    drawing.add(Line(left, bottom, left, bottom + plot_h, strokeColor=AXIS_COLOR, strokeWidth=0.6))
+    if spec.show_legend:
+        items = [(s.name, to_reportlab_color(s.color)) for s in spec.series]
+        drawing.add(_legend(items, left, font_size * 0.3, plot_w, font_size))
+    return drawing
+
+
+def _draw_pie(spec: VectorChartSpec, width: float, height: float, font_size: float) -> Drawing:
+    drawing = Drawing(width, height)
+    values = spec.series[0].values
+    total = sum(values)
+    legend_width = width * 0.45 if spec.show_legend else 0.0
+    radius = max(min((width - legend_width) / 2, height / 2) - 4, 5.0)
+    cx, cy = 4 + radius, height / 2
+    angle = 90.0
+    for value, color in zip(values, spec.slice_colors):
+        extent = 360.0 * value / total
+        start, end = (angle - extent, angle) if spec.clockwise else (angle, angle + extent)
+        wedge_kwargs: Dict[str, Any] = {"fillColor": to_reportlab_color(color), "strokeColor": colors.white, "strokeWidth": 0.5}
+        if spec.hole > 0:
+            wedge_kwargs.update(radius1=radius * spec.hole, annular=True)
+        drawing.add(Wedge(cx, cy, radius, start, end, **wedge_kwargs))
+        angle = start if spec.clockwise else end
+    if spec.show_legend:
+        line_height = font_size * 1.5
+        x = cx + radius + 10
+        y = cy + line_height * (len(values) - 1) / 2
+        box = font_size * 0.9
+        for label, value, color in zip(spec.categories, values, spec.slice_colors):
+            if y < 0:
+                break
+            text = f"{label} ({format_tick(100.0 * value / total)} %)"
+            drawing.add(Rect(x, y, box, box, fillColor=to_reportlab_color(color), strokeColor=None))
+            drawing.add(String(x + box + 3, y + 0.5, text, fontName=FONT_NAME, fontSize=font_size, fillColor=TEXT_COLOR))
+            y -= line_height
+    return drawing
+
+
+def draw_chart(spec: VectorChartSpec, width: float, height: float) -> Drawing:
+    """Zeichnet ``spec`` als Drawing der Größe ``width`` × ``height`` (Punkte)."""
+    font_size = max(5.5, min(8.0, height / 26.0))
+    if spec.kind in ("pie", "donut"):
+        return _draw_pie(spec, width, height, font_size)
+    return _draw_cartesian(spec, width, height, font_size)
+
+
+def figure_to_drawing(fig: Any, width: float, height: float) -> Optional[Drawing]:
+    """Plotly-Figur als Vektor-Drawing oder None (dann Kaleido-Export verwenden)."""
+    spec = chart_spec_from_figure(fig)
+    if spec is None:
+        return None
+    try:
+        return draw_chart(spec, width, height)
+    except Exception as e_draw:
+        print(f"VECTOR CHART: Diagramm konnte nicht nativ gezeichnet werden: {e_draw}")
+        return None